@@ -14,7 +14,7 @@
 
 from __future__ import annotations
 
-import copy
+from collections import OrderedDict
 from typing import AsyncGenerator
 from typing import Generator
 from typing import Optional
@@ -26,9 +26,15 @@ from ...agents.invocation_context import InvocationContext
 from ...events.event import Event
 from ...models.llm_request import LlmRequest
 from ._base_llm_processor import BaseLlmRequestProcessor
-from .functions import remove_client_function_call_id
+from .functions import AF_FUNCTION_CALL_ID_PREFIX
 from .functions import REQUEST_EUC_FUNCTION_CALL_NAME
 
+# Maximum number of event histories whose converted contents are memoized.
+_MAX_CONTENTS_MEMOS = 256
+# Maximum number of events held by all memos together. Least recently used
+# histories are dropped first; the history of the current call is always kept.
+_MAX_MEMOIZED_EVENTS = 10000
+
 
 class _ContentLlmRequestProcessor(BaseLlmRequestProcessor):
   """Builds the contents for the LLM request."""
@@ -202,6 +208,136 @@ def _rearrange_events_for_latest_function_response(
   return result_events
 
 
+class _ContentsMemo:
+  """Filtered events and their converted contents for one event history.
+
+  Session events are append-only, so the events seen so far are kept and
+  only the events appended since the previous call are filtered and
+  converted. Events are compared by identity, so a session reloaded from
+  storage starts a new memo.
+  """
+
+  def __init__(self):
+    self.events: list[Event] = []
+    self.filtered_events: list[Event] = []
+    # id() of an event in filtered_events -> its converted content.
+    self.contents: dict[int, types.Content] = {}
+
+  def matches(self, events: list[Event]) -> bool:
+    """Whether the memoized events are a prefix of the given events."""
+    if len(events) < len(self.events):
+      return False
+    for event, seen_event in zip(events, self.events):
+      if event is not seen_event:
+        return False
+    return True
+
+
+_contents_memos: OrderedDict[tuple[str, str, str], _ContentsMemo] = (
+    OrderedDict()
+)
+
+
+def _get_contents_memo(
+    current_branch: Optional[str], events: list[Event], agent_name: str
+) -> _ContentsMemo:
+  """Returns the memo for the event history, resetting it if it diverged."""
+  key = (events[0].id, current_branch or '', agent_name)
+  memo = _contents_memos.get(key)
+  if memo is None or not memo.matches(events):
+    memo = _ContentsMemo()
+    _contents_memos[key] = memo
+  _contents_memos.move_to_end(key)
+  return memo
+
+
+def _evict_contents_memos() -> None:
+  """Drops the least recently used memos beyond the memo and event limits."""
+  total_events = sum(len(memo.events) for memo in _contents_memos.values())
+  while len(_contents_memos) > 1 and (
+      len(_contents_memos) > _MAX_CONTENTS_MEMOS
+      or total_events > _MAX_MEMOIZED_EVENTS
+  ):
+    _, memo = _contents_memos.popitem(last=False)
+    total_events -= len(memo.events)
+
+
+def _clear_contents_memos() -> None:
+  """Drops all memoized contents."""
+  _contents_memos.clear()
+
+
+def _should_include_event(
+    current_branch: Optional[str], event: Event
+) -> bool:
+  """Whether the event contributes to the contents of the LLM request."""
+  if (
+      not event.content
+      or not event.content.role
+      or not event.content.parts
+      or event.content.parts[0].text == ''
+  ):
+    # Skip events without content, or generated neither by user nor by model
+    # or has empty text.
+    # E.g. events purely for mutating session states.
+    return False
+  if not _is_event_belongs_to_branch(current_branch, event):
+    # Skip events not belong to current branch.
+    return False
+  if _is_auth_event(event):
+    # Skip auth events.
+    return False
+  return True
+
+
+def _remove_client_function_call_ids(
+    content: types.Content,
+) -> types.Content:
+  """Returns the content without client function call ids.
+
+  Copy-on-write: the content is returned as is when it has no client ids,
+  otherwise only the affected parts and function calls/responses are copied.
+  """
+
+  def _is_client_id(id_: Optional[str]) -> bool:
+    return bool(id_) and id_.startswith(AF_FUNCTION_CALL_ID_PREFIX)
+
+  parts = content.parts or []
+  if not any(
+      (part.function_call and _is_client_id(part.function_call.id))
+      or (part.function_response and _is_client_id(part.function_response.id))
+      for part in parts
+  ):
+    return content
+
+  new_parts = []
+  for part in parts:
+    update = {}
+    if part.function_call and _is_client_id(part.function_call.id):
+      update['function_call'] = part.function_call.model_copy(
+          update={'id': None}
+      )
+    if part.function_response and _is_client_id(part.function_response.id):
+      update['function_response'] = part.function_response.model_copy(
+          update={'id': None}
+      )
+    new_parts.append(part.model_copy(update=update) if update else part)
+  return content.model_copy(update={'parts': new_parts})
+
+
+def _copy_for_request(content: types.Content) -> types.Content:
+  """Copies the content and its parts, sharing everything below the parts.
+
+  Request processors may replace parts or set part and content fields, which
+  must not leak into the session events or the memo. Nested objects (function
+  calls and responses, blobs, ...) are shared and must be replaced rather
+  than mutated.
+  """
+  return content.model_copy(
+      update={'parts': [part.model_copy() for part in content.parts or []]}
+  )
+
+
 def _get_contents(
     current_branch: Optional[str], events: list[Event], agent_name: str = ''
 ) -> list[types.Content]:
@@ -209,6 +345,11 @@ def _get_contents(
 
   Applies filtering, rearrangement, and content processing to events.
 
+  Filtered and converted events are memoized per event history (keyed by
+  the first event id, branch and agent name), so repeated calls for a growing
+  session only process the newly appended events. The memos are bounded by
+  _MAX_CONTENTS_MEMOS histories and _MAX_MEMOIZED_EVENTS events in total.
+
   Args:
     current_branch: The current branch of the agent.
     events: Events to process.
@@ -217,36 +358,25 @@ def _get_contents(
   Returns:
     A list of processed contents.
   """
-  filtered_events = []
-  # Parse the events, leaving the contents and the function calls and
-  # responses from the current agent.
-  for event in events:
-    if (
-        not event.content
-        or not event.content.role
-        or not event.content.parts
-        or event.content.parts[0].text == ''
-    ):
-      # Skip events without content, or generated neither by user nor by model
-      # or has empty text.
-      # E.g. events purely for mutating session states.
+  if not events:
+    return []
 
+  memo = _get_contents_memo(current_branch, events, agent_name)
+  # Parse the new events, leaving the contents and the function calls and
+  # responses from the current agent.
+  for event in events[len(memo.events) :]:
+    memo.events.append(event)
+    if not _should_include_event(current_branch, event):
       continue
-    if not _is_event_belongs_to_branch(current_branch, event):
-      # Skip events not belong to current branch.
-      continue
-    if _is_auth_event(event):
-      # Skip auth events.
-      continue
-    filtered_events.append(
-        _convert_foreign_event(event)
-        if _is_other_agent_reply(agent_name, event)
-        else event
-    )
+    if _is_other_agent_reply(agent_name, event):
+      event = _convert_foreign_event(event)
+    memo.filtered_events.append(event)
+    memo.contents[id(event)] = _remove_client_function_call_ids(event.content)
+  _evict_contents_memos()
 
   # Rearrange events for proper function call/response pairing
   result_events = _rearrange_events_for_latest_function_response(
-      filtered_events
+      memo.filtered_events
   )
   result_events = _rearrange_events_for_async_function_responses_in_history(
       result_events
@@ -255,9 +385,11 @@ def _get_contents(
   # Convert events to contents
   contents = []
   for event in result_events:
-    content = copy.deepcopy(event.content)
-    remove_client_function_call_id(content)
-    contents.append(content)
+    content = memo.contents.get(id(event))
+    if content is None:
+      # Merged function response events are built per call.
+      content = _remove_client_function_call_ids(event.content)
+    contents.append(_copy_for_request(content))
   return contents
 
 
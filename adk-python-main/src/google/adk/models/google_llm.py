@@ -322,8 +322,10 @@ class Gemini(BaseLlm):
           if not content.parts:
             continue
           for part in content.parts:
-            _remove_display_name_if_present(part.inline_data)
-            _remove_display_name_if_present(part.file_data)
+            part.inline_data = _remove_display_name_if_present(
+                part.inline_data
+            )
+            part.file_data = _remove_display_name_if_present(part.file_data)
 
     # Initialize config if needed
     if llm_request.config and llm_request.config.tools:
@@ -434,11 +436,13 @@ Raw response:
 
 def _remove_display_name_if_present(
     data_obj: Union[types.Blob, types.FileData, None],
-):
-  """Sets display_name to None for the Gemini API (non-Vertex) backend.
+) -> Union[types.Blob, types.FileData, None]:
+  """Returns data_obj without display_name for the Gemini API backend.
 
   This backend does not support the display_name parameter for file uploads,
-  so it must be removed to prevent request failures.
+  so it must be removed to prevent request failures. The object is copied
+  rather than modified, since request contents share it with session events.
   """
   if data_obj and data_obj.display_name:
-    data_obj.display_name = None
+    return data_obj.model_copy(update={'display_name': None})
+  return data_obj
@@ -15,10 +15,13 @@
 from __future__ import annotations
 
 import base64
+from collections import OrderedDict
 import json
 import logging
+import re
 from typing import Any
 from typing import AsyncGenerator
+from typing import Callable
 from typing import cast
 from typing import Dict
 from typing import Generator
@@ -28,6 +31,7 @@ from typing import Literal
 from typing import Optional
 from typing import Tuple
 from typing import Union
+import weakref
 
 from google.genai import types
 import litellm
@@ -66,6 +70,127 @@ logger = logging.getLogger("google_adk." + __name__)
 _NEW_LINE = "\n"
 _EXCLUDED_PART_FIELD = {"inline_data": {"data"}}
 
+# Maximum number of serialized part fields kept by _cached_serialize.
+_MAX_SERIALIZED_PART_FIELDS = 4096
+_serialized_part_fields: OrderedDict[int, tuple[weakref.ref, str]] = (
+    OrderedDict()
+)
+
+
+# Characters that change the JSON nesting state outside and inside strings.
+_JSON_STRUCTURE = re.compile(r'[{}\[\]"]')
+_JSON_STRING_END = re.compile(r'["\\]')
+
+
+class _StreamedJsonArgs:
+  """Accumulates streamed function call arguments.
+
+  Detects when the arguments form a complete JSON object by tracking the
+  nesting depth and string state chunk by chunk, so streaming large arguments
+  stays linear in their size instead of re-parsing the accumulated text after
+  every chunk.
+  """
+
+  def __init__(self):
+    self._chunks: list[str] = []
+    self._started = False
+    # Arguments not starting with an object or array, re-parsed on each chunk.
+    self._scalar = False
+    self._depth = 0
+    self._in_string = False
+    self._escaped = False
+    self._closed = False
+    # Set once the text can no longer become valid JSON.
+    self._invalid = False
+    self._valid: Optional[bool] = None
+
+  @property
+  def text(self) -> str:
+    if len(self._chunks) > 1:
+      self._chunks = ["".join(self._chunks)]
+    return self._chunks[0] if self._chunks else ""
+
+  def append(self, chunk: str) -> bool:
+    """Appends a chunk of arguments.
+
+    Args:
+      chunk: The next chunk of the arguments.
+
+    Returns:
+      Whether the accumulated arguments are valid JSON.
+    """
+    self._chunks.append(chunk)
+    pos = 0
+    if not self._started:
+      stripped = chunk.lstrip()
+      if not stripped:
+        return False
+      self._started = True
+      self._scalar = stripped[0] not in "{["
+      pos = len(chunk) - len(stripped)
+    if self._scalar:
+      return self._parses()
+    if self._invalid:
+      return False
+    if self._closed:
+      if chunk.strip():
+        self._invalid = True
+        return False
+      return self._is_valid()
+
+    if self._escaped:
+      self._escaped = False
+      pos += 1
+    while not self._closed:
+      if self._in_string:
+        match = _JSON_STRING_END.search(chunk, pos)
+        if not match:
+          break
+        pos = match.end()
+        if match.group() == "\\":
+          if pos == len(chunk):
+            self._escaped = True
+            break
+          pos += 1
+        else:
+          self._in_string = False
+        continue
+      match = _JSON_STRUCTURE.search(chunk, pos)
+      if not match:
+        break
+      pos = match.end()
+      char = match.group()
+      if char == '"':
+        self._in_string = True
+      elif char in "{[":
+        self._depth += 1
+      else:
+        self._depth -= 1
+        if self._depth == 0:
+          self._closed = True
+        elif self._depth < 0:
+          self._invalid = True
+          return False
+
+    if not self._closed:
+      return False
+    if chunk[pos:].strip():
+      self._invalid = True
+      return False
+    return self._is_valid()
+
+  def _is_valid(self) -> bool:
+    if self._valid is None:
+      self._valid = self._parses()
+    return self._valid
+
+  def _parses(self) -> bool:
+    try:
+      json.loads(self.text)
+      return True
+    except json.JSONDecodeError:
+      return False
+
 
 class FunctionChunk(BaseModel):
   id: Optional[str]
@@ -151,6 +276,38 @@ def _safe_json_serialize(obj) -> str:
     return str(obj)
 
 
+def _cached_serialize(obj: Any, serialize: Callable[[Any], str]) -> str:
+  """Serializes a function call, function response or blob once.
+
+  Request contents share these objects with the session events across LLM
+  calls, so they are cached by identity. Entries hold a weak reference and are
+  dropped once the object is garbage collected.
+
+  Args:
+    obj: The part field to serialize.
+    serialize: Converts obj to its string form.
+
+  Returns:
+    The serialized string.
+  """
+  key = id(obj)
+  entry = _serialized_part_fields.get(key)
+  if entry is not None and entry[0]() is obj:
+    _serialized_part_fields.move_to_end(key)
+    return entry[1]
+  value = serialize(obj)
+
+  def _evict(ref: weakref.ref) -> None:
+    current = _serialized_part_fields.get(key)
+    if current is not None and current[0] is ref:
+      del _serialized_part_fields[key]
+
+  _serialized_part_fields[key] = (weakref.ref(obj, _evict), value)
+  while len(_serialized_part_fields) > _MAX_SERIALIZED_PART_FIELDS:
+    _serialized_part_fields.popitem(last=False)
+  return value
+
+
 def _content_to_message_param(
     content: types.Content,
 ) -> Union[Message, list[Message]]:
@@ -173,7 +330,10 @@ def _content_to_message_param(
           ChatCompletionToolMessage(
               role="tool",
               tool_call_id=part.function_response.id,
-              content=_safe_json_serialize(part.function_response.response),
+              content=_cached_serialize(
+                  part.function_response,
+                  lambda response: _safe_json_serialize(response.response),
+              ),
           )
       )
   if tool_messages:
@@ -196,7 +356,10 @@ def _content_to_message_param(
                 id=part.function_call.id,
                 function=Function(
                     name=part.function_call.name,
-                    arguments=_safe_json_serialize(part.function_call.args),
+                    arguments=_cached_serialize(
+                        part.function_call,
+                        lambda call: _safe_json_serialize(call.args),
+                    ),
                 ),
             )
         )
@@ -248,8 +411,13 @@ def _get_content(
         and part.inline_data.data
         and part.inline_data.mime_type
     ):
-      base64_string = base64.b64encode(part.inline_data.data).decode("utf-8")
-      data_uri = f"data:{part.inline_data.mime_type};base64,{base64_string}"
+      data_uri = _cached_serialize(
+          part.inline_data,
+          lambda blob: (
+              f"data:{blob.mime_type};base64,"
+              f"{base64.b64encode(blob.data).decode('utf-8')}"
+          ),
+      )
 
       if part.inline_data.mime_type.startswith("image"):
         # Extract format from mime type (e.g., "image/png" -> "png")
@@ -727,7 +895,8 @@ class LiteLlm(BaseLlm):
     """
 
     self._maybe_append_user_content(llm_request)
-    logger.debug(_build_request_log(llm_request))
+    if logger.isEnabledFor(logging.DEBUG):
+      logger.debug(_build_request_log(llm_request))
 
     messages, tools, response_format, generation_params = (
         _get_completion_inputs(llm_request)
@@ -751,7 +920,7 @@ class LiteLlm(BaseLlm):
     if stream:
       text = ""
       # Track function calls by index
-      function_calls = {}  # index -> {name, args, id}
+      function_calls = {}  # index -> {name, args (_StreamedJsonArgs), id}
       completion_args["stream"] = True
       aggregated_llm_response = None
       aggregated_llm_response_with_tool_call = None
@@ -762,20 +931,18 @@ class LiteLlm(BaseLlm):
           if isinstance(chunk, FunctionChunk):
             index = chunk.index or fallback_index
             if index not in function_calls:
-              function_calls[index] = {"name": "", "args": "", "id": None}
+              function_calls[index] = {
+                  "name": "",
+                  "args": _StreamedJsonArgs(),
+                  "id": None,
+              }
 
             if chunk.name:
               function_calls[index]["name"] += chunk.name
-            if chunk.args:
-              function_calls[index]["args"] += chunk.args
-
-              # check if args is completed (workaround for improper chunk
-              # indexing)
-              try:
-                json.loads(function_calls[index]["args"])
-                fallback_index += 1
-              except json.JSONDecodeError:
-                pass
+            # check if args is completed (workaround for improper chunk
+            # indexing)
+            if chunk.args and function_calls[index]["args"].append(chunk.args):
+              fallback_index += 1
 
             function_calls[index]["id"] = (
                 chunk.id or function_calls[index]["id"] or str(index)
@@ -808,7 +975,7 @@ class LiteLlm(BaseLlm):
                         id=func_data["id"],
                         function=Function(
                             name=func_data["name"],
-                            arguments=func_data["args"],
+                            arguments=func_data["args"].text,
                             index=index,
                         ),
                     )
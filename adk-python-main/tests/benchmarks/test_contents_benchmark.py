@@ -0,0 +1,129 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Per-step request building overhead versus session length.
+
+Each round appends one tool call/response pair to the session (one step of a
+tool loop) and builds the request: contents from the session events, then the
+litellm messages from the contents. The "cold" runs drop the memoized contents
+and serialized parts before every round, which is what every step cost before
+they were memoized.
+
+Run with:
+  pytest tests/benchmarks --benchmark-group-by=param:session_length
+"""
+
+from google.adk.events.event import Event
+from google.adk.flows.llm_flows import contents
+from google.adk.models import lite_llm
+from google.adk.models.llm_request import LlmRequest
+from google.genai import types
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+_AGENT_NAME = "bench_agent"
+_ROUNDS = 20
+
+
+def _step_events(step: int) -> list[Event]:
+  """Returns the function call and response events of one tool loop step."""
+  call_id = f"adk-{step}"
+  return [
+      Event(
+          invocation_id="bench_inv",
+          author=_AGENT_NAME,
+          content=types.Content(
+              role="model",
+              parts=[
+                  types.Part(
+                      function_call=types.FunctionCall(
+                          id=call_id,
+                          name="search",
+                          args={"query": f"query {step}", "limit": 10},
+                      )
+                  )
+              ],
+          ),
+      ),
+      Event(
+          invocation_id="bench_inv",
+          author="user",
+          content=types.Content(
+              role="user",
+              parts=[
+                  types.Part(
+                      function_response=types.FunctionResponse(
+                          id=call_id,
+                          name="search",
+                          response={
+                              "results": [
+                                  {"title": f"Result {i}", "snippet": "x" * 200}
+                                  for i in range(10)
+                              ]
+                          },
+                      )
+                  )
+              ],
+          ),
+      ),
+  ]
+
+
+def _session_events(session_length: int) -> list[Event]:
+  events = [
+      Event(
+          invocation_id="bench_inv",
+          author="user",
+          content=types.Content(
+              role="user", parts=[types.Part.from_text(text="Find it.")]
+          ),
+      )
+  ]
+  step = 0
+  while len(events) < session_length:
+    events.extend(_step_events(step))
+    step += 1
+  return events
+
+
+def _clear_memos() -> None:
+  contents._clear_contents_memos()
+  lite_llm._serialized_part_fields.clear()
+
+
+@pytest.mark.parametrize("session_length", [50, 200, 500])
+@pytest.mark.parametrize("memoized", [True, False], ids=["warm", "cold"])
+def test_request_building_per_step(benchmark, session_length, memoized):
+  events = _session_events(session_length)
+  _clear_memos()
+  contents._get_contents(None, events, _AGENT_NAME)
+  next_step = [len(events)]
+
+  def setup():
+    events.extend(_step_events(next_step[0]))
+    next_step[0] += 1
+    if not memoized:
+      _clear_memos()
+
+  def build_request():
+    llm_request = LlmRequest(
+        contents=contents._get_contents(None, events, _AGENT_NAME)
+    )
+    return lite_llm._get_completion_inputs(llm_request)
+
+  messages, _, _, _ = benchmark.pedantic(
+      build_request, setup=setup, rounds=_ROUNDS, iterations=1
+  )
+  assert len(messages) == len(events)
@@ -0,0 +1,165 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Streaming large function call arguments through LiteLlm.
+
+Streams synthetic ~500KB create_file arguments in small chunks. The "reparse"
+detector is the previous completion check (json.loads of the accumulated
+arguments after every chunk) and is kept as the reference point.
+
+Run with:
+  pytest tests/benchmarks/test_lite_llm_streaming_benchmark.py
+"""
+
+import asyncio
+import json
+
+from google.adk.models.lite_llm import _StreamedJsonArgs
+from google.adk.models.lite_llm import LiteLlm
+from google.adk.models.lite_llm import LiteLLMClient
+from google.adk.models.llm_request import LlmRequest
+from google.genai import types
+from litellm import Function
+from litellm.types.utils import ChatCompletionDeltaToolCall
+from litellm.types.utils import Delta
+from litellm.types.utils import ModelResponse
+from litellm.types.utils import StreamingChoices
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+_ARGS_SIZE = 500_000
+_CHUNK_SIZE = 200
+
+
+def _synthetic_arguments() -> str:
+  line = 'print("hello {world}")  # [not] a "brace"\n'
+  content = line * (_ARGS_SIZE // len(line))
+  return json.dumps({"file_path": "src/main.py", "file_contents": content})
+
+
+def _chunks(arguments: str) -> list[str]:
+  return [
+      arguments[i : i + _CHUNK_SIZE]
+      for i in range(0, len(arguments), _CHUNK_SIZE)
+  ]
+
+
+def _reparse_detector(chunks: list[str]) -> int:
+  args = ""
+  completed = 0
+  for chunk in chunks:
+    args += chunk
+    try:
+      json.loads(args)
+      completed += 1
+    except json.JSONDecodeError:
+      pass
+  return completed
+
+
+def _incremental_detector(chunks: list[str]) -> int:
+  args = _StreamedJsonArgs()
+  completed = 0
+  for chunk in chunks:
+    if args.append(chunk):
+      completed += 1
+  return completed
+
+
+@pytest.mark.parametrize(
+    "detector",
+    [_incremental_detector, _reparse_detector],
+    ids=["incremental", "reparse"],
+)
+def test_function_call_args_completion_detection(benchmark, detector):
+  chunks = _chunks(_synthetic_arguments())
+
+  completed = benchmark.pedantic(detector, args=(chunks,), rounds=3)
+
+  assert completed == 1
+
+
+class _StreamingClient(LiteLLMClient):
+
+  def __init__(self, stream: list[ModelResponse]):
+    self._stream = stream
+
+  async def acompletion(self, model, messages, tools, **kwargs):
+    async def stream_generator():
+      for item in self._stream:
+        yield item
+
+    return stream_generator()
+
+
+def _tool_call_stream(arguments: str) -> list[ModelResponse]:
+  stream = []
+  for i, chunk in enumerate(_chunks(arguments)):
+    stream.append(
+        ModelResponse(
+            choices=[
+                StreamingChoices(
+                    finish_reason=None,
+                    delta=Delta(
+                        role="assistant",
+                        tool_calls=[
+                            ChatCompletionDeltaToolCall(
+                                type="function",
+                                id="call_1" if i == 0 else None,
+                                function=Function(
+                                    name="create_file" if i == 0 else None,
+                                    arguments=chunk,
+                                ),
+                                index=0,
+                            )
+                        ],
+                    ),
+                )
+            ]
+        )
+    )
+  stream.append(
+      ModelResponse(choices=[StreamingChoices(finish_reason="tool_calls")])
+  )
+  return stream
+
+
+def test_generate_content_async_stream_large_function_call(benchmark):
+  arguments = _synthetic_arguments()
+  model = LiteLlm(
+      model="test_model",
+      llm_client=_StreamingClient(_tool_call_stream(arguments)),
+  )
+  llm_request = LlmRequest(
+      contents=[
+          types.Content(
+              role="user", parts=[types.Part.from_text(text="Write main.py")]
+          )
+      ]
+  )
+
+  async def stream():
+    return [
+        response
+        async for response in model.generate_content_async(
+            llm_request, stream=True
+        )
+    ]
+
+  responses = benchmark.pedantic(lambda: asyncio.run(stream()), rounds=3)
+
+  assert responses[-1].content.parts[-1].function_call.args == json.loads(
+      arguments
+  )
@@ -535,3 +535,136 @@ def test_rearrange_events_for_latest_function_response_mixed_responses():
       ),
   ):
     _rearrange_events_for_latest_function_response(events)
+
+
+def _tool_loop_events(num_steps: int) -> list[Event]:
+  """Builds a session with a user message followed by tool call steps."""
+  events = [
+      Event(
+          invocation_id="test_inv",
+          author="user",
+          content=types.Content(
+              role="user", parts=[types.Part.from_text(text="Hello")]
+          ),
+      )
+  ]
+  for i in range(num_steps):
+    if i % 3 == 0:
+      events.append(
+          Event(
+              invocation_id="test_inv",
+              author="other_agent",
+              content=types.Content(
+                  role="model", parts=[types.Part.from_text(text=f"Step {i}")]
+              ),
+          )
+      )
+    events.append(
+        Event(
+            invocation_id="test_inv",
+            author="test_agent",
+            content=types.Content(
+                role="model",
+                parts=[
+                    types.Part(
+                        function_call=types.FunctionCall(
+                            id=f"adk-{i}", name="tool", args={"step": i}
+                        )
+                    )
+                ],
+            ),
+        )
+    )
+    events.append(
+        Event(
+            invocation_id="test_inv",
+            author="user",
+            content=types.Content(
+                role="user",
+                parts=[
+                    types.Part(
+                        function_response=types.FunctionResponse(
+                            id=f"adk-{i}", name="tool", response={"step": i}
+                        )
+                    )
+                ],
+            ),
+        )
+    )
+  return events
+
+
+def test_get_contents_incremental_matches_full_rebuild():
+  """Test memoized _get_contents matches a rebuild for a growing session."""
+  events = _tool_loop_events(10)
+  contents._clear_contents_memos()
+
+  for n in range(1, len(events) + 1):
+    incremental = _get_contents(None, events[:n], "test_agent")
+    contents._clear_contents_memos()
+    full = _get_contents(None, events[:n], "test_agent")
+    assert incremental == full
+
+  result = _get_contents(None, events, "test_agent")
+  assert result[1].parts[0].text == "For context:"
+  assert result[2].parts[0].function_call.id is None
+  assert result[3].parts[0].function_response.id is None
+
+
+def test_get_contents_does_not_mutate_session_events():
+  """Test request contents can be modified without touching the events."""
+  events = _tool_loop_events(2)
+  contents._clear_contents_memos()
+
+  result = _get_contents(None, events, "test_agent")
+  result[-2].parts[0] = types.Part.from_text(text="replaced")
+  result[-1].parts[0].thought = True
+  result[-1].role = "model"
+
+  assert events[-2].content.parts[0].function_call.id == "adk-1"
+  assert events[-1].content.parts[0].function_response.id == "adk-1"
+  assert events[-1].content.parts[0].thought is None
+  assert events[-1].content.role == "user"
+
+  again = _get_contents(None, events, "test_agent")
+  assert again[-2].parts[0].function_call.name == "tool"
+  assert again[-1].parts[0].thought is None
+  assert again[-1].role == "user"
+
+
+def test_get_contents_resets_memo_when_history_changes():
+  """Test a replaced event invalidates the memoized contents."""
+  events = _tool_loop_events(2)
+  contents._clear_contents_memos()
+  _get_contents(None, events + [events[0]], "test_agent")
+
+  edited_event = Event(
+      invocation_id="test_inv",
+      author="user",
+      content=types.Content(
+          role="user", parts=[types.Part.from_text(text="Edited")]
+      ),
+  )
+  result = _get_contents(None, events + [edited_event], "test_agent")
+
+  assert result[-1].parts[0].text == "Edited"
+
+
+def test_get_contents_memos_are_bounded_by_event_count(monkeypatch):
+  """Test least recently used histories are dropped past the event limit."""
+  monkeypatch.setattr(contents, "_MAX_MEMOIZED_EVENTS", 10)
+  contents._clear_contents_memos()
+
+  histories = [_tool_loop_events(1) for _ in range(4)]
+  for events in histories:
+    _get_contents(None, events, "test_agent")
+
+  memoized = sum(len(memo.events) for memo in contents._contents_memos.values())
+  assert memoized <= 10
+  assert (histories[-1][0].id, "", "test_agent") in contents._contents_memos
+  assert (histories[0][0].id, "", "test_agent") not in contents._contents_memos
+
+  # A single history larger than the limit is still memoized for its session
+  long_events = _tool_loop_events(10)
+  _get_contents(None, long_events, "test_agent")
+  assert list(contents._contents_memos) == [(long_events[0].id, "", "test_agent")]
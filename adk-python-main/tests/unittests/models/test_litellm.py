@@ -14,14 +14,17 @@
 
 
 import json
+import logging
 from unittest.mock import AsyncMock
 from unittest.mock import Mock
+from unittest.mock import patch
 
 from google.adk.models.lite_llm import _content_to_message_param
 from google.adk.models.lite_llm import _function_declaration_to_tool_param
 from google.adk.models.lite_llm import _get_content
 from google.adk.models.lite_llm import _message_to_generate_content_response
 from google.adk.models.lite_llm import _model_response_to_chunk
+from google.adk.models.lite_llm import _StreamedJsonArgs
 from google.adk.models.lite_llm import _to_litellm_role
 from google.adk.models.lite_llm import FunctionChunk
 from google.adk.models.lite_llm import LiteLlm
@@ -1544,3 +1547,102 @@ def test_get_completion_inputs_generation_params():
   # Should not include max_output_tokens
   assert "max_output_tokens" not in generation_params
   assert "stop_sequences" not in generation_params
+
+
+@pytest.mark.parametrize(
+    "chunks",
+    [
+        ['{"arg": "val', 'ue"}'],
+        ['{"arg": "brace } and \\', '" quote"', ", ", '"n": [1, {"a": []}]}'],
+        ['  {"path": "C:\\\\', '"}', " "],
+        ['{"a": 1}', "}"],
+        ['{"a": }'],
+        ["[1, ", "2]"],
+        ['"text', '"'],
+        ["12", "3"],
+    ],
+)
+def test_streamed_json_args_matches_json_loads(chunks):
+  args = _StreamedJsonArgs()
+  text = ""
+  for chunk in chunks:
+    text += chunk
+    try:
+      json.loads(text)
+      expected = True
+    except json.JSONDecodeError:
+      expected = False
+    assert args.append(chunk) == expected
+  assert args.text == text
+
+
+@pytest.mark.asyncio
+async def test_generate_content_async_stream_large_function_call_args(
+    mock_completion, lite_llm_instance
+):
+  content = '{"nested": "}]\\"' + "x" * 100_000
+  arguments = json.dumps({"path": "a.txt", "content": content})
+  chunk_size = 1000
+  mock_completion.return_value = [
+      ModelResponse(
+          choices=[
+              StreamingChoices(
+                  finish_reason=None,
+                  delta=Delta(
+                      role="assistant",
+                      tool_calls=[
+                          ChatCompletionDeltaToolCall(
+                              type="function",
+                              id="call_1" if i == 0 else None,
+                              function=Function(
+                                  name="create_file" if i == 0 else None,
+                                  arguments=arguments[i : i + chunk_size],
+                              ),
+                              index=0,
+                          )
+                      ],
+                  ),
+              )
+          ]
+      )
+      for i in range(0, len(arguments), chunk_size)
+  ] + [ModelResponse(choices=[StreamingChoices(finish_reason="tool_calls")])]
+
+  responses = [
+      response
+      async for response in lite_llm_instance.generate_content_async(
+          LLM_REQUEST_WITH_FUNCTION_DECLARATION, stream=True
+      )
+  ]
+
+  function_call = responses[-1].content.parts[-1].function_call
+  assert function_call.name == "create_file"
+  assert function_call.id == "call_1"
+  assert function_call.args == {"path": "a.txt", "content": content}
+
+
+@pytest.mark.asyncio
+async def test_generate_content_async_builds_request_log_only_for_debug(
+    mock_acompletion, lite_llm_instance
+):
+  logger = logging.getLogger("google_adk.google.adk.models.lite_llm")
+  original_level = logger.level
+  try:
+    with patch(
+        "google.adk.models.lite_llm._build_request_log", return_value=""
+    ) as mock_build_request_log:
+      logger.setLevel(logging.INFO)
+      async for _ in lite_llm_instance.generate_content_async(
+          LLM_REQUEST_WITH_FUNCTION_DECLARATION
+      ):
+        pass
+      mock_build_request_log.assert_not_called()
+
+      logger.setLevel(logging.DEBUG)
+      async for _ in lite_llm_instance.generate_content_async(
+          LLM_REQUEST_WITH_FUNCTION_DECLARATION
+      ):
+        pass
+      mock_build_request_log.assert_called_once()
+  finally:
+    logger.setLevel(original_level)
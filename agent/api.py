@@ -15,13 +15,15 @@ import os
 # from agentpress.thread_manager import ThreadManager
 from services.postgresql import DBConnection
 from services import redis
+from services import agent_run_stream
 from utils.simple_auth_middleware import get_current_user_id_from_jwt, get_user_id_from_stream_auth, verify_thread_access
 from utils.logger import logger, structlog
-# from services.billing import check_billing_status, can_use_model
+from services.billing import billing_preflight
+from services.event_version import bump_event_version
 from utils.config import config
 from sandbox.sandbox import create_sandbox, delete_sandbox, get_or_start_sandbox
 # from run_agent_background import run_agent_background, _cleanup_redis_response_list, update_agent_run_status
-from run_agent_background import run_agent_background
+from run_agent_background import run_agent_background, update_agent_run_status
 
 def determine_sandbox_type(files):
     """
@@ -284,17 +286,6 @@ async def stop_agent_run(agent_run_id: str, error_message: Optional[str] = None)
     client = await db.client
     final_status = "failed" if error_message else "stopped"
 
-    # Attempt to fetch final responses from Redis
-    response_list_key = f"agent_run:{agent_run_id}:responses"
-    all_responses = []
-    try:
-        all_responses_json = await redis.lrange(response_list_key, 0, -1)
-        all_responses = [json.loads(r) for r in all_responses_json]
-        logger.info(f"Fetched {len(all_responses)} responses from Redis for DB update on stop/fail: {agent_run_id}")
-    except Exception as e:
-        logger.error(f"Failed to fetch responses from Redis for {agent_run_id} during stop/fail: {e}")
-        # Try fetching from DB as a fallback? Or proceed without responses? Proceeding without for now.
-
     # Update the agent run status in the database
     update_success = await update_agent_run_status(
         client, agent_run_id, final_status, error=error_message
@@ -305,9 +296,9 @@ async def stop_agent_run(agent_run_id: str, error_message: Optional[str] = None)
         raise HTTPException(status_code=500, detail="Failed to update agent run status in database")
 
     # Send STOP signal to the global control channel
-    global_control_channel = f"agent_run:{agent_run_id}:control"
+    global_control_channel = agent_run_stream.control_channel(agent_run_id)
     try:
-        await redis.publish(global_control_channel, "STOP")
+        await agent_run_stream.publish_control(agent_run_id, "STOP")
         logger.debug(f"Published STOP signal to global channel {global_control_channel}")
     except Exception as e:
         logger.error(f"Failed to publish STOP signal to global channel {global_control_channel}: {str(e)}")
@@ -332,7 +323,7 @@ async def stop_agent_run(agent_run_id: str, error_message: Optional[str] = None)
                  logger.warning(f"Unexpected key format found: {key}")
 
         # Clean up the response list immediately on stop/fail
-        await _cleanup_redis_response_list(agent_run_id)
+        await agent_run_stream.delete(agent_run_id)
 
     except Exception as e:
         logger.error(f"Failed to find or signal active instances for {agent_run_id}: {str(e)}")
@@ -367,6 +358,40 @@ async def get_agent_run_with_access_check(client, agent_run_id: str, user_id: st
     await verify_thread_access(client, thread_id, user_id)
     return agent_run_data
 
+def _start_billing_preflight(client, account_id: str, model_name: str) -> asyncio.Task:
+    """后台启动计费预检，让它与后续的数据库查询并行执行"""
+    task = asyncio.create_task(billing_preflight(client, account_id, model_name))
+    # 请求提前失败时没有人等待结果，避免出现未读取异常的警告
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    return task
+
+async def _check_billing_preflight(preflight: asyncio.Task, account_id: str):
+    """
+    等待计费预检结果
+
+    开启 BILLING_ENFORCEMENT 时，未通过则抛出对应的HTTP异常（403：模型无权限，402：额度已用尽）；
+    未开启时只记录日志，不拦截请求。
+
+    预检本身出错（数据库异常、用量台账表不存在等）时：未开启 BILLING_ENFORCEMENT 则记录警告并放行；
+    开启时按失败关闭处理，返回 503，避免在无法确认额度时放行计费运行。
+    """
+    try:
+        verdict = await preflight
+    except Exception as e:
+        if not config.BILLING_ENFORCEMENT:
+            logger.warning(f"Billing preflight errored for account {account_id}, not enforced: {e}")
+            return
+        logger.error(f"Billing preflight errored for account {account_id}: {e}")
+        raise HTTPException(status_code=503, detail="Billing check is temporarily unavailable, please try again later")
+    if verdict['can_run']:
+        return
+    if not config.BILLING_ENFORCEMENT:
+        logger.warning(f"Billing preflight failed for account {account_id} ({verdict['status_code']}), not enforced: {verdict['message']}")
+        return
+    if verdict['status_code'] == 403:
+        raise HTTPException(status_code=403, detail={"message": verdict['message'], "allowed_models": verdict['allowed_models']})
+    raise HTTPException(status_code=402, detail={"message": verdict['message'], "subscription": verdict['subscription']})
+
 @router.post("/thread/{thread_id}/agent/start")
 async def start_agent(
     thread_id: str,
@@ -418,6 +443,9 @@ async def start_agent(
     if account_id != user_id:
         await verify_thread_access(client, thread_id, user_id)
 
+    # 计费预检与Agent配置加载并行执行，在创建agent_run之前再等待结果
+    preflight = _start_billing_preflight(client, account_id, model_name)
+
     structlog.contextvars.bind_contextvars(
         project_id=project_id,
         account_id=account_id,
@@ -562,6 +590,8 @@ async def start_agent(
         logger.info(f"Using user-selected model: {effective_model}")
     else:
         logger.info(f"Using default model: {effective_model}")
+
+    await _check_billing_preflight(preflight, account_id)
     
     agent_run = await client.schema('public').table('agent_runs').insert({
         "thread_id": thread_id,
@@ -1125,8 +1155,32 @@ async def stream_agent_run(
             print(f"  ✅ 流式输出清理完成")
             logger.debug(f"Streaming cleanup complete for agent run: {agent_run_id}")
 
+    async def stream_generator_from_redis_stream(agent_run_data):
+        """Redis Streams 后端：一个 XREAD BLOCK 读取任务按条目 id 续读，SSE 事件带上 id 以支持断线重连"""
+        try:
+            current_status = agent_run_data.get('status') if agent_run_data else None
+            if current_status != 'running':
+                for response in await agent_run_stream.read_all(agent_run_id):
+                    yield f"data: {json.dumps(response)}\n\n"
+                logger.info(f"Agent run {agent_run_id} is not running (status: {current_status}). Ending stream.")
+                yield f"data: {json.dumps({'type': 'status', 'status': 'completed'})}\n\n"
+                return
+
+            structlog.contextvars.bind_contextvars(
+                thread_id=agent_run_data.get('thread_id'),
+            )
+            last_event_id = request.headers.get('last-event-id') if request else None
+            async for entry_id, raw, _ in agent_run_stream.iterate_stream(agent_run_id, after_id=last_event_id):
+                yield f"id: {entry_id}\ndata: {raw}\n\n"
+        except asyncio.CancelledError:
+            logger.info(f"Stream generator cancelled for {agent_run_id}")
+        except Exception as e:
+            logger.error(f"Error streaming agent run {agent_run_id}: {e}", exc_info=True)
+            yield f"data: {json.dumps({'type': 'status', 'status': 'error', 'message': f'Stream failed: {e}'})}\n\n"
+
+    generator = stream_generator_from_redis_stream if agent_run_stream.use_streams() else stream_generator
     print(f"  开始创建StreamingResponse...")
-    return StreamingResponse(stream_generator(agent_run_data), media_type="text/event-stream", headers={
+    return StreamingResponse(generator(agent_run_data), media_type="text/event-stream", headers={
         "Cache-Control": "no-cache, no-transform", "Connection": "keep-alive",
         "X-Accel-Buffering": "no", "Content-Type": "text/event-stream",
         "Access-Control-Allow-Origin": "*"
@@ -1200,6 +1254,9 @@ async def initiate_agent_with_files(
     # 初始化数据库连接
     client = await db.client
     logger.info(f"Database connection successful, account_id: {user_id}")
+
+    # 计费预检与Agent配置加载并行执行
+    preflight = _start_billing_preflight(client, user_id, model_name)
     
     # 4: TODO：加载Agent配置（支持版本管理，注：此版本还未实现）
     agent_config = None
@@ -1333,6 +1390,8 @@ async def initiate_agent_with_files(
     # 模型使用监控：model usage monitoring check
     # 模型使用分析：model usage analysis check
 
+    await _check_billing_preflight(preflight, user_id)
+
     try:
         # 5. 创建项目并生成项目ID,并插入到数据库中。注意：此操作仅用于初始化占位符
         placeholder_name = f"{prompt[:30]}..." if len(prompt) > 30 else prompt if prompt else "new conversation"
@@ -3351,108 +3410,131 @@ async def get_agent_tools(
     return {"agentpress_tools": agentpress_tools, "mcp_tools": mcp_tools}
 
 
+def _encode_keyset_cursor(sort_ts: datetime, sort_id: str) -> str:
+    """把排序键 (时间, id) 编码为不透明的分页游标"""
+    payload = json.dumps({"ts": sort_ts.isoformat(), "id": str(sort_id)})
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def _decode_keyset_cursor(cursor: str):
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(data["ts"]), data["id"]
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+# 侧边栏线程列表：只取需要的列，项目信息通过 LEFT JOIN 一次取回
+_USER_THREADS_SQL = """
+SELECT t.thread_id, t.account_id, t.project_id, t.metadata, t.created_at, t.updated_at,
+       p.project_id AS p_project_id, p.name AS p_name, p.description AS p_description,
+       p.account_id AS p_account_id, p.sandbox AS p_sandbox,
+       p.created_at AS p_created_at, p.updated_at AS p_updated_at
+FROM threads t
+LEFT JOIN projects p ON p.project_id = t.project_id
+WHERE t.account_id = $1 {cursor_condition}
+ORDER BY t.created_at DESC, t.thread_id DESC
+LIMIT ${limit_param}{offset_clause}
+"""
+
+_USER_THREADS_COUNT_SQL = "SELECT COUNT(*) FROM threads WHERE account_id = $1"
+
+
+async def _count_user_threads(client, user_id: str) -> int:
+    """统计用户线程数（走 account_id 索引，只扫描索引不取行数据）"""
+    async with client.pool.acquire() as conn:
+        return await conn.fetchval(_USER_THREADS_COUNT_SQL, user_id) or 0
+
+
+async def _fetch_user_threads(client, user_id: str, limit: int, offset: int = 0, after=None):
+    params: List[Any] = [user_id]
+    cursor_condition = ""
+    offset_clause = ""
+    if after is not None:
+        params.extend(after)
+        cursor_condition = "AND (t.created_at, t.thread_id) < ($2, $3)"
+    params.append(limit)
+    limit_param = len(params)
+    if offset and after is None:
+        params.append(offset)
+        offset_clause = f" OFFSET ${len(params)}"
+    query = _USER_THREADS_SQL.format(cursor_condition=cursor_condition, limit_param=limit_param, offset_clause=offset_clause)
+    async with client.pool.acquire() as conn:
+        return await conn.fetch(query, *params)
+
+
+def _map_thread_row(row) -> Dict[str, Any]:
+    project_data = None
+    if row['p_project_id']:
+        project_data = {
+            "project_id": row['p_project_id'],
+            "name": row['p_name'] or '',
+            "description": row['p_description'] or '',
+            "account_id": row['p_account_id'],
+            "sandbox": row['p_sandbox'] or {},
+            "is_public": False,
+            "created_at": row['p_created_at'],
+            "updated_at": row['p_updated_at']
+        }
+    return {
+        "thread_id": row['thread_id'],
+        "account_id": row['account_id'],
+        "project_id": row['project_id'],
+        "metadata": row['metadata'] or {},
+        "is_public": False,
+        "created_at": row['created_at'],
+        "updated_at": row['updated_at'],
+        "project": project_data  # 关联的项目数据
+    }
+
+
 @router.get("/threads")
 async def get_user_threads(
     user_id: str = Depends(get_current_user_id_from_jwt),
     page: Optional[int] = Query(1, ge=1, description="Page number (1-based)"),
-    limit: Optional[int] = Query(1000, ge=1, le=1000, description="Number of items per page (max 1000)")
+    limit: Optional[int] = Query(1000, ge=1, le=1000, description="Number of items per page (max 1000)"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page (keyset pagination, overrides page)"),
+    include_total: bool = Query(True, description="Whether to count all threads of the user")
 ):
-    """获取当前用户的所有对话线程，包含关联的项目数据"""
-    logger.info(f"Fetching threads with project data for user: {user_id} (page={page}, limit={limit})")
+    """获取当前用户的对话线程（分页），包含关联的项目数据"""
+    logger.info(f"Fetching threads with project data for user: {user_id} (page={page}, limit={limit}, cursor={'yes' if cursor else 'no'})")
     client = await db.client
     try:
-        # 计算分页偏移量
+        after = _decode_keyset_cursor(cursor) if cursor else None
         offset = (page - 1) * limit
-        
-        # 步骤1: 从threads表中获取指定用户的所有对话线程，按创建时间倒序排列
-        threads_result = await client.table('threads').select('*').eq('account_id', user_id).order('created_at', desc=True).execute()
-        
-        # 如果没有找到任何线程，返回空结果
-        if not threads_result.data:
-            logger.info(f"No threads found for user: {user_id}")
-            return {
-                "threads": [],
-                "pagination": {
-                    "page": page,
-                    "limit": limit,
-                    "total": 0,
-                    "pages": 0
-                }
-            }
-        
-        # 获取总线程数量
-        total_count = len(threads_result.data)
-        
-        # 步骤2: 对线程数据进行分页处理
-        paginated_threads = threads_result.data[offset:offset + limit]
-        
-        # 步骤3: 提取所有线程中关联的项目ID，并去重
-        project_ids = [
-            thread['project_id'] for thread in paginated_threads 
-            if thread.get('project_id')
-        ]
-        unique_project_ids = list(set(project_ids)) if project_ids else []
-        
-        # 步骤4: 如果有项目ID，则批量获取项目数据
-        projects_by_id = {}
-        if unique_project_ids:
-            projects_result = await client.table('projects').select('*').in_('project_id', unique_project_ids).execute()
-            
-            if projects_result.data:
-                logger.info(f"[API] Raw projects from DB: {len(projects_result.data)}")
-                # 创建项目ID到项目数据的映射表，便于快速查找
-                projects_by_id = {
-                    project['project_id']: project 
-                    for project in projects_result.data
-                }
-        
-        # 步骤5: 将线程数据与项目数据进行关联映射
-        mapped_threads = []
-        for thread in paginated_threads:
-            project_data = None
-            # 如果线程有关联的项目，则获取项目数据
-            if thread.get('project_id') and thread['project_id'] in projects_by_id:
-                project = projects_by_id[thread['project_id']]
-                project_data = {
-                    "project_id": project['project_id'],
-                    "name": project.get('name', ''),
-                    "description": project.get('description', ''),
-                    "account_id": project['account_id'],
-                    "sandbox": project.get('sandbox', {}),
-                    "is_public": project.get('is_public', False),
-                    "created_at": project['created_at'],
-                    "updated_at": project['updated_at']
-                }
-            
-            # 构建线程数据结构，包含关联的项目信息
-            mapped_thread = {
-                "thread_id": thread['thread_id'],
-                "account_id": thread['account_id'],
-                "project_id": thread.get('project_id'),
-                "metadata": thread.get('metadata', {}),
-                "is_public": thread.get('is_public', False),
-                "created_at": thread['created_at'],
-                "updated_at": thread['updated_at'],
-                "project": project_data  # 关联的项目数据
-            }
-            mapped_threads.append(mapped_thread)
-        
-        # 步骤6: 计算总页数
+
+        # 当前页与总数并行查询；总数只扫描 account_id 索引
+        if include_total:
+            rows, total_count = await asyncio.gather(
+                _fetch_user_threads(client, user_id, limit, offset, after),
+                _count_user_threads(client, user_id),
+            )
+        else:
+            rows = await _fetch_user_threads(client, user_id, limit, offset, after)
+            total_count = None
+
+        mapped_threads = [_map_thread_row(row) for row in rows]
+        next_cursor = None
+        if len(rows) == limit:
+            last = rows[-1]
+            next_cursor = _encode_keyset_cursor(last['created_at'], last['thread_id'])
+
         total_pages = (total_count + limit - 1) // limit if total_count else 0
-        
-        logger.info(f"[API] Mapped threads for frontend: {len(mapped_threads)} threads, {len(projects_by_id)} unique projects")
-        
-        # 步骤7: 返回结果，包含线程列表和分页信息
+        logger.debug(f"[API] Mapped threads for frontend: {len(mapped_threads)} threads")
+
         return {
             "threads": mapped_threads,
             "pagination": {
                 "page": page,
                 "limit": limit,
                 "total": total_count,
-                "pages": total_pages
+                "pages": total_pages,
+                "next_cursor": next_cursor
             }
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching threads for user {user_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to fetch threads: {str(e)}")
@@ -3813,79 +3895,184 @@ async def create_thread(
         raise HTTPException(status_code=500, detail=f"Failed to create thread: {str(e)}")
 
 
+# messages 表与 events 表中的用户消息在 SQL 中合并：游标条件会下推到两个分支，
+# 两个分支都可以按 (线程, 时间) 索引有序扫描，再由 ORDER BY + LIMIT 归并（Merge Append）
+_THREAD_MESSAGES_SQL = """
+SELECT * FROM (
+    SELECT 'message' AS source, message_id::text AS sort_id, created_at AS sort_ts,
+           message_id, thread_id, type, role, content, metadata, is_llm_message,
+           created_at, updated_at, agent_id, agent_version_id
+    FROM messages
+    WHERE thread_id = $1::uuid
+    UNION ALL
+    SELECT 'event', id, timestamp,
+           NULL, NULL, 'user', 'user', content, NULL, false,
+           timestamp, timestamp, NULL, NULL
+    FROM events
+    WHERE session_id = $2 AND author = 'user'
+) merged
+{cursor_condition}
+ORDER BY sort_ts {direction}, sort_id {direction}
+LIMIT ${limit_param}
+"""
+
+THREAD_MESSAGES_BATCH_SIZE = 1000
+
+
+async def _fetch_thread_message_rows(client, thread_id: str, descending: bool, after=None, limit: int = THREAD_MESSAGES_BATCH_SIZE):
+    """按 (时间, id) 键集分页读取线程的合并消息行"""
+    params: List[Any] = [thread_id, thread_id]
+    cursor_condition = ""
+    if after is not None:
+        params.extend(after)
+        cursor_condition = f"WHERE (sort_ts, sort_id) {'<' if descending else '>'} ($3, $4)"
+    params.append(limit)
+    query = _THREAD_MESSAGES_SQL.format(
+        cursor_condition=cursor_condition,
+        direction="DESC" if descending else "ASC",
+        limit_param=len(params),
+    )
+    async with client.pool.acquire() as conn:
+        return await conn.fetch(query, *params)
+
+
+def _format_thread_message_rows_unlinked(rows, thread_id: str) -> List[Dict[str, Any]]:
+    """按合并后的顺序格式化消息行，不做tool消息关联"""
+    formatted_messages = []
+    for row in rows:
+        if row["source"] == "message":
+            formatted_messages.extend(_format_message_row(dict(row)))
+        else:
+            user_message = _convert_user_event({
+                "id": row["sort_id"],
+                "session_id": thread_id,
+                "content": row["content"],
+                "timestamp": row["created_at"],
+            })
+            if user_message:
+                formatted_messages.append(user_message)
+    return formatted_messages
+
+
+def _format_thread_message_rows(rows, thread_id: str) -> List[Dict[str, Any]]:
+    """按合并后的顺序格式化消息行，并关联tool消息与assistant消息"""
+    formatted_messages = _format_thread_message_rows_unlinked(rows, thread_id)
+    _link_tool_messages(formatted_messages)
+    return formatted_messages
+
+
+# 分页时 tool 消息对应的 assistant 消息可能在相邻页：按 tool_call_id 一次查出这些 assistant 消息
+_ASSISTANT_ROWS_FOR_TOOL_CALLS_SQL = """
+SELECT message_id, thread_id, type, role, content, metadata, is_llm_message,
+       created_at, updated_at, agent_id, agent_version_id
+FROM messages
+WHERE thread_id = $1::uuid AND type = 'assistant'
+  AND jsonb_typeof(content->'tool_calls') = 'array'
+  AND EXISTS (
+      SELECT 1 FROM jsonb_array_elements(content->'tool_calls') tool_call
+      WHERE tool_call->>'id' = ANY($2::text[])
+  )
+"""
+
+
+async def _link_tool_messages_across_pages(client, thread_id: str, formatted_messages) -> None:
+    """关联一页消息中的tool消息；assistant消息不在本页的，额外查询一次后关联（不加入返回结果）"""
+    tool_call_to_assistant: Dict[str, Any] = {}
+    _link_tool_messages(formatted_messages, tool_call_to_assistant)
+    missing = [
+        _tool_call_id(message) for message in formatted_messages
+        if _is_unlinked_tool_message(message, tool_call_to_assistant)
+    ]
+    if not missing:
+        return
+    async with client.pool.acquire() as conn:
+        rows = await conn.fetch(_ASSISTANT_ROWS_FOR_TOOL_CALLS_SQL, thread_id, missing)
+    partners = [message for row in rows for message in _format_message_row(dict(row))]
+    _link_tool_messages(partners, tool_call_to_assistant)
+    _link_tool_messages(formatted_messages, tool_call_to_assistant)
+
+
+def _ndjson_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
 @router.get("/threads/{thread_id}/messages")
 async def get_thread_messages(
     thread_id: str,
     user_id: str = Depends(get_current_user_id_from_jwt),
-    order: str = Query("desc", description="Order by created_at: 'asc' or 'desc'")
+    order: str = Query("desc", description="Order by created_at: 'asc' or 'desc'"),
+    limit: Optional[int] = Query(None, ge=1, le=THREAD_MESSAGES_BATCH_SIZE, description="Page size; omit to return all messages"),
+    cursor: Optional[str] = Query(None, description="next_cursor returned by the previous page"),
+    stream: bool = Query(False, description="Stream all messages as NDJSON (one message per line)"),
 ):
-    """Get all messages for a thread, fetching in batches of 1000 from the DB to avoid large queries."""
-    logger.info(f"Fetching all messages for thread: {thread_id}, order={order}")
+    """
+    Get messages for a thread.
+
+    Rows from the messages table and user events from the events table are merged
+    in SQL and read with keyset pagination. With ``limit`` a single page is returned
+    together with ``next_cursor``; with ``stream`` the whole thread is streamed as
+    NDJSON; otherwise all messages are returned.
+    """
+    logger.info(f"Fetching messages for thread: {thread_id}, order={order}, limit={limit}, stream={stream}")
     client = await db.client
     await verify_thread_access(client, thread_id, user_id)
+    descending = order == "desc"
+    after = _decode_keyset_cursor(cursor) if cursor else None
+
+    if stream:
+        async def ndjson_generator():
+            # tool消息与assistant消息可能落在批次边界两侧：映射跨批次保留，
+            # 本批次中尚未关联的tool消息及其后的消息留到下一批次再输出
+            tool_call_to_assistant: Dict[str, Any] = {}
+            carried: List[Dict[str, Any]] = []
+            position = after
+            while True:
+                rows = await _fetch_thread_message_rows(client, thread_id, descending, position)
+                messages = carried + _format_thread_message_rows_unlinked(rows, thread_id)
+                _link_tool_messages(messages, tool_call_to_assistant)
+                more = len(rows) == THREAD_MESSAGES_BATCH_SIZE
+                cutoff = len(messages)
+                if more:
+                    # 已经延后过一次的消息不再延后，避免找不到配对的tool消息一直积压
+                    cutoff = next(
+                        (i for i in range(len(carried), len(messages))
+                         if _is_unlinked_tool_message(messages[i], tool_call_to_assistant)),
+                        len(messages),
+                    )
+                for message in messages[:cutoff]:
+                    yield json.dumps(message, ensure_ascii=False, default=_ndjson_default) + "\n"
+                carried = messages[cutoff:]
+                if not more:
+                    break
+                position = (rows[-1]["sort_ts"], rows[-1]["sort_id"])
+
+        return StreamingResponse(ndjson_generator(), media_type="application/x-ndjson")
+
     try:
-        batch_size = 1000
-        offset = 0
-        all_messages = []
-        # 🔧 Step 1: 从 messages 表查询系统消息 (assistant, tool, status等)
-        all_system_messages = []
-        offset = 0
-        while True:
-            query = client.table('messages').select('*').eq('thread_id', thread_id)
-            query = query.order('created_at', desc=(order == "desc"))
-            query = query.range(offset, offset + batch_size - 1)
-            messages_result = await query.execute()
-            batch = messages_result.data or []
-            all_system_messages.extend(batch)
-            logger.debug(f"Fetched batch of {len(batch)} system messages (offset {offset})")
-            if len(batch) < batch_size:
-                break
-            offset += batch_size
-        
-        # 🔧 Step 2: 从 events 表查询用户消息
-        all_user_events = []
-        offset = 0  
+        if limit:
+            rows = await _fetch_thread_message_rows(client, thread_id, descending, after, limit)
+            has_more = len(rows) == limit
+            messages = _format_thread_message_rows_unlinked(rows, thread_id)
+            await _link_tool_messages_across_pages(client, thread_id, messages)
+            return {
+                "messages": messages,
+                "next_cursor": _encode_keyset_cursor(rows[-1]["sort_ts"], rows[-1]["sort_id"]) if has_more else None,
+                "has_more": has_more,
+            }
+
+        all_rows = []
+        position = after
         while True:
-            query = client.schema('public').table('events').select('*').eq('session_id', thread_id).eq('author', 'user')
-            query = query.order('timestamp', desc=(order == "desc"))
-            query = query.range(offset, offset + batch_size - 1)
-            events_result = await query.execute()
-            batch = events_result.data or []
-            all_user_events.extend(batch)
-            logger.debug(f"Fetched batch of {len(batch)} user events (offset {offset})")
-            if len(batch) < batch_size:
+            rows = await _fetch_thread_message_rows(client, thread_id, descending, position)
+            all_rows.extend(rows)
+            if len(rows) < THREAD_MESSAGES_BATCH_SIZE:
                 break
-            offset += batch_size
-        
-        # 🔧 Step 3: 转换并合并两种数据源
-        system_messages = _format_messages_from_table(all_system_messages)
-        user_messages = _convert_user_events_to_messages(all_user_events)
-        
-        # 🔧 Step 4: 合并并按时间排序
-        all_messages = system_messages + user_messages
-        all_messages.sort(key=lambda x: x.get('created_at', ''), reverse=(order == "desc"))
-        
-        # 🔍 详细统计
-        system_stats = {}
-        for msg in system_messages:
-            msg_type = msg.get('type', 'unknown')
-            system_stats[msg_type] = system_stats.get(msg_type, 0) + 1
-            
-        user_stats = {}
-        for msg in user_messages:
-            msg_type = msg.get('type', 'unknown')  
-            user_stats[msg_type] = user_stats.get(msg_type, 0) + 1
-        
-        all_stats = {}
-        for msg in all_messages:
-            msg_type = msg.get('type', 'unknown')
-            all_stats[msg_type] = all_stats.get(msg_type, 0) + 1
-        
-        logger.info(f"🔗 合并结果统计:")
-        logger.info(f"  📨 系统消息{len(system_messages)}条: {system_stats}")
-        logger.info(f"  👤 用户消息{len(user_messages)}条: {user_stats}")
-        logger.info(f"  📊 总计{len(all_messages)}条: {all_stats}")
-        
+            position = (rows[-1]["sort_ts"], rows[-1]["sort_id"])
+
+        all_messages = _format_thread_message_rows(all_rows, thread_id)
+        logger.debug(f"Fetched {len(all_rows)} rows -> {len(all_messages)} messages for thread {thread_id}")
         return {"messages": all_messages}
     except Exception as e:
         logger.error(f"Error fetching messages for thread {thread_id}: {str(e)}")
@@ -4007,6 +4194,8 @@ async def delete_message(
         # Don't allow users to delete the "status" messages
         # 从ADK events表删除消息（通过message_id在content中查找）
         await client.schema('public').table('events').delete().eq('session_id', thread_id).filter('content', 'cs', f'{{"message_id":"{message_id}"}}').execute()
+        # 使各进程中缓存的消息失效
+        await bump_event_version(thread_id)
         return {"message": "Message deleted successfully"}
     except Exception as e:
         logger.error(f"Error deleting message {message_id} from thread {thread_id}: {str(e)}")
@@ -4287,8 +4476,12 @@ async def _log_adk_user_message_event(client, user_id: str, message_content: str
             "requested_auth_configs": {}
         }
         
-        # 手动序列化 actions 字典为字节（这是ADK的格式要求）
-        actions_bytes = pickle.dumps(actions_dict)
+        # 手动序列化 actions 字典为字节：异步会话服务使用带版本头的编码，SQLAlchemy 会话服务只能读取 pickle
+        if config.ADK_ASYNC_SESSION_SERVICE:
+            from services.event_codec import encode_actions
+            actions_bytes = encode_actions(actions_dict, config.ADK_EVENT_ACTIONS_CODEC)
+        else:
+            actions_bytes = pickle.dumps(actions_dict)
         
         # 插入到ADK events表
         async with client.pool.acquire() as conn:
@@ -4345,158 +4538,151 @@ async def _log_adk_agent_response_event(client, user_id: str, response_content:
         logger.error(f"记录AI回复事件失败: {e}")
         raise
 
-def _format_messages_from_table(messages):
-    """格式化messages表数据为前端期望格式，支持assistant消息动态拆分"""
-    formatted_messages = []
-    
-    # 🔍 调试：检查原始数据库消息
-    logger.info(f"🔍 数据库原始消息数量: {len(messages)}")
-    raw_message_stats = {}
-    for msg in messages:
-        msg_type = msg.get('type', 'unknown')
-        raw_message_stats[msg_type] = raw_message_stats.get(msg_type, 0) + 1
-    logger.info(f"🔍 原始消息类型统计: {raw_message_stats}")
-    
-    # 🔍 特别检查原始assistant消息
-    raw_assistant_messages = [msg for msg in messages if msg.get('type') == 'assistant']
-    if raw_assistant_messages:
-        for assistant_msg in raw_assistant_messages:
-            raw_msg_id = assistant_msg.get('message_id')
-            logger.info(f"🔍 发现原始assistant消息: ID={raw_msg_id} (类型: {type(raw_msg_id)}), metadata预览={str(assistant_msg.get('metadata', ''))[:200]}...")
-    else:
-        logger.warning("⚠️ 数据库查询结果中没有assistant消息！")
-    
-    for msg in messages:
-        try:
-            # 🔧 处理content字段 - 解析为对象以便后续判断
-            content = msg.get('content', {})
-            content_obj = content
-            if isinstance(content, str):
-                try:
-                    import json
-                    content_obj = json.loads(content)
-                    content_str = content
-                except:
-                    content_str = str(content) if content else "{}"
-                    content_obj = {}
-            elif isinstance(content, dict):
-                import json
-                content_str = json.dumps(content, ensure_ascii=False)
-                content_obj = content
-            else:
+def _format_message_row(msg) -> List[Dict[str, Any]]:
+    """格式化单条messages表记录为前端期望格式，需要拆分的assistant消息会展开为多条"""
+    try:
+        # 🔧 处理content字段 - 解析为对象以便后续判断
+        content = msg.get('content', {})
+        content_obj = content
+        if isinstance(content, str):
+            try:
+                content_obj = json.loads(content)
+                content_str = content
+            except:
                 content_str = str(content) if content else "{}"
                 content_obj = {}
-            
-            # 🔧 处理metadata字段 - 解析为对象以便后续判断
-            metadata = msg.get('metadata', {})
-            metadata_obj = metadata
-            if isinstance(metadata, str):
-                try:
-                    import json
-                    metadata_obj = json.loads(metadata)
-                    metadata_str = metadata
-                except:
-                    metadata_str = str(metadata) if metadata else "{}"
-                    metadata_obj = {}
-            elif isinstance(metadata, dict):
-                import json
-                metadata_str = json.dumps(metadata, ensure_ascii=False)
-                metadata_obj = metadata
-            else:
+        elif isinstance(content, dict):
+            content_str = json.dumps(content, ensure_ascii=False)
+            content_obj = content
+        else:
+            content_str = str(content) if content else "{}"
+            content_obj = {}
+        
+        # 🔧 处理metadata字段 - 解析为对象以便后续判断
+        metadata = msg.get('metadata', {})
+        metadata_obj = metadata
+        if isinstance(metadata, str):
+            try:
+                metadata_obj = json.loads(metadata)
+                metadata_str = metadata
+            except:
                 metadata_str = str(metadata) if metadata else "{}"
                 metadata_obj = {}
+        elif isinstance(metadata, dict):
+            metadata_str = json.dumps(metadata, ensure_ascii=False)
+            metadata_obj = metadata
+        else:
+            metadata_str = str(metadata) if metadata else "{}"
+            metadata_obj = {}
+        
+        # 🔧 检查是否需要拆分assistant消息
+        if (msg.get("type") == "assistant" and 
+            metadata_obj.get("split_for_frontend") == True and
+            metadata_obj.get("tool_call_mapping")):
+            
+            logger.debug(f"🔧 检测到需要拆分的assistant消息: {msg.get('message_id')}")
+            tool_call_mapping = metadata_obj.get("tool_call_mapping", [])
+            assistant_text = content_obj.get("content", "")
+            tool_calls = content_obj.get("tool_calls", [])
             
-            # 🔧 检查是否需要拆分assistant消息
-            if (msg.get("type") == "assistant" and 
-                metadata_obj.get("split_for_frontend") == True and
-                metadata_obj.get("tool_call_mapping")):
+            # 为每个tool_call创建单独的assistant消息
+            split_messages = []
+            for mapping in tool_call_mapping:
+                index = mapping.get("index", 0)
+                tool_call_id = mapping.get("tool_call_id", "")
+                include_text = mapping.get("include_text", False)
                 
-                logger.info(f"🔧 检测到需要拆分的assistant消息: {msg.get('message_id')}")
-                tool_call_mapping = metadata_obj.get("tool_call_mapping", [])
-                assistant_text = content_obj.get("content", "")
-                tool_calls = content_obj.get("tool_calls", [])
+                # 找到对应的tool_call对象
+                matching_tool_call = None
+                for tc in tool_calls:
+                    if tc.get("id") == tool_call_id:
+                        matching_tool_call = tc
+                        break
                 
-                # 为每个tool_call创建单独的assistant消息
-                for mapping in tool_call_mapping:
-                    index = mapping.get("index", 0)
-                    tool_call_id = mapping.get("tool_call_id", "")
-                    include_text = mapping.get("include_text", False)
+                if matching_tool_call:
+                    # 🔧 生成确定性UUID（与agent/run.py保持一致）
+                    import hashlib
+                    seed_data = f"assistant_split_{tool_call_id}_{msg.get('thread_id')}_{index}_v1"
+                    hash_object = hashlib.md5(seed_data.encode())
+                    hex_dig = hash_object.hexdigest()
+                    deterministic_uuid = f"{hex_dig[:8]}-{hex_dig[8:12]}-{hex_dig[12:16]}-{hex_dig[16:20]}-{hex_dig[20:]}"
                     
-                    # 找到对应的tool_call对象
-                    matching_tool_call = None
-                    for tc in tool_calls:
-                        if tc.get("id") == tool_call_id:
-                            matching_tool_call = tc
-                            break
+                    # 构建拆分后的消息内容
+                    split_content = {
+                        "role": "assistant",
+                        "content": assistant_text if include_text else "",
+                        "tool_calls": [matching_tool_call]
+                    }
                     
-                    if matching_tool_call:
-                        # 🔧 生成确定性UUID（与agent/run.py保持一致）
-                        import hashlib
-                        seed_data = f"assistant_split_{tool_call_id}_{msg.get('thread_id')}_{index}_v1"
-                        hash_object = hashlib.md5(seed_data.encode())
-                        hex_dig = hash_object.hexdigest()
-                        deterministic_uuid = f"{hex_dig[:8]}-{hex_dig[8:12]}-{hex_dig[12:16]}-{hex_dig[16:20]}-{hex_dig[20:]}"
-                        
-                        # 构建拆分后的消息内容
-                        split_content = {
-                            "role": "assistant",
-                            "content": assistant_text if include_text else "",
-                            "tool_calls": [matching_tool_call]
-                        }
-                        
-                        # 构建拆分后的元数据
-                        split_metadata = metadata_obj.copy()
-                        split_metadata["tool_index"] = index
-                        split_metadata["original_message_id"] = str(msg.get("message_id")) if msg.get("message_id") else None
-                        
-                        # 创建拆分后的消息 - 确保所有UUID字段都是字符串
-                        split_message = {
-                            "message_id": deterministic_uuid,
-                            "thread_id": str(msg.get("thread_id")) if msg.get("thread_id") else None,
-                            "type": "assistant",
-                            "role": "assistant",
-                            "is_llm_message": msg.get("is_llm_message", False),
-                            "content": json.dumps(split_content, ensure_ascii=False),
-                            "metadata": json.dumps(split_metadata, ensure_ascii=False),
-                            "created_at": msg.get("created_at"),
-                            "updated_at": msg.get("updated_at"),
-                            "agent_id": str(msg.get("agent_id")) if msg.get("agent_id") else None,
-                            "agent_version_id": str(msg.get("agent_version_id")) if msg.get("agent_version_id") else None
-                        }
-                        
-                        formatted_messages.append(split_message)
-                        logger.info(f"✅ 拆分assistant消息: {deterministic_uuid} (tool: {matching_tool_call.get('function', {}).get('name', 'unknown')})")
-                        logger.debug(f"🔍 拆分消息字段类型检查: message_id={type(deterministic_uuid)}, thread_id={type(split_message['thread_id'])}")
-                
-            else:
-                # 🔧 普通消息处理逻辑 - 确保所有UUID字段都是字符串
-                formatted_message = {
-                    "message_id": str(msg.get("message_id")) if msg.get("message_id") else None,
-                    "thread_id": str(msg.get("thread_id")) if msg.get("thread_id") else None,
-                    "type": msg.get("type"),  # assistant, user, tool, status等
-                    "role": msg.get("role"),  # assistant, user, system等
-                    "is_llm_message": msg.get("is_llm_message", False),
-                    "content": content_str,     # JSON字符串格式
-                    "metadata": metadata_str,   # JSON字符串格式  
-                    "created_at": msg.get("created_at"),
-                    "updated_at": msg.get("updated_at"),
-                    "agent_id": str(msg.get("agent_id")) if msg.get("agent_id") else None,
-                    "agent_version_id": str(msg.get("agent_version_id")) if msg.get("agent_version_id") else None
-                }
-                
-                formatted_messages.append(formatted_message)
+                    # 构建拆分后的元数据
+                    split_metadata = metadata_obj.copy()
+                    split_metadata["tool_index"] = index
+                    split_metadata["original_message_id"] = str(msg.get("message_id")) if msg.get("message_id") else None
+                    
+                    # 创建拆分后的消息 - 确保所有UUID字段都是字符串
+                    split_messages.append({
+                        "message_id": deterministic_uuid,
+                        "thread_id": str(msg.get("thread_id")) if msg.get("thread_id") else None,
+                        "type": "assistant",
+                        "role": "assistant",
+                        "is_llm_message": msg.get("is_llm_message", False),
+                        "content": json.dumps(split_content, ensure_ascii=False),
+                        "metadata": json.dumps(split_metadata, ensure_ascii=False),
+                        "created_at": msg.get("created_at"),
+                        "updated_at": msg.get("updated_at"),
+                        "agent_id": str(msg.get("agent_id")) if msg.get("agent_id") else None,
+                        "agent_version_id": str(msg.get("agent_version_id")) if msg.get("agent_version_id") else None
+                    })
+                    logger.debug(f"✅ 拆分assistant消息: {deterministic_uuid} (tool: {matching_tool_call.get('function', {}).get('name', 'unknown')})")
             
-        except Exception as e:
-            logger.warning(f"跳过格式错误的消息 {msg.get('message_id', 'unknown')}: {e}")
-            continue
-    
-                # 🔧 更新tool消息的assistant_message_id关联
-    assistant_messages = [msg for msg in formatted_messages if msg.get('type') == 'assistant']
-    tool_messages = [msg for msg in formatted_messages if msg.get('type') == 'tool']
-    
+            return split_messages
+        
+        # 🔧 普通消息处理逻辑 - 确保所有UUID字段都是字符串
+        return [{
+            "message_id": str(msg.get("message_id")) if msg.get("message_id") else None,
+            "thread_id": str(msg.get("thread_id")) if msg.get("thread_id") else None,
+            "type": msg.get("type"),  # assistant, user, tool, status等
+            "role": msg.get("role"),  # assistant, user, system等
+            "is_llm_message": msg.get("is_llm_message", False),
+            "content": content_str,     # JSON字符串格式
+            "metadata": metadata_str,   # JSON字符串格式  
+            "created_at": msg.get("created_at"),
+            "updated_at": msg.get("updated_at"),
+            "agent_id": str(msg.get("agent_id")) if msg.get("agent_id") else None,
+            "agent_version_id": str(msg.get("agent_version_id")) if msg.get("agent_version_id") else None
+        }]
+        
+    except Exception as e:
+        logger.warning(f"跳过格式错误的消息 {msg.get('message_id', 'unknown')}: {e}")
+        return []
+
+def _tool_call_id(tool_msg) -> Optional[str]:
+    try:
+        metadata = tool_msg.get('metadata', {})
+        if isinstance(metadata, str):
+            metadata = json.loads(metadata)
+        return metadata.get('tool_call_id')
+    except Exception:
+        return None
+
+def _is_unlinked_tool_message(message, tool_call_to_assistant: Dict[str, Any]) -> bool:
+    """tool消息的assistant消息还没有出现"""
+    if message.get('type') != 'tool':
+        return False
+    tool_call_id = _tool_call_id(message)
+    return bool(tool_call_id) and tool_call_id not in tool_call_to_assistant
+
+def _link_tool_messages(formatted_messages, tool_call_to_assistant: Optional[Dict[str, Any]] = None) -> int:
+    """把tool消息metadata中的assistant_message_id指向（拆分后的）assistant消息，返回更新的数量
+
+    tool_call_to_assistant 可以跨批次传入，使分批处理时之前批次的assistant消息仍能被关联
+    """
     # 创建tool_call_id到assistant_message_id的映射
-    tool_call_to_assistant = {}
-    for assistant_msg in assistant_messages:
+    if tool_call_to_assistant is None:
+        tool_call_to_assistant = {}
+    for assistant_msg in formatted_messages:
+        if assistant_msg.get('type') != 'assistant':
+            continue
         try:
             content = assistant_msg.get('content', {})
             if isinstance(content, str):
@@ -4510,9 +4696,14 @@ def _format_messages_from_table(messages):
         except Exception as e:
             logger.warning(f"⚠️ 解析assistant消息content失败: {e}")
     
+    if not tool_call_to_assistant:
+        return 0
+    
     # 更新tool消息的assistant_message_id
     updated_tool_count = 0
-    for tool_msg in tool_messages:
+    for tool_msg in formatted_messages:
+        if tool_msg.get('type') != 'tool':
+            continue
         try:
             metadata = tool_msg.get('metadata', {})
             if isinstance(metadata, str):
@@ -4524,69 +4715,53 @@ def _format_messages_from_table(messages):
                 metadata['assistant_message_id'] = correct_assistant_id
                 tool_msg['metadata'] = json.dumps(metadata, ensure_ascii=False)
                 updated_tool_count += 1
-                logger.info(f"🔗 更新tool消息 {tool_msg.get('message_id')} -> assistant {correct_assistant_id}")
+                logger.debug(f"🔗 更新tool消息 {tool_msg.get('message_id')} -> assistant {correct_assistant_id}")
         except Exception as e:
             logger.warning(f"⚠️ 更新tool消息关联失败 {tool_msg.get('message_id')}: {e}")
     
-    # 🔍 最终统计
-    logger.info(f"🤖 最终Assistant消息数量: {len(assistant_messages)}")
-    logger.info(f"🔧 Tool消息数量: {len(tool_messages)}")
-    logger.info(f"🔗 更新了 {updated_tool_count} 个tool消息的关联")
-    
-    return formatted_messages
+    return updated_tool_count
 
-def _convert_user_events_to_messages(events):
-    """将用户events转换为前端期望的消息格式"""
-    user_messages = []
-    
-    for event in events:
-        try:
-            # 🔧 解析content字段
-            content = event.get('content')
-            if isinstance(content, str):
-                import json
-                content = json.loads(content)
-            
-            # 🔧 提取用户文本内容
-            user_text = ""
-            if isinstance(content, dict) and 'parts' in content:
-                text_parts = []
-                for part in content['parts']:
-                    if isinstance(part, dict) and 'text' in part:
-                        text_parts.append(part['text'].strip())
-                user_text = ' '.join(text_parts).strip()
-            elif isinstance(content, dict) and 'content' in content:
-                user_text = content['content']
-            else:
-                user_text = str(content)
-            
-            # 🔧 构建前端期望的用户消息格式
-            import json
-            user_content = {
-                "role": "user",
-                "content": user_text
-            }
-            
-            formatted_message = {
-                "message_id": str(event.get("id")) if event.get("id") else None,
-                "thread_id": str(event.get("session_id")) if event.get("session_id") else None,
-                "type": "user",
-                "role": "user", 
-                "is_llm_message": False,
-                "content": json.dumps(user_content, ensure_ascii=False),  # JSON字符串
-                "metadata": "{}",  # 空metadata
-                "created_at": event.get("timestamp"),
-                "updated_at": event.get("timestamp"),  # 使用timestamp作为updated_at
-                "agent_id": None,
-                "agent_version_id": None
-            }
-            
-            user_messages.append(formatted_message)
-            logger.debug(f"转换用户消息: {event.get('id')} - {user_text[:50]}{'...' if len(user_text) > 50 else ''}")
-            
-        except Exception as e:
-            logger.warning(f"跳过格式错误的用户事件 {event.get('id', 'unknown')}: {e}")
-            continue
-    
-    logger.info(f"🔄 转换了 {len(user_messages)} 条用户消息")
-    return user_messages
+def _convert_user_event(event) -> Optional[Dict[str, Any]]:
+    """将单个用户event转换为前端期望的消息格式，格式错误时返回None"""
+    try:
+        # 🔧 解析content字段
+        content = event.get('content')
+        if isinstance(content, str):
+            content = json.loads(content)
+        
+        # 🔧 提取用户文本内容
+        user_text = ""
+        if isinstance(content, dict) and 'parts' in content:
+            text_parts = []
+            for part in content['parts']:
+                if isinstance(part, dict) and 'text' in part:
+                    text_parts.append(part['text'].strip())
+            user_text = ' '.join(text_parts).strip()
+        elif isinstance(content, dict) and 'content' in content:
+            user_text = content['content']
+        else:
+            user_text = str(content)
+        
+        # 🔧 构建前端期望的用户消息格式
+        user_content = {
+            "role": "user",
+            "content": user_text
+        }
+        
+        return {
+            "message_id": str(event.get("id")) if event.get("id") else None,
+            "thread_id": str(event.get("session_id")) if event.get("session_id") else None,
+            "type": "user",
+            "role": "user", 
+            "is_llm_message": False,
+            "content": json.dumps(user_content, ensure_ascii=False),  # JSON字符串
+            "metadata": "{}",  # 空metadata
+            "created_at": event.get("timestamp"),
+            "updated_at": event.get("timestamp"),  # 使用timestamp作为updated_at
+            "agent_id": None,
+            "agent_version_id": None
+        }
+        
+    except Exception as e:
+        logger.warning(f"跳过格式错误的用户事件 {event.get('id', 'unknown')}: {e}")
+        return None
@@ -1,6 +1,14 @@
 import os
-import requests
-from typing import Dict, Any, Optional, TypedDict, Literal
+import json
+import time
+import random
+import asyncio
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple, TypedDict, Literal
+
+import httpx
+
+from utils.logger import logger
 
 
 class EndpointSchema(TypedDict):
@@ -11,39 +19,90 @@ class EndpointSchema(TypedDict):
     payload: Dict[str, Any]
 
 
+# Concurrent requests per RapidAPI host, shared by all providers in the process
+MAX_CONCURRENCY_PER_HOST = 5
+MAX_ATTEMPTS = 3
+RETRY_BACKOFF_SECONDS = 0.5
+MAX_RETRY_AFTER_SECONDS = 10
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+# Successful responses are reused for identical (route, payload) calls
+RESPONSE_CACHE_TTL_SECONDS = 300
+RESPONSE_CACHE_MAX_ENTRIES = 512
+
+_client: Optional[httpx.AsyncClient] = None
+_host_semaphores: Dict[str, asyncio.Semaphore] = {}
+_response_cache: "OrderedDict[Tuple[str, str, str], Tuple[float, Any]]" = OrderedDict()
+
+
+def _get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(30.0, connect=10.0),
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+        )
+    return _client
+
+
+def _host_semaphore(host: str) -> asyncio.Semaphore:
+    semaphore = _host_semaphores.get(host)
+    if semaphore is None:
+        semaphore = _host_semaphores[host] = asyncio.Semaphore(MAX_CONCURRENCY_PER_HOST)
+    return semaphore
+
+
+def _cache_get(key: Tuple[str, str, str]) -> Optional[Any]:
+    cached = _response_cache.get(key)
+    if cached is None:
+        return None
+    expires_at, data = cached
+    if expires_at < time.monotonic():
+        del _response_cache[key]
+        return None
+    _response_cache.move_to_end(key)
+    return data
+
+
+def _cache_set(key: Tuple[str, str, str], data: Any):
+    _response_cache[key] = (time.monotonic() + RESPONSE_CACHE_TTL_SECONDS, data)
+    _response_cache.move_to_end(key)
+    while len(_response_cache) > RESPONSE_CACHE_MAX_ENTRIES:
+        _response_cache.popitem(last=False)
+
+
+def _retry_delay(attempt: int, response: Optional[httpx.Response] = None) -> float:
+    if response is not None:
+        retry_after = response.headers.get("retry-after", "")
+        if retry_after.isdigit():
+            return min(float(retry_after), MAX_RETRY_AFTER_SECONDS)
+    return RETRY_BACKOFF_SECONDS * (2 ** attempt) + random.uniform(0, RETRY_BACKOFF_SECONDS)
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
 class RapidDataProviderBase:
     def __init__(self, base_url: str, endpoints: Dict[str, EndpointSchema]):
         self.base_url = base_url
         self.endpoints = endpoints
-    
+
     def get_endpoints(self):
         return self.endpoints
-    
-    def call_endpoint(
-            self,
-            route: str,
-            payload: Optional[Dict[str, Any]] = None
-    ):
-        """
-        Call an API endpoint with the given parameters and data.
-        
-        Args:
-            endpoint (EndpointSchema): The endpoint configuration dictionary
-            params (dict, optional): Query parameters for GET requests
-            payload (dict, optional): JSON payload for POST requests
-            
-        Returns:
-            dict: The JSON response from the API
-        """
+
+    def _prepare_request(self, route: str) -> Tuple[str, str, Dict[str, str]]:
         if route.startswith("/"):
             route = route[1:]
 
         endpoint = self.endpoints.get(route)
         if not endpoint:
             raise ValueError(f"Endpoint {route} not found")
-        
+
         url = f"{self.base_url}{endpoint['route']}"
-        
+
         headers = {
             "x-rapidapi-key": os.getenv("RAPID_API_KEY"),
             "x-rapidapi-host": url.split("//")[1].split("/")[0],
@@ -51,11 +110,80 @@ class RapidDataProviderBase:
         }
 
         method = endpoint.get('method', 'GET').upper()
-        
-        if method == 'GET':
-            response = requests.get(url, params=payload, headers=headers)
-        elif method == 'POST':
-            response = requests.post(url, json=payload, headers=headers)
-        else:
+        if method not in ('GET', 'POST'):
             raise ValueError(f"Unsupported HTTP method: {method}")
+        return method, url, headers
+
+    async def acall_endpoint(
+            self,
+            route: str,
+            payload: Optional[Dict[str, Any]] = None
+    ):
+        """
+        Call an API endpoint without blocking the event loop.
+
+        Requests go through a shared connection pool, at most
+        MAX_CONCURRENCY_PER_HOST at a time per RapidAPI host, and are retried
+        with backoff on timeouts, connection errors, 429 and 5xx responses.
+        Successful responses are cached for RESPONSE_CACHE_TTL_SECONDS.
+
+        Args:
+            route (str): The endpoint key
+            payload (dict, optional): Query parameters for GET requests, JSON payload for POST requests
+
+        Returns:
+            dict: The JSON response from the API
+        """
+        method, url, headers = self._prepare_request(route)
+        cache_key = (method, url, json.dumps(payload, sort_keys=True, default=str))
+        cached = _cache_get(cache_key)
+        if cached is not None:
+            logger.debug(f"RapidAPI cache hit: {method} {url}")
+            return cached
+
+        client = _get_client()
+        request_kwargs = {"params": payload} if method == 'GET' else {"json": payload}
+
+        async with _host_semaphore(headers["x-rapidapi-host"]):
+            for attempt in range(MAX_ATTEMPTS):
+                try:
+                    response = await client.request(method, url, headers=headers, **request_kwargs)
+                except httpx.TransportError as e:
+                    if attempt == MAX_ATTEMPTS - 1:
+                        raise
+                    delay = _retry_delay(attempt)
+                    logger.warning(f"RapidAPI {method} {url} failed ({type(e).__name__}), retrying in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+                    continue
+
+                if response.status_code in RETRY_STATUS_CODES and attempt < MAX_ATTEMPTS - 1:
+                    delay = _retry_delay(attempt, response)
+                    logger.warning(f"RapidAPI {method} {url} returned {response.status_code}, retrying in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+                    continue
+                break
+
+        data = response.json()
+        if response.is_success:
+            _cache_set(cache_key, data)
+        return data
+
+    def call_endpoint(
+            self,
+            route: str,
+            payload: Optional[Dict[str, Any]] = None
+    ):
+        """
+        Blocking variant of acall_endpoint for scripts; async code should use acall_endpoint.
+
+        Args:
+            route (str): The endpoint key
+            payload (dict, optional): Query parameters for GET requests, JSON payload for POST requests
+
+        Returns:
+            dict: The JSON response from the API
+        """
+        method, url, headers = self._prepare_request(route)
+        request_kwargs = {"params": payload} if method == 'GET' else {"json": payload}
+        response = httpx.request(method, url, headers=headers, timeout=30.0, **request_kwargs)
         return response.json()
@@ -1,9 +1,11 @@
-from typing import Any, Dict, List, Optional
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
 from agentpress.tool import Tool, ToolResult, ToolSchema, SchemaType
-from mcp_module import mcp_service
+from mcp_module import mcp_service, MCPConnectionError
 from utils.logger import logger
+from collections import OrderedDict
 import inspect
 import asyncio
+import fnmatch
 import time
 import hashlib
 import json
@@ -14,11 +16,39 @@ from agent.tools.utils.mcp_tool_executor import MCPToolExecutor
 from services import redis as redis_service
 
 
+# Concurrent list_tools discoveries per process, shared by agent startup and background refreshes
+DISCOVERY_CONCURRENCY = 8
+
+
 class MCPSchemaRedisCache:
-    def __init__(self, ttl_seconds: int = 3600, key_prefix: str = "mcp_schema:"):
+    """Two-tier (in-process LRU + Redis) cache of discovered MCP tool schemas.
+
+    Entries are fresh for ``ttl_seconds``. Past ``refresh_ratio`` of that age,
+    a hit still returns the cached schemas but schedules a background refresh,
+    and expired entries keep being served for up to ``max_stale_seconds`` while
+    they are refreshed (stale-while-revalidate). Discovery failures are cached
+    for ``negative_ttl_seconds`` so unreachable servers don't stall every start.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: int = 3600,
+        key_prefix: str = "mcp_schema:v2:",
+        max_stale_seconds: int = 86400,
+        negative_ttl_seconds: int = 60,
+        refresh_ratio: float = 0.8,
+        memory_max_entries: int = 256,
+    ):
         self._ttl = ttl_seconds
         self._key_prefix = key_prefix
+        self._max_stale = max_stale_seconds
+        self._negative_ttl = negative_ttl_seconds
+        self._refresh_after = ttl_seconds * refresh_ratio
+        self._memory_max_entries = memory_max_entries
+        self._memory: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._refreshing: Dict[str, asyncio.Task] = {}
         self._redis_client = None
+        self._stats = {"memory_hits": 0, "redis_hits": 0, "misses": 0, "stale_hits": 0, "negative_hits": 0, "refreshes": 0}
     
     async def _ensure_redis(self):
         if not self._redis_client:
@@ -30,52 +60,132 @@ class MCPSchemaRedisCache:
         return True
     
     def _get_cache_key(self, config: Dict[str, Any]) -> str:
-        config_str = json.dumps(config, sort_keys=True)
-        config_hash = hashlib.md5(config_str.encode()).hexdigest()
+        config_str = json.dumps(config, sort_keys=True, separators=(",", ":"), default=str)
+        config_hash = hashlib.blake2b(config_str.encode(), digest_size=16).hexdigest()
         return f"{self._key_prefix}{config_hash}"
     
-    async def get(self, config: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    @staticmethod
+    def _name(config: Dict[str, Any]) -> str:
+        return config.get('name', config.get('qualifiedName', 'Unknown'))
+    
+    def _expired(self, entry: Dict[str, Any]) -> bool:
+        age = time.time() - entry["cached_at"]
+        if entry.get("negative"):
+            return age > self._negative_ttl
+        return age > self._ttl + self._max_stale
+    
+    def _remember(self, key: str, entry: Dict[str, Any]):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self._memory_max_entries:
+            self._memory.popitem(last=False)
+    
+    async def _get_entry(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._memory.get(key)
+        if entry is not None:
+            if not self._expired(entry):
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return entry
+            del self._memory[key]
+        
         if not await self._ensure_redis():
             return None
-            
         try:
-            key = self._get_cache_key(config)
             cached_data = await self._redis_client.get(key)
-            
-            if cached_data:
-                logger.debug(f"⚡ Redis cache hit for MCP: {config.get('name', config.get('qualifiedName', 'Unknown'))}")
-                return json.loads(cached_data)
-            else:
-                logger.debug(f"Redis cache miss for MCP: {config.get('name', config.get('qualifiedName', 'Unknown'))}")
-                return None
-                
         except Exception as e:
             logger.warning(f"Error reading from Redis cache: {e}")
             return None
+        if not cached_data:
+            return None
+        
+        entry = json.loads(cached_data)
+        if self._expired(entry):
+            return None
+        self._remember(key, entry)
+        self._stats["redis_hits"] += 1
+        return entry
     
-    async def set(self, config: Dict[str, Any], data: Dict[str, Any]):
+    async def _put_entry(self, key: str, entry: Dict[str, Any]):
+        self._remember(key, entry)
         if not await self._ensure_redis():
             return
-            
+        ttl = self._negative_ttl if entry.get("negative") else self._ttl + self._max_stale
         try:
-            key = self._get_cache_key(config)
-            serialized_data = json.dumps(data)
-            
-            await self._redis_client.setex(key, self._ttl, serialized_data)
-            logger.debug(f"✅ Cached MCP schema in Redis for {config.get('name', config.get('qualifiedName', 'Unknown'))} (TTL: {self._ttl}s)")
-            
+            await self._redis_client.setex(key, ttl, json.dumps(entry))
         except Exception as e:
             logger.warning(f"Error writing to Redis cache: {e}")
     
+    async def get(self, config: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        entry = await self._get_entry(self._get_cache_key(config))
+        if entry is None or entry.get("negative"):
+            logger.debug(f"Cache miss for MCP: {self._name(config)}")
+            return None
+        logger.debug(f"⚡ Cache hit for MCP: {self._name(config)}")
+        return entry["data"]
+    
+    async def set(self, config: Dict[str, Any], data: Dict[str, Any]):
+        await self._put_entry(self._get_cache_key(config), {"data": data, "cached_at": time.time()})
+        logger.debug(f"✅ Cached MCP schema for {self._name(config)} (TTL: {self._ttl}s)")
+    
+    async def _load(self, key: str, config: Dict[str, Any], loader: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        try:
+            data = await loader()
+        except Exception as e:
+            await self._put_entry(key, {"negative": True, "error": str(e), "cached_at": time.time()})
+            raise
+        await self._put_entry(key, {"data": data, "cached_at": time.time()})
+        return data
+    
+    async def _refresh(self, key: str, config: Dict[str, Any], loader: Callable[[], Awaitable[Dict[str, Any]]]):
+        try:
+            # One refresh per entry across workers
+            if await self._ensure_redis() and not await self._redis_client.set(f"mcp_schema_refresh:{key}", "1", nx=True, ex=60):
+                return
+            data = await loader()
+            await self._put_entry(key, {"data": data, "cached_at": time.time()})
+            self._stats["refreshes"] += 1
+            logger.debug(f"Refreshed cached MCP schema for {self._name(config)}")
+        except Exception as e:
+            # Keep serving the previous schemas until they expire
+            logger.warning(f"Background refresh of MCP schema for {self._name(config)} failed: {e}")
+        finally:
+            self._refreshing.pop(key, None)
+    
+    async def get_or_load(self, config: Dict[str, Any], loader: Callable[[], Awaitable[Dict[str, Any]]]) -> Tuple[Dict[str, Any], bool]:
+        """Return (data, from_cache) for ``config``, running ``loader`` on a miss.
+
+        Raises MCPConnectionError while a recent discovery failure is cached.
+        """
+        key = self._get_cache_key(config)
+        entry = await self._get_entry(key)
+        
+        if entry is None:
+            self._stats["misses"] += 1
+            return await self._load(key, config, loader), False
+        
+        if entry.get("negative"):
+            self._stats["negative_hits"] += 1
+            raise MCPConnectionError(f"MCP server {self._name(config)} recently failed discovery: {entry.get('error')}")
+        
+        age = time.time() - entry["cached_at"]
+        if age > self._ttl:
+            self._stats["stale_hits"] += 1
+        if age > self._refresh_after and key not in self._refreshing:
+            self._refreshing[key] = asyncio.create_task(self._refresh(key, config, loader))
+        return entry["data"], True
+    
     async def clear_pattern(self, pattern: Optional[str] = None):
+        if pattern:
+            search_pattern = f"{self._key_prefix}{pattern}*"
+        else:
+            search_pattern = f"{self._key_prefix}*"
+        for key in [key for key in self._memory if fnmatch.fnmatchcase(key, search_pattern)]:
+            del self._memory[key]
+        
         if not await self._ensure_redis():
             return
         try:
-            if pattern:
-                search_pattern = f"{self._key_prefix}{pattern}*"
-            else:
-                search_pattern = f"{self._key_prefix}*"
-            
             keys = []
             async for key in self._redis_client.scan_iter(match=search_pattern):
                 keys.append(key)
@@ -88,25 +198,28 @@ class MCPSchemaRedisCache:
             logger.warning(f"Error clearing Redis cache: {e}")
     
     async def get_stats(self) -> Dict[str, Any]:
+        stats = {
+            **self._stats,
+            "memory_entries": len(self._memory),
+            "refreshing": len(self._refreshing),
+            "ttl_seconds": self._ttl,
+            "key_prefix": self._key_prefix
+        }
         if not await self._ensure_redis():
-            return {"available": False}
+            return {**stats, "available": False}
         try:
             count = 0
             async for _ in self._redis_client.scan_iter(match=f"{self._key_prefix}*"):
                 count += 1
             
-            return {
-                "available": True,
-                "cached_schemas": count,
-                "ttl_seconds": self._ttl,
-                "key_prefix": self._key_prefix
-            }
+            return {**stats, "available": True, "cached_schemas": count}
         except Exception as e:
             logger.warning(f"Error getting cache stats: {e}")
-            return {"available": False, "error": str(e)}
+            return {**stats, "available": False, "error": str(e)}
 
 
 _redis_cache = MCPSchemaRedisCache(ttl_seconds=3600)
+_discovery_semaphore = asyncio.Semaphore(DISCOVERY_CONCURRENCY)
 
 class MCPToolWrapper(Tool):
     def __init__(self, mcp_configs: Optional[List[Dict[str, Any]]] = None, use_cache: bool = True):
@@ -134,104 +247,68 @@ class MCPToolWrapper(Tool):
     async def _initialize_servers(self):
         start_time = time.time()
         
-        standard_configs = [cfg for cfg in self.mcp_configs if not cfg.get('isCustom', False)]
-        custom_configs = [cfg for cfg in self.mcp_configs if cfg.get('isCustom', False)]
-        
-        cached_configs = []
-        cached_tools_data = []
+        if not self.mcp_configs:
+            logger.info("No MCP servers to initialize")
+            return
         
-        initialization_tasks = []
+        logger.info(f"🚀 Initializing {len(self.mcp_configs)} MCP servers in parallel (cache enabled: {self.use_cache})...")
+        results = await asyncio.gather(*(self._initialize_server(config) for config in self.mcp_configs), return_exceptions=True)
         
-        if standard_configs:
-            for config in standard_configs:
-                if self.use_cache:
-                    cached_data = await _redis_cache.get(config)
-                    if cached_data:
-                        cached_configs.append(config.get('qualifiedName', 'Unknown'))
-                        cached_tools_data.append(cached_data)
-                        continue
-                
-                task = self._initialize_single_standard_server(config)
-                initialization_tasks.append(('standard', config, task))
+        successful = 0
+        failed = 0
+        cached_configs = []
         
-        if custom_configs:
-            for config in custom_configs:
-                if self.use_cache:
-                    cached_data = await _redis_cache.get(config)
-                    if cached_data:
-                        cached_configs.append(config.get('name', 'Unknown'))
-                        cached_tools_data.append(cached_data)
-                        continue
-                
-                task = self._initialize_single_custom_mcp(config)
-                initialization_tasks.append(('custom', config, task))
+        for config, result in zip(self.mcp_configs, results):
+            config_name = config.get('name', config.get('qualifiedName', 'Unknown'))
+            if isinstance(result, Exception):
+                failed += 1
+                logger.error(f"Failed to initialize MCP server '{config_name}': {result}")
+            else:
+                successful += 1
+                if result:
+                    cached_configs.append(config_name)
         
-        if cached_tools_data:
-            logger.info(f"⚡ Loaded {len(cached_configs)} MCP schemas from Redis cache: {', '.join(cached_configs)}")
-            for cached_data in cached_tools_data:
-                try:
-                    if cached_data.get('type') == 'standard':
-                        logger.debug("Standard MCP tools found in cache but require connection to restore")
-                    elif cached_data.get('type') == 'custom':
-                        custom_tools = cached_data.get('tools', {})
-                        if custom_tools:
-                            self.custom_handler.custom_tools.update(custom_tools)
-                            logger.debug(f"Restored {len(custom_tools)} custom tools from cache")
-                except Exception as e:
-                    logger.warning(f"Failed to restore cached tools: {e}")
+        elapsed_time = time.time() - start_time
+        logger.info(f"⚡ MCP initialization completed in {elapsed_time:.2f}s - {successful} successful, {failed} failed, {len(cached_configs)} from cache")
+    
+    async def _initialize_server(self, config: Dict[str, Any]) -> bool:
+        """Load one server's tools, from the cache when possible. Returns True on a cache hit."""
+        is_custom = config.get('isCustom', False)
+        discover = self._discover_custom_mcp if is_custom else self._discover_standard_server
         
-        if initialization_tasks:
-            logger.info(f"🚀 Initializing {len(initialization_tasks)} MCP servers in parallel (cache enabled: {self.use_cache})...")
-            
-            tasks = [task for _, _, task in initialization_tasks]
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-            
-            successful = 0
-            failed = 0
-            
-            for i, result in enumerate(results):
-                task_type, config, _ = initialization_tasks[i]
-                if isinstance(result, Exception):
-                    failed += 1
-                    config_name = config.get('name', config.get('qualifiedName', 'Unknown'))
-                    logger.error(f"Failed to initialize MCP server '{config_name}': {result}")
-                else:
-                    successful += 1
-                    if self.use_cache and result:
-                        await _redis_cache.set(config, result)
-            
-            elapsed_time = time.time() - start_time
-            logger.info(f"⚡ MCP initialization completed in {elapsed_time:.2f}s - {successful} successful, {failed} failed, {len(cached_configs)} from cache")
+        if self.use_cache:
+            data, from_cache = await _redis_cache.get_or_load(config, lambda: discover(config))
         else:
-            if cached_configs:
-                elapsed_time = time.time() - start_time
-                logger.info(f"⚡ All {len(cached_configs)} MCP schemas loaded from Redis cache in {elapsed_time:.2f}s - instant startup!")
-            else:
-                logger.info("No MCP servers to initialize")
+            data, from_cache = await discover(config), False
+        
+        if is_custom:
+            self.custom_handler.custom_tools.update(data.get('tools', {}))
+        elif from_cache:
+            await self.mcp_manager.restore_connection(config, data.get('tools', []))
+        return from_cache
     
-    async def _initialize_single_standard_server(self, config: Dict[str, Any]):
-        try:
+    async def _discover_standard_server(self, config: Dict[str, Any]) -> Dict[str, Any]:
+        async with _discovery_semaphore:
             logger.debug(f"Connecting to standard MCP server: {config['qualifiedName']}")
-            await self.mcp_manager.connect_server(config)
+            connection = await self.mcp_manager.connect_server(config)
             logger.debug(f"✓ Connected to MCP server: {config['qualifiedName']}")
-            
-            tools_info = self.mcp_manager.get_all_tools_openapi()
-            return {'tools': tools_info, 'type': 'standard', 'timestamp': time.time()}
-        except Exception as e:
-            logger.error(f"✗ Failed to connect to MCP server {config['qualifiedName']}: {e}")
-            raise e
+        
+        tools_info = [
+            {"name": tool.name, "description": tool.description, "input_schema": tool.inputSchema}
+            for tool in connection.tools or []
+        ]
+        return {'tools': tools_info, 'type': 'standard', 'timestamp': time.time()}
     
-    async def _initialize_single_custom_mcp(self, config: Dict[str, Any]):
-        try:
+    async def _discover_custom_mcp(self, config: Dict[str, Any]) -> Dict[str, Any]:
+        # A separate handler keeps the result to this server's tools, and lets
+        # background refreshes run without touching this wrapper's tools
+        handler = CustomMCPHandler(MCPConnectionManager())
+        async with _discovery_semaphore:
             logger.debug(f"Initializing custom MCP: {config.get('name', 'Unknown')}")
-            await self.custom_handler._initialize_single_custom_mcp(config)
+            await handler._initialize_single_custom_mcp(config)
             logger.debug(f"✓ Initialized custom MCP: {config.get('name', 'Unknown')}")
-            
-            custom_tools = self.custom_handler.get_custom_tools()
-            return {'tools': custom_tools, 'type': 'custom', 'timestamp': time.time()}
-        except Exception as e:
-            logger.error(f"✗ Failed to initialize custom MCP {config.get('name', 'Unknown')}: {e}")
-            raise e
+        
+        return {'tools': handler.get_custom_tools(), 'type': 'custom', 'timestamp': time.time()}
             
     async def _initialize_standard_servers(self, standard_configs: List[Dict[str, Any]]):
         pass
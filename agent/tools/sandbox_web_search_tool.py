@@ -2,9 +2,14 @@ from tavily import AsyncTavilyClient
 import httpx
 from dotenv import load_dotenv
 from agentpress.tool import ToolResult
+from utils.cache import Cache
 from utils.config import config
 from sandbox.tool_base import SandboxToolsBase
 from agentpress.adk_thread_manager import ADKThreadManager
+from typing import Optional
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+import importlib.util
+import hashlib
 import json
 import os
 import datetime
@@ -13,6 +18,60 @@ import logging
 
 # TODO: add subpages, etc... in filters as sometimes its necessary 
 
+# URLs scraped concurrently by one scrape_webpage call
+SCRAPE_CONCURRENCY = 5
+# Upper bound for one URL, including Firecrawl retries
+SCRAPE_URL_TIMEOUT_SECONDS = 120
+SCRAPE_CACHE_TTL_SECONDS = 60 * 60
+SEARCH_CACHE_TTL_SECONDS = 15 * 60
+
+# One client per process, so Firecrawl connections are reused across URLs and runs
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def _get_http_client() -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            # HTTP/2 needs the optional h2 package
+            http2=importlib.util.find_spec("h2") is not None,
+            limits=httpx.Limits(max_connections=50, max_keepalive_connections=20, keepalive_expiry=60),
+            timeout=httpx.Timeout(30.0, connect=10.0),
+        )
+    return _http_client
+
+
+def normalize_url(url: str) -> str:
+    """Canonical form of a URL for cache keys: lower-case scheme and host, no default port, fragment or trailing slash, sorted query."""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc.lower()
+    if (scheme == "http" and netloc.endswith(":80")) or (scheme == "https" and netloc.endswith(":443")):
+        netloc = netloc.rsplit(":", 1)[0]
+    path = parts.path.rstrip("/") if parts.path not in ("", "/") else ""
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, netloc, path, query, ""))
+
+
+def _cache_key(prefix: str, value: str) -> str:
+    return f"{prefix}:{hashlib.sha256(value.encode()).hexdigest()}"
+
+
+async def _cache_get(key: str):
+    try:
+        return await Cache.get(key)
+    except Exception as e:
+        logging.warning(f"Web cache read failed for {key}: {e}")
+        return None
+
+
+async def _cache_set(key: str, value, ttl: int):
+    try:
+        await Cache.set(key, value, ttl=ttl)
+    except Exception as e:
+        logging.warning(f"Web cache write failed for {key}: {e}")
+
+
 class SandboxWebSearchTool(SandboxToolsBase):
     """Tool for performing web searches using Tavily API and web scraping using Firecrawl."""
 
@@ -90,15 +149,23 @@ class SandboxWebSearchTool(SandboxToolsBase):
             else:
                 num_results = 20
 
-            # 使用 Tavily 执行搜索
-            logging.info(f"Executing web search for query: '{query}' with {num_results} results")
-            search_response = await self.tavily_client.search(
-                query=query,
-                max_results=num_results,
-                include_images=True,
-                include_answer="advanced",
-                search_depth="advanced",
-            )
+            # 相同的查询在缓存有效期内直接复用 Tavily 的结果
+            cache_key = _cache_key("web_search", json.dumps([" ".join(query.lower().split()), num_results]))
+            search_response = await _cache_get(cache_key)
+            if search_response is not None:
+                logging.info(f"Web search cache hit for query: '{query}'")
+            else:
+                # 使用 Tavily 执行搜索
+                logging.info(f"Executing web search for query: '{query}' with {num_results} results")
+                search_response = await self.tavily_client.search(
+                    query=query,
+                    max_results=num_results,
+                    include_images=True,
+                    include_answer="advanced",
+                    search_depth="advanced",
+                )
+                if search_response.get('results') or search_response.get('answer'):
+                    await _cache_set(cache_key, search_response, SEARCH_CACHE_TTL_SECONDS)
             
             # 检查是否实际有结果或答案
             results = search_response.get('results', [])
@@ -183,8 +250,17 @@ class SandboxWebSearchTool(SandboxToolsBase):
             
             logging.info(f"Processing {len(url_list)} URLs: {url_list}")
             
-            # Process each URL concurrently and collect results
-            tasks = [self._scrape_single_url(url) for url in url_list]
+            # Process the URLs concurrently, at most SCRAPE_CONCURRENCY at a time
+            semaphore = asyncio.Semaphore(SCRAPE_CONCURRENCY)
+
+            async def scrape_bounded(url: str) -> dict:
+                async with semaphore:
+                    try:
+                        return await asyncio.wait_for(self._scrape_single_url(url), timeout=SCRAPE_URL_TIMEOUT_SECONDS)
+                    except asyncio.TimeoutError:
+                        raise Exception(f"Scraping timed out after {SCRAPE_URL_TIMEOUT_SECONDS}s")
+
+            tasks = [scrape_bounded(url) for url in url_list]
             results = await asyncio.gather(*tasks, return_exceptions=True)
 
             # Process results, handling exceptions
@@ -236,6 +312,54 @@ class SandboxWebSearchTool(SandboxToolsBase):
             logging.error(f"Error in scrape_webpage: {error_message}")
             return self.fail_response(f"Error processing scrape request: {error_message[:200]}")
     
+    async def _firecrawl_scrape(self, url: str) -> dict:
+        """
+        Fetch a URL through the Firecrawl scrape endpoint on the shared client, retrying timeouts.
+        """
+        logging.info(f"Sending request to Firecrawl for URL: {url}")
+        client = _get_http_client()
+        headers = {
+            "Authorization": f"Bearer {self.firecrawl_api_key}",
+            "Content-Type": "application/json",
+        }
+        payload = {
+            "url": url,
+            "formats": ["markdown"]
+        }
+        
+        # Use longer timeout and retry logic for more reliability
+        max_retries = 3
+        timeout_seconds = 30
+        retry_count = 0
+        
+        while retry_count < max_retries:
+            try:
+                logging.info(f"Sending request to Firecrawl (attempt {retry_count + 1}/{max_retries})")
+                response = await client.post(
+                    f"{self.firecrawl_url}/v1/scrape",
+                    json=payload,
+                    headers=headers,
+                    timeout=timeout_seconds,
+                )
+                response.raise_for_status()
+                data = response.json()
+                logging.info(f"Successfully received response from Firecrawl for {url}")
+                break
+            except (httpx.ReadTimeout, httpx.ConnectTimeout, httpx.ReadError) as timeout_err:
+                retry_count += 1
+                logging.warning(f"Request timed out (attempt {retry_count}/{max_retries}): {str(timeout_err)}")
+                if retry_count >= max_retries:
+                    raise Exception(f"Request timed out after {max_retries} attempts with {timeout_seconds}s timeout")
+                # Exponential backoff
+                logging.info(f"Waiting {2 ** retry_count}s before retry")
+                await asyncio.sleep(2 ** retry_count)
+            except Exception as e:
+                # Don't retry on non-timeout errors
+                logging.error(f"Error during scraping: {str(e)}")
+                raise e
+
+        return data
+
     async def _scrape_single_url(self, url: str) -> dict:
         """
         Helper function to scrape a single URL and return the result information.
@@ -249,48 +373,14 @@ class SandboxWebSearchTool(SandboxToolsBase):
         logging.info(f"Scraping single URL: {url}")
         
         try:
-            # ---------- Firecrawl scrape endpoint ----------
-            logging.info(f"Sending request to Firecrawl for URL: {url}")
-            async with httpx.AsyncClient() as client:
-                headers = {
-                    "Authorization": f"Bearer {self.firecrawl_api_key}",
-                    "Content-Type": "application/json",
-                }
-                payload = {
-                    "url": url,
-                    "formats": ["markdown"]
-                }
-                
-                # Use longer timeout and retry logic for more reliability
-                max_retries = 3
-                timeout_seconds = 30
-                retry_count = 0
-                
-                while retry_count < max_retries:
-                    try:
-                        logging.info(f"Sending request to Firecrawl (attempt {retry_count + 1}/{max_retries})")
-                        response = await client.post(
-                            f"{self.firecrawl_url}/v1/scrape",
-                            json=payload,
-                            headers=headers,
-                            timeout=timeout_seconds,
-                        )
-                        response.raise_for_status()
-                        data = response.json()
-                        logging.info(f"Successfully received response from Firecrawl for {url}")
-                        break
-                    except (httpx.ReadTimeout, httpx.ConnectTimeout, httpx.ReadError) as timeout_err:
-                        retry_count += 1
-                        logging.warning(f"Request timed out (attempt {retry_count}/{max_retries}): {str(timeout_err)}")
-                        if retry_count >= max_retries:
-                            raise Exception(f"Request timed out after {max_retries} attempts with {timeout_seconds}s timeout")
-                        # Exponential backoff
-                        logging.info(f"Waiting {2 ** retry_count}s before retry")
-                        await asyncio.sleep(2 ** retry_count)
-                    except Exception as e:
-                        # Don't retry on non-timeout errors
-                        logging.error(f"Error during scraping: {str(e)}")
-                        raise e
+            cache_key = _cache_key("web_scrape", normalize_url(url))
+            data = await _cache_get(cache_key)
+            if data is not None:
+                logging.info(f"Scrape cache hit for URL: {url}")
+            else:
+                data = await self._firecrawl_scrape(url)
+                if data.get("data", {}).get("markdown"):
+                    await _cache_set(cache_key, data, SCRAPE_CACHE_TTL_SECONDS)
 
             # Format the response
             title = data.get("data", {}).get("metadata", {}).get("title", "")
@@ -1,10 +1,7 @@
 import json
 import asyncio
 from typing import Dict, Any, List
-from mcp import ClientSession, StdioServerParameters
-from mcp.client.sse import sse_client
-from mcp.client.stdio import stdio_client
-from mcp.client.streamable_http import streamablehttp_client
+from mcp_module import mcp_session_pool, MCPServerSpec, MCPConnectionError
 from utils.logger import logger
 from .mcp_connection_manager import MCPConnectionManager
 
@@ -58,13 +55,12 @@ class CustomMCPHandler:
         elif custom_type == 'json':
             await self._initialize_json_mcp(server_name, server_config, enabled_tools)
         else:
-            logger.error(f"Custom MCP {server_name}: Unsupported type '{custom_type}'")
+            raise MCPConnectionError(f"Custom MCP {server_name}: Unsupported type '{custom_type}'")
     
     async def _initialize_composio_mcp(self, server_name: str, server_config: Dict[str, Any], enabled_tools: List[str]):
         profile_id = server_config.get('profile_id')
         if not profile_id:
-            logger.error(f"Composio MCP {server_name}: Missing profile_id in config")
-            return
+            raise MCPConnectionError(f"Composio MCP {server_name}: Missing profile_id in config")
         
         try:
             from composio_integration.composio_profile_service import ComposioProfileService
@@ -76,17 +72,15 @@ class CustomMCPHandler:
             
             logger.info(f"Resolved Composio profile {profile_id} to MCP URL")
 
-            async with streamablehttp_client(mcp_url) as (read_stream, write_stream, _):
-                async with ClientSession(read_stream, write_stream) as session:
-                    await session.initialize()
-                    tools_result = await session.list_tools()
-                    tools = tools_result.tools if hasattr(tools_result, 'tools') else tools_result
-                    
-                    self._register_custom_tools(tools, server_name, enabled_tools, 'composio', server_config)
-                    logger.info(f"Registered {len(tools)} tools from Composio MCP {server_name}")
+            tools_result = await mcp_session_pool.list_tools(MCPServerSpec.http(mcp_url, name=server_name))
+            tools = tools_result.tools if hasattr(tools_result, 'tools') else tools_result
+            
+            self._register_custom_tools(tools, server_name, enabled_tools, 'composio', server_config)
+            logger.info(f"Registered {len(tools)} tools from Composio MCP {server_name}")
             
         except Exception as e:
             logger.error(f"Failed to initialize Composio MCP {server_name}: {str(e)}")
+            raise
     
     async def _initialize_pipedream_mcp(self, server_name: str, server_config: Dict[str, Any], enabled_tools: List[str]):
         app_slug = server_config.get('app_slug')
@@ -96,8 +90,7 @@ class CustomMCPHandler:
         
         external_user_id = await self._resolve_external_user_id(server_config)
         if not external_user_id:
-            logger.error(f"Custom MCP {server_name}: Missing external_user_id for Pipedream")
-            return
+            raise MCPConnectionError(f"Custom MCP {server_name}: Missing external_user_id for Pipedream")
         
         server_config['external_user_id'] = external_user_id
         oauth_app_id = server_config.get('oauth_app_id')
@@ -107,8 +100,6 @@ class CustomMCPHandler:
         try:
             import os
             from pipedream import connection_service
-            from mcp import ClientSession
-            from mcp.client.streamable_http import streamablehttp_client
             
             access_token = await connection_service._ensure_access_token()
             
@@ -131,13 +122,11 @@ class CustomMCPHandler:
 
             url = "https://remote.mcp.pipedream.net"
             
-            async with streamablehttp_client(url, headers=headers) as (read_stream, write_stream, _):
-                async with ClientSession(read_stream, write_stream) as session:
-                    await session.initialize()
-                    tools_result = await session.list_tools()
-                    tools = tools_result.tools if hasattr(tools_result, 'tools') else tools_result
-                    
-                    self._register_custom_tools(tools, server_name, enabled_tools, 'pipedream', server_config)
+            spec = MCPServerSpec.http(url, headers=headers, name=f"pipedream:{app_slug}")
+            tools_result = await mcp_session_pool.list_tools(spec)
+            tools = tools_result.tools if hasattr(tools_result, 'tools') else tools_result
+            
+            self._register_custom_tools(tools, server_name, enabled_tools, 'pipedream', server_config)
                     
         except Exception as e:
             logger.error(f"Pipedream MCP {server_name}: Connection failed - {str(e)}")
@@ -145,39 +134,36 @@ class CustomMCPHandler:
     
     async def _initialize_sse_mcp(self, server_name: str, server_config: Dict[str, Any], enabled_tools: List[str]):
         if 'url' not in server_config:
-            logger.error(f"Custom MCP {server_name}: Missing 'url' in config")
-            return
+            raise MCPConnectionError(f"Custom MCP {server_name}: Missing 'url' in config")
         
         server_info = await self.connection_manager.connect_sse_server(server_name, server_config)
         if server_info.get('status') == 'connected':
             tools_info = server_info.get('tools', [])
             self._register_custom_tools_from_info(tools_info, server_name, enabled_tools, 'sse', server_config)
         else:
-            logger.error(f"Failed to connect to custom MCP {server_name}")
+            raise MCPConnectionError(f"Failed to connect to custom MCP {server_name}")
     
     async def _initialize_http_mcp(self, server_name: str, server_config: Dict[str, Any], enabled_tools: List[str]):
         if 'url' not in server_config:
-            logger.error(f"Custom MCP {server_name}: Missing 'url' in config")
-            return
+            raise MCPConnectionError(f"Custom MCP {server_name}: Missing 'url' in config")
         
         server_info = await self.connection_manager.connect_http_server(server_name, server_config)
         if server_info.get('status') == 'connected':
             tools_info = server_info.get('tools', [])
             self._register_custom_tools_from_info(tools_info, server_name, enabled_tools, 'http', server_config)
         else:
-            logger.error(f"Failed to connect to custom MCP {server_name}")
+            raise MCPConnectionError(f"Failed to connect to custom MCP {server_name}")
     
     async def _initialize_json_mcp(self, server_name: str, server_config: Dict[str, Any], enabled_tools: List[str]):
         if 'command' not in server_config:
-            logger.error(f"Custom MCP {server_name}: Missing 'command' in config")
-            return
+            raise MCPConnectionError(f"Custom MCP {server_name}: Missing 'command' in config")
         
         server_info = await self.connection_manager.connect_stdio_server(server_name, server_config)
         if server_info.get('status') == 'connected':
             tools_info = server_info.get('tools', [])
             self._register_custom_tools_from_info(tools_info, server_name, enabled_tools, 'json', server_config)
         else:
-            logger.error(f"Failed to connect to custom MCP {server_name}")
+            raise MCPConnectionError(f"Failed to connect to custom MCP {server_name}")
     
     async def _resolve_external_user_id(self, server_config: Dict[str, Any]) -> str:
         profile_id = server_config.get('profile_id')
@@ -5,13 +5,13 @@ from utils.cache import Cache
 from utils.logger import logger
 from utils.config import config
 from services import redis
+from services import agent_run_stream
 from run_agent_background import update_agent_run_status
 
 
 async def _cleanup_redis_response_list(agent_run_id: str):
     try:
-        response_list_key = f"agent_run:{agent_run_id}:responses"
-        await redis.delete(response_list_key)
+        await agent_run_stream.delete(agent_run_id)
         logger.debug(f"Cleaned up Redis response list for agent run {agent_run_id}")
     except Exception as e:
         logger.warning(f"Failed to clean up Redis response list for {agent_run_id}: {str(e)}")
@@ -33,25 +33,16 @@ async def stop_agent_run(db, agent_run_id: str, error_message: Optional[str] = N
     client = await db.client
     final_status = "failed" if error_message else "stopped"
 
-    response_list_key = f"agent_run:{agent_run_id}:responses"
-    all_responses = []
-    try:
-        all_responses_json = await redis.lrange(response_list_key, 0, -1)
-        all_responses = [json.loads(r) for r in all_responses_json]
-        logger.info(f"Fetched {len(all_responses)} responses from Redis for DB update on stop/fail: {agent_run_id}")
-    except Exception as e:
-        logger.error(f"Failed to fetch responses from Redis for {agent_run_id} during stop/fail: {e}")
-
     update_success = await update_agent_run_status(
-        client, agent_run_id, final_status, error=error_message, responses=all_responses
+        client, agent_run_id, final_status, error=error_message
     )
 
     if not update_success:
         logger.error(f"Failed to update database status for stopped/failed run {agent_run_id}")
 
-    global_control_channel = f"agent_run:{agent_run_id}:control"
+    global_control_channel = agent_run_stream.control_channel(agent_run_id)
     try:
-        await redis.publish(global_control_channel, "STOP")
+        await agent_run_stream.publish_control(agent_run_id, "STOP")
         logger.debug(f"Published STOP signal to global channel {global_control_channel}")
     except Exception as e:
         logger.error(f"Failed to publish STOP signal to global channel {global_control_channel}: {str(e)}")
@@ -6,6 +6,7 @@ from uuid import uuid4, UUID
 from enum import Enum
 
 from services.postgresql import DBConnection
+from services.adk_registry import adk_registry
 from utils.logger import logger
 
 
@@ -147,6 +148,9 @@ class VersionService:
         
         if not result.data:
             raise Exception("Failed to update agent current version")
+
+        # 当前版本变更后，释放进程内缓存的旧版本 ADK Agent/Runner
+        adk_registry.invalidate(reason=f"agent {agent_id} switched to version {version_id}")
     
     def _version_from_db_row(self, row: Dict[str, Any]) -> AgentVersion:
         config_raw = row.get('config', '{}')
@@ -7,9 +7,12 @@ Google ADK 版本的线程管理器
 import json
 from typing import List, Dict, Any, Optional, Type, Union, AsyncGenerator, Literal
 from services.postgresql import DBConnection
+from services import usage_ledger
 from utils.logger import logger
 from agentpress.tool_registry import ToolRegistry
 from agentpress.context_manager import ContextManager
+from agentpress.message_loader import IncrementalMessageLoader
+from agentpress.message_sink import MessageSink
 from agentpress.response_processor import ResponseProcessor, ProcessorConfig
 from agentpress.tool import Tool
 
@@ -37,6 +40,63 @@ from utils.config import config
 # Type alias for tool choice
 ToolChoice = Literal["auto", "required", "none"]
 
+def _event_to_message(event: Dict[str, Any]) -> Dict[str, Any]:
+    """将 events 表的一行转换为与原始 messages 表格式兼容的消息对象"""
+    # 解析事件内容
+    content = event.get('content', {})
+    if isinstance(content, str):
+        try:
+            content = json.loads(content)
+        except json.JSONDecodeError:
+            # 如果不是JSON，当作纯文本处理
+            content = {"content": content}
+
+    # 构建与原始 messages 表格式兼容的消息对象
+    message = {
+        "role": event.get('author', 'user'),
+        "message_id": event.get('id'),
+        "timestamp": event.get('timestamp'),
+        "app_name": event.get('app_name'),
+        "user_id": event.get('user_id'),
+        "session_id": event.get('session_id'),
+        "invocation_id": event.get('invocation_id')
+    }
+
+    # 处理timestamp字段，确保datetime对象被转换为字符串
+    if message.get('timestamp') and hasattr(message['timestamp'], 'isoformat'):
+        message['timestamp'] = message['timestamp'].isoformat()
+
+    # 处理内容格式 - 兼容原始格式和ADK格式
+    if isinstance(content, dict):
+        # 处理ADK格式 {"role": "user", "parts": [{"text": "..."}]}
+        if 'parts' in content and isinstance(content['parts'], list):
+            # 提取ADK parts中的文本内容
+            text_parts = []
+            for part in content['parts']:
+                if isinstance(part, dict) and 'text' in part:
+                    text_parts.append(part['text'])
+            message["content"] = ' '.join(text_parts).strip()
+        # 如果存在：处理原始格式 {"role": "user", "content": "..."}
+        elif 'content' in content:
+            message["content"] = content['content']
+        else:
+            # 如果都没有，将整个对象转为字符串（向后兼容）
+            message["content"] = json.dumps(content)
+    else:
+        message["content"] = str(content)
+
+    return message
+
+
+# 进程级的增量消息加载器，跨 ADKThreadManager 实例共享缓存
+_adk_message_loader = IncrementalMessageLoader(
+    name="adk",
+    columns=['id', 'author', 'content', 'timestamp', 'session_id', 'user_id', 'app_name', 'invocation_id'],
+    convert=_event_to_message,
+    authors=['user', 'assistant'],
+)
+
+
 class ADKThreadManager:
     """
     Google ADK 版本的线程管理器
@@ -56,6 +116,7 @@ class ADKThreadManager:
             raise ImportError("Google ADK is not available. Please install google-adk package.")
         
         self.db = DBConnection()
+        self.message_sink = MessageSink(self.db)
         self.tool_registry = ToolRegistry()
         self.trace = trace
         self.is_agent_builder = is_agent_builder
@@ -80,6 +141,22 @@ class ADKThreadManager:
         # self.runner: Optional[Runner] = None
         # self.session_service: Optional[DatabaseSessionService] = None
 
+    async def _flush_messages_after(self, response_gen: AsyncGenerator) -> AsyncGenerator:
+        """Yield the run's responses, then write messages still buffered by the message sink.
+
+        Raises MessageFlushError if buffered messages could not be written.
+        """
+        try:
+            async for chunk in response_gen:
+                yield chunk
+        finally:
+            await self.message_sink.flush(final=True)
+
+    def _with_message_flush(self, response):
+        if not hasattr(response, '__aiter__'):
+            return response
+        return self._flush_messages_after(response)
+
     def add_tool(self, tool_class: Type[Tool], function_names: Optional[List[str]] = None, **kwargs):
         """Add a tool to the ThreadManager."""
         self.tool_registry.register_tool(tool_class, function_names, **kwargs)
@@ -108,6 +185,9 @@ class ADKThreadManager:
 
         This method fetches messages from the events table and formats them
         to match the original messages table format for downstream compatibility.
+        Converted messages are cached per thread, so repeated calls only fetch
+        events newer than the last one seen. Summary events are not applied
+        here: the model gets its history from the ADK session, which skips them.
 
         Args:
             thread_id: The ID of the thread to get messages for.
@@ -119,94 +199,7 @@ class ADKThreadManager:
         client = await self.db.client
 
         try:
-            # 获取事件，分批获取，避免数据库过载
-            all_events = []
-            batch_size = 1000
-            offset = 0
-            
-            while True:
-                # 从 events 表获取消息，按时间戳排序
-                result = await client.table('events').select(
-                    'id, author, content, timestamp, session_id, user_id, app_name, invocation_id'
-                ).eq('session_id', thread_id).in_(
-                    'author', ['user', 'assistant']
-                ).order('timestamp').range(offset, offset + batch_size - 1).execute()
-                
-                if not result.data or len(result.data) == 0:
-                    break
-                    
-                all_events.extend(result.data)
-                
-                # 如果获取的记录数小于 batch_size，则表示已经到达末尾
-                if len(result.data) < batch_size:
-                    break
-                    
-                offset += batch_size
-            
-            # 使用 all_events 而不是 result.data 
-            result_data = all_events
-
-            # 解析返回的数据，并转换为原始消息格式
-            if not result_data:
-                return []
-
-            # 将事件转换为原始消息格式，用于下游兼容
-            messages = []
-            for event in result_data:
-                try:
-                    # 确保event是字典格式
-                    if hasattr(event, '__dict__'):
-                        event = dict(event)
-                    
-                    # 解析事件内容
-                    content = event.get('content', {})
-                    if isinstance(content, str):
-                        try:
-                            content = json.loads(content)
-                        except json.JSONDecodeError:
-                            # 如果不是JSON，当作纯文本处理
-                            content = {"content": content}
-                    
-                    # 构建与原始 messages 表格式兼容的消息对象
-                    message = {
-                        "role": event.get('author', 'user'),
-                        "message_id": event.get('id'),
-                        "timestamp": event.get('timestamp'),
-                        "app_name": event.get('app_name'),
-                        "user_id": event.get('user_id'),
-                        "session_id": event.get('session_id'),
-                        "invocation_id": event.get('invocation_id')
-                    }
-                    
-                    # 处理timestamp字段，确保datetime对象被转换为字符串
-                    if message.get('timestamp') and hasattr(message['timestamp'], 'isoformat'):
-                        message['timestamp'] = message['timestamp'].isoformat()
-                    
-                    # 处理内容格式 - 兼容原始格式和ADK格式
-                    if isinstance(content, dict):
-                        # 处理ADK格式 {"role": "user", "parts": [{"text": "..."}]}
-                        if 'parts' in content and isinstance(content['parts'], list):
-                            # 提取ADK parts中的文本内容
-                            text_parts = []
-                            for part in content['parts']:
-                                if isinstance(part, dict) and 'text' in part:
-                                    text_parts.append(part['text'])
-                            message["content"] = ' '.join(text_parts).strip()
-                        # 如果存在：处理原始格式 {"role": "user", "content": "..."}
-                        elif 'content' in content:
-                            message["content"] = content['content']
-                        else:
-                            # 如果都没有，将整个对象转为字符串（向后兼容）
-                            message["content"] = json.dumps(content)
-                    else:
-                        message["content"] = str(content)
-                    
-                    messages.append(message)
-                    
-                except Exception as e:
-                    logger.error(f"Failed to parse event {event.get('id')}: {e}")
-                    continue
-
+            messages = await _adk_message_loader.load(client, thread_id)
             logger.debug(f"Retrieved {len(messages)} messages from events table for thread {thread_id}")
             return messages
 
@@ -291,14 +284,13 @@ class ADKThreadManager:
                 # 2. 检查 token 计数，再继续
                 token_count = 0
                 try:
-                    from litellm.utils import token_counter # type: ignore
-                    # 使用修改后的working_system_prompt进行token计数
-                    token_count = token_counter(model=llm_model, messages=[working_system_prompt] + messages)
+                    # 使用修改后的working_system_prompt进行token计数（按消息缓存）
+                    token_count = self.context_manager.count_tokens([working_system_prompt] + messages, llm_model)
                     token_threshold = self.context_manager.token_threshold
                     logger.info(f"Thread {thread_id} token count: {token_count}/{token_threshold} ({(token_count/token_threshold)*100:.1f}%)")
 
                 except Exception as e:
-                    logger.error(f"Error counting tokens or summarizing: {str(e)}")
+                    logger.error(f"Error counting tokens: {str(e)}")
 
                 # 3. 预处理输入消息，准备LLM调用 + 添加临时消息（如果存在）
                 # 使用修改后的working_system_prompt，可能包含XML示例
@@ -538,10 +530,10 @@ class ADKThreadManager:
         if native_max_auto_continues == 0:
             print("自动继续被禁用 (native_max_auto_continues=0)")
             # Pass the potentially modified system prompt and temp message
-            return await _run_once(temporary_message)
+            return self._with_message_flush(await _run_once(temporary_message))
         
         # 否则返回自动继续包装器生成器
-        return auto_continue_wrapper()
+        return self._with_message_flush(auto_continue_wrapper())
         
         # try:
         #     # if not self.runner or not self.session:
@@ -740,6 +732,14 @@ class ADKThreadManager:
         if agent_version_id:
             data_to_insert['agent_version_id'] = agent_version_id
 
+        # LLM 响应结束时累加用量台账（写后缓冲和直接写入都需要）
+        if type == 'assistant_response_end' and isinstance(content, dict):
+            await usage_ledger.record_response_usage(client, thread_id, content)
+
+        if config.MESSAGE_WRITE_BEHIND:
+            # 写后批量落库：立即返回带客户端生成 message_id 的消息行
+            return await self.message_sink.add(data_to_insert)
+
         try:
             # 插入消息
             result = await client.table('messages').insert(data_to_insert)
@@ -3,28 +3,103 @@ Context Management for AgentPress Threads.
 
 This module handles token counting and thread summarization to prevent
 reaching the context window limitations of LLM models.
+
+Token counts are computed per message and cached process-wide, keyed by the
+model family, the message_id and a hash of the message, so an unchanged
+message is tokenized once no matter how many turns or compression passes see
+it. The compression passes keep a per-message count array and adjust the
+running total when a message is rewritten instead of re-counting the whole
+thread.
 """
 
+import hashlib
 import json
-from typing import List, Dict, Any, Optional, Union
+from collections import OrderedDict
+from typing import Callable, List, Dict, Any, Optional, Tuple, Union
 
 from litellm.utils import token_counter
 from services.postgresql import DBConnection
 from utils.logger import logger
 
 DEFAULT_TOKEN_THRESHOLD = 120000
+# Per-message token counts kept in memory per process
+TOKEN_CACHE_SIZE = 50000
+
+
+def _model_family(llm_model: str) -> str:
+    """Strip the provider prefix; models of the same name share a tokenizer."""
+    return (llm_model or "").lower().rsplit("/", 1)[-1]
+
+
+class TokenCountCache:
+    """LRU cache of per-message token counts.
+
+    Keys are (model family, message_id, hash of the message), so a message that
+    is rewritten (e.g. compressed) gets a new entry and stale counts are never used.
+    A message list counts as the sum of its messages, which overestimates the
+    litellm total by the few tokens of per-request priming.
+    """
+
+    def __init__(self, max_entries: int = TOKEN_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._counts: "OrderedDict[Tuple[str, Optional[str], str], int]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _digest(msg: Any) -> str:
+        if isinstance(msg, dict):
+            payload = json.dumps(msg, sort_keys=True, default=str)
+        else:
+            payload = str(msg)
+        return hashlib.blake2b(payload.encode("utf-8", "surrogatepass"), digest_size=16).hexdigest()
+
+    def count(self, llm_model: str, msg: Any) -> int:
+        """Return the token count of a single message."""
+        message_id = msg.get("message_id") if isinstance(msg, dict) else None
+        key = (_model_family(llm_model), message_id, self._digest(msg))
+        cached = self._counts.get(key)
+        if cached is not None:
+            self.hits += 1
+            self._counts.move_to_end(key)
+            return cached
+
+        self.misses += 1
+        if isinstance(msg, dict):
+            tokens = token_counter(model=llm_model, messages=[msg])
+        else:
+            tokens = token_counter(model=llm_model, text=str(msg))
+        self._counts[key] = tokens
+        if len(self._counts) > self.max_entries:
+            self._counts.popitem(last=False)
+        return tokens
+
+    def count_each(self, llm_model: str, messages: List[Any]) -> List[int]:
+        """Return the token count of every message."""
+        return [self.count(llm_model, msg) for msg in messages]
+
+
+# Shared by every ContextManager in the process
+token_count_cache = TokenCountCache()
+
 
 class ContextManager:
     """Manages thread context including token counting and summarization."""
     
-    def __init__(self, token_threshold: int = DEFAULT_TOKEN_THRESHOLD):
+    def __init__(self, token_threshold: int = DEFAULT_TOKEN_THRESHOLD, token_cache: Optional[TokenCountCache] = None):
         """Initialize the ContextManager.
         
         Args:
             token_threshold: Token count threshold to trigger summarization
+            token_cache: Per-message token count cache (defaults to the process-wide cache)
         """
         self.db = DBConnection()
         self.token_threshold = token_threshold
+        self.token_cache = token_cache or token_count_cache
+
+    def count_tokens(self, messages: List[Dict[str, Any]], llm_model: str) -> int:
+        """Count the tokens of a message list using the per-message cache."""
+        return sum(self.token_cache.count_each(llm_model, messages))
 
     def is_tool_result_message(self, msg: Dict[str, Any]) -> bool:
         """Check if a message is a tool result message."""
@@ -107,78 +182,62 @@ class ContextManager:
             else:
                 return msg_content
   
-    def compress_tool_result_messages(self, messages: List[Dict[str, Any]], llm_model: str, max_tokens: Optional[int], token_threshold: int = 1000) -> List[Dict[str, Any]]:
-        """Compress the tool result messages except the most recent one."""
-        uncompressed_total_token_count = token_counter(model=llm_model, messages=messages)
+    def _compress_messages_where(
+        self,
+        messages: List[Dict[str, Any]],
+        counts: List[int],
+        llm_model: str,
+        max_tokens: Optional[int],
+        token_threshold: int,
+        predicate: Callable[[Dict[str, Any]], bool],
+    ) -> List[Dict[str, Any]]:
+        """Compress the messages matching ``predicate`` except the most recent one.
+
+        ``counts`` holds the token count of each message and is updated in place
+        for every message that gets rewritten.
+        """
         max_tokens_value = max_tokens or (100 * 1000)
 
-        if uncompressed_total_token_count > max_tokens_value:
-            _i = 0  # Count the number of ToolResult messages
-            for msg in reversed(messages):  # Start from the end and work backwards
-                if not isinstance(msg, dict):
-                    continue  # Skip non-dict messages
-                if self.is_tool_result_message(msg):  # Only compress ToolResult messages
-                    _i += 1  # Count the number of ToolResult messages
-                    msg_token_count = token_counter(messages=[msg])  # Count the number of tokens in the message
-                    if msg_token_count > token_threshold:  # If the message is too long
-                        if _i > 1:  # If this is not the most recent ToolResult message
-                            message_id = msg.get('message_id')  # Get the message_id
-                            if message_id:
-                                msg["content"] = self.compress_message(msg["content"], message_id, token_threshold * 3)
-                            else:
-                                logger.warning(f"UNEXPECTED: Message has no message_id {str(msg)[:100]}")
+        if sum(counts) > max_tokens_value:
+            _i = 0  # Count the number of matching messages
+            for index in range(len(messages) - 1, -1, -1):  # Start from the end and work backwards
+                msg = messages[index]
+                if not isinstance(msg, dict) or not predicate(msg):
+                    continue
+                _i += 1
+                if counts[index] > token_threshold:  # If the message is too long
+                    if _i > 1:  # If this is not the most recent matching message
+                        message_id = msg.get('message_id')
+                        if message_id:
+                            msg["content"] = self.compress_message(msg["content"], message_id, token_threshold * 3)
                         else:
-                            msg["content"] = self.safe_truncate(msg["content"], int(max_tokens_value * 2))
+                            logger.warning(f"UNEXPECTED: Message has no message_id {str(msg)[:100]}")
+                            continue
+                    else:
+                        msg["content"] = self.safe_truncate(msg["content"], int(max_tokens_value * 2))
+                    counts[index] = self.token_cache.count(llm_model, msg)
         return messages
 
-    def compress_user_messages(self, messages: List[Dict[str, Any]], llm_model: str, max_tokens: Optional[int], token_threshold: int = 1000) -> List[Dict[str, Any]]:
-        """Compress the user messages except the most recent one."""
-        uncompressed_total_token_count = token_counter(model=llm_model, messages=messages)
-        max_tokens_value = max_tokens or (100 * 1000)
+    def _is_user_message(self, msg: Dict[str, Any]) -> bool:
+        return msg.get('role') == 'user'
 
-        if uncompressed_total_token_count > max_tokens_value:
-            _i = 0  # Count the number of User messages
-            for msg in reversed(messages):  # Start from the end and work backwards
-                if not isinstance(msg, dict):
-                    continue  # Skip non-dict messages
-                if msg.get('role') == 'user':  # Only compress User messages
-                    _i += 1  # Count the number of User messages
-                    msg_token_count = token_counter(messages=[msg])  # Count the number of tokens in the message
-                    if msg_token_count > token_threshold:  # If the message is too long
-                        if _i > 1:  # If this is not the most recent User message
-                            message_id = msg.get('message_id')  # Get the message_id
-                            if message_id:
-                                msg["content"] = self.compress_message(msg["content"], message_id, token_threshold * 3)
-                            else:
-                                logger.warning(f"UNEXPECTED: Message has no message_id {str(msg)[:100]}")
-                        else:
-                            msg["content"] = self.safe_truncate(msg["content"], int(max_tokens_value * 2))
-        return messages
+    def _is_assistant_message(self, msg: Dict[str, Any]) -> bool:
+        return msg.get('role') == 'assistant'
+
+    def compress_tool_result_messages(self, messages: List[Dict[str, Any]], llm_model: str, max_tokens: Optional[int], token_threshold: int = 1000, counts: Optional[List[int]] = None) -> List[Dict[str, Any]]:
+        """Compress the tool result messages except the most recent one."""
+        counts = counts if counts is not None else self.token_cache.count_each(llm_model, messages)
+        return self._compress_messages_where(messages, counts, llm_model, max_tokens, token_threshold, self.is_tool_result_message)
+
+    def compress_user_messages(self, messages: List[Dict[str, Any]], llm_model: str, max_tokens: Optional[int], token_threshold: int = 1000, counts: Optional[List[int]] = None) -> List[Dict[str, Any]]:
+        """Compress the user messages except the most recent one."""
+        counts = counts if counts is not None else self.token_cache.count_each(llm_model, messages)
+        return self._compress_messages_where(messages, counts, llm_model, max_tokens, token_threshold, self._is_user_message)
 
-    def compress_assistant_messages(self, messages: List[Dict[str, Any]], llm_model: str, max_tokens: Optional[int], token_threshold: int = 1000) -> List[Dict[str, Any]]:
+    def compress_assistant_messages(self, messages: List[Dict[str, Any]], llm_model: str, max_tokens: Optional[int], token_threshold: int = 1000, counts: Optional[List[int]] = None) -> List[Dict[str, Any]]:
         """Compress the assistant messages except the most recent one."""
-        uncompressed_total_token_count = token_counter(model=llm_model, messages=messages)
-        max_tokens_value = max_tokens or (100 * 1000)
-        
-        if uncompressed_total_token_count > max_tokens_value:
-            _i = 0  # Count the number of Assistant messages
-            for msg in reversed(messages):  # Start from the end and work backwards
-                if not isinstance(msg, dict):
-                    continue  # Skip non-dict messages
-                if msg.get('role') == 'assistant':  # Only compress Assistant messages
-                    _i += 1  # Count the number of Assistant messages
-                    msg_token_count = token_counter(messages=[msg])  # Count the number of tokens in the message
-                    if msg_token_count > token_threshold:  # If the message is too long
-                        if _i > 1:  # If this is not the most recent Assistant message
-                            message_id = msg.get('message_id')  # Get the message_id
-                            if message_id:
-                                msg["content"] = self.compress_message(msg["content"], message_id, token_threshold * 3)
-                            else:
-                                logger.warning(f"UNEXPECTED: Message has no message_id {str(msg)[:100]}")
-                        else:
-                            msg["content"] = self.safe_truncate(msg["content"], int(max_tokens_value * 2))
-                            
-        return messages
+        counts = counts if counts is not None else self.token_cache.count_each(llm_model, messages)
+        return self._compress_messages_where(messages, counts, llm_model, max_tokens, token_threshold, self._is_assistant_message)
 
     def remove_meta_messages(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Remove meta messages from the messages, but preserve ADK metadata fields."""
@@ -250,24 +309,29 @@ class ContextManager:
         result = messages
         # result = self.remove_meta_messages(result)
 
-        uncompressed_total_token_count = token_counter(model=llm_model, messages=result)
+        # Count every message once; each pass only re-counts the messages it rewrites
+        counts = self.token_cache.count_each(llm_model, result)
+        uncompressed_total_token_count = sum(counts)
 
-        result = self.compress_tool_result_messages(result, llm_model, max_tokens, token_threshold)
-        result = self.compress_user_messages(result, llm_model, max_tokens, token_threshold)
-        result = self.compress_assistant_messages(result, llm_model, max_tokens, token_threshold)
+        # Halve the per-message threshold until the thread fits (messages are compressed in place)
+        for remaining_iterations in range(max_iterations, -1, -1):
+            self.compress_tool_result_messages(result, llm_model, max_tokens, token_threshold, counts=counts)
+            self.compress_user_messages(result, llm_model, max_tokens, token_threshold, counts=counts)
+            self.compress_assistant_messages(result, llm_model, max_tokens, token_threshold, counts=counts)
 
-        compressed_token_count = token_counter(model=llm_model, messages=result)
+            compressed_token_count = sum(counts)
 
-        logger.info(f"compress_messages: {uncompressed_total_token_count} -> {compressed_token_count}")  # Log the token compression for debugging later
+            logger.info(f"compress_messages: {uncompressed_total_token_count} -> {compressed_token_count}")  # Log the token compression for debugging later
 
-        if max_iterations <= 0:
-            logger.warning(f"compress_messages: Max iterations reached, omitting messages")
-            result = self.compress_messages_by_omitting_messages(messages, llm_model, max_tokens)
-            return result
+            if remaining_iterations <= 0:
+                logger.warning(f"compress_messages: Max iterations reached, omitting messages")
+                return self.compress_messages_by_omitting_messages(result, llm_model, max_tokens)
+
+            if compressed_token_count <= max_tokens:
+                break
 
-        if compressed_token_count > max_tokens:
             logger.warning(f"Further token compression is needed: {compressed_token_count} > {max_tokens}")
-            result = self.compress_messages(messages, llm_model, max_tokens, token_threshold // 2, max_iterations - 1)
+            token_threshold //= 2
 
         return self.middle_out_messages(result)
     
@@ -295,7 +359,8 @@ class ContextManager:
         result = self.remove_meta_messages(result)
 
         # Early exit if no compression needed
-        initial_token_count = token_counter(model=llm_model, messages=result)
+        counts = self.token_cache.count_each(llm_model, result)
+        initial_token_count = sum(counts)
         max_allowed_tokens = max_tokens or (100 * 1000)
         
         if initial_token_count <= max_allowed_tokens:
@@ -304,9 +369,11 @@ class ContextManager:
         # Separate system message (assumed to be first) from conversation messages
         system_message = messages[0] if messages and isinstance(messages[0], dict) and messages[0].get('role') == 'system' else None
         conversation_messages = result[1:] if system_message else result
+        conversation_counts = counts[1:] if system_message else counts
+        system_token_count = self.token_cache.count(llm_model, system_message) if system_message else 0
         
         safety_limit = 500
-        current_token_count = initial_token_count
+        current_token_count = system_token_count + sum(conversation_counts)
         
         while current_token_count > max_allowed_tokens and safety_limit > 0:
             safety_limit -= 1
@@ -320,23 +387,23 @@ class ContextManager:
                 # Remove from middle, keeping recent and early context
                 middle_start = len(conversation_messages) // 2 - (removal_batch_size // 2)
                 middle_end = middle_start + removal_batch_size
+                current_token_count -= sum(conversation_counts[middle_start:middle_end])
                 conversation_messages = conversation_messages[:middle_start] + conversation_messages[middle_end:]
+                conversation_counts = conversation_counts[:middle_start] + conversation_counts[middle_end:]
             else:
                 # Remove from earlier messages, preserving recent context
                 messages_to_remove = min(removal_batch_size, len(conversation_messages) // 2)
                 if messages_to_remove > 0:
+                    current_token_count -= sum(conversation_counts[:messages_to_remove])
                     conversation_messages = conversation_messages[messages_to_remove:]
+                    conversation_counts = conversation_counts[messages_to_remove:]
                 else:
                     # Can't remove any more messages
                     break
 
-            # Recalculate token count
-            messages_to_count = ([system_message] + conversation_messages) if system_message else conversation_messages
-            current_token_count = token_counter(model=llm_model, messages=messages_to_count)
-
         # Prepare final result
         final_messages = ([system_message] + conversation_messages) if system_message else conversation_messages
-        final_token_count = token_counter(model=llm_model, messages=final_messages)
+        final_token_count = current_token_count
         
         logger.info(f"compress_messages_by_omitting_messages: {initial_token_count} -> {final_token_count} tokens ({len(messages)} -> {len(final_messages)} messages)")
             
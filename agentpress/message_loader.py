@@ -0,0 +1,199 @@
+"""
+Incremental message loading for AgentPress threads.
+
+get_llm_messages used to reload a thread's entire event history (1000-row
+OFFSET batches) on every agent iteration. This module keeps a per-thread,
+process-wide cache of already-converted messages together with the timestamp
+of the newest event, and only fetches events after that cursor using keyset
+pagination, so each loop iteration costs O(new events) in database I/O.
+
+Events are not guaranteed to be committed in timestamp order (ADK stamps an
+event when it is created and writes it when the step finishes), so every
+refresh re-scans a short lookback window before the cursor and de-duplicates
+by event id. Late events are inserted at their timestamp position.
+
+Optionally the cache is mirrored to Redis so another worker process picking up
+the same thread can resume from the cached state instead of a full reload.
+
+Deleting or rewriting existing events is not visible to a cursor, so every
+cache entry records the thread's event version (services.event_version) and is
+discarded when the version changed since it was built, in any process.
+"""
+
+import bisect
+import copy
+import json
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from services import redis
+from services.event_version import get_event_version
+from utils.config import config
+from utils.logger import logger
+
+# Number of threads whose messages are kept in memory per process
+THREAD_CACHE_SIZE = 256
+# Re-scan window before the cursor to pick up events committed out of order
+LOOKBACK_SECONDS = 300
+# Rows per keyset page
+BATCH_SIZE = 1000
+# Redis mirror TTL
+REDIS_TTL_SECONDS = 3600
+
+
+class _ThreadMessages:
+    """Converted messages of one thread, ordered by event timestamp."""
+
+    __slots__ = ("messages", "timestamps", "ids", "last_timestamp", "version")
+
+    def __init__(self, version: Optional[str] = None):
+        self.messages: List[Dict[str, Any]] = []
+        self.timestamps: List[datetime] = []
+        self.ids: set = set()
+        self.last_timestamp: Optional[datetime] = None
+        # Event version of the thread when this entry was built (None: not validated)
+        self.version = version
+
+    def add(self, event_id: str, timestamp: datetime, message: Dict[str, Any]) -> None:
+        # Common case: appended in order. Late events are inserted in place.
+        index = bisect.bisect_right(self.timestamps, timestamp)
+        self.timestamps.insert(index, timestamp)
+        self.messages.insert(index, message)
+        self.ids.add(event_id)
+        if self.last_timestamp is None or timestamp > self.last_timestamp:
+            self.last_timestamp = timestamp
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """Return copies safe for callers that modify messages in place (e.g. ContextManager)."""
+        return [
+            dict(message) if isinstance(message.get("content"), (str, type(None))) else copy.deepcopy(message)
+            for message in self.messages
+        ]
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "messages": self.messages,
+            "timestamps": [ts.isoformat() for ts in self.timestamps],
+            "version": self.version,
+        }, default=str)
+
+    @classmethod
+    def from_json(cls, raw: str) -> "_ThreadMessages":
+        data = json.loads(raw)
+        entry = cls(data.get("version"))
+        entry.messages = data["messages"]
+        entry.timestamps = [datetime.fromisoformat(ts) for ts in data["timestamps"]]
+        entry.ids = {message.get("message_id") for message in entry.messages}
+        entry.last_timestamp = entry.timestamps[-1] if entry.timestamps else None
+        return entry
+
+
+class IncrementalMessageLoader:
+    """Loads a thread's LLM messages from the events table incrementally.
+
+    Args:
+        name: Cache namespace (each converter gets its own cache).
+        columns: Columns of the events table passed to ``convert``; must include id and timestamp.
+        convert: Turns an event row (dict) into a message dict, or None to skip it.
+        authors: Event authors to include.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        columns: List[str],
+        convert: Callable[[Dict[str, Any]], Optional[Dict[str, Any]]],
+        authors: Optional[List[str]] = None,
+    ):
+        self.name = name
+        self.columns = columns
+        self.convert = convert
+        self.authors = authors or ["user", "assistant"]
+        self._cache: "OrderedDict[str, _ThreadMessages]" = OrderedDict()
+
+    def _redis_key(self, thread_id: str) -> str:
+        return f"thread_messages:{self.name}:{thread_id}"
+
+    async def _load_from_redis(self, thread_id: str) -> Optional[_ThreadMessages]:
+        if not config.THREAD_MESSAGE_CACHE_REDIS:
+            return None
+        try:
+            raw = await redis.get(self._redis_key(thread_id))
+            return _ThreadMessages.from_json(raw) if raw else None
+        except Exception as e:
+            logger.warning(f"Failed to read message cache for thread {thread_id} from Redis: {e}")
+            return None
+
+    async def _save_to_redis(self, thread_id: str, entry: _ThreadMessages) -> None:
+        if not config.THREAD_MESSAGE_CACHE_REDIS:
+            return
+        try:
+            await redis.set(self._redis_key(thread_id), entry.to_json(), ex=REDIS_TTL_SECONDS)
+        except Exception as e:
+            logger.warning(f"Failed to write message cache for thread {thread_id} to Redis: {e}")
+
+    async def _fetch_after(self, client, thread_id: str, after: Optional[datetime]) -> List[Dict[str, Any]]:
+        """Fetch events newer than ``after`` with keyset pagination on (timestamp, id)."""
+        rows: List[Dict[str, Any]] = []
+        cursor_ts, cursor_id = after, ""
+        select_fields = ", ".join(self.columns)
+
+        async with client.pool.acquire() as conn:
+            while True:
+                params: List[Any] = [thread_id, self.authors]
+                query = f"SELECT {select_fields} FROM events WHERE session_id = $1 AND author = ANY($2::varchar[])"
+                if cursor_ts is not None:
+                    params.extend([cursor_ts, cursor_id])
+                    query += " AND (timestamp, id) > ($3, $4)"
+                params.append(BATCH_SIZE)
+                query += f" ORDER BY timestamp, id LIMIT ${len(params)}"
+
+                batch = await conn.fetch(query, *params)
+                rows.extend(dict(row) for row in batch)
+                if len(batch) < BATCH_SIZE:
+                    break
+                cursor_ts, cursor_id = batch[-1]["timestamp"], batch[-1]["id"]
+        return rows
+
+    async def load(self, client, thread_id: str) -> List[Dict[str, Any]]:
+        """Return all converted messages of the thread, fetching only new events."""
+        # Read the version before fetching, so a change racing with this load is seen next time
+        version = await get_event_version(thread_id)
+        entry = self._cache.get(thread_id)
+        if entry is None:
+            entry = await self._load_from_redis(thread_id)
+        if entry is None or version is None or entry.version != version:
+            # Events were deleted or rewritten since the entry was built (or it cannot be validated)
+            entry = _ThreadMessages(version)
+
+        after = None
+        if entry.last_timestamp is not None:
+            after = entry.last_timestamp - timedelta(seconds=LOOKBACK_SECONDS)
+
+        rows = await self._fetch_after(client, thread_id, after)
+        added = 0
+        for row in rows:
+            event_id = row.get("id")
+            if event_id in entry.ids:
+                continue
+            try:
+                message = self.convert(row)
+            except Exception as e:
+                logger.error(f"Failed to parse event {event_id}: {e}")
+                continue
+            if message is None:
+                continue
+            entry.add(event_id, row["timestamp"], message)
+            added += 1
+
+        self._cache[thread_id] = entry
+        self._cache.move_to_end(thread_id)
+        while len(self._cache) > THREAD_CACHE_SIZE:
+            self._cache.popitem(last=False)
+
+        if added:
+            await self._save_to_redis(thread_id, entry)
+
+        logger.debug(f"Thread {thread_id}: {added} new messages, {len(entry.messages)} total (scanned {len(rows)} events)")
+        return entry.snapshot()
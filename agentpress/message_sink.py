@@ -0,0 +1,167 @@
+"""
+Write-behind persistence for thread messages.
+
+During a streamed run the ResponseProcessor saves status, tool-started,
+tool-completed and tool result messages one at a time, each as its own
+INSERT ... RETURNING round-trip on the hot path. MessageSink instead assigns
+the message_id and created_at on the client, hands the caller the message
+row immediately and buffers it. Buffered rows are written with a single
+multi-row INSERT (unnest of column arrays) once the batch is full, after a
+short delay, or when the run finishes and the thread manager calls flush().
+
+Because created_at is taken when the message is added, not when the batch
+is written, message order in the thread is unchanged.
+
+A batch that keeps failing is retried row by row before giving up. Rows that
+still cannot be written raise MessageFlushError from the run's final
+flush(final=True), so the run fails instead of silently losing history that
+callers already hold message ids for.
+"""
+
+import asyncio
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from utils.logger import logger
+
+# Flush as soon as this many messages are buffered
+MAX_BATCH_SIZE = 50
+# Flush buffered messages at most this long after the first one was added
+MAX_DELAY_SECONDS = 0.25
+# Fall back to row-by-row inserts after this many failed batch writes
+MAX_FLUSH_ATTEMPTS = 3
+
+_COLUMNS = [
+    "message_id", "thread_id", "project_id", "type", "role", "is_llm_message",
+    "content", "metadata", "agent_id", "agent_version_id", "created_at",
+]
+
+_INSERT_SQL = """
+INSERT INTO messages (
+    message_id, thread_id, project_id, type, role, is_llm_message,
+    content, metadata, agent_id, agent_version_id, created_at, updated_at
+)
+SELECT m.message_id, m.thread_id, m.project_id, m.type, m.role, m.is_llm_message,
+       m.content::jsonb, m.metadata::jsonb, m.agent_id, m.agent_version_id, m.created_at, m.created_at
+FROM unnest(
+    $1::uuid[], $2::uuid[], $3::uuid[], $4::text[], $5::text[], $6::bool[],
+    $7::text[], $8::text[], $9::uuid[], $10::uuid[], $11::timestamptz[]
+) AS m(message_id, thread_id, project_id, type, role, is_llm_message,
+       content, metadata, agent_id, agent_version_id, created_at)
+"""
+
+
+class MessageFlushError(Exception):
+    """Buffered messages could not be written to the messages table."""
+
+
+class MessageSink:
+    """Buffers message inserts and writes them in batches.
+
+    Args:
+        db: DBConnection used for the batched writes.
+        max_batch_size: Buffered messages that trigger an immediate flush.
+        max_delay: Seconds after which buffered messages are flushed in the background.
+    """
+
+    def __init__(self, db, max_batch_size: int = MAX_BATCH_SIZE, max_delay: float = MAX_DELAY_SECONDS):
+        self.db = db
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self._pending: List[Dict[str, Any]] = []
+        self._attempts = 0
+        self._lock = asyncio.Lock()
+        self._timer: Optional[asyncio.Task] = None
+        # Failure of an intermediate flush, raised by the next final flush
+        self._error: Optional[MessageFlushError] = None
+
+    async def add(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        """Buffer a message row and return it as it will be stored.
+
+        ``row`` holds the messages columns except message_id and the timestamps,
+        which are generated here. content and metadata must already be JSON strings.
+        """
+        now = datetime.now(timezone.utc)
+        message = {
+            "message_id": str(uuid.uuid4()),
+            "agent_id": None,
+            "agent_version_id": None,
+            **row,
+            "created_at": now,
+            "updated_at": now,
+        }
+        self._pending.append(message)
+
+        if len(self._pending) >= self.max_batch_size:
+            try:
+                await self.flush()
+            except MessageFlushError as e:
+                self._error = e
+        elif self._timer is None or self._timer.done():
+            self._timer = asyncio.create_task(self._flush_later())
+        return dict(message)
+
+    async def _flush_later(self) -> None:
+        # Keep going while a failed batch is waiting to be retried
+        while True:
+            await asyncio.sleep(self.max_delay)
+            try:
+                await self.flush()
+            except MessageFlushError as e:
+                self._error = e
+            if not self._pending:
+                return
+
+    async def _insert_rows(self, batch: List[Dict[str, Any]]) -> None:
+        columns = [[message.get(column) for message in batch] for column in _COLUMNS]
+        client = await self.db.client
+        async with client.pool.acquire() as conn:
+            await conn.execute(_INSERT_SQL, *columns)
+
+    async def _insert_each(self, batch: List[Dict[str, Any]]) -> int:
+        """Insert rows one at a time; returns the number of rows that failed."""
+        failed = 0
+        for message in batch:
+            try:
+                await self._insert_rows([message])
+            except Exception as e:
+                failed += 1
+                logger.error(f"Failed to write buffered message {message['message_id']}: {e}")
+        return failed
+
+    async def flush(self, final: bool = False) -> None:
+        """Write all buffered messages.
+
+        A failed batch is retried on the next flush; after MAX_FLUSH_ATTEMPTS
+        failures, or right away when ``final`` is set, its rows are inserted one
+        by one.
+
+        Raises:
+            MessageFlushError: Rows could not be written. With ``final`` set,
+                this is also raised for an earlier background flush that failed.
+        """
+        async with self._lock:
+            if self._pending:
+                batch, self._pending = self._pending, []
+                try:
+                    await self._insert_rows(batch)
+                    self._attempts = 0
+                    logger.debug(f"Flushed {len(batch)} buffered messages")
+                except Exception as e:
+                    self._attempts += 1
+                    if self._attempts < MAX_FLUSH_ATTEMPTS and not final:
+                        logger.warning(f"Failed to flush {len(batch)} buffered messages (attempt {self._attempts}), will retry: {e}")
+                        self._pending = batch + self._pending
+                    else:
+                        logger.warning(f"Failed to flush {len(batch)} buffered messages (attempt {self._attempts}), writing them one by one: {e}")
+                        self._attempts = 0
+                        failed = await self._insert_each(batch)
+                        if failed:
+                            if final:
+                                self._error = None
+                            raise MessageFlushError(f"{failed} of {len(batch)} buffered messages could not be written") from e
+
+            if final and self._error is not None:
+                error, self._error = self._error, None
+                raise error
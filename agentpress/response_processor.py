@@ -19,7 +19,7 @@ from utils.logger import logger
 from utils.json_helpers import to_json_string
 from agentpress.tool import ToolResult
 from agentpress.tool_registry import ToolRegistry
-from agentpress.xml_tool_parser import XMLToolParser
+from agentpress.xml_tool_parser import XMLToolParser, XMLChunkScanner
 try:
     from langfuse.client import StatefulTraceClient
 except ImportError:
@@ -289,12 +289,8 @@ class ResponseProcessor:
         if not isinstance(accumulated_content, str):
             accumulated_content = str(accumulated_content)
         tool_calls_buffer = {} # 工具调用缓冲区
-        # 🔧 修复：current_xml_content每轮从空开始，用于XML工具解析
-        current_xml_content = ""  # 每轮从空开始累积XML内容
-        # 🔧 确保 current_xml_content 也是字符串类型
-        if not isinstance(current_xml_content, str):
-            logger.warning(f"⚠️ current_xml_content 初始化类型异常: {type(current_xml_content)}, 重置为空字符串")
-            current_xml_content = ""
+        # 增量扫描XML工具调用：每个chunk只扫描新增的文本（每轮重新开始）
+        xml_scanner = XMLChunkScanner(self._legacy_xml_tag_names())
         xml_chunks_buffer = [] # 累积 XML 内容
         pending_tool_executions = [] # 待执行工具
         yielded_tool_indices = set() # 存储已生成状态的工具索引
@@ -497,26 +493,14 @@ class ResponseProcessor:
                                     logger.warning(f"⚠️ accumulated_content 类型异常: {type(accumulated_content)}, 重置为空字符串")
                                     accumulated_content = ""
                                     
-                                if not isinstance(current_xml_content, str):
-                                    logger.warning(f"⚠️ current_xml_content 类型异常: {type(current_xml_content)}, 重置为空字符串")
-                                    current_xml_content = ""
-
-                                # 更新累积内容和XML内容
-                                
-                                logger.info(f"current chunk_content: {accumulated_content}")
+                                # 更新累积内容
                                 accumulated_content += chunk_content
-                                current_xml_content += chunk_content  # 用于XML工具调用检测
-    
-
-                                # logger.info(f"accumulated_content: {accumulated_content}")
-                                # logger.info(f"current_xml_content: {current_xml_content}")  
 
                                 # 防止模型无限循环调用工具，如果 没有达到工具调用上限，则继续输出内容
                                 # config.max_xml_tool_calls:最多允许1次XML工具调用
                                 # xml_tool_call_count:当前已执行XML工具调用
                                 if not (config.max_xml_tool_calls > 0 and xml_tool_call_count >= config.max_xml_tool_calls):
-                                    logger.info(f"config.max_xml_tool_calls: {config.max_xml_tool_calls}")
-                                    logger.info(f"xml_tool_call_count: {xml_tool_call_count}")
+                                    logger.debug(f"xml_tool_call_count: {xml_tool_call_count}/{config.max_xml_tool_calls}")
                                     # Yield ONLY content chunk (don't save)
                                     now_chunk = datetime.now(timezone.utc).isoformat()
                                     yield {
@@ -534,10 +518,9 @@ class ResponseProcessor:
                                 
                                 # --- 处理 XML 的工具调用  (如果启用了XML工具调用 并且 还没达到调用次数上限) ---
                                 if config.xml_tool_calling and not (config.max_xml_tool_calls > 0 and xml_tool_call_count >= config.max_xml_tool_calls):
-                                    # 提取XML工具调用
-                                    xml_chunks = self._extract_xml_chunks(current_xml_content)
+                                    # 提取本次chunk补全的XML工具调用
+                                    xml_chunks = xml_scanner.feed(chunk_content)
                                     for xml_chunk in xml_chunks:
-                                        current_xml_content = current_xml_content.replace(xml_chunk, "", 1)
                                         xml_chunks_buffer.append(xml_chunk)
                                         result = self._parse_xml_tool_call(xml_chunk)
                                         if result:
@@ -1282,94 +1265,21 @@ class ResponseProcessor:
             if end_msg_obj: yield format_for_yield(end_msg_obj)
 
 
+    def _legacy_xml_tag_names(self) -> List[str]:
+        """Tag names of legacy-format XML tool calls (function name with underscores as dashes)."""
+        return [func_name.replace('_', '-') for func_name in self.tool_registry.get_available_functions().keys()]
+
     def _extract_xml_chunks(self, content: str) -> List[str]:
         """Extract complete XML chunks using start and end pattern matching."""
         chunks = []
-        pos = 0
         
         try:
             # First, look for new format <function_calls> blocks
-            start_pattern = '<function_calls>'
-            end_pattern = '</function_calls>'
-            
-            while pos < len(content):
-                # Find the next function_calls block
-                start_pos = content.find(start_pattern, pos)
-                if start_pos == -1:
-                    break
-                
-                # Find the matching end tag
-                end_pos = content.find(end_pattern, start_pos)
-                if end_pos == -1:
-                    break
-                
-                # Extract the complete block including tags
-                chunk_end = end_pos + len(end_pattern)
-                chunk = content[start_pos:chunk_end]
-                chunks.append(chunk)
-                
-                # Move position past this chunk
-                pos = chunk_end
+            chunks = XMLChunkScanner().feed(content)
             
             # If no new format found, fall back to old format for backwards compatibility
             if not chunks:
-                pos = 0
-                while pos < len(content):
-                    # Find the next tool tag
-                    next_tag_start = -1
-                    current_tag = None
-                    
-                    # Find the earliest occurrence of any registered tool function name
-                    # Check for available function names
-                    available_functions = self.tool_registry.get_available_functions()
-                    for func_name in available_functions.keys():
-                        # Convert function name to potential tag name (underscore to dash)
-                        tag_name = func_name.replace('_', '-')
-                        start_pattern = f'<{tag_name}'
-                        tag_pos = content.find(start_pattern, pos)
-                        
-                        if tag_pos != -1 and (next_tag_start == -1 or tag_pos < next_tag_start):
-                            next_tag_start = tag_pos
-                            current_tag = tag_name
-                    
-                    if next_tag_start == -1 or not current_tag:
-                        break
-                    
-                    # Find the matching end tag
-                    end_pattern = f'</{current_tag}>'
-                    tag_stack = []
-                    chunk_start = next_tag_start
-                    current_pos = next_tag_start
-                    
-                    while current_pos < len(content):
-                        # Look for next start or end tag of the same type
-                        next_start = content.find(f'<{current_tag}', current_pos + 1)
-                        next_end = content.find(end_pattern, current_pos)
-                        
-                        if next_end == -1:  # No closing tag found
-                            break
-                        
-                        if next_start != -1 and next_start < next_end:
-                            # Found nested start tag
-                            tag_stack.append(next_start)
-                            current_pos = next_start + 1
-                        else:
-                            # Found end tag
-                            if not tag_stack:  # This is our matching end tag
-                                chunk_end = next_end + len(end_pattern)
-                                chunk = content[chunk_start:chunk_end]
-                                chunks.append(chunk)
-                                pos = chunk_end
-                                break
-                            else:
-                                # Pop nested tag
-                                tag_stack.pop()
-                                current_pos = next_end + 1
-                    
-                    if current_pos >= len(content):  # Reached end without finding closing tag
-                        break
-                    
-                    pos = max(pos + 1, current_pos)
+                chunks = XMLChunkScanner(self._legacy_xml_tag_names()).feed(content)
         
         except Exception as e:
             logger.error(f"Error extracting XML chunks: {e}")
@@ -16,12 +16,17 @@ from services.llm import make_llm_api_call
 from agentpress.tool import Tool
 from agentpress.tool_registry import ToolRegistry
 from agentpress.context_manager import ContextManager
+from agentpress.message_loader import IncrementalMessageLoader
+from agentpress.message_sink import MessageSink
+from agentpress.thread_summarizer import SUMMARY_AUTHOR, apply_summary, maybe_schedule_summary, with_summary_events
 from agentpress.response_processor import (
     ResponseProcessor,
     ProcessorConfig
 )
 from services.postgresql import DBConnection
+from services import usage_ledger
 from utils.logger import logger
+from utils.config import config
 try:
     from langfuse.client import StatefulGenerationClient, StatefulTraceClient # type: ignore
 except ImportError:
@@ -35,11 +40,55 @@ except ImportError:
         StatefulTraceClient = Any
 from services.langfuse import langfuse
 import datetime
-from litellm.utils import token_counter # type: ignore
 
 # Type alias for tool choice
 ToolChoice = Literal["auto", "required", "none"]
 
+
+def _event_to_llm_message(event: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert a row of the events table to LLM message format."""
+    # 解析事件内容
+    content = event.get('content', {})
+    if isinstance(content, str):
+        try:
+            content = json.loads(content)
+        except json.JSONDecodeError:
+            # 如果不是JSON，当作纯文本处理
+            content = {"content": content}
+
+    # 构建LLM消息格式
+    message = {
+        "role": event.get('author', 'user'),
+        "message_id": event.get('id'),
+        "timestamp": event.get('timestamp')
+    }
+
+    # 处理timestamp字段，确保datetime对象被转换为字符串
+    if message.get('timestamp') and hasattr(message['timestamp'], 'isoformat'):
+        message['timestamp'] = message['timestamp'].isoformat()
+
+    # 处理内容格式
+    if isinstance(content, dict):
+        # 如果content是对象，提取文本内容
+        if 'content' in content:
+            message["content"] = content['content']
+        else:
+            # 如果没有content字段，将整个对象转为字符串
+            message["content"] = json.dumps(content)
+    else:
+        message["content"] = str(content)
+
+    return message
+
+
+# Process-wide incremental loader shared by all ThreadManager instances
+_message_loader = IncrementalMessageLoader(
+    name="llm",
+    columns=['id', 'author', 'content', 'timestamp'],
+    convert=with_summary_events(_event_to_llm_message),
+    authors=['user', 'assistant', SUMMARY_AUTHOR],
+)
+
 class ThreadManager:
     """
     管理与大型语言模型的对话线程以及工具的执行过程。
@@ -56,6 +105,7 @@ class ThreadManager:
             agent_config: Optional agent configuration with version information
         """
         self.db = DBConnection()
+        self.message_sink = MessageSink(self.db)
         self.tool_registry = ToolRegistry()
         self.trace = trace
         self.is_agent_builder = is_agent_builder
@@ -73,6 +123,22 @@ class ThreadManager:
         )
         self.context_manager = ContextManager()
 
+    async def _flush_messages_after(self, response_gen: AsyncGenerator) -> AsyncGenerator:
+        """Yield the run's responses, then write messages still buffered by the message sink.
+
+        Raises MessageFlushError if buffered messages could not be written.
+        """
+        try:
+            async for chunk in response_gen:
+                yield chunk
+        finally:
+            await self.message_sink.flush(final=True)
+
+    def _with_message_flush(self, response):
+        if not hasattr(response, '__aiter__'):
+            return response
+        return self._flush_messages_after(response)
+
     def add_tool(self, tool_class: Type[Tool], function_names: Optional[List[str]] = None, **kwargs):
         """Add a tool to the ThreadManager."""
         self.tool_registry.register_tool(tool_class, function_names, **kwargs)
@@ -171,6 +237,19 @@ class ThreadManager:
         if agent_version_id:
             data_to_insert['agent_version_id'] = agent_version_id
 
+        if type == 'assistant_response_end' and isinstance(content, dict):
+            await usage_ledger.record_response_usage(client, thread_id, content)
+
+        if config.MESSAGE_WRITE_BEHIND:
+            # Buffered write: return the row with a client-generated message_id right away
+            return await self.message_sink.add({
+                **data_to_insert,
+                'project_id': '00000000-0000-0000-0000-000000000000',
+                'role': 'assistant' if type == 'assistant' else 'user' if type == 'user' else 'system',
+                'content': json.dumps(content) if isinstance(content, (dict, list)) else str(content),
+                'metadata': json.dumps(metadata) if metadata else '{}',
+            })
+
         try:
             # Insert the message and get the inserted row data including the id
             result = await client.table('messages').insert(data_to_insert)
@@ -189,7 +268,9 @@ class ThreadManager:
         """Get all messages for a thread from events table.
 
         This method fetches messages from the events table and formats them
-        for LLM consumption.
+        for LLM consumption. Converted messages are cached per thread, so
+        repeated calls only fetch events newer than the last one seen.
+        Messages covered by the thread's latest summary are replaced by it.
 
         Args:
             thread_id: The ID of the thread to get messages for.
@@ -201,79 +282,7 @@ class ThreadManager:
         client = await self.db.client
 
         try:
-            # Fetch events in batches of 1000 to avoid overloading the database
-            all_events = []
-            batch_size = 1000
-            offset = 0
-            
-            while True:
-                # 从 events 表获取消息，按时间戳排序
-                result = await client.table('events').select(
-                    'id, author, content, timestamp'
-                ).eq('session_id', thread_id).in_(
-                    'author', ['user', 'assistant']
-                ).order('timestamp').range(offset, offset + batch_size - 1).execute()
-                
-                if not result.data or len(result.data) == 0:
-                    break
-                    
-                all_events.extend(result.data)
-                
-                # If we got fewer than batch_size records, we've reached the end
-                if len(result.data) < batch_size:
-                    break
-                    
-                offset += batch_size
-            
-            # Parse the returned data and convert to LLM message format
-            if not all_events:
-                return []
-
-            # Convert events to LLM message format
-            messages = []
-            for event in all_events:
-                try:
-                    # 确保event是字典格式
-                    if hasattr(event, '__dict__'):
-                        event = dict(event)
-                    
-                    # 解析事件内容
-                    content = event.get('content', {})
-                    if isinstance(content, str):
-                        try:
-                            content = json.loads(content)
-                        except json.JSONDecodeError:
-                            # 如果不是JSON，当作纯文本处理
-                            content = {"content": content}
-                    
-                    # 构建LLM消息格式
-                    message = {
-                        "role": event.get('author', 'user'),
-                        "message_id": event.get('id'),
-                        "timestamp": event.get('timestamp')
-                    }
-                    
-                    # 处理timestamp字段，确保datetime对象被转换为字符串
-                    if message.get('timestamp') and hasattr(message['timestamp'], 'isoformat'):
-                        message['timestamp'] = message['timestamp'].isoformat()
-                    
-                    # 处理内容格式
-                    if isinstance(content, dict):
-                        # 如果content是对象，提取文本内容
-                        if 'content' in content:
-                            message["content"] = content['content']
-                        else:
-                            # 如果没有content字段，将整个对象转为字符串
-                            message["content"] = json.dumps(content)
-                    else:
-                        message["content"] = str(content)
-                    
-                    messages.append(message)
-                    
-                except Exception as e:
-                    logger.error(f"Failed to parse event {event.get('id')}: {e}")
-                    continue
-
+            messages = apply_summary(await _message_loader.load(client, thread_id))
             logger.debug(f"Retrieved {len(messages)} messages from events table for thread {thread_id}")
             return messages
 
@@ -443,11 +452,15 @@ When using the tools:
                 try:
                     # Use the potentially modified working_system_prompt for token counting
                     print(f"    📊 计算token数量...")
-                    token_count = token_counter(model=llm_model, messages=[working_system_prompt] + messages)
+                    token_count = self.context_manager.count_tokens([working_system_prompt] + messages, llm_model)
                     token_threshold = self.context_manager.token_threshold
                     print(f"    ✅ Token数量: {token_count}/{token_threshold} ({(token_count/token_threshold)*100:.1f}%)")
                     logger.info(f"Thread {thread_id} token count: {token_count}/{token_threshold} ({(token_count/token_threshold)*100:.1f}%)")
 
+                    # Summarize the oldest messages in the background once the thread gets long
+                    if enable_context_manager:
+                        await maybe_schedule_summary(thread_id, token_count, token_threshold, llm_model)
+
                 except Exception as e:
                     print(f"    ❌ Token计算失败: {str(e)}")
                     logger.error(f"Error counting tokens or summarizing: {str(e)}")
@@ -807,8 +820,8 @@ When using the tools:
             print("我现在是进到这里来了！！！！！！！！！！！！！")
             print("Auto-continue is disabled (native_max_auto_continues=0)")
             # Pass the potentially modified system prompt and temp message
-            return await _run_once(temporary_message)
+            return self._with_message_flush(await _run_once(temporary_message))
 
         # Otherwise return the auto-continue wrapper generator
-        return auto_continue_wrapper()
+        return self._with_message_flush(auto_continue_wrapper())
 
@@ -0,0 +1,259 @@
+"""
+Background summarization of long threads.
+
+When a thread's token count crosses a configurable share of the context
+manager's threshold, run_thread enqueues a Dramatiq job (summarize_thread in
+run_agent_background.py) instead of compressing the whole history on every
+turn. The job summarizes the oldest messages that are not yet covered by a
+summary and stores the result as an event with author ``summary``.
+
+The summary event's content has no role and the ADK session services skip
+events by this author, so it never reaches the model through ADK; a second
+part records which message the summary runs up to. Only ThreadManager
+schedules and uses summaries: its message loader includes summary events, and
+get_llm_messages calls apply_summary to replace the summarized range with a
+single message. ADKThreadManager takes the model's history from the ADK
+session, where a summary would shorten nothing, so it never schedules one.
+
+agent/run.py runs agents through ADKThreadManager, so real agent runs
+currently neither schedule nor apply summaries; enabling the feature only
+affects code that drives a ThreadManager directly.
+Summarization is off unless THREAD_SUMMARY_ENABLED is set.
+"""
+
+import json
+import pickle
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+from agentpress.message_loader import IncrementalMessageLoader
+from services import redis
+from utils.config import config
+from utils.logger import logger
+
+SUMMARY_AUTHOR = "summary"
+# Roles of the events the summarizer reads
+MESSAGE_AUTHORS = ["user", "assistant"]
+# Characters of a single message included in the summarization prompt
+MAX_MESSAGE_CHARS = 4000
+# Characters of transcript sent in one summarization call; the rest waits for the next job
+MAX_TRANSCRIPT_CHARS = 120000
+# Don't bother summarizing fewer messages than this
+MIN_MESSAGES_TO_SUMMARIZE = 10
+SUMMARY_MAX_TOKENS = 2000
+# A job that dies without releasing its lock blocks new jobs for at most this long
+LOCK_TTL_SECONDS = 600
+
+SUMMARY_PROMPT = (
+    "You maintain the running summary of a long conversation between a user and an AI agent. "
+    "Merge the previous summary (if any) with the new messages into one summary that keeps "
+    "the user's goals and constraints, decisions made, files, URLs, names and numbers that "
+    "may be needed later, tool results that matter, and open tasks. Drop small talk and "
+    "superseded details. Write in the language of the conversation, at most 800 words."
+)
+
+
+def _lock_key(thread_id: str) -> str:
+    return f"thread_summary_lock:{thread_id}"
+
+
+def _event_text(content: Any) -> str:
+    if isinstance(content, str):
+        try:
+            content = json.loads(content)
+        except json.JSONDecodeError:
+            return content
+    if isinstance(content, dict):
+        if isinstance(content.get("parts"), list):
+            return " ".join(
+                part["text"] for part in content["parts"] if isinstance(part, dict) and part.get("text")
+            ).strip()
+        if "content" in content:
+            value = content["content"]
+            return value if isinstance(value, str) else json.dumps(value)
+        return json.dumps(content)
+    return "" if content is None else str(content)
+
+
+def _summary_event_to_message(event: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    content = event.get("content")
+    if isinstance(content, str):
+        content = json.loads(content)
+    parts = (content or {}).get("parts") or []
+    if len(parts) < 2:
+        return None
+    meta = json.loads(parts[1].get("text") or "{}")
+    timestamp = event.get("timestamp")
+    return {
+        "role": SUMMARY_AUTHOR,
+        "message_id": event.get("id"),
+        "timestamp": timestamp.isoformat() if hasattr(timestamp, "isoformat") else timestamp,
+        "content": parts[0].get("text", ""),
+        "summarized_until_id": meta.get("summarized_until_id"),
+        "summarized_count": meta.get("summarized_count", 0),
+    }
+
+
+def with_summary_events(convert: Callable[[Dict[str, Any]], Optional[Dict[str, Any]]]) -> Callable[[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """Wrap a loader converter so summary events become summary markers."""
+    def _convert(event: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        if event.get("author") == SUMMARY_AUTHOR:
+            return _summary_event_to_message(event)
+        return convert(event)
+    return _convert
+
+
+def _latest_summary(messages: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    for message in reversed(messages):
+        if message.get("role") == SUMMARY_AUTHOR:
+            return message
+    return None
+
+
+def apply_summary(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Replace the messages covered by the latest summary with the summary itself."""
+    summary = _latest_summary(messages)
+    conversation = [message for message in messages if message.get("role") != SUMMARY_AUTHOR]
+    if summary is None:
+        return conversation
+
+    until_id = summary.get("summarized_until_id")
+    until_index = next((i for i, message in enumerate(conversation) if message.get("message_id") == until_id), None)
+    if until_index is None:
+        logger.warning(f"Summary {summary.get('message_id')} points at unknown message {until_id}, ignoring it")
+        return conversation
+
+    summarized = conversation[:until_index + 1]
+    summary_message = {
+        # Keep the metadata fields (app_name, session_id, ...) some callers read from user messages
+        **{key: value for key, value in summarized[0].items() if key not in ("content", "message_id", "timestamp")},
+        "role": "user",
+        "message_id": summary.get("message_id"),
+        "timestamp": summary.get("timestamp"),
+        "content": f"[Summary of the earlier conversation ({summary.get('summarized_count', len(summarized))} messages)]\n{summary['content']}",
+    }
+    return [summary_message] + conversation[until_index + 1:]
+
+
+async def maybe_schedule_summary(thread_id: str, token_count: int, token_threshold: int, llm_model: str) -> bool:
+    """Enqueue a summarization job if the thread is over the trigger and none is pending."""
+    if not config.THREAD_SUMMARY_ENABLED:
+        return False
+    if token_count < token_threshold * config.THREAD_SUMMARY_TRIGGER_PERCENT / 100:
+        return False
+    try:
+        if not await redis.set(_lock_key(thread_id), "pending", nx=True, ex=LOCK_TTL_SECONDS):
+            return False
+        # Imported here: run_agent_background imports the thread managers
+        from run_agent_background import summarize_thread
+        summarize_thread.send(thread_id, llm_model)
+        logger.info(f"Thread {thread_id} at {token_count}/{token_threshold} tokens, scheduled background summarization")
+        return True
+    except Exception as e:
+        logger.warning(f"Failed to schedule summarization for thread {thread_id}: {e}")
+        return False
+
+
+async def release_lock(thread_id: str) -> None:
+    try:
+        await redis.delete(_lock_key(thread_id))
+    except Exception as e:
+        logger.warning(f"Failed to release summarization lock for thread {thread_id}: {e}")
+
+
+def _transcript_message(event: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "role": event.get("author"),
+        "message_id": event.get("id"),
+        "content": _event_text(event.get("content")),
+    }
+
+
+_summary_loader = IncrementalMessageLoader(
+    name="summary",
+    columns=["id", "author", "content", "timestamp"],
+    convert=with_summary_events(_transcript_message),
+    authors=MESSAGE_AUTHORS + [SUMMARY_AUTHOR],
+)
+
+
+def _select_span(messages: List[Dict[str, Any]], keep_recent: int):
+    """Pick the oldest not-yet-summarized messages, leaving the newest ``keep_recent`` alone."""
+    summary = _latest_summary(messages)
+    conversation = [message for message in messages if message.get("role") != SUMMARY_AUTHOR]
+
+    start = 0
+    if summary is not None:
+        until_id = summary.get("summarized_until_id")
+        start = next((i + 1 for i, message in enumerate(conversation) if message.get("message_id") == until_id), 0)
+        if start == 0:
+            summary = None
+
+    end = len(conversation) - keep_recent
+    span, size = [], 0
+    for message in conversation[start:max(start, end)]:
+        line = f"{message['role']}: {message['content'][:MAX_MESSAGE_CHARS]}"
+        if span and size + len(line) > MAX_TRANSCRIPT_CHARS:
+            break
+        span.append((message, line))
+        size += len(line)
+    return summary, span
+
+
+async def summarize_thread(client, thread_id: str, llm_model: str) -> Optional[str]:
+    """Summarize the oldest unsummarized span of a thread and store it as a summary event.
+
+    Returns:
+        The id of the new summary event, or None if there was nothing to summarize.
+    """
+    from services.llm import make_llm_api_call
+
+    messages = await _summary_loader.load(client, thread_id)
+    previous, span = _select_span(messages, config.THREAD_SUMMARY_KEEP_RECENT)
+    if len(span) < MIN_MESSAGES_TO_SUMMARIZE:
+        logger.info(f"Thread {thread_id}: {len(span)} messages to summarize, skipping")
+        return None
+
+    previous_text = previous["content"] if previous else "(none)"
+    transcript = "\n\n".join(line for _, line in span)
+    response = await make_llm_api_call(
+        messages=[
+            {"role": "system", "content": SUMMARY_PROMPT},
+            {"role": "user", "content": f"Previous summary:\n{previous_text}\n\nNew messages:\n{transcript}"},
+        ],
+        model_name=config.THREAD_SUMMARY_MODEL or llm_model,
+        temperature=0,
+        max_tokens=SUMMARY_MAX_TOKENS,
+    )
+    summary_text = (response.choices[0].message.content or "").strip()
+    if not summary_text:
+        logger.warning(f"Thread {thread_id}: summarization returned no text")
+        return None
+
+    until_id = span[-1][0]["message_id"]
+    summarized_count = (previous.get("summarized_count", 0) if previous else 0) + len(span)
+    content = {"parts": [
+        {"text": summary_text},
+        {"text": json.dumps({"summarized_until_id": until_id, "summarized_count": summarized_count})},
+    ]}
+    event_id = str(uuid.uuid4())
+    # Event.actions is required when ADK loads the row; encode it like agent/api.py does for manual events
+    if config.ADK_ASYNC_SESSION_SERVICE:
+        from services.event_codec import encode_actions
+        actions_bytes = encode_actions({}, config.ADK_EVENT_ACTIONS_CODEC)
+    else:
+        actions_bytes = pickle.dumps({})
+
+    async with client.pool.acquire() as conn:
+        # Copy app_name/user_id from an existing event of the session
+        await conn.execute(
+            """
+            INSERT INTO events (id, app_name, user_id, session_id, invocation_id, author, timestamp, content, actions)
+            SELECT $1, app_name, user_id, session_id, $2, $3, now(), $4::jsonb, $6
+            FROM events WHERE session_id = $5 LIMIT 1
+            """,
+            event_id, f"summary-{event_id}", SUMMARY_AUTHOR, json.dumps(content), thread_id, actions_bytes,
+        )
+
+    logger.info(f"Thread {thread_id}: summarized {len(span)} messages up to {until_id} ({summarized_count} in total)")
+    return event_id
@@ -6,8 +6,9 @@ the XML format with structured function_calls blocks.
 """
 
 import re
+import bisect
 import xml.etree.ElementTree as ET
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Tuple, Iterable
 from dataclasses import dataclass
 import json
 import logging
@@ -73,14 +74,13 @@ class XMLToolParser:
         
         for fc_content in function_calls_matches:
             # Find all invoke blocks within this function_calls block
-            invoke_matches = self.INVOKE_PATTERN.findall(fc_content)
-            
-            for function_name, invoke_content in invoke_matches:
+            for invoke_match in self.INVOKE_PATTERN.finditer(fc_content):
+                function_name, invoke_content = invoke_match.groups()
                 try:
                     tool_call = self._parse_invoke_block(
                         function_name, 
                         invoke_content,
-                        fc_content
+                        invoke_match.group(0)
                     )
                     if tool_call:
                         tool_calls.append(tool_call)
@@ -93,7 +93,7 @@ class XMLToolParser:
         self, 
         function_name: str, 
         invoke_content: str,
-        full_block: str
+        raw_xml: str
     ) -> Optional[XMLToolCall]:
         """Parse a single invoke block into an XMLToolCall."""
         parameters = {}
@@ -115,14 +115,6 @@ class XMLToolParser:
             parameters[param_name] = parsed_value
             parsing_details["raw_parameters"][param_name] = param_value
         
-        # Extract the raw XML for this specific invoke
-        invoke_pattern = re.compile(
-            rf'<invoke\s+name=["\']{re.escape(function_name)}["\']>.*?</invoke>',
-            re.DOTALL | re.IGNORECASE
-        )
-        raw_xml_match = invoke_pattern.search(full_block)
-        raw_xml = raw_xml_match.group(0) if raw_xml_match else f"<invoke name=\"{function_name}\">...</invoke>"
-        
         return XMLToolCall(
             function_name=function_name,
             parameters=parameters,
@@ -221,6 +213,200 @@ class XMLToolParser:
         return True, None
 
 
+@dataclass
+class _OpenBlock:
+    """Scan state of a legacy tool tag whose closing tag has not been seen yet."""
+    tag: str
+    start: int
+    # Where the search for nested/closing tags continues
+    pos: int
+    depth: int = 0
+    # Position after the last closing tag seen; tags before it belong to this block
+    skip_to: int = 0
+
+
+class XMLChunkScanner:
+    """
+    Incremental extractor of complete tool call XML blocks from streamed text.
+    
+    Text is passed in with ``feed`` as it arrives. The scanner remembers where it
+    stopped searching, so each call only looks at the newly added text (plus a
+    few characters of overlap for tags split across chunks) instead of
+    re-scanning the whole response. Text outside of tool call blocks is dropped
+    once it can no longer be the start of a tag.
+    
+    Besides ``<function_calls>`` blocks, legacy tool tags (e.g. ``<create-file ...>``)
+    can be recognised; their nesting is tracked like the original extractor did.
+    All opening tags are matched with a single compiled alternation.
+    
+    The original extractor's priorities are kept: ``<function_calls>`` blocks
+    come first, and a legacy tag that is never closed (e.g. a tag name mentioned
+    in prose) is skipped over instead of hiding the tool calls after it.
+    """
+    
+    FUNCTION_CALLS_START = '<function_calls>'
+    FUNCTION_CALLS_END = '</function_calls>'
+    
+    def __init__(self, legacy_tag_names: Iterable[str] = ()):
+        """
+        Args:
+            legacy_tag_names: Tag names of legacy-format tool calls to recognise
+        """
+        legacy_tag_names = sorted(set(legacy_tag_names), key=len, reverse=True)
+        alternatives = [re.escape(self.FUNCTION_CALLS_START)]
+        if legacy_tag_names:
+            alternatives.append('<(' + '|'.join(re.escape(name) for name in legacy_tag_names) + ')')
+        self._start_pattern = re.compile('|'.join(alternatives))
+        # Longest opening tag text, used to keep a tail that may hold a partial tag
+        self._max_start_len = max([len(self.FUNCTION_CALLS_START)] + [len(name) + 1 for name in legacy_tag_names])
+        self._tag_patterns: Dict[str, "re.Pattern[str]"] = {}
+        
+        self._buffer = ""
+        # Where the search for opening tags continues
+        self._scan_pos = 0
+        # Start of the pending <function_calls> block and where its end search continues
+        self._calls_start: Optional[int] = None
+        self._calls_pos = 0
+        # Positions and names of the legacy opening tags found so far, in order
+        self._tag_starts: List[Tuple[int, str]] = []
+        # Scan state of the unclosed legacy blocks, by start position
+        self._open_blocks: Dict[int, _OpenBlock] = {}
+    
+    def feed(self, text: str) -> List[str]:
+        """
+        Add streamed text and return the tool call blocks completed by it.
+        
+        Args:
+            text: The next piece of streamed content
+            
+        Returns:
+            Complete XML blocks in the order they are completed
+        """
+        self._buffer += text
+        self._find_starts()
+        chunks = []
+        
+        while True:
+            block = self._next_complete_block()
+            if block is None:
+                break
+            start, end = block
+            chunks.append(self._buffer[start:end])
+            self._remove(start, end)
+        
+        self._trim()
+        return chunks
+    
+    def _find_starts(self):
+        """Record the opening tags after the scan position."""
+        for match in self._start_pattern.finditer(self._buffer, self._scan_pos):
+            tag = match.group(1)
+            if tag is not None:
+                self._tag_starts.append((match.start(), tag))
+            elif self._calls_start is None:
+                # Only the first pending <function_calls> matters: its end is the next closing tag
+                self._calls_start = match.start()
+                self._calls_pos = match.end()
+            self._scan_pos = match.end()
+        self._scan_pos = max(self._scan_pos, len(self._buffer) - self._max_start_len + 1)
+    
+    def _next_complete_block(self) -> Optional[Tuple[int, int]]:
+        """Return (start, end) of the next completed block, or None."""
+        # <function_calls> blocks first, like the original extractor
+        if self._calls_start is not None:
+            end = self._buffer.find(self.FUNCTION_CALLS_END, self._calls_pos)
+            if end != -1:
+                return self._calls_start, end + len(self.FUNCTION_CALLS_END)
+            self._calls_pos = max(self._calls_pos, len(self._buffer) - len(self.FUNCTION_CALLS_END) + 1)
+        
+        # Walk the legacy tags like the original extractor: take the first tag, and
+        # if it is not closed yet, continue after the part of it scanned so far
+        pos = 0
+        while True:
+            index = bisect.bisect_left(self._tag_starts, (pos, ''))
+            if index == len(self._tag_starts):
+                return None
+            start, tag = self._tag_starts[index]
+            block = self._open_blocks.get(start)
+            if block is None:
+                block = self._open_blocks[start] = _OpenBlock(tag, start, start + len(tag) + 1, skip_to=start + 1)
+            end = self._find_block_end(block)
+            if end != -1:
+                return start, end
+            pos = block.skip_to
+    
+    def _find_block_end(self, block: _OpenBlock) -> int:
+        """Return the end offset of a legacy block in the buffer, or -1 if it is not complete yet."""
+        # Legacy tags may nest: count further opening tags of the same name
+        pattern = self._tag_patterns.get(block.tag)
+        if pattern is None:
+            tag = re.escape(block.tag)
+            pattern = self._tag_patterns[block.tag] = re.compile(f'(</{tag}>)|<{tag}')
+        
+        for match in pattern.finditer(self._buffer, block.pos):
+            if match.group(1):
+                if block.depth == 0:
+                    return match.end()
+                block.depth -= 1
+                block.skip_to = match.start() + 1
+            else:
+                block.depth += 1
+            block.pos = match.end()
+        
+        end_len = len(block.tag) + 3
+        block.pos = max(block.pos, len(self._buffer) - end_len + 1)
+        return -1
+    
+    def _remove(self, start: int, end: int):
+        """Cut an extracted block out of the buffer and rescan the text after it."""
+        self._buffer = self._buffer[:start] + self._buffer[end:]
+        
+        # Blocks that started before the cut are searched again from their opening tag
+        for block in self._open_blocks.values():
+            if block.start < start:
+                block.pos = block.start + len(block.tag) + 1
+                block.depth = 0
+                block.skip_to = block.start + 1
+        
+        # Tags after the cut (or joined across it) are found again
+        rescan_from = max(0, start - self._max_start_len + 1)
+        index = bisect.bisect_left(self._tag_starts, (rescan_from, ''))
+        for position, _ in self._tag_starts[index:]:
+            self._open_blocks.pop(position, None)
+        del self._tag_starts[index:]
+        if self._calls_start is not None:
+            if self._calls_start >= rescan_from:
+                self._calls_start = None
+            else:
+                self._calls_pos = self._calls_start + len(self.FUNCTION_CALLS_START)
+        self._scan_pos = rescan_from
+        self._find_starts()
+    
+    def _trim(self):
+        """Drop text that can no longer belong to a block or start a tag."""
+        keep_from = max(0, len(self._buffer) - self._max_start_len + 1)
+        if self._calls_start is not None:
+            keep_from = min(keep_from, self._calls_start)
+        if self._tag_starts:
+            keep_from = min(keep_from, self._tag_starts[0][0])
+        if not keep_from:
+            return
+        
+        self._buffer = self._buffer[keep_from:]
+        self._scan_pos -= keep_from
+        if self._calls_start is not None:
+            self._calls_start -= keep_from
+            self._calls_pos -= keep_from
+        self._tag_starts = [(position - keep_from, tag) for position, tag in self._tag_starts]
+        open_blocks = {}
+        for block in self._open_blocks.values():
+            block.start -= keep_from
+            block.pos -= keep_from
+            block.skip_to -= keep_from
+            open_blocks[block.start] = block
+        self._open_blocks = open_blocks
+
+
 # Convenience function for quick parsing
 def parse_xml_tool_calls(content: str) -> List[XMLToolCall]:
     """
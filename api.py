@@ -77,7 +77,11 @@ async def lifespan(app: FastAPI):
         # 清理Agent资源
         logger.info("Cleaning up agent resources")
         await agent_api.cleanup()
-        
+
+        # 关闭连接池中的 MCP 会话
+        from mcp_module import mcp_session_pool
+        await mcp_session_pool.close_all()
+
         # 清理Redis连接
         try:
             logger.info("Closing Redis connection")
@@ -153,6 +153,8 @@ async def logout(
         refresh_token = request.refresh_token if request else None
         await auth_service.logout(user_id, refresh_token)
         return {"message": "Logged out successfully"}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Logout error: {e}")
         raise HTTPException(status_code=500, detail="Logout failed")
@@ -2,24 +2,33 @@
 User Authentication Service
 """
 
+import asyncio
 import json
 from datetime import datetime
 from typing import Optional
 from fastapi import HTTPException # type: ignore
 from services.postgresql import DBConnection
 from utils.auth_utils import AuthUtils
+from utils.token_cache import RefreshTokenStore
 from utils.logger import logger
 from .models import (
     LoginRequest, RegisterRequest, RefreshRequest,
     AuthResponse, RefreshResponse, UserResponse, User
 )
 
+# 撤销Redis中的刷新token副本的重试次数和间隔
+REVOKE_ATTEMPTS = 3
+REVOKE_RETRY_DELAY_SECONDS = 0.1
+
 class AuthService:
     """User Authentication Service"""
     
     def __init__(self):
         self.db = DBConnection()
         self.auth = AuthUtils()
+        # Redis 中的刷新token副本和撤销集合，刷新/撤销时不需要查询数据库
+        self.refresh_tokens = RefreshTokenStore(AuthUtils.REFRESH_TOKEN_EXPIRE_DAYS * 24 * 3600)
+        self._background_tasks = set()
         self.default_app_name = "fufanmanus"  # 默认应用名称
     
     async def _get_client(self):
@@ -53,7 +62,7 @@ class AuthService:
             raise HTTPException(status_code=400, detail="Email already registered")
         
         # 创建新用户
-        hashed_password = self.auth.hash_password(request.password)
+        hashed_password = await self.auth.hash_password_async(request.password)
         
         async with client.pool.acquire() as conn:
             user_record = await conn.fetchrow(
@@ -128,17 +137,23 @@ class AuthService:
             raise HTTPException(status_code=401, detail="Account is not active")
         
         # 验证密码
-        if not self.auth.verify_password(request.password, user['password_hash']):
+        if not await self.auth.verify_password_async(request.password, user['password_hash']):
             raise HTTPException(status_code=401, detail="Invalid email or password")
         
-        # 登录前先清除该用户的所有旧refresh tokens
-        async with client.pool.acquire() as conn:
-            old_tokens_result = await conn.execute(
-                "DELETE FROM refresh_tokens WHERE user_id = $1",
-                str(user['id'])
-            )
-        old_tokens_count = int(old_tokens_result.split()[-1]) if old_tokens_result else 0
-        logger.info(f"Login: Cleared {old_tokens_count} old refresh tokens for user {user['id']}")
+        # 登录前先清除该用户的所有旧refresh tokens（先撤销Redis中的副本，再删除数据库记录）
+        # Redis撤销失败时保留数据库记录，旧token在两处都保持有效，登录照常进行
+        try:
+            await self._revoke_user_refresh_tokens(str(user['id']))
+        except Exception as e:
+            logger.warning(f"Login: keeping old refresh tokens for user {user['id']}, Redis revoke failed: {e}")
+        else:
+            async with client.pool.acquire() as conn:
+                old_tokens_result = await conn.execute(
+                    "DELETE FROM refresh_tokens WHERE user_id = $1",
+                    str(user['id'])
+                )
+            old_tokens_count = int(old_tokens_result.split()[-1]) if old_tokens_result else 0
+            logger.info(f"Login: Cleared {old_tokens_count} old refresh tokens for user {user['id']}")
         
         # 生成新的tokens
         access_token = self.auth.create_access_token(str(user['id']))
@@ -184,28 +199,14 @@ class AuthService:
         """刷新token"""
         client = await self._get_client()
         
-        # 验证刷新token
+        # 验证刷新token（优先查Redis，未命中时回退到数据库）
         token_hash = self.auth.hash_refresh_token(request.refresh_token)
-        async with client.pool.acquire() as conn:
-            result = await conn.fetchrow(
-                """
-                SELECT user_id FROM refresh_tokens 
-                WHERE token_hash = $1 AND expires_at > $2
-                """,
-                token_hash, datetime.now()
-            )
-        
-        if not result:
+        user_id = await self._lookup_refresh_token(client, token_hash)
+        if not user_id:
             raise HTTPException(status_code=401, detail="Invalid refresh token")
         
-        user_id = result['user_id']
-        
-        # 删除旧的刷新token
-        async with client.pool.acquire() as conn:
-            await conn.execute(
-                "DELETE FROM refresh_tokens WHERE token_hash = $1",
-                token_hash
-            )
+        # 撤销旧的刷新token：写入Redis撤销集合，数据库记录在后台删除
+        await self._revoke_refresh_token(client, token_hash, user_id)
         
         # 生成新的tokens
         access_token = self.auth.create_access_token(user_id)
@@ -238,6 +239,11 @@ class AuthService:
         client = await self._get_client()
         
         # 1. 删除refresh tokens (建议删除所有，避免token不一致问题)
+        # Redis撤销失败时登出失败，不删除数据库记录，客户端可以重试
+        try:
+            await self._revoke_user_refresh_tokens(user_id)
+        except Exception:
+            raise HTTPException(status_code=503, detail="Logout is temporarily unavailable, please try again")
         async with client.pool.acquire() as conn:
             result = await conn.execute(
                 "DELETE FROM refresh_tokens WHERE user_id = $1",
@@ -278,6 +284,88 @@ class AuthService:
                 """,
                 user_id, token_hash, expires_at, datetime.now()
             )
+        
+        try:
+            await self.refresh_tokens.remember(user_id, token_hash, expires_at)
+        except Exception as e:
+            # Redis不可用时刷新会回退到数据库校验
+            logger.warning(f"Failed to cache refresh token for user {user_id}: {e}")
+    
+    async def _lookup_refresh_token(self, client, token_hash: str) -> Optional[str]:
+        """校验刷新token，返回所属用户ID；无效时返回None"""
+        try:
+            revoked, user_id = await self.refresh_tokens.lookup(token_hash)
+            if revoked:
+                return None
+            if user_id:
+                return user_id
+        except Exception as e:
+            logger.warning(f"Refresh token cache lookup failed, falling back to database: {e}")
+        
+        async with client.pool.acquire() as conn:
+            result = await conn.fetchrow(
+                """
+                SELECT user_id, expires_at FROM refresh_tokens 
+                WHERE token_hash = $1 AND expires_at > $2
+                """,
+                token_hash, datetime.now()
+            )
+        if not result:
+            return None
+        
+        # 回填Redis（例如Redis重启后或本功能上线前签发的token）
+        try:
+            await self.refresh_tokens.remember(str(result['user_id']), token_hash, self._as_aware(result['expires_at']))
+        except Exception as e:
+            logger.warning(f"Failed to cache refresh token: {e}")
+        return str(result['user_id'])
+    
+    async def _revoke_refresh_token(self, client, token_hash: str, user_id: str):
+        """撤销单个刷新token：Redis撤销集合保证立即生效，数据库记录在后台删除"""
+        try:
+            await self.refresh_tokens.revoke([token_hash], user_id=user_id)
+        except Exception as e:
+            logger.warning(f"Failed to revoke refresh token in Redis, deleting synchronously: {e}")
+            await self._delete_refresh_token(client, token_hash)
+            return
+        
+        task = asyncio.create_task(self._delete_refresh_token(client, token_hash))
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+    
+    async def _delete_refresh_token(self, client, token_hash: str):
+        try:
+            async with client.pool.acquire() as conn:
+                await conn.execute(
+                    "DELETE FROM refresh_tokens WHERE token_hash = $1",
+                    token_hash
+                )
+        except Exception as e:
+            # 撤销集合中的记录会一直保留到token过期，数据库记录残留不影响安全性
+            logger.error(f"Failed to delete refresh token: {e}")
+    
+    async def _revoke_user_refresh_tokens(self, user_id: str):
+        """
+        撤销Redis中该用户的所有刷新token副本（数据库记录由调用方删除）
+
+        刷新时Redis命中的token不再查询数据库，所以撤销失败时不能只删除数据库记录：
+        重试 REVOKE_ATTEMPTS 次后仍失败则抛出异常，由调用方决定是否继续。
+        """
+        for attempt in range(1, REVOKE_ATTEMPTS + 1):
+            try:
+                await self.refresh_tokens.revoke_user(user_id)
+                return
+            except Exception as e:
+                if attempt == REVOKE_ATTEMPTS:
+                    logger.error(f"Failed to revoke cached refresh tokens for user {user_id} after {attempt} attempts: {e}")
+                    raise
+                logger.warning(f"Failed to revoke cached refresh tokens for user {user_id} (attempt {attempt}), retrying: {e}")
+                await asyncio.sleep(REVOKE_RETRY_DELAY_SECONDS * attempt)
+    
+    @staticmethod
+    def _as_aware(value: datetime) -> datetime:
+        """数据库中的 timestamp 可能不带时区，按本地时间解释"""
+        return value if value.tzinfo else value.astimezone()
     
     async def _update_user_state(self, client, user_id: str, state_data: dict, app_name: str = "fufanmanus"):
         """Update user state"""
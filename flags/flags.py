@@ -10,9 +10,11 @@ credentials_api = True     是否启用凭据API
 default_agent = True       是否启用默认Agent
 """
 
+import asyncio
 import json
 import logging
 import os
+import time
 from datetime import datetime
 from typing import Dict, List, Optional
 import sys
@@ -22,11 +24,100 @@ from services import redis
 
 logger = logging.getLogger(__name__)
 
+# Fallback refresh interval of the in-process snapshot, in case an invalidation message is missed
+SNAPSHOT_TTL_SECONDS = 30
+# Delay before resubscribing after the invalidation listener loses its connection
+LISTENER_RETRY_SECONDS = 5
+
+
 class FeatureFlagManager:
     def __init__(self):
         """Initialize with existing Redis service"""
         self.flag_prefix = "feature_flag:"
         self.flag_list_key = "feature_flags:list"
+        self.invalidation_channel = "feature_flags:invalidate"
+        # In-process copy of all flags, so is_enabled is a dict lookup on the request path
+        self._snapshot: Dict[str, bool] = {}
+        self._snapshot_loaded_at = 0.0
+        # After a failed load, don't hit Redis again before this time
+        self._snapshot_retry_at = 0.0
+        # Bumped on every invalidation, so a load racing with a change isn't treated as fresh
+        self._snapshot_generation = 0
+        self._snapshot_lock = asyncio.Lock()
+        self._listener_task: Optional[asyncio.Task] = None
+    
+    async def _load_snapshot(self) -> Dict[str, bool]:
+        redis_client = await redis.get_client()
+        keys = sorted(await redis_client.smembers(self.flag_list_key))
+        pipe = redis_client.pipeline()
+        for key in keys:
+            pipe.hget(f"{self.flag_prefix}{key}", 'enabled')
+        values = await pipe.execute() if keys else []
+        return {key: value == 'true' for key, value in zip(keys, values)}
+    
+    async def refresh_snapshot(self) -> Dict[str, bool]:
+        """Reload all flags from Redis into the in-process snapshot"""
+        started_at = time.monotonic()
+        async with self._snapshot_lock:
+            # Another caller refreshed while we waited for the lock
+            if self._snapshot_loaded_at >= started_at:
+                return self._snapshot
+            # Another caller's load just failed, don't retry it serially
+            if time.monotonic() < self._snapshot_retry_at:
+                return self._snapshot
+            try:
+                generation = self._snapshot_generation
+                self._snapshot = await self._load_snapshot()
+                if generation == self._snapshot_generation:
+                    self._snapshot_loaded_at = time.monotonic()
+                logger.debug(f"Loaded {len(self._snapshot)} feature flags into snapshot")
+            except Exception as e:
+                # Keep serving the previous snapshot until Redis is back
+                self._snapshot_retry_at = time.monotonic() + LISTENER_RETRY_SECONDS
+                logger.error(f"Failed to refresh feature flag snapshot: {e}")
+        return self._snapshot
+    
+    def _snapshot_is_stale(self) -> bool:
+        now = time.monotonic()
+        return now - self._snapshot_loaded_at > SNAPSHOT_TTL_SECONDS and now >= self._snapshot_retry_at
+    
+    def _invalidate_snapshot(self):
+        self._snapshot_generation += 1
+        self._snapshot_loaded_at = 0.0
+    
+    def _ensure_listener(self):
+        if self._listener_task is None or self._listener_task.done():
+            self._listener_task = asyncio.create_task(self._listen_for_invalidations())
+    
+    async def _listen_for_invalidations(self):
+        while True:
+            pubsub = None
+            try:
+                pubsub = await redis.create_pubsub()
+                await pubsub.subscribe(self.invalidation_channel)
+                # Changes made while we were not subscribed
+                self._invalidate_snapshot()
+                async for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        logger.debug(f"Feature flag {message.get('data')} changed, invalidating snapshot")
+                        self._invalidate_snapshot()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Feature flag invalidation listener failed: {e}")
+            finally:
+                if pubsub is not None:
+                    try:
+                        await pubsub.close()
+                    except Exception:
+                        pass
+            await asyncio.sleep(LISTENER_RETRY_SECONDS)
+    
+    async def _publish_invalidation(self, key: str):
+        try:
+            await redis.publish(self.invalidation_channel, key)
+        except Exception as e:
+            logger.warning(f"Failed to publish feature flag invalidation for {key}: {e}")
     
     async def set_flag(self, key: str, enabled: bool, description: str = "") -> bool:
         """Set a feature flag to enabled or disabled"""
@@ -42,6 +133,8 @@ class FeatureFlagManager:
             redis_client = await redis.get_client()
             await redis_client.hset(flag_key, mapping=flag_data)
             await redis_client.sadd(self.flag_list_key, key)
+            self._snapshot = {**self._snapshot, key: enabled}
+            await self._publish_invalidation(key)
             
             logger.info(f"Set feature flag {key} to {enabled}")
             return True
@@ -51,28 +144,12 @@ class FeatureFlagManager:
     
     async def is_enabled(self, key: str) -> bool:
         """Check if a feature flag is enabled"""
-        logger.info(f"🔍 [FLAGS] Checking if flag '{key}' is enabled...")
-        try:
-            flag_key = f"{self.flag_prefix}{key}"
-            logger.info(f"🔍 [FLAGS] Redis key: {flag_key}")
-            
-            redis_client = await redis.get_client()
-            logger.info(f"🔍 [FLAGS] Got Redis client")
-            
-            enabled = await redis_client.hget(flag_key, 'enabled')
-            logger.info(f"🔍 [FLAGS] Redis returned: {enabled}")
-            
-            result = enabled == 'true' if enabled else False
-            logger.info(f"✅ [FLAGS] Flag '{key}' enabled: {result}")
-            return result
-            
-        except Exception as e:
-            logger.error(f"❌ [FLAGS] Failed to check feature flag {key}: {e}")
-            logger.error(f"❌ [FLAGS] Exception type: {type(e)}")
-            import traceback
-            logger.error(f"❌ [FLAGS] Traceback: {traceback.format_exc()}")
-            # Return False by default if Redis is unavailable
-            return False
+        self._ensure_listener()
+        snapshot = self._snapshot
+        if self._snapshot_is_stale():
+            snapshot = await self.refresh_snapshot()
+        # Unknown flags, or no snapshot because Redis is unavailable, count as disabled
+        return snapshot.get(key, False)
     
     async def get_flag(self, key: str) -> Optional[Dict[str, str]]:
         """Get feature flag details"""
@@ -93,6 +170,8 @@ class FeatureFlagManager:
             deleted = await redis_client.delete(flag_key)
             if deleted:
                 await redis_client.srem(self.flag_list_key, key)
+                self._snapshot = {k: v for k, v in self._snapshot.items() if k != key}
+                await self._publish_invalidation(key)
                 logger.info(f"Deleted feature flag: {key}")
                 return True
             return False
@@ -103,14 +182,10 @@ class FeatureFlagManager:
     async def list_flags(self) -> Dict[str, bool]:
         """List all feature flags with their status"""
         try:
-            redis_client = await redis.get_client()
-            flag_keys = await redis_client.smembers(self.flag_list_key)
-            flags = {}
-            
-            for key in flag_keys:
-                flags[key] = await self.is_enabled(key)
-            
-            return flags
+            self._ensure_listener()
+            if self._snapshot_is_stale():
+                await self.refresh_snapshot()
+            return dict(self._snapshot)
         except Exception as e:
             logger.error(f"Failed to list feature flags: {e}")
             return {}
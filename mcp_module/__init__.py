@@ -15,6 +15,11 @@ from .mcp_service import (
     MCPAuthenticationError,
     CustomMCPError,
 )
+from .session_pool import (
+    MCPSessionPool,
+    MCPServerSpec,
+    mcp_session_pool,
+)
 
 __all__ = [
     "MCPService",
@@ -29,5 +34,8 @@ __all__ = [
     "MCPProviderError",
     "MCPConfigurationError",
     "MCPAuthenticationError",
-    "CustomMCPError"
+    "CustomMCPError",
+    "MCPSessionPool",
+    "MCPServerSpec",
+    "mcp_session_pool",
 ] 
\ No newline at end of file
@@ -8,12 +8,11 @@ from dataclasses import dataclass, field
 from datetime import datetime
 from collections import OrderedDict
 
-from mcp import ClientSession
-from mcp.client.sse import sse_client
-from mcp.client.streamable_http import streamablehttp_client
+from mcp.types import Tool
 
 from utils.logger import logger
 from credentials import EncryptionService
+from .session_pool import MCPServerSpec, mcp_session_pool
 
 
 class MCPException(Exception):
@@ -49,7 +48,7 @@ class MCPConnection:
     enabled_tools: List[str]
     provider: str = 'custom'
     external_user_id: Optional[str] = None
-    session: Optional[ClientSession] = field(default=None, compare=False)
+    spec: Optional[MCPServerSpec] = field(default=None, compare=False)
     tools: Optional[List[Any]] = field(default=None, compare=False)
 
 
@@ -99,13 +98,18 @@ class MCPService:
     def __init__(self):
         self._logger = logger
         self._connections: Dict[str, MCPConnection] = {}
+        # tool name -> (connection, tool) that handles it, kept in sync with _connections
+        self._tool_index: Dict[str, Tuple[MCPConnection, Any]] = {}
+        # tool name -> qualified names of every connected server exposing it, for names seen more than once
+        self._duplicate_tools: Dict[str, List[str]] = {}
+        self._openapi_tools: Optional[List[Dict[str, Any]]] = None
         self._encryption_service = EncryptionService()
 
-    async def connect_server(self, mcp_config: Dict[str, Any], external_user_id: Optional[str] = None) -> MCPConnection:
+    def _build_request(self, mcp_config: Dict[str, Any], external_user_id: Optional[str] = None) -> MCPConnectionRequest:
         # Determine provider from type field
         provider = mcp_config.get('type', mcp_config.get('provider', 'custom'))
         
-        request = MCPConnectionRequest(
+        return MCPConnectionRequest(
             qualified_name=mcp_config.get('qualifiedName', mcp_config.get('name', '')),
             name=mcp_config.get('name', ''),
             config=mcp_config.get('config', {}),
@@ -113,44 +117,67 @@ class MCPService:
             provider=provider,  # Use the determined provider
             external_user_id=external_user_id
         )
-        return await self._connect_server_internal(request)
+    
+    async def connect_server(self, mcp_config: Dict[str, Any], external_user_id: Optional[str] = None) -> MCPConnection:
+        return await self._connect_server_internal(self._build_request(mcp_config, external_user_id))
+    
+    async def restore_connection(self, mcp_config: Dict[str, Any], tools: List[Dict[str, Any]], external_user_id: Optional[str] = None) -> MCPConnection:
+        """Register a connection from previously discovered tools, without calling list_tools."""
+        request = self._build_request(mcp_config, external_user_id)
+        try:
+            spec = await self._build_server_spec(request)
+        except Exception as e:
+            raise MCPConnectionError(f"Failed to restore MCP server {request.qualified_name}: {str(e)}")
+        
+        connection = MCPConnection(
+            qualified_name=request.qualified_name,
+            name=request.name,
+            config=request.config,
+            enabled_tools=request.enabled_tools,
+            provider=request.provider,
+            external_user_id=request.external_user_id,
+            spec=spec,
+            tools=[Tool(name=tool['name'], description=tool.get('description'), inputSchema=tool.get('input_schema') or {}) for tool in tools]
+        )
+        self._add_connection(connection)
+        self._logger.debug(f"Restored {request.qualified_name} from cached tools ({len(tools)} tools)")
+        return connection
+    
+    async def _build_server_spec(self, request: MCPConnectionRequest) -> MCPServerSpec:
+        server_url = await self._get_server_url(request.qualified_name, request.config, request.provider)
+        headers = self._get_headers(request.qualified_name, request.config, request.provider, request.external_user_id)
+        
+        # Add debugging
+        self._logger.info(f"MCP connection details - Provider: {request.provider}, URL: {server_url}, Headers: {headers}")
+        
+        return MCPServerSpec.http(server_url, headers=headers, name=request.qualified_name)
     
     async def _connect_server_internal(self, request: MCPConnectionRequest) -> MCPConnection:
         self._logger.info(f"Connecting to MCP server: {request.qualified_name}")
         
         try:
-            server_url = await self._get_server_url(request.qualified_name, request.config, request.provider)
-            headers = self._get_headers(request.qualified_name, request.config, request.provider, request.external_user_id)
-            
-            # Add debugging
-            self._logger.info(f"MCP connection details - Provider: {request.provider}, URL: {server_url}, Headers: {headers}")
+            spec = await self._build_server_spec(request)
             
             # Add timeout to prevent hanging
             async with asyncio.timeout(30):
-                async with streamablehttp_client(server_url, headers=headers) as (
-                    read_stream, write_stream, _
-                ):
-                    session = ClientSession(read_stream, write_stream)
-                    await session.initialize()
-                    
-                    tool_result = await session.list_tools()
-                    tools = tool_result.tools if tool_result else []
-                    
-                    connection = MCPConnection(
-                        qualified_name=request.qualified_name,
-                        name=request.name,
-                        config=request.config,
-                        enabled_tools=request.enabled_tools,
-                        provider=request.provider,
-                        external_user_id=request.external_user_id,
-                        session=session,
-                        tools=tools
-                    )
-                    
-                    self._connections[request.qualified_name] = connection
-                    self._logger.info(f"Connected to {request.qualified_name} ({len(tools)} tools available)")
-                    
-                    return connection
+                tool_result = await mcp_session_pool.list_tools(spec)
+            tools = tool_result.tools if tool_result else []
+            
+            connection = MCPConnection(
+                qualified_name=request.qualified_name,
+                name=request.name,
+                config=request.config,
+                enabled_tools=request.enabled_tools,
+                provider=request.provider,
+                external_user_id=request.external_user_id,
+                spec=spec,
+                tools=tools
+            )
+            
+            self._add_connection(connection)
+            self._logger.info(f"Connected to {request.qualified_name} ({len(tools)} tools available)")
+            
+            return connection
                     
         except asyncio.TimeoutError:
             error_msg = f"Connection timeout for {request.qualified_name} after 30 seconds"
@@ -184,22 +211,54 @@ class MCPService:
                 continue
     
     async def disconnect_server(self, qualified_name: str) -> None:
-        connection = self._connections.get(qualified_name)
-        if connection and connection.session:
-            try:
-                await connection.session.close()
-                self._logger.info(f"Disconnected from {qualified_name}")
-            except Exception as e:
-                self._logger.warning(f"Error disconnecting from {qualified_name}: {str(e)}")
-        
-        self._connections.pop(qualified_name, None)
+        # The pooled session may be shared with other users of the same server;
+        # the pool closes it once it has been idle for long enough.
+        if self._connections.pop(qualified_name, None):
+            self._rebuild_tool_index()
+            self._logger.info(f"Disconnected from {qualified_name}")
     
     async def disconnect_all(self) -> None:
-        for qualified_name in list(self._connections.keys()):
-            await self.disconnect_server(qualified_name)
         self._connections.clear()
+        self._rebuild_tool_index()
         self._logger.info("Disconnected from all MCP servers")
     
+    def _add_connection(self, connection: MCPConnection) -> None:
+        replaced = connection.qualified_name in self._connections
+        self._connections[connection.qualified_name] = connection
+        if replaced:
+            self._rebuild_tool_index()
+        else:
+            self._index_connection(connection)
+            self._openapi_tools = None
+    
+    def _index_connection(self, connection: MCPConnection) -> None:
+        for tool in connection.tools or []:
+            indexed = self._tool_index.get(tool.name)
+            if indexed is None:
+                self._tool_index[tool.name] = (connection, tool)
+                continue
+            
+            owner = indexed[0]
+            servers = self._duplicate_tools.setdefault(tool.name, [owner.qualified_name])
+            servers.append(connection.qualified_name)
+            # The first server that has the tool enabled handles it
+            if tool.name not in owner.enabled_tools and tool.name in connection.enabled_tools:
+                self._tool_index[tool.name] = (connection, tool)
+            self._logger.warning(
+                f"Tool {tool.name} is exposed by several MCP servers ({', '.join(servers)}), "
+                f"calls go to {self._tool_index[tool.name][0].qualified_name}"
+            )
+    
+    def _rebuild_tool_index(self) -> None:
+        self._tool_index = {}
+        self._duplicate_tools = {}
+        self._openapi_tools = None
+        for connection in self._connections.values():
+            self._index_connection(connection)
+    
+    def get_duplicate_tool_names(self) -> Dict[str, List[str]]:
+        return {name: list(servers) for name, servers in self._duplicate_tools.items()}
+    
     def get_connection(self, qualified_name: str) -> Optional[MCPConnection]:
         return self._connections.get(qualified_name)
     
@@ -207,17 +266,10 @@ class MCPService:
         return list(self._connections.values())
 
     def get_all_tools_openapi(self) -> List[Dict[str, Any]]:
-        tools = []
-        
-        for connection in self.get_all_connections():
-            if not connection.tools:
-                continue
-            
-            for tool in connection.tools:
-                if tool.name not in connection.enabled_tools:
-                    continue
-                
-                openapi_tool = {
+        if self._openapi_tools is None:
+            # One schema per tool name: duplicates would be rejected by the LLM API
+            self._openapi_tools = [
+                {
                     "type": "function",
                     "function": {
                         "name": tool.name,
@@ -225,9 +277,11 @@ class MCPService:
                         "parameters": tool.inputSchema
                     }
                 }
-                tools.append(openapi_tool)
+                for connection, tool in self._tool_index.values()
+                if tool.name in connection.enabled_tools
+            ]
         
-        return tools
+        return list(self._openapi_tools)
     
     async def execute_tool(self, tool_name: str, arguments: Dict[str, Any], external_user_id: Optional[str] = None) -> ToolExecutionResult:
         request = ToolExecutionRequest(
@@ -244,14 +298,14 @@ class MCPService:
         if not connection:
             raise MCPToolNotFoundError(f"Tool not found: {request.tool_name}")
         
-        if not connection.session:
+        if not connection.spec:
             raise MCPToolExecutionError(f"No active session for tool: {request.tool_name}")
         
         if request.tool_name not in connection.enabled_tools:
             raise MCPToolExecutionError(f"Tool not enabled: {request.tool_name}")
         
         try:
-            result = await connection.session.call_tool(request.tool_name, request.arguments)
+            result = await mcp_session_pool.call_tool(connection.spec, request.tool_name, request.arguments)
             
             self._logger.info(f"Tool {request.tool_name} executed successfully")
             
@@ -283,15 +337,8 @@ class MCPService:
             )
     
     def _find_tool_connection(self, tool_name: str) -> Optional[MCPConnection]:
-        for connection in self.get_all_connections():
-            if not connection.tools:
-                continue
-            
-            for tool in connection.tools:
-                if tool.name == tool_name:
-                    return connection
-        
-        return None
+        indexed = self._tool_index.get(tool_name)
+        return indexed[0] if indexed else None
 
     async def discover_custom_tools(self, request_type: str, config: Dict[str, Any]) -> CustomMCPConnectionResult:
         if request_type == "http":
@@ -307,28 +354,25 @@ class MCPService:
             raise CustomMCPError("URL is required for HTTP MCP connections")
         
         try:
-            async with streamablehttp_client(url) as (read_stream, write_stream, _):
-                async with ClientSession(read_stream, write_stream) as session:
-                    await session.initialize()
-                    tool_result = await session.list_tools()
-                    
-                    tools_info = []
-                    for tool in tool_result.tools:
-                        tools_info.append({
-                            "name": tool.name,
-                            "description": tool.description,
-                            "inputSchema": tool.inputSchema
-                        })
-                    
-                    return CustomMCPConnectionResult(
-                        success=True,
-                        qualified_name=f"custom_http_{url.split('/')[-1]}",
-                        display_name=f"Custom HTTP MCP ({url})",
-                        tools=tools_info,
-                        config=config,
-                        url=url,
-                        message=f"Connected via HTTP ({len(tools_info)} tools)"
-                    )
+            tool_result = await mcp_session_pool.list_tools(MCPServerSpec.http(url))
+            
+            tools_info = []
+            for tool in tool_result.tools:
+                tools_info.append({
+                    "name": tool.name,
+                    "description": tool.description,
+                    "inputSchema": tool.inputSchema
+                })
+            
+            return CustomMCPConnectionResult(
+                success=True,
+                qualified_name=f"custom_http_{url.split('/')[-1]}",
+                display_name=f"Custom HTTP MCP ({url})",
+                tools=tools_info,
+                config=config,
+                url=url,
+                message=f"Connected via HTTP ({len(tools_info)} tools)"
+            )
         
         except Exception as e:
             self._logger.error(f"Error connecting to HTTP MCP server: {str(e)}")
@@ -348,28 +392,25 @@ class MCPService:
             raise CustomMCPError("URL is required for SSE MCP connections")
         
         try:
-            async with sse_client(url) as (read_stream, write_stream):
-                async with ClientSession(read_stream, write_stream) as session:
-                    await session.initialize()
-                    tool_result = await session.list_tools()
-                    
-                    tools_info = []
-                    for tool in tool_result.tools:
-                        tools_info.append({
-                            "name": tool.name,
-                            "description": tool.description,
-                            "inputSchema": tool.inputSchema
-                        })
-                    
-                    return CustomMCPConnectionResult(
-                        success=True,
-                        qualified_name=f"custom_sse_{url.split('/')[-1]}",
-                        display_name=f"Custom SSE MCP ({url})",
-                        tools=tools_info,
-                        config=config,
-                        url=url,
-                        message=f"Connected via SSE ({len(tools_info)} tools)"
-                    )
+            tool_result = await mcp_session_pool.list_tools(MCPServerSpec.sse(url))
+            
+            tools_info = []
+            for tool in tool_result.tools:
+                tools_info.append({
+                    "name": tool.name,
+                    "description": tool.description,
+                    "inputSchema": tool.inputSchema
+                })
+            
+            return CustomMCPConnectionResult(
+                success=True,
+                qualified_name=f"custom_sse_{url.split('/')[-1]}",
+                display_name=f"Custom SSE MCP ({url})",
+                tools=tools_info,
+                config=config,
+                url=url,
+                message=f"Connected via SSE ({len(tools_info)} tools)"
+            )
         
         except Exception as e:
             self._logger.error(f"Error connecting to SSE MCP server: {str(e)}")
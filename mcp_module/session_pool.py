@@ -0,0 +1,338 @@
+"""
+Pool of initialized MCP client sessions.
+
+Opening an MCP session means a transport handshake plus ``initialize()``, and
+for stdio servers spawning a subprocess. The pool keeps one live session per
+server spec (transport + URL/headers or command/args/env, keyed by a hash of
+the spec) and hands it to every caller: tool discovery, tool calls from
+MCPToolExecutor, CustomMCPHandler and MCPService all share it.
+
+Each session is owned by a background task, because the anyio-based MCP
+transports must be entered and exited in the same task. Sessions are closed
+after IDLE_TTL_SECONDS without use, pinged before reuse after
+HEALTH_CHECK_INTERVAL_SECONDS of inactivity, limited to
+MAX_CONCURRENCY_PER_SERVER concurrent requests, and reopened when the
+transport turns out to be closed.
+
+A session that fails a request is retired rather than closed: it is taken out
+of the pool so new callers open a fresh one, and closed once the requests
+still in flight on it have finished.
+"""
+
+import asyncio
+import hashlib
+import json
+import time
+from contextlib import AsyncExitStack, asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+import anyio
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.sse import sse_client
+from mcp.client.stdio import stdio_client
+from mcp.client.streamable_http import streamablehttp_client
+from mcp.shared.exceptions import McpError
+
+from utils.logger import logger
+
+IDLE_TTL_SECONDS = 300
+HEALTH_CHECK_INTERVAL_SECONDS = 60
+HEALTH_CHECK_TIMEOUT_SECONDS = 5
+MAX_CONCURRENCY_PER_SERVER = 8
+CONNECT_TIMEOUT_SECONDS = 30
+REAPER_INTERVAL_SECONDS = 30
+
+
+def _transport_closed(session: ClientSession) -> bool:
+    """Whether writing to ``session`` would fail, checked before sending a request."""
+    stream = getattr(session, "_write_stream", None)
+    if stream is None:
+        return False
+    if getattr(stream, "_closed", False):
+        return True
+    try:
+        return stream.statistics().open_receive_streams == 0
+    except Exception:
+        return False
+
+
+@dataclass(frozen=True)
+class MCPServerSpec:
+    transport: str
+    url: Optional[str] = None
+    headers: Tuple[Tuple[str, str], ...] = ()
+    command: Optional[str] = None
+    args: Tuple[str, ...] = ()
+    env: Tuple[Tuple[str, str], ...] = ()
+    name: str = field(default="", compare=False)
+
+    @classmethod
+    def http(cls, url: str, headers: Optional[Dict[str, str]] = None, name: str = "") -> "MCPServerSpec":
+        return cls(transport="http", url=url, headers=tuple(sorted((headers or {}).items())), name=name or url)
+
+    @classmethod
+    def sse(cls, url: str, headers: Optional[Dict[str, str]] = None, name: str = "") -> "MCPServerSpec":
+        return cls(transport="sse", url=url, headers=tuple(sorted((headers or {}).items())), name=name or url)
+
+    @classmethod
+    def stdio(cls, command: str, args: Optional[list] = None, env: Optional[Dict[str, str]] = None, name: str = "") -> "MCPServerSpec":
+        return cls(transport="stdio", command=command, args=tuple(args or ()), env=tuple(sorted((env or {}).items())), name=name or command)
+
+    @property
+    def key(self) -> str:
+        payload = json.dumps([self.transport, self.url, self.headers, self.command, self.args, self.env])
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class _PooledSession:
+    """One live session, owned by its own task."""
+
+    def __init__(self, spec: MCPServerSpec):
+        self.spec = spec
+        self.session: Optional[ClientSession] = None
+        self.semaphore = asyncio.Semaphore(MAX_CONCURRENCY_PER_SERVER)
+        self.connect_lock = asyncio.Lock()
+        self.in_flight = 0
+        # Set once a request failed on this session; it is closed when in_flight drops to 0
+        self.retired = False
+        self.last_used = time.monotonic()
+        self._task: Optional[asyncio.Task] = None
+        self._ready = asyncio.Event()
+        self._closing = asyncio.Event()
+        self._error: Optional[BaseException] = None
+
+    @property
+    def alive(self) -> bool:
+        return self.session is not None and self._task is not None and not self._task.done()
+
+    async def _open_transport(self, stack: AsyncExitStack):
+        spec = self.spec
+        headers = dict(spec.headers)
+        if spec.transport == "http":
+            read, write, _ = await stack.enter_async_context(streamablehttp_client(spec.url, headers=headers))
+        elif spec.transport == "sse":
+            try:
+                read, write = await stack.enter_async_context(sse_client(spec.url, headers=headers))
+            except TypeError as e:
+                # Older mcp versions don't accept headers
+                if "unexpected keyword argument" not in str(e):
+                    raise
+                read, write = await stack.enter_async_context(sse_client(spec.url))
+        elif spec.transport == "stdio":
+            params = StdioServerParameters(command=spec.command, args=list(spec.args), env=dict(spec.env))
+            read, write = await stack.enter_async_context(stdio_client(params))
+        else:
+            raise ValueError(f"Unsupported MCP transport: {spec.transport}")
+        return read, write
+
+    async def _run(self) -> None:
+        try:
+            async with AsyncExitStack() as stack:
+                read, write = await self._open_transport(stack)
+                session = await stack.enter_async_context(ClientSession(read, write))
+                await session.initialize()
+                self.session = session
+                self._ready.set()
+                await self._closing.wait()
+        except BaseException as e:
+            if not self._ready.is_set():
+                self._error = e
+            elif not isinstance(e, asyncio.CancelledError):
+                logger.warning(f"MCP session for {self.spec.name} ended: {e}")
+        finally:
+            self.session = None
+            self._ready.set()
+
+    async def open(self) -> ClientSession:
+        self._ready = asyncio.Event()
+        self._closing = asyncio.Event()
+        self._error = None
+        self._task = asyncio.create_task(self._run())
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout=CONNECT_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            await self.close()
+            raise
+        if self.session is None:
+            raise self._error or ConnectionError(f"Failed to open MCP session for {self.spec.name}")
+        return self.session
+
+    async def close(self) -> None:
+        task = self._task
+        self.session = None
+        if task is None or task.done():
+            return
+        self._closing.set()
+        try:
+            await asyncio.wait_for(asyncio.shield(task), timeout=5)
+        except (asyncio.TimeoutError, Exception):
+            task.cancel()
+
+
+class MCPSessionPool:
+    def __init__(self):
+        self._servers: Dict[str, _PooledSession] = {}
+        self._reaper: Optional[asyncio.Task] = None
+        self.metrics: Dict[str, float] = {
+            "hits": 0,
+            "misses": 0,
+            "reconnects": 0,
+            "health_check_failures": 0,
+            "setup_count": 0,
+            "setup_seconds_total": 0.0,
+            "setup_seconds_max": 0.0,
+        }
+
+    def _ensure_reaper(self) -> None:
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.create_task(self._reap_idle())
+
+    async def _reap_idle(self) -> None:
+        while self._servers:
+            await asyncio.sleep(REAPER_INTERVAL_SECONDS)
+            now = time.monotonic()
+            for key, pooled in list(self._servers.items()):
+                if pooled.in_flight == 0 and now - pooled.last_used > IDLE_TTL_SECONDS:
+                    logger.debug(f"Closing idle MCP session for {pooled.spec.name}")
+                    self._servers.pop(key, None)
+                    await pooled.close()
+
+    async def _connect(self, pooled: _PooledSession) -> ClientSession:
+        start = time.monotonic()
+        session = await pooled.open()
+        elapsed = time.monotonic() - start
+        self.metrics["misses"] += 1
+        self.metrics["setup_count"] += 1
+        self.metrics["setup_seconds_total"] += elapsed
+        self.metrics["setup_seconds_max"] = max(self.metrics["setup_seconds_max"], elapsed)
+        logger.info(f"Opened MCP session for {pooled.spec.name} ({pooled.spec.transport}) in {elapsed:.2f}s")
+        return session
+
+    async def _get_session(self, pooled: _PooledSession) -> ClientSession:
+        async with pooled.connect_lock:
+            if pooled.alive:
+                idle = time.monotonic() - pooled.last_used
+                # Only ping a session nobody else is using, so a failed ping can close it safely
+                if idle > HEALTH_CHECK_INTERVAL_SECONDS and pooled.in_flight == 1:
+                    try:
+                        await asyncio.wait_for(pooled.session.send_ping(), timeout=HEALTH_CHECK_TIMEOUT_SECONDS)
+                    except Exception as e:
+                        logger.warning(f"MCP session for {pooled.spec.name} failed health check: {e}")
+                        self.metrics["health_check_failures"] += 1
+                        await pooled.close()
+                if pooled.alive:
+                    self.metrics["hits"] += 1
+                    return pooled.session
+            return await self._connect(pooled)
+
+    def _pooled(self, spec: MCPServerSpec) -> _PooledSession:
+        pooled = self._servers.get(spec.key)
+        if pooled is None:
+            pooled = self._servers[spec.key] = _PooledSession(spec)
+            self._ensure_reaper()
+        return pooled
+
+    @asynccontextmanager
+    async def _borrow(self, spec: MCPServerSpec) -> AsyncIterator[Tuple[_PooledSession, ClientSession]]:
+        pooled = self._pooled(spec)
+        await pooled.semaphore.acquire()
+        # The session may have been retired while we waited for a slot
+        while pooled.retired:
+            pooled.semaphore.release()
+            pooled = self._pooled(spec)
+            await pooled.semaphore.acquire()
+
+        pooled.in_flight += 1
+        try:
+            yield pooled, await self._get_session(pooled)
+        finally:
+            pooled.in_flight -= 1
+            pooled.last_used = time.monotonic()
+            pooled.semaphore.release()
+            if pooled.retired and pooled.in_flight == 0:
+                await pooled.close()
+
+    @asynccontextmanager
+    async def session(self, spec: MCPServerSpec) -> AsyncIterator[ClientSession]:
+        """Borrow the pooled session for ``spec``, opening it if needed."""
+        async with self._borrow(spec) as (_, session):
+            yield session
+
+    async def _retire(self, pooled: _PooledSession) -> None:
+        """Take ``pooled`` out of the pool and close it once no request is using it."""
+        if self._servers.get(pooled.spec.key) is pooled:
+            del self._servers[pooled.spec.key]
+        pooled.retired = True
+        if pooled.in_flight == 0:
+            await pooled.close()
+
+    async def invalidate(self, spec: MCPServerSpec) -> None:
+        """Retire the pooled session for ``spec``; the next caller reconnects."""
+        pooled = self._servers.get(spec.key)
+        if pooled is not None:
+            await self._retire(pooled)
+
+    async def list_tools(self, spec: MCPServerSpec):
+        """list_tools on the pooled session, reconnecting once on transport errors."""
+        for attempt in range(2):
+            pooled = None
+            try:
+                async with self._borrow(spec) as (pooled, session):
+                    return await session.list_tools()
+            except McpError:
+                raise
+            except Exception as e:
+                if pooled is not None:
+                    await self._retire(pooled)
+                if attempt:
+                    raise
+                self.metrics["reconnects"] += 1
+                logger.warning(f"MCP list_tools on {spec.name} failed ({e}), reconnecting")
+
+    async def call_tool(self, spec: MCPServerSpec, tool_name: str, arguments: Dict[str, Any]):
+        """call_tool on the pooled session.
+
+        Tool calls are not idempotent, so a call is never sent twice: the only
+        retry happens when the borrowed session's transport is found closed
+        before the request is written. Any failure after that retires the
+        session and is raised to the caller.
+        """
+        for attempt in range(2):
+            pooled = None
+            try:
+                async with self._borrow(spec) as (pooled, session):
+                    if _transport_closed(session):
+                        if attempt:
+                            raise anyio.ClosedResourceError()
+                        await self._retire(pooled)
+                        self.metrics["reconnects"] += 1
+                        logger.warning(f"MCP session for {spec.name} was closed, reconnecting")
+                        continue
+                    return await session.call_tool(tool_name, arguments)
+            except McpError:
+                raise
+            except Exception:
+                if pooled is not None:
+                    await self._retire(pooled)
+                raise
+
+    def stats(self) -> Dict[str, Any]:
+        setup_count = self.metrics["setup_count"]
+        return {
+            **self.metrics,
+            "setup_seconds_avg": self.metrics["setup_seconds_total"] / setup_count if setup_count else 0.0,
+            "open_sessions": sum(1 for pooled in self._servers.values() if pooled.alive),
+            "in_flight": sum(pooled.in_flight for pooled in self._servers.values()),
+        }
+
+    async def close_all(self) -> None:
+        servers, self._servers = list(self._servers.values()), {}
+        for pooled in servers:
+            await pooled.close()
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+
+
+mcp_session_pool = MCPSessionPool()
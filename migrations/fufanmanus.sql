@@ -314,6 +314,28 @@ COMMENT ON COLUMN "threads"."status" IS '线程状态';
 COMMENT ON COLUMN "threads"."metadata" IS '线程元数据';
 COMMENT ON TABLE "threads" IS '线程表 - 存储项目中的对话线程';
 
+-- ----------------------------
+-- Table structure for usage_daily
+-- ----------------------------
+CREATE TABLE "usage_daily" (
+  "account_id" varchar(128) COLLATE "pg_catalog"."default" NOT NULL,
+  "usage_date" date NOT NULL,
+  "model" varchar(255) COLLATE "pg_catalog"."default" NOT NULL,
+  "prompt_tokens" int8 NOT NULL DEFAULT 0,
+  "completion_tokens" int8 NOT NULL DEFAULT 0,
+  "cost" float8 NOT NULL DEFAULT 0,
+  "request_count" int4 NOT NULL DEFAULT 0,
+  "updated_at" timestamptz(6) DEFAULT now()
+);
+COMMENT ON COLUMN "usage_daily"."account_id" IS '所属用户ID';
+COMMENT ON COLUMN "usage_daily"."usage_date" IS '用量日期（UTC）';
+COMMENT ON COLUMN "usage_daily"."model" IS '模型名称';
+COMMENT ON COLUMN "usage_daily"."prompt_tokens" IS '输入token数';
+COMMENT ON COLUMN "usage_daily"."completion_tokens" IS '输出token数';
+COMMENT ON COLUMN "usage_daily"."cost" IS '估算费用（美元，已含价格倍率）';
+COMMENT ON COLUMN "usage_daily"."request_count" IS 'LLM响应次数';
+COMMENT ON TABLE "usage_daily" IS '用量日汇总表 - 每次LLM响应结束时按 用户/日期/模型 累加';
+
 -- ----------------------------
 -- Table structure for user_activities
 -- ----------------------------
@@ -375,6 +397,7 @@ ALTER TABLE "projects" ADD CONSTRAINT "projects_pkey" PRIMARY KEY ("project_id")
 ALTER TABLE "refresh_tokens" ADD CONSTRAINT "refresh_tokens_pkey" PRIMARY KEY ("id");
 ALTER TABLE "sessions" ADD CONSTRAINT "sessions_pkey" PRIMARY KEY ("app_name", "user_id", "id");
 ALTER TABLE "threads" ADD CONSTRAINT "threads_pkey" PRIMARY KEY ("thread_id");
+ALTER TABLE "usage_daily" ADD CONSTRAINT "usage_daily_pkey" PRIMARY KEY ("account_id", "usage_date", "model");
 ALTER TABLE "user_activities" ADD CONSTRAINT "user_activities_pkey" PRIMARY KEY ("id");
 ALTER TABLE "user_sessions" ADD CONSTRAINT "user_sessions_pkey" PRIMARY KEY ("id");
 ALTER TABLE "user_states" ADD CONSTRAINT "user_states_pkey" PRIMARY KEY ("app_name", "user_id");
@@ -416,6 +439,7 @@ CREATE INDEX "idx_app_states_update_time" ON "app_states" USING btree ("update_t
 CREATE INDEX "idx_events_app_name_user_id_session_id" ON "events" USING btree ("app_name", "user_id", "session_id");
 CREATE INDEX "idx_events_author" ON "events" USING btree ("author");
 CREATE INDEX "idx_events_timestamp" ON "events" USING btree ("timestamp");
+CREATE INDEX "idx_events_session_timestamp" ON "events" USING btree ("session_id", "timestamp", "id");
 
 -- messages 索引
 CREATE INDEX "idx_messages_agent_id" ON "messages" USING btree ("agent_id");
@@ -426,6 +450,7 @@ CREATE INDEX "idx_messages_is_llm_message" ON "messages" USING btree ("is_llm_me
 CREATE INDEX "idx_messages_project_id" ON "messages" USING btree ("project_id");
 CREATE INDEX "idx_messages_thread_id" ON "messages" USING btree ("thread_id");
 CREATE INDEX "idx_messages_thread_type" ON "messages" USING btree ("thread_id", "type");
+CREATE INDEX "idx_messages_thread_created" ON "messages" USING btree ("thread_id", "created_at", "message_id");
 CREATE INDEX "idx_messages_type" ON "messages" USING btree ("type");
 
 -- oauth_providers 索引
@@ -454,6 +479,7 @@ CREATE INDEX "idx_sessions_update_time" ON "sessions" USING btree ("update_time"
 
 -- threads 索引
 CREATE INDEX "idx_threads_account_id" ON "threads" USING btree ("account_id");
+CREATE INDEX "idx_threads_account_created" ON "threads" USING btree ("account_id", "created_at", "thread_id");
 CREATE INDEX "idx_threads_created_at" ON "threads" USING btree ("created_at");
 CREATE INDEX "idx_threads_project_id" ON "threads" USING btree ("project_id");
 CREATE INDEX "idx_threads_status" ON "threads" USING btree ("status");
@@ -9,11 +9,13 @@ import traceback
 from datetime import datetime, timezone
 from typing import Optional
 from services import redis
+from services import agent_run_stream
 from agent.run import run_agent
 from utils.logger import logger, structlog
 import dramatiq # type: ignore
 import uuid
 from agentpress.thread_manager import ThreadManager
+from agentpress import thread_summarizer
 from services.postgresql import DBConnection
 from services import redis
 from dramatiq.brokers.redis import RedisBroker # type: ignore
@@ -72,6 +74,21 @@ async def check_health(key: str):
     await redis.set(key, "healthy", ex=redis.REDIS_KEY_TTL)
 
 
+@dramatiq.actor
+async def summarize_thread(thread_id: str, llm_model: str):
+    """Summarize the oldest messages of a long thread off the request path."""
+    structlog.contextvars.clear_contextvars()
+    structlog.contextvars.bind_contextvars(thread_id=thread_id)
+    try:
+        await initialize()
+        client = await db.client
+        await thread_summarizer.summarize_thread(client, thread_id, llm_model)
+    except Exception as e:
+        logger.error(f"Failed to summarize thread {thread_id}: {e}", exc_info=True)
+    finally:
+        await thread_summarizer.release_lock(thread_id)
+
+
 @dramatiq.actor
 async def run_agent_background(
     agent_run_id: str,
@@ -208,11 +225,9 @@ async def run_agent_background(
     stop_signal_received = False
     pending_redis_operations = []  
 
-    # 定义 Redis keys 和 channels
-    response_list_key = f"agent_run:{agent_run_id}:responses"
-    response_channel = f"agent_run:{agent_run_id}:new_response"
+    # 定义 Redis keys 和 channels（响应的存储与通知由 agent_run_stream 负责）
     instance_control_channel = f"agent_run:{agent_run_id}:control:{instance_id}"
-    global_control_channel = f"agent_run:{agent_run_id}:control"
+    global_control_channel = agent_run_stream.control_channel(agent_run_id)
     instance_active_key = f"active_run:{instance_id}:{agent_run_id}"
     
     async def check_for_stop_signal():
@@ -310,10 +325,9 @@ async def run_agent_background(
                     logger.warning(f"Failed to record trace for agent run {agent_run_id}: {trace_error}")
                 break
 
-            # Store response in Redis list and publish notification
+            # Store response in Redis and notify viewers (list + pubsub, or a single XADD)
             response_json = json.dumps(response)
-            pending_redis_operations.append(asyncio.create_task(redis.rpush(response_list_key, response_json)))
-            pending_redis_operations.append(asyncio.create_task(redis.publish(response_channel, "new")))
+            pending_redis_operations.append(asyncio.create_task(agent_run_stream.append_response(agent_run_id, response_json)))
             total_responses += 1
             
             if total_responses % 10 == 1:  # 每10个响应打印一次进度
@@ -338,12 +352,10 @@ async def run_agent_background(
              logger.info(f"Agent run {agent_run_id} completed normally (duration: {duration:.2f}s, responses: {total_responses})")
              completion_message = {"type": "status", "status": "completed", "message": "Agent run completed successfully"}
              # trace.span(name="agent_run_completed").end(status_message="agent_run_completed")
-             await redis.rpush(response_list_key, json.dumps(completion_message))
-             await redis.publish(response_channel, "new") # Notify about the completion message
+             await agent_run_stream.append_response(agent_run_id, json.dumps(completion_message))
 
-        # Fetch final responses from Redis for DB update
-        all_responses_json = await redis.lrange(response_list_key, 0, -1)
-        all_responses = [json.loads(r) for r in all_responses_json]
+        # Make sure every response is stored before the final control signal
+        await asyncio.gather(*pending_redis_operations)
 
         # Update DB status
         await update_agent_run_status(client, agent_run_id, final_status, error=error_message)
@@ -352,7 +364,7 @@ async def run_agent_background(
         control_signal = "END_STREAM" if final_status == "completed" else "ERROR" if final_status == "failed" else "STOP"
         
         try:
-            await redis.publish(global_control_channel, control_signal)
+            await agent_run_stream.publish_control(agent_run_id, control_signal)
             # No need to publish to instance channel as the run is ending on this instance
             logger.debug(f"Published final control signal '{control_signal}' to {global_control_channel}")
         except Exception as e:
@@ -374,26 +386,16 @@ async def run_agent_background(
         # Push error message to Redis list
         error_response = {"type": "status", "status": "error", "message": error_message}
         try:
-            await redis.rpush(response_list_key, json.dumps(error_response))
-            await redis.publish(response_channel, "new")
+            await agent_run_stream.append_response(agent_run_id, json.dumps(error_response))
         except Exception as redis_err:
              logger.error(f"Failed to push error response to Redis for {agent_run_id}: {redis_err}")
 
-        # Fetch final responses (including the error)
-        all_responses = []
-        try:
-             all_responses_json = await redis.lrange(response_list_key, 0, -1)
-             all_responses = [json.loads(r) for r in all_responses_json]
-        except Exception as fetch_err:
-             logger.error(f"Failed to fetch responses from Redis after error for {agent_run_id}: {fetch_err}")
-             all_responses = [error_response] # Use the error message we tried to push
-
         # Update DB status
         await update_agent_run_status(client, agent_run_id, "failed", error=f"{error_message}\n{traceback_str}")
 
         # Publish ERROR signal
         try:
-            await redis.publish(global_control_channel, "ERROR")
+            await agent_run_stream.publish_control(agent_run_id, "ERROR")
             logger.debug(f"Published ERROR signal to {global_control_channel}")
         except Exception as e:
             logger.warning(f"Failed to publish ERROR signal: {str(e)}")
@@ -466,13 +468,12 @@ async def _cleanup_redis_run_lock(agent_run_id: str):
 REDIS_RESPONSE_LIST_TTL = 3600 * 24
 
 async def _cleanup_redis_response_list(agent_run_id: str):
-    """Set TTL on the Redis response list."""
-    response_list_key = f"agent_run:{agent_run_id}:responses"
+    """Set TTL on the Redis response list (or stream)."""
     try:
-        await redis.expire(response_list_key, REDIS_RESPONSE_LIST_TTL)
-        logger.debug(f"Set TTL ({REDIS_RESPONSE_LIST_TTL}s) on response list: {response_list_key}")
+        await agent_run_stream.expire(agent_run_id, REDIS_RESPONSE_LIST_TTL)
+        logger.debug(f"Set TTL ({REDIS_RESPONSE_LIST_TTL}s) on responses of agent run: {agent_run_id}")
     except Exception as e:
-        logger.warning(f"Failed to set TTL on response list {response_list_key}: {str(e)}")
+        logger.warning(f"Failed to set TTL on responses of agent run {agent_run_id}: {str(e)}")
 
 async def update_agent_run_status(
     client,
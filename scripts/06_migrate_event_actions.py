@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+把 events.actions 从 pickle 转换为 services.event_codec 的带版本头编码
+
+按 (session_id, id) 键集分页流式处理，每批在一个事务中更新，
+已经是新格式的行会被跳过，因此脚本可以中断后重复执行。
+无法反序列化的损坏数据（EOFError 等）会被替换为空 actions 并记录日志。
+
+注意：转换后只有 ADK_ASYNC_SESSION_SERVICE=true 时使用的异步会话服务能读取这些行。
+把 ADK_EVENT_ACTIONS_CODEC 从默认的 pickle 改为 json/msgpack 之前必须先运行本脚本；
+转换是单向的，之后不能再回退到 SQLAlchemy 的 DatabaseSessionService。
+"""
+
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from services.event_codec import decode_actions, encode_actions, is_encoded
+from services.postgresql import DBConnection
+from utils.logger import logger
+
+_SELECT_BATCH_SQL = """
+SELECT id, app_name, user_id, session_id, actions
+FROM events
+WHERE (session_id, id) > ($1, $2)
+ORDER BY session_id, id
+LIMIT $3
+"""
+
+_UPDATE_SQL = """
+UPDATE events SET actions = $5
+WHERE id = $1 AND app_name = $2 AND user_id = $3 AND session_id = $4
+"""
+
+
+async def migrate_event_actions(codec: str = "json", batch_size: int = 1000, dry_run: bool = False):
+    """分批转换所有旧格式的 actions"""
+    db = DBConnection()
+    await db.initialize()
+    client = await db.client
+
+    last_session_id, last_id = "", ""
+    scanned = converted = corrupted = 0
+    bytes_before = bytes_after = 0
+    start = time.perf_counter()
+
+    try:
+        while True:
+            async with client.pool.acquire() as conn:
+                rows = await conn.fetch(_SELECT_BATCH_SQL, last_session_id, last_id, batch_size)
+                if not rows:
+                    break
+                last_session_id, last_id = rows[-1]["session_id"], rows[-1]["id"]
+                scanned += len(rows)
+
+                updates = []
+                for row in rows:
+                    data = row["actions"]
+                    if data is None or is_encoded(data):
+                        continue
+                    try:
+                        actions = decode_actions(data)
+                    except Exception as e:
+                        logger.warning(f"Corrupted actions in event {row['id']} (session {row['session_id']}): {e}")
+                        actions = {}
+                        corrupted += 1
+                    encoded = encode_actions(actions, codec)
+                    bytes_before += len(data)
+                    bytes_after += len(encoded)
+                    updates.append((row["id"], row["app_name"], row["user_id"], row["session_id"], encoded))
+
+                if updates and not dry_run:
+                    async with conn.transaction():
+                        await conn.executemany(_UPDATE_SQL, updates)
+                converted += len(updates)
+
+            logger.info(f"Scanned {scanned} events, converted {converted} ({corrupted} corrupted)")
+    finally:
+        await DBConnection.disconnect()
+
+    elapsed = time.perf_counter() - start
+    logger.info(
+        f"Event actions migration {'(dry run) ' if dry_run else ''}finished in {elapsed:.1f}s: "
+        f"scanned={scanned}, converted={converted}, corrupted={corrupted}, "
+        f"bytes {bytes_before} -> {bytes_after}"
+    )
+
+
+def main():
+    """主函数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="转换 events.actions 的存储格式")
+    parser.add_argument("--codec", default="json", choices=["json", "msgpack"], help="目标编码格式：json 或 msgpack")
+    parser.add_argument("--batch-size", type=int, default=1000, help="每批处理的行数")
+    parser.add_argument("--dry-run", action="store_true", help="只统计，不写入")
+
+    args = parser.parse_args()
+    asyncio.run(migrate_event_actions(args.codec, args.batch_size, args.dry_run))
+
+
+if __name__ == "__main__":
+    main()
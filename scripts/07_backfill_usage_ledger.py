@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+从 messages 回填 usage_daily 用量日汇总表
+
+按 (用户, UTC 日期, 模型) 在 SQL 中汇总 assistant_response_end 消息的 token 数，
+再用 calculate_token_cost 按汇总后的 token 数计算费用（价格按 token 线性计算，
+与逐条计算的结果一致）。指定日期范围内的旧汇总行会在同一个事务中被替换，
+因此脚本可以重复执行。
+
+回填期间写入的新用量可能被覆盖，建议在低峰期执行。
+
+已有数据库（不是由 03_init_fufanmanus_table.py 新建的）升级时，脚本会先幂等地
+创建 usage_daily 表及其主键，以及分页查询使用的三个索引；--schema-only 只做这一步。
+"""
+
+import asyncio
+import sys
+import time
+from datetime import date, datetime, timezone
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from services.billing import calculate_token_cost
+from services.postgresql import DBConnection
+from utils.logger import logger
+
+# 与 migrations/fufanmanus.sql 保持一致，可重复执行
+_SCHEMA_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS "usage_daily" (
+      "account_id" varchar(128) COLLATE "pg_catalog"."default" NOT NULL,
+      "usage_date" date NOT NULL,
+      "model" varchar(255) COLLATE "pg_catalog"."default" NOT NULL,
+      "prompt_tokens" int8 NOT NULL DEFAULT 0,
+      "completion_tokens" int8 NOT NULL DEFAULT 0,
+      "cost" float8 NOT NULL DEFAULT 0,
+      "request_count" int4 NOT NULL DEFAULT 0,
+      "updated_at" timestamptz(6) DEFAULT now()
+    )
+    """,
+    """
+    DO $$
+    BEGIN
+      IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'usage_daily_pkey') THEN
+        ALTER TABLE "usage_daily" ADD CONSTRAINT "usage_daily_pkey" PRIMARY KEY ("account_id", "usage_date", "model");
+      END IF;
+    END $$
+    """,
+]
+
+# CONCURRENTLY 不能放在事务中，逐条执行；不阻塞线上写入
+_INDEX_SQL = [
+    'CREATE INDEX CONCURRENTLY IF NOT EXISTS "idx_events_session_timestamp" ON "events" USING btree ("session_id", "timestamp", "id")',
+    'CREATE INDEX CONCURRENTLY IF NOT EXISTS "idx_messages_thread_created" ON "messages" USING btree ("thread_id", "created_at", "message_id")',
+    'CREATE INDEX CONCURRENTLY IF NOT EXISTS "idx_threads_account_created" ON "threads" USING btree ("account_id", "created_at", "thread_id")',
+]
+
+_AGGREGATE_SQL = """
+SELECT
+    t.account_id,
+    (m.created_at AT TIME ZONE 'UTC')::date AS usage_date,
+    COALESCE(m.content->>'model', 'unknown') AS model,
+    SUM(COALESCE((m.content->'usage'->>'prompt_tokens')::bigint, 0)) AS prompt_tokens,
+    SUM(COALESCE((m.content->'usage'->>'completion_tokens')::bigint, 0)) AS completion_tokens,
+    COUNT(*) AS request_count
+FROM messages m
+JOIN threads t ON t.thread_id = m.thread_id::text
+WHERE m.type = 'assistant_response_end'
+  AND m.created_at >= $1
+GROUP BY 1, 2, 3
+"""
+
+_DELETE_SQL = "DELETE FROM usage_daily WHERE usage_date >= $1"
+
+_INSERT_SQL = """
+INSERT INTO usage_daily (account_id, usage_date, model, prompt_tokens, completion_tokens, cost, request_count, updated_at)
+VALUES ($1, $2, $3, $4, $5, $6, $7, now())
+"""
+
+
+async def ensure_schema(conn):
+    """在已有数据库上创建 usage_daily 表、主键和新增的索引（已存在则跳过）"""
+    for sql in _SCHEMA_SQL:
+        await conn.execute(sql)
+    for sql in _INDEX_SQL:
+        await conn.execute(sql)
+    logger.info("usage_daily table and indexes are in place")
+
+
+async def backfill_usage_ledger(since: date, dry_run: bool = False, schema_only: bool = False):
+    """重新计算 since（含）之后每天的用量汇总"""
+    db = DBConnection()
+    await db.initialize()
+    client = await db.client
+    start = time.perf_counter()
+    values = []
+
+    try:
+        async with client.pool.acquire() as conn:
+            if not dry_run:
+                await ensure_schema(conn)
+            if schema_only:
+                return
+            since_ts = datetime(since.year, since.month, since.day, tzinfo=timezone.utc)
+            rows = await conn.fetch(_AGGREGATE_SQL, since_ts)
+            logger.info(f"Aggregated {len(rows)} usage rows since {since.isoformat()}")
+
+            values = [
+                (
+                    row['account_id'],
+                    row['usage_date'],
+                    row['model'],
+                    row['prompt_tokens'],
+                    row['completion_tokens'],
+                    calculate_token_cost(row['prompt_tokens'], row['completion_tokens'], row['model']),
+                    row['request_count'],
+                )
+                for row in rows
+            ]
+
+            if not dry_run:
+                async with conn.transaction():
+                    await conn.execute(_DELETE_SQL, since)
+                    await conn.executemany(_INSERT_SQL, values)
+    finally:
+        await DBConnection.disconnect()
+
+    elapsed = time.perf_counter() - start
+    total_cost = sum(value[5] for value in values)
+    logger.info(
+        f"Usage ledger backfill {'(dry run) ' if dry_run else ''}finished in {elapsed:.1f}s: "
+        f"rows={len(values)}, accounts={len({value[0] for value in values})}, total_cost={total_cost:.4f}"
+    )
+
+
+def main():
+    """主函数"""
+    import argparse
+
+    now = datetime.now(timezone.utc)
+    parser = argparse.ArgumentParser(description="从 messages 回填 usage_daily 用量日汇总表")
+    parser.add_argument("--since", type=date.fromisoformat, default=date(now.year, now.month, 1),
+                        help="起始日期（UTC，YYYY-MM-DD），默认本月1日")
+    parser.add_argument("--dry-run", action="store_true", help="只统计，不写入")
+    parser.add_argument("--schema-only", action="store_true", help="只创建 usage_daily 表和索引，不回填")
+
+    args = parser.parse_args()
+    asyncio.run(backfill_usage_ledger(args.since, args.dry_run, args.schema_only))
+
+
+if __name__ == "__main__":
+    main()
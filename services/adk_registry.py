@@ -0,0 +1,350 @@
+"""
+ADK 运行时对象注册表 - 进程级复用 SessionService / LiteLlm / LlmAgent / Runner
+
+make_adk_api_call 每轮都会被调用，如果每次都重新构建：
+- ModelOnlyDBSessionService: create_engine + inspect + create_all
+- LiteLlm / LlmAgent / Runner: 大量 pydantic 校验和工具声明解析
+
+在高并发下这些构建开销会主导单轮延迟，并不断创建新的数据库连接。
+本模块提供一个进程级注册表：
+- SessionService 按数据库URL只构建一次
+- LiteLlm 按 (model, api_base, api_key 摘要) 缓存
+- LlmAgent + Runner 按 (app_name, model, api_base, instruction 摘要, 工具指纹) 缓存
+- 工具以代理函数注册到 Agent，调用时才从上下文变量取本次运行的工具实例，
+  因此每次运行新建的工具实例不会导致 Runner 缓存失效
+- LRU 淘汰，支持在 Agent 版本变更时整体失效
+- 提供命中率和构建耗时统计
+"""
+
+import contextvars
+import hashlib
+import inspect
+import threading
+import time
+import typing
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from utils.logger import logger
+
+# LiteLlm 实例数上限（按模型+凭证区分，数量很少）
+MAX_MODELS = 32
+# Agent/Runner 实例数上限（按模型、提示词和工具集区分）
+MAX_RUNNERS = 128
+
+# 本次运行的工具函数（工具名 -> 绑定到本次运行工具实例的方法）
+# Runner 在进程内复用，工具实例只能在调用时从上下文变量获取，不能在构建时捕获
+current_run_tools_context: contextvars.ContextVar[Optional[Dict[str, Callable]]] = contextvars.ContextVar('current_run_tools', default=None)
+
+
+def _digest(value: Optional[str]) -> str:
+    """计算字符串摘要，避免把原始提示词/API Key 作为字典键长期持有"""
+    if not value:
+        return ""
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()[:16]
+
+
+def _unwrap_tool(tool: Any) -> Tuple[Any, Any]:
+    """返回 (绑定对象, 原始函数)，FunctionTool 取其包装的函数"""
+    func = getattr(tool, "func", tool)
+    return getattr(func, "__self__", None), getattr(func, "__func__", func)
+
+
+def tool_fingerprint(tools: Any) -> Tuple[Hashable, ...]:
+    """
+    计算工具集合指纹
+
+    工具函数字典（工具名 -> 工具实例的方法）按 (工具名, 函数限定名, 签名, 文档摘要) 计算，
+    即 Agent 看到的工具声明，与具体是哪个工具实例无关：实例在调用时通过
+    bind_run_tools 绑定，每次运行新建工具实例仍能命中同一个 Runner。
+
+    已构建好的 ADK 工具列表会被 Runner 直接持有，无法重新绑定，
+    因此仍按绑定对象的身份区分。
+    """
+    if not tools:
+        return ()
+
+    if isinstance(tools, dict):
+        fingerprint = []
+        for name, tool in sorted(tools.items(), key=lambda item: item[0]):
+            _, target = _unwrap_tool(tool)
+            try:
+                signature = str(inspect.signature(tool))
+            except (TypeError, ValueError):
+                signature = ""
+            fingerprint.append((
+                name,
+                getattr(target, "__qualname__", repr(target)),
+                signature,
+                _digest(getattr(tool, "__doc__", None)),
+            ))
+        return tuple(fingerprint)
+
+    if isinstance(tools, list):
+        fingerprint = []
+        for tool in tools:
+            owner, target = _unwrap_tool(tool)
+            fingerprint.append((
+                getattr(tool, "name", None) or repr(type(tool)),
+                getattr(target, "__qualname__", repr(target)),
+                id(owner) if owner is not None else id(target),
+            ))
+        return tuple(fingerprint)
+
+    return (("unsupported", id(tools)),)
+
+
+def bind_run_tools(tools: Any) -> None:
+    """将本次运行的工具函数绑定到当前上下文，供 run_tool_proxy 创建的代理调用"""
+    current_run_tools_context.set(dict(tools) if isinstance(tools, dict) else None)
+
+
+def run_tool_proxy(name: str, func: Callable) -> Callable:
+    """
+    为工具函数创建代理，用于构建可复用的 FunctionTool
+
+    代理保留原函数的名称、文档和签名（用于生成工具声明），
+    调用时转发给 bind_run_tools 绑定的同名工具函数。
+    这里不使用 functools.wraps：它设置的 __wrapped__ 会让缓存的 Runner
+    一直持有首次运行的工具实例（沙箱、thread_manager 等）。
+    字符串形式的注解在创建时解析好，声明生成不需要再访问原函数。
+    """
+    async def proxy(*args, **kwargs):
+        run_tools = current_run_tools_context.get() or {}
+        target = run_tools.get(name)
+        if target is None:
+            raise RuntimeError(f"Tool {name} is not bound to the current run")
+        result = target(*args, **kwargs)
+        if inspect.isawaitable(result):
+            result = await result
+        return result
+
+    for attr in ("__module__", "__name__", "__qualname__", "__doc__"):
+        try:
+            setattr(proxy, attr, getattr(func, attr))
+        except AttributeError:
+            pass
+    try:
+        proxy.__signature__ = inspect.signature(func, eval_str=True)
+    except (NameError, TypeError, ValueError):
+        proxy.__signature__ = inspect.signature(func)
+    try:
+        proxy.__annotations__ = typing.get_type_hints(func)
+    except Exception:
+        proxy.__annotations__ = dict(getattr(func, "__annotations__", {}))
+
+    return proxy
+
+
+class _LRU:
+    """简单的线程安全 LRU 容器"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._items: "OrderedDict[Hashable, Any]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        value = self._items.get(key)
+        if value is not None:
+            self._items.move_to_end(key)
+        return value
+
+    def put(self, key: Hashable, value: Any) -> int:
+        """写入并返回被淘汰的条目数"""
+        self._items[key] = value
+        self._items.move_to_end(key)
+        evicted = 0
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+            evicted += 1
+        return evicted
+
+    def clear(self) -> int:
+        size = len(self._items)
+        self._items.clear()
+        return size
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class _Stats:
+    """单类对象的命中/构建统计"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.build_seconds = 0.0
+
+    def to_dict(self, size: int) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "avg_build_ms": round(self.build_seconds * 1000 / self.misses, 3) if self.misses else 0.0,
+        }
+
+
+class ADKRegistry:
+    """进程级 ADK 对象注册表"""
+
+    def __init__(self, max_models: int = MAX_MODELS, max_runners: int = MAX_RUNNERS):
+        self._lock = threading.Lock()
+        self._session_services: Dict[Hashable, Any] = {}
+        self._models = _LRU(max_models)
+        self._runners = _LRU(max_runners)
+        self._stats = {
+            "session_service": _Stats(),
+            "model": _Stats(),
+            "runner": _Stats(),
+        }
+
+    def _get_or_build(self, kind: str, store: Any, key: Hashable, builder: Callable[[], Any]) -> Any:
+        stats = self._stats[kind]
+        with self._lock:
+            cached = store.get(key)
+            if cached is not None:
+                stats.hits += 1
+                return cached
+
+        # 构建放在锁外，避免慢构建阻塞其他 key 的查找
+        start = time.perf_counter()
+        value = builder()
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            existing = store.get(key)
+            if existing is not None:
+                # 并发构建了同一个 key，保留先写入的实例
+                stats.hits += 1
+                return existing
+            stats.misses += 1
+            stats.build_seconds += elapsed
+            if isinstance(store, _LRU):
+                stats.evictions += store.put(key, value)
+            else:
+                store[key] = value
+
+        logger.info(f"ADK registry built {kind} in {elapsed * 1000:.1f}ms")
+        return value
+
+    def get_session_service(self, db_url: str, use_async: bool = True) -> Any:
+        """
+        按数据库URL获取（或构建）会话服务
+
+        use_async 为 True 时使用复用 DBConnection 连接池的 asyncpg 实现，
+        否则使用基于 SQLAlchemy 的 ModelOnlyDBSessionService。
+        """
+        from services.model_only_session_service import ModelOnlyAsyncDBSessionService, ModelOnlyDBSessionService
+
+        def build():
+            if use_async:
+                return ModelOnlyAsyncDBSessionService()
+            return ModelOnlyDBSessionService(db_url)
+
+        return self._get_or_build(
+            "session_service",
+            self._session_services,
+            (db_url, use_async),
+            build,
+        )
+
+    def get_model(self, model: str, api_key: Optional[str] = None, api_base: Optional[str] = None) -> Any:
+        """按 (model, api_base, api_key 摘要) 获取（或构建）LiteLlm"""
+        from google.adk.models.lite_llm import LiteLlm  # type: ignore
+
+        def build():
+            model_params = {"model": model, "api_key": api_key}
+            if api_base:
+                model_params["api_base"] = api_base
+            return LiteLlm(**model_params)
+
+        key = (model, api_base or "", _digest(api_key))
+        return self._get_or_build("model", self._models, key, build)
+
+    def get_runner(
+        self,
+        app_name: str,
+        model: str,
+        api_key: Optional[str],
+        api_base: Optional[str],
+        instruction: str,
+        tools: Any,
+        adk_tools_factory: Callable[[], List[Any]],
+        session_service: Any,
+        before_model_callback: Optional[Callable] = None,
+    ) -> Any:
+        """
+        获取（或构建）绑定了 LlmAgent 的 Runner
+
+        Args:
+            app_name: 应用名，同时作为 Agent 名称
+            model: 解析后的模型名
+            api_key: 模型 API Key
+            api_base: 模型 API Base
+            instruction: Agent 系统提示词
+            tools: 原始工具集合，用于计算指纹
+            adk_tools_factory: 未命中时将原始工具转换为 ADK 工具列表的函数
+            session_service: 会话服务实例；不是由注册表构建的（如回退的内存会话服务）时不缓存 Runner
+            before_model_callback: LLM 调用前回调
+        """
+        from google.adk import Runner  # type: ignore
+        from google.adk.agents import LlmAgent  # type: ignore
+
+        key = (
+            app_name,
+            model,
+            api_base or "",
+            _digest(api_key),
+            _digest(instruction),
+            tool_fingerprint(tools),
+            id(session_service),
+        )
+
+        def build():
+            agent = LlmAgent(
+                name=app_name,
+                model=self.get_model(model, api_key, api_base),
+                instruction=instruction,
+                tools=adk_tools_factory(),
+                before_model_callback=before_model_callback,
+            )
+            return Runner(agent=agent, app_name=app_name, session_service=session_service)
+
+        # 键中的 id(session_service) 只对注册表持有的会话服务稳定，其他实例每次调用都不同
+        with self._lock:
+            registered = any(service is session_service for service in self._session_services.values())
+        if not registered:
+            logger.debug(f"Session service {type(session_service).__name__} is not registry-owned, building an uncached runner")
+            return build()
+
+        return self._get_or_build("runner", self._runners, key, build)
+
+    def invalidate(self, reason: str = "") -> None:
+        """
+        失效所有缓存的 Agent/Runner
+
+        在 Agent 版本变更时调用。指令和工具已经包含在缓存键中，
+        这里主要是尽快释放旧版本的 Agent。
+        SessionService 和 LiteLlm 与 Agent 版本无关，不受影响。
+        """
+        with self._lock:
+            removed = self._runners.clear()
+        if removed:
+            logger.info(f"ADK registry invalidated {removed} runners ({reason or 'manual'})")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """返回各类对象的命中率与构建耗时统计"""
+        with self._lock:
+            return {
+                "session_service": self._stats["session_service"].to_dict(len(self._session_services)),
+                "model": self._stats["model"].to_dict(len(self._models)),
+                "runner": self._stats["runner"].to_dict(len(self._runners)),
+            }
+
+
+adk_registry = ADKRegistry()
@@ -0,0 +1,194 @@
+"""
+Agent 运行响应的传输层
+
+run_agent_background 产生的每个响应都要交给正在观看该运行的所有前端连接。
+支持两种后端（config.AGENT_RUN_STREAM_BACKEND）：
+
+- list（默认）：rpush 到 agent_run:{id}:responses，再 publish "new" 通知；
+  观看者收到通知后 lrange(last_index, -1) 拉取新响应。
+- stream：XADD 到 agent_run:{id}:stream（MAXLEN 限长），一个命令完成存储与通知；
+  观看者用 XREAD BLOCK 从上次读到的 id 继续读取，天然有序、可断点续读。
+  同一进程内观看同一运行的多个连接共享一个读取任务（_StreamTail），
+  每条响应只从 Redis 读取和解析一次。
+
+控制信号（STOP / END_STREAM / ERROR）仍然发布到 agent_run:{id}:control 频道，
+stream 后端额外把它写入流中，观看者无需再订阅控制频道。
+"""
+
+import asyncio
+import json
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from services import redis
+from utils.config import config
+from utils.logger import logger
+
+# XREAD 单次阻塞时长（毫秒），需小于 Redis 客户端的 socket 超时
+STREAM_BLOCK_MS = 5000
+# XREAD 单次读取的最大条数
+STREAM_READ_COUNT = 500
+# 停止运行时流的保留时长（秒）
+STREAM_DELETE_GRACE_SECONDS = 30
+# 表示运行结束的响应状态（与 list 后端一致）与控制信号；
+# "error" 不在其中：线程管理器对可恢复的单步/单工具错误也会产生该状态，运行仍会继续
+TERMINAL_STATUSES = {"completed", "failed", "stopped", "STOP", "END_STREAM", "ERROR"}
+
+
+def use_streams() -> bool:
+    return config.AGENT_RUN_STREAM_BACKEND == "stream"
+
+
+def response_list_key(agent_run_id: str) -> str:
+    return f"agent_run:{agent_run_id}:responses"
+
+
+def response_stream_key(agent_run_id: str) -> str:
+    return f"agent_run:{agent_run_id}:stream"
+
+
+def response_channel(agent_run_id: str) -> str:
+    return f"agent_run:{agent_run_id}:new_response"
+
+
+def control_channel(agent_run_id: str) -> str:
+    return f"agent_run:{agent_run_id}:control"
+
+
+def is_terminal(response: Dict[str, Any]) -> bool:
+    return response.get("type") == "status" and response.get("status") in TERMINAL_STATUSES
+
+
+async def append_response(agent_run_id: str, response_json: str) -> None:
+    """保存一条响应并通知观看者"""
+    if use_streams():
+        await redis.xadd(
+            response_stream_key(agent_run_id),
+            {"data": response_json},
+            maxlen=config.AGENT_RUN_STREAM_MAXLEN,
+        )
+        return
+    await redis.rpush(response_list_key(agent_run_id), response_json)
+    await redis.publish(response_channel(agent_run_id), "new")
+
+
+async def publish_control(agent_run_id: str, signal: str) -> None:
+    """发布控制信号（STOP / END_STREAM / ERROR）"""
+    await redis.publish(control_channel(agent_run_id), signal)
+    if use_streams():
+        # 写入流中，让 XREAD 的观看者按顺序收到结束信号
+        await append_response(agent_run_id, json.dumps({"type": "status", "status": signal}))
+
+
+async def read_all(agent_run_id: str) -> List[Dict[str, Any]]:
+    """读取运行的全部响应"""
+    if use_streams():
+        entries = await redis.xrange(response_stream_key(agent_run_id))
+        return [json.loads(fields["data"]) for _, fields in entries]
+    return [json.loads(r) for r in await redis.lrange(response_list_key(agent_run_id), 0, -1)]
+
+
+async def expire(agent_run_id: str, seconds: int) -> None:
+    key = response_stream_key(agent_run_id) if use_streams() else response_list_key(agent_run_id)
+    await redis.expire(key, seconds)
+
+
+async def delete(agent_run_id: str) -> None:
+    if use_streams():
+        # 流中刚写入了停止信号，留一点时间让正在 XREAD 的观看者读到它
+        await redis.expire(response_stream_key(agent_run_id), STREAM_DELETE_GRACE_SECONDS)
+        return
+    await redis.delete(response_list_key(agent_run_id))
+
+
+class _StreamTail:
+    """进程内共享的流读取任务：一个 XREAD BLOCK 循环，结果分发给所有观看者"""
+
+    def __init__(self, agent_run_id: str):
+        self.agent_run_id = agent_run_id
+        self.key = response_stream_key(agent_run_id)
+        # (条目 id, 原始 JSON, 解析后的响应)，观看者按下标各自推进
+        self.entries: List[Tuple[str, str, Dict[str, Any]]] = []
+        self.last_id = "0-0"
+        self.finished = False
+        self.error: Optional[Exception] = None
+        self.viewers = 0
+        self.condition = asyncio.Condition()
+        self.task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        try:
+            while self.viewers > 0 and not self.finished:
+                result = await redis.xread({self.key: self.last_id}, count=STREAM_READ_COUNT, block=STREAM_BLOCK_MS)
+                if not result:
+                    continue
+                for entry_id, fields in result[0][1]:
+                    raw = fields["data"]
+                    response = json.loads(raw)
+                    self.entries.append((entry_id, raw, response))
+                    self.last_id = entry_id
+                    if is_terminal(response):
+                        self.finished = True
+                async with self.condition:
+                    self.condition.notify_all()
+        except Exception as e:
+            logger.error(f"Error reading response stream for {self.agent_run_id}: {e}")
+            self.error = e
+        finally:
+            self.finished = True
+            async with self.condition:
+                self.condition.notify_all()
+            if _tails.get(self.agent_run_id) is self:
+                del _tails[self.agent_run_id]
+
+    async def iterate(self, after_id: Optional[str] = None) -> AsyncIterator[Tuple[str, str, Dict[str, Any]]]:
+        position = 0
+        while True:
+            async with self.condition:
+                await self.condition.wait_for(lambda: position < len(self.entries) or self.finished)
+            while position < len(self.entries):
+                entry = self.entries[position]
+                position += 1
+                if after_id is None or _entry_key(entry[0]) > _entry_key(after_id):
+                    yield entry
+            if self.finished and position >= len(self.entries):
+                if self.error:
+                    raise self.error
+                return
+
+
+_tails: Dict[str, _StreamTail] = {}
+
+
+def _entry_key(entry_id: str) -> Tuple[int, int]:
+    ms, _, seq = entry_id.partition("-")
+    return int(ms), int(seq or 0)
+
+
+async def iterate_stream(agent_run_id: str, after_id: Optional[str] = None) -> AsyncIterator[Tuple[str, str, Dict[str, Any]]]:
+    """
+    按顺序读取运行的响应，直到出现结束状态或控制信号
+
+    Args:
+        agent_run_id: 运行 ID
+        after_id: 只返回该条目 id 之后的响应（断线重连时的 Last-Event-ID）
+
+    Yields:
+        (条目 id, 原始 JSON, 解析后的响应)
+    """
+    if after_id is not None:
+        try:
+            _entry_key(after_id)
+        except ValueError:
+            after_id = None
+
+    tail = _tails.get(agent_run_id)
+    if tail is None or tail.finished:
+        tail = _tails[agent_run_id] = _StreamTail(agent_run_id)
+    tail.viewers += 1
+    if tail.task is None:
+        tail.task = asyncio.create_task(tail._run())
+    try:
+        async for item in tail.iterate(after_id):
+            yield item
+    finally:
+        tail.viewers -= 1
@@ -0,0 +1,473 @@
+"""
+基于 asyncpg 的 ADK 会话服务 - DatabaseSessionService 的原生异步实现
+
+ADK 自带的 DatabaseSessionService 在 async 方法中使用同步 SQLAlchemy 会话
+（sql_session.get / commit / refresh），每个流式事件都会阻塞 FastAPI / Dramatiq
+的事件循环。本服务直接复用 services.postgresql.DBConnection 的 asyncpg 连接池：
+- 表结构与 DatabaseSessionService 完全一致（sessions / events / app_states / user_states）
+- append_event 在一条 SQL 中完成过期检查、三级状态增量合并和事件写入
+- append_events 支持批量写入多个事件，只需一次往返
+- actions 使用 services.event_codec 的带版本头编码，兼容读取旧的 pickle 数据
+- 读取完整历史时缓存已解码的事件，之后只拉取新事件；事件版本号变化时整段重新加载
+"""
+
+import bisect
+import json
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from google.adk.events.event import Event # type: ignore
+from google.adk.events.event_actions import EventActions # type: ignore
+from google.adk.sessions import _session_util # type: ignore
+from google.adk.sessions.base_session_service import BaseSessionService, GetSessionConfig, ListSessionsResponse # type: ignore
+from google.adk.sessions.session import Session # type: ignore
+from google.adk.sessions.state import State # type: ignore
+
+from services.event_codec import decode_actions, encode_actions
+from services.event_version import bump_event_version, get_event_version
+from services.postgresql import DBConnection
+from utils.config import config
+from utils.logger import logger
+
+# update_time 以 epoch 秒（float）在内存中传递，比较时允许 1 微秒的浮点误差
+_STALE_TOLERANCE_SECONDS = 0.000001
+# 进程内缓存完整事件历史的会话数
+_SESSION_EVENT_CACHE_SIZE = 256
+# 增量加载时回看的时间窗口：事件按创建时间打时间戳，但可能在之后才写入
+_EVENT_LOOKBACK_SECONDS = 300
+
+_EVENT_COLUMNS = (
+    "id, app_name, user_id, session_id, invocation_id, author, branch, timestamp, "
+    "content, actions, long_running_tool_ids_json, grounding_metadata, partial, "
+    "turn_complete, error_code, error_message, interrupted"
+)
+
+# 单事件追加：过期检查 + 会话/应用/用户状态合并 + 插入事件，一次往返完成
+# 只有会话更新成功（未过期）时，后续的状态合并和事件写入才会执行
+_APPEND_EVENT_SQL = f"""
+WITH s AS (
+    UPDATE sessions
+    SET state = state || $4::jsonb, update_time = now()
+    WHERE app_name = $1 AND user_id = $2 AND id = $3
+      AND EXTRACT(EPOCH FROM update_time) <= $5::float8 + {_STALE_TOLERANCE_SECONDS}
+    RETURNING EXTRACT(EPOCH FROM update_time)::float8 AS update_ts
+), a AS (
+    INSERT INTO app_states (app_name, state, update_time)
+    SELECT $1, $6::jsonb, now() FROM s WHERE $6::jsonb <> '{{}}'::jsonb
+    ON CONFLICT (app_name) DO UPDATE
+    SET state = app_states.state || EXCLUDED.state, update_time = now()
+), u AS (
+    INSERT INTO user_states (app_name, user_id, state, update_time)
+    SELECT $1, $2, $7::jsonb, now() FROM s WHERE $7::jsonb <> '{{}}'::jsonb
+    ON CONFLICT (app_name, user_id) DO UPDATE
+    SET state = user_states.state || EXCLUDED.state, update_time = now()
+), e AS (
+    INSERT INTO events ({_EVENT_COLUMNS})
+    SELECT ev.id, $1, $2, $3, ev.invocation_id, ev.author, ev.branch, ev.timestamp,
+           ev.content, ev.actions, ev.long_running_tool_ids_json, ev.grounding_metadata,
+           ev.partial, ev.turn_complete, ev.error_code, ev.error_message, ev.interrupted
+    FROM s, unnest(
+        $8::varchar[], $9::varchar[], $10::varchar[], $11::varchar[], $12::timestamptz[],
+        $13::jsonb[], $14::bytea[], $15::text[], $16::jsonb[], $17::bool[],
+        $18::bool[], $19::varchar[], $20::varchar[], $21::bool[]
+    ) AS ev(id, invocation_id, author, branch, timestamp, content, actions,
+            long_running_tool_ids_json, grounding_metadata, partial,
+            turn_complete, error_code, error_message, interrupted)
+)
+SELECT update_ts FROM s
+"""
+
+_CREATE_SESSION_SQL = """
+WITH a AS (
+    INSERT INTO app_states (app_name, state, update_time)
+    VALUES ($1, $4::jsonb, now())
+    ON CONFLICT (app_name) DO UPDATE
+    SET state = app_states.state || EXCLUDED.state, update_time = now()
+    WHERE EXCLUDED.state <> '{}'::jsonb
+    RETURNING state
+), u AS (
+    INSERT INTO user_states (app_name, user_id, state, update_time)
+    VALUES ($1, $2, $5::jsonb, now())
+    ON CONFLICT (app_name, user_id) DO UPDATE
+    SET state = user_states.state || EXCLUDED.state, update_time = now()
+    WHERE EXCLUDED.state <> '{}'::jsonb
+    RETURNING state
+), s AS (
+    INSERT INTO sessions (app_name, user_id, id, state, create_time, update_time)
+    VALUES ($1, $2, $3, $6::jsonb, now(), now())
+    RETURNING state, EXTRACT(EPOCH FROM update_time)::float8 AS update_ts
+)
+SELECT s.state, s.update_ts,
+       COALESCE((SELECT state FROM a), (SELECT state FROM app_states WHERE app_name = $1), '{}'::jsonb) AS app_state,
+       COALESCE((SELECT state FROM u), (SELECT state FROM user_states WHERE app_name = $1 AND user_id = $2), '{}'::jsonb) AS user_state
+FROM s
+"""
+
+# 会话与应用/用户状态一次查出
+_GET_SESSION_SQL = """
+SELECT s.state, EXTRACT(EPOCH FROM s.update_time)::float8 AS update_ts,
+       COALESCE(a.state, '{}'::jsonb) AS app_state,
+       COALESCE(u.state, '{}'::jsonb) AS user_state
+FROM sessions s
+LEFT JOIN app_states a ON a.app_name = s.app_name
+LEFT JOIN user_states u ON u.app_name = s.app_name AND u.user_id = s.user_id
+WHERE s.app_name = $1 AND s.user_id = $2 AND s.id = $3
+"""
+
+
+def _load_json(value: Any) -> Any:
+    """asyncpg 默认以字符串返回 jsonb，这里统一解码"""
+    if isinstance(value, str):
+        return json.loads(value)
+    return value
+
+
+def _extract_state_delta(state: Optional[Dict[str, Any]]) -> Tuple[Dict[str, Any], Dict[str, Any], Dict[str, Any]]:
+    """按前缀拆分 app / user / session 三级状态增量，temp: 前缀的键不持久化"""
+    app_state_delta = {}
+    user_state_delta = {}
+    session_state_delta = {}
+    for key, value in (state or {}).items():
+        if key.startswith(State.APP_PREFIX):
+            app_state_delta[key.removeprefix(State.APP_PREFIX)] = value
+        elif key.startswith(State.USER_PREFIX):
+            user_state_delta[key.removeprefix(State.USER_PREFIX)] = value
+        elif not key.startswith(State.TEMP_PREFIX):
+            session_state_delta[key] = value
+    return app_state_delta, user_state_delta, session_state_delta
+
+
+def _merge_state(app_state: Dict[str, Any], user_state: Dict[str, Any], session_state: Dict[str, Any]) -> Dict[str, Any]:
+    """合并三级状态用于返回（session_state 来自刚解码的 JSON，无需深拷贝）"""
+    merged_state = dict(session_state)
+    for key, value in app_state.items():
+        merged_state[State.APP_PREFIX + key] = value
+    for key, value in user_state.items():
+        merged_state[State.USER_PREFIX + key] = value
+    return merged_state
+
+
+def _event_to_row(event: Event) -> Tuple[Any, ...]:
+    """把事件转换为 unnest 使用的列值（不含 app_name/user_id/session_id）"""
+    return (
+        event.id,
+        event.invocation_id,
+        event.author,
+        event.branch,
+        datetime.fromtimestamp(event.timestamp, tz=timezone.utc),
+        json.dumps(event.content.model_dump(exclude_none=True, mode="json")) if event.content else None,
+        encode_actions(event.actions, config.ADK_EVENT_ACTIONS_CODEC),
+        json.dumps(list(event.long_running_tool_ids)) if event.long_running_tool_ids is not None else None,
+        json.dumps(event.grounding_metadata.model_dump(exclude_none=True, mode="json")) if event.grounding_metadata else None,
+        event.partial,
+        event.turn_complete,
+        event.error_code,
+        event.error_message,
+        event.interrupted,
+    )
+
+
+def _row_to_event(row: Any) -> Event:
+    """把 events 表的一行转换为 ADK Event"""
+    long_running_tool_ids_json = row["long_running_tool_ids_json"]
+    # 直接写入 events 表的行可能没有 actions，Event.actions 不能为 None
+    actions = decode_actions(row["actions"]) if row["actions"] is not None else EventActions()
+    return Event(
+        id=row["id"],
+        invocation_id=row["invocation_id"],
+        author=row["author"],
+        branch=row["branch"],
+        actions=actions,
+        timestamp=row["timestamp"].timestamp(),
+        content=_session_util.decode_content(_load_json(row["content"])),
+        long_running_tool_ids=set(json.loads(long_running_tool_ids_json)) if long_running_tool_ids_json else set(),
+        partial=row["partial"],
+        turn_complete=row["turn_complete"],
+        error_code=row["error_code"],
+        error_message=row["error_message"],
+        interrupted=row["interrupted"],
+        grounding_metadata=_session_util.decode_grounding_metadata(_load_json(row["grounding_metadata"])),
+    )
+
+
+class _SessionEvents:
+    """单个会话已解码的事件，按时间戳有序"""
+
+    __slots__ = ("events", "timestamps", "ids", "last_timestamp", "version")
+
+    def __init__(self, version: Optional[str] = None):
+        self.events: List[Event] = []
+        self.timestamps: List[datetime] = []
+        self.ids: set = set()
+        self.last_timestamp: Optional[datetime] = None
+        # 缓存建立时会话的事件版本号，版本号变化说明已有事件被删除或修改
+        self.version = version
+
+    def add(self, timestamp: datetime, event: Event) -> None:
+        # 晚提交的事件按时间戳插入到正确位置
+        index = bisect.bisect_right(self.timestamps, timestamp)
+        self.timestamps.insert(index, timestamp)
+        self.events.insert(index, event)
+        self.ids.add(event.id)
+        if self.last_timestamp is None or timestamp > self.last_timestamp:
+            self.last_timestamp = timestamp
+
+
+class AsyncDBSessionService(BaseSessionService):
+    """
+    使用 asyncpg 连接池的 ADK 会话服务
+
+    与 DatabaseSessionService 使用相同的表结构，可以直接替换；
+    表由 migrations/fufanmanus.sql 创建，这里不再执行 create_all。
+    """
+
+    # 读取会话时跳过的事件作者（这些事件由应用直接写入，不属于 ADK 会话历史）
+    excluded_authors: Tuple[str, ...] = ()
+
+    def __init__(self, db: Optional[DBConnection] = None):
+        self._db = db or DBConnection()
+        # (app_name, user_id, session_id) -> 已解码的事件，用于增量加载完整历史
+        self._event_cache: "OrderedDict[Tuple[str, str, str], _SessionEvents]" = OrderedDict()
+
+    async def _pool(self):
+        client = await self._db.client
+        return client.pool
+
+    async def create_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        state: Optional[Dict[str, Any]] = None,
+        session_id: Optional[str] = None,
+    ) -> Session:
+        app_state_delta, user_state_delta, session_state = _extract_state_delta(state)
+        session_id = session_id or str(uuid.uuid4())
+        self._event_cache.pop((app_name, user_id, session_id), None)
+
+        pool = await self._pool()
+        async with pool.acquire() as conn:
+            row = await conn.fetchrow(
+                _CREATE_SESSION_SQL,
+                app_name,
+                user_id,
+                session_id,
+                json.dumps(app_state_delta),
+                json.dumps(user_state_delta),
+                json.dumps(session_state),
+            )
+
+        merged_state = _merge_state(
+            _load_json(row["app_state"]),
+            _load_json(row["user_state"]),
+            _load_json(row["state"]),
+        )
+        return Session(
+            app_name=app_name,
+            user_id=user_id,
+            id=session_id,
+            state=merged_state,
+            events=[],
+            last_update_time=row["update_ts"],
+        )
+
+    async def get_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        session_id: str,
+        config: Optional[GetSessionConfig] = None,
+    ) -> Optional[Session]:
+        key = (app_name, user_id, session_id)
+        # 未指定窗口时读取完整历史：使用进程内缓存，只拉取游标之后的新事件
+        cached = self._event_cache.get(key) if not config else None
+        if not config:
+            # 在查询前读取版本号，与本次加载并发的修改会在下次读取时发现
+            version = await get_event_version(session_id)
+            if cached is not None and (version is None or cached.version != version):
+                cached = None
+
+        conditions = ["app_name = $1", "user_id = $2", "session_id = $3"]
+        params: List[Any] = [app_name, user_id, session_id]
+        if self.excluded_authors:
+            params.append(list(self.excluded_authors))
+            conditions.append(f"author <> ALL(${len(params)}::text[])")
+        if config and config.after_timestamp:
+            params.append(datetime.fromtimestamp(config.after_timestamp, tz=timezone.utc))
+            conditions.append(f"timestamp >= ${len(params)}")
+        elif cached is not None and cached.last_timestamp is not None:
+            params.append(cached.last_timestamp - timedelta(seconds=_EVENT_LOOKBACK_SECONDS))
+            conditions.append(f"timestamp >= ${len(params)}")
+
+        events_sql = f"SELECT {_EVENT_COLUMNS} FROM events WHERE {' AND '.join(conditions)} ORDER BY timestamp DESC"
+        if config and config.num_recent_events:
+            params.append(config.num_recent_events)
+            events_sql += f" LIMIT ${len(params)}"
+
+        pool = await self._pool()
+        async with pool.acquire() as conn:
+            session_row = await conn.fetchrow(_GET_SESSION_SQL, app_name, user_id, session_id)
+            if session_row is None:
+                self._event_cache.pop(key, None)
+                return None
+            event_rows = await conn.fetch(events_sql, *params)
+
+        merged_state = _merge_state(
+            _load_json(session_row["app_state"]),
+            _load_json(session_row["user_state"]),
+            _load_json(session_row["state"]),
+        )
+
+        if config:
+            events = [_row_to_event(row) for row in reversed(event_rows)]
+        else:
+            if cached is None:
+                cached = _SessionEvents(version)
+            for row in reversed(event_rows):
+                if row["id"] not in cached.ids:
+                    cached.add(row["timestamp"], _row_to_event(row))
+            self._event_cache[key] = cached
+            self._event_cache.move_to_end(key)
+            while len(self._event_cache) > _SESSION_EVENT_CACHE_SIZE:
+                self._event_cache.popitem(last=False)
+            # Runner 会向 session.events 追加事件，返回列表副本避免污染缓存
+            events = list(cached.events)
+
+        return Session(
+            app_name=app_name,
+            user_id=user_id,
+            id=session_id,
+            state=merged_state,
+            events=events,
+            last_update_time=session_row["update_ts"],
+        )
+
+    async def list_sessions(self, *, app_name: str, user_id: str) -> ListSessionsResponse:
+        pool = await self._pool()
+        async with pool.acquire() as conn:
+            rows = await conn.fetch(
+                """
+                SELECT s.id, s.state, EXTRACT(EPOCH FROM s.update_time)::float8 AS update_ts,
+                       COALESCE(a.state, '{}'::jsonb) AS app_state,
+                       COALESCE(u.state, '{}'::jsonb) AS user_state
+                FROM sessions s
+                LEFT JOIN app_states a ON a.app_name = s.app_name
+                LEFT JOIN user_states u ON u.app_name = s.app_name AND u.user_id = s.user_id
+                WHERE s.app_name = $1 AND s.user_id = $2
+                """,
+                app_name,
+                user_id,
+            )
+
+        sessions = []
+        for row in rows:
+            merged_state = _merge_state(
+                _load_json(row["app_state"]),
+                _load_json(row["user_state"]),
+                _load_json(row["state"]),
+            )
+            sessions.append(Session(
+                app_name=app_name,
+                user_id=user_id,
+                id=row["id"],
+                state=merged_state,
+                events=[],
+                last_update_time=row["update_ts"],
+            ))
+        return ListSessionsResponse(sessions=sessions)
+
+    async def delete_session(self, *, app_name: str, user_id: str, session_id: str) -> None:
+        self._event_cache.pop((app_name, user_id, session_id), None)
+        pool = await self._pool()
+        async with pool.acquire() as conn:
+            await conn.execute(
+                "DELETE FROM sessions WHERE app_name = $1 AND user_id = $2 AND id = $3",
+                app_name,
+                user_id,
+                session_id,
+            )
+        # 其他进程可能还缓存着这个会话的事件
+        await bump_event_version(session_id)
+
+    async def append_event(self, session: Session, event: Event) -> Event:
+        if event.partial:
+            return event
+
+        await self._write_events(session, [event])
+
+        # Also update the in-memory session
+        await super().append_event(session=session, event=event)
+        return event
+
+    async def append_events(self, session: Session, events: List[Event]) -> List[Event]:
+        """
+        批量追加事件：所有事件和合并后的状态增量在同一条 SQL 中写入
+
+        适用于一次产生多个事件的场景（如多个工具结果），
+        相比逐条 append_event 只需要一次数据库往返。
+        """
+        events = [event for event in events if not event.partial]
+        if not events:
+            return events
+
+        await self._write_events(session, events)
+
+        for event in events:
+            await super().append_event(session=session, event=event)
+        return events
+
+    async def _write_events(self, session: Session, events: List[Event]) -> None:
+        """执行过期检查、状态增量合并并写入事件"""
+        app_state_delta: Dict[str, Any] = {}
+        user_state_delta: Dict[str, Any] = {}
+        session_state_delta: Dict[str, Any] = {}
+        for event in events:
+            if event.actions and event.actions.state_delta:
+                app_delta, user_delta, session_delta = _extract_state_delta(event.actions.state_delta)
+                app_state_delta.update(app_delta)
+                user_state_delta.update(user_delta)
+                session_state_delta.update(session_delta)
+
+        # 按列转置，作为 unnest 的数组参数
+        columns = list(zip(*(_event_to_row(event) for event in events)))
+
+        pool = await self._pool()
+        async with pool.acquire() as conn:
+            update_ts = await conn.fetchval(
+                _APPEND_EVENT_SQL,
+                session.app_name,
+                session.user_id,
+                session.id,
+                json.dumps(session_state_delta),
+                session.last_update_time,
+                json.dumps(app_state_delta),
+                json.dumps(user_state_delta),
+                *[list(column) for column in columns],
+            )
+
+            if update_ts is None:
+                # 区分会话不存在与会话过期（仅在出错路径上多查一次）
+                storage_ts = await conn.fetchval(
+                    "SELECT EXTRACT(EPOCH FROM update_time)::float8 FROM sessions WHERE app_name = $1 AND user_id = $2 AND id = $3",
+                    session.app_name,
+                    session.user_id,
+                    session.id,
+                )
+
+        if update_ts is None:
+            if storage_ts is None:
+                raise ValueError(f"Session {session.id} not found.")
+            raise ValueError(
+                "The last_update_time provided in the session object"
+                f" {datetime.fromtimestamp(session.last_update_time):'%Y-%m-%d %H:%M:%S'} is"
+                " earlier than the update_time in the storage_session"
+                f" {datetime.fromtimestamp(storage_ts):'%Y-%m-%d %H:%M:%S'}."
+                " Please check if it is a stale session."
+            )
+
+        # Update timestamp with commit time
+        session.last_update_time = update_ts
+        logger.debug(f"Appended {len(events)} events to session {session.id}")
@@ -14,11 +14,13 @@ from utils.cache import Cache
 from utils.logger import logger
 from utils.config import config, EnvMode
 from services.postgresql import DBConnection
+from services import usage_ledger
 from utils.simple_auth_middleware import get_current_user_id_from_jwt
 from pydantic import BaseModel
 from utils.constants import MODEL_ACCESS_TIERS, MODEL_NAME_ALIASES, HARDCODED_MODEL_PRICES
 from litellm.cost_calculator import cost_per_token
 import time
+import asyncio
 
 # Initialize Stripe
 stripe.api_key = config.STRIPE_SECRET_KEY
@@ -165,21 +167,19 @@ class SubscriptionStatus(BaseModel):
     subscription: Optional[Dict] = None
 
 # Helper functions
-async def get_stripe_customer_id(client: SupabaseClient, user_id: str) -> Optional[str]:
+async def get_stripe_customer_id(client, user_id: str) -> Optional[str]:
     """Get the Stripe customer ID for a user."""
 
-    result = await Cache.get(f"stripe_customer_id:{user_id}")
-    if result:
-        return result
-
-    result = await client.schema('basejump').from_('billing_customers') \
-        .select('id') \
-        .eq('account_id', user_id) \
-        .execute()
+    async def load_from_db() -> Optional[str]:
+        result = await client.schema('basejump').from_('billing_customers') \
+            .select('id') \
+            .eq('account_id', user_id) \
+            .execute()
+        return result.data[0]['id'] if result.data else None
 
-    if result.data and len(result.data) > 0:
-        customer_id = result.data[0]['id']
-        await Cache.set(f"stripe_customer_id:{user_id}", customer_id, ttl=24 * 60)
+    # Only IDs found in billing_customers are cached, a missing customer may be created any moment
+    customer_id = await Cache.get_or_set(f"stripe_customer_id:{user_id}", load_from_db, ttl=24 * 60, cache_none=False)
+    if customer_id:
         return customer_id
 
     customer_result = await stripe.Customer.search_async(
@@ -240,128 +240,83 @@ async def create_stripe_customer(client, user_id: str, email: str) -> str:
 async def get_user_subscription(user_id: str) -> Optional[Dict]:
     """Get the current subscription for a user from Stripe."""
     try:
-        result = await Cache.get(f"user_subscription:{user_id}")
-        if result:
-            return result
-
-        # Get customer ID
-        db = DBConnection()
-        client = await db.client
-        customer_id = await get_stripe_customer_id(client, user_id)
-        
-        if not customer_id:
-            await Cache.set(f"user_subscription:{user_id}", None, ttl=1 * 60)
-            return None
-            
-        # Get all active subscriptions for the customer
-        subscriptions = await stripe.Subscription.list_async(
-            customer=customer_id,
-            status='active'
-        )
-        # print("Found subscriptions:", subscriptions)
-        
-        # Check if we have any subscriptions
-        if not subscriptions or not subscriptions.get('data'):
-            await Cache.set(f"user_subscription:{user_id}", None, ttl=1 * 60)
-            return None
-            
-        # Filter subscriptions to only include our product's subscriptions
-        our_subscriptions = []
-        for sub in subscriptions['data']:
-            # Check if subscription items contain any of our price IDs
-            for item in sub.get('items', {}).get('data', []):
-                price_id = item.get('price', {}).get('id')
-                if price_id in [
-                    config.STRIPE_FREE_TIER_ID,
-                    config.STRIPE_TIER_2_20_ID, config.STRIPE_TIER_6_50_ID, config.STRIPE_TIER_12_100_ID,
-                    config.STRIPE_TIER_25_200_ID, config.STRIPE_TIER_50_400_ID, config.STRIPE_TIER_125_800_ID,
-                    config.STRIPE_TIER_200_1000_ID,
-                    # Yearly tiers
-                    config.STRIPE_TIER_2_20_YEARLY_ID, config.STRIPE_TIER_6_50_YEARLY_ID,
-                    config.STRIPE_TIER_12_100_YEARLY_ID, config.STRIPE_TIER_25_200_YEARLY_ID,
-                    config.STRIPE_TIER_50_400_YEARLY_ID, config.STRIPE_TIER_125_800_YEARLY_ID,
-                    config.STRIPE_TIER_200_1000_YEARLY_ID,
-                    # Yearly commitment tiers (monthly payments with 12-month commitment)
-                    config.STRIPE_TIER_2_17_YEARLY_COMMITMENT_ID,
-                    config.STRIPE_TIER_6_42_YEARLY_COMMITMENT_ID,
-                    config.STRIPE_TIER_25_170_YEARLY_COMMITMENT_ID
-                ]:
-                    our_subscriptions.append(sub)
-        
-        if not our_subscriptions:
-            await Cache.set(f"user_subscription:{user_id}", None, ttl=1 * 60)
-            return None
-            
-        # If there are multiple active subscriptions, we need to handle this
-        if len(our_subscriptions) > 1:
-            logger.warning(f"User {user_id} has multiple active subscriptions: {[sub['id'] for sub in our_subscriptions]}")
-            
-            # Get the most recent subscription
-            most_recent = max(our_subscriptions, key=lambda x: x['created'])
-            
-            # Cancel all other subscriptions
-            for sub in our_subscriptions:
-                if sub['id'] != most_recent['id']:
-                    try:
-                        await stripe.Subscription.modify_async(
-                            sub['id'],
-                            cancel_at_period_end=True
-                        )
-                        logger.info(f"Cancelled subscription {sub['id']} for user {user_id}")
-                    except Exception as e:
-                        logger.error(f"Error cancelling subscription {sub['id']}: {str(e)}")
-            
-            return most_recent
-
-        result = our_subscriptions[0]
-        await Cache.set(f"user_subscription:{user_id}", result, ttl=1 * 60)
-        return result
-        
+        return await Cache.get_or_set(f"user_subscription:{user_id}", lambda: _fetch_user_subscription(user_id), ttl=1 * 60)
     except Exception as e:
         logger.error(f"Error getting subscription from Stripe: {str(e)}")
         return None
 
-async def calculate_monthly_usage(client, user_id: str) -> float:
-    """Calculate total agent run minutes for the current month for a user."""
-    result = await Cache.get(f"monthly_usage:{user_id}")
-    if result:
-        return result
-
-    start_time = time.time()
+async def _fetch_user_subscription(user_id: str) -> Optional[Dict]:
+    """Look up the user's active subscription to one of our products in Stripe."""
+    # Get customer ID
+    db = DBConnection()
+    client = await db.client
+    customer_id = await get_stripe_customer_id(client, user_id)
     
-    # Use get_usage_logs to fetch all usage data (it already handles the date filtering and batching)
-    total_cost = 0.0
-    page = 0
-    items_per_page = 1000
+    if not customer_id:
+        return None
+        
+    # Get all active subscriptions for the customer
+    subscriptions = await stripe.Subscription.list_async(
+        customer=customer_id,
+        status='active'
+    )
+    # print("Found subscriptions:", subscriptions)
     
-    while True:
-        # Get usage logs for this page
-        usage_result = await get_usage_logs(client, user_id, page, items_per_page)
+    # Check if we have any subscriptions
+    if not subscriptions or not subscriptions.get('data'):
+        return None
         
-        if not usage_result['logs']:
-            break
+    # Filter subscriptions to only include our product's subscriptions
+    our_subscriptions = []
+    for sub in subscriptions['data']:
+        # Check if subscription items contain any of our price IDs
+        for item in sub.get('items', {}).get('data', []):
+            price_id = item.get('price', {}).get('id')
+            if price_id in [
+                config.STRIPE_FREE_TIER_ID,
+                config.STRIPE_TIER_2_20_ID, config.STRIPE_TIER_6_50_ID, config.STRIPE_TIER_12_100_ID,
+                config.STRIPE_TIER_25_200_ID, config.STRIPE_TIER_50_400_ID, config.STRIPE_TIER_125_800_ID,
+                config.STRIPE_TIER_200_1000_ID,
+                # Yearly tiers
+                config.STRIPE_TIER_2_20_YEARLY_ID, config.STRIPE_TIER_6_50_YEARLY_ID,
+                config.STRIPE_TIER_12_100_YEARLY_ID, config.STRIPE_TIER_25_200_YEARLY_ID,
+                config.STRIPE_TIER_50_400_YEARLY_ID, config.STRIPE_TIER_125_800_YEARLY_ID,
+                config.STRIPE_TIER_200_1000_YEARLY_ID,
+                # Yearly commitment tiers (monthly payments with 12-month commitment)
+                config.STRIPE_TIER_2_17_YEARLY_COMMITMENT_ID,
+                config.STRIPE_TIER_6_42_YEARLY_COMMITMENT_ID,
+                config.STRIPE_TIER_25_170_YEARLY_COMMITMENT_ID
+            ]:
+                our_subscriptions.append(sub)
+    
+    if not our_subscriptions:
+        return None
         
-        # Sum up the estimated costs from this page
-        for log_entry in usage_result['logs']:
-            total_cost += log_entry['estimated_cost']
+    # If there are multiple active subscriptions, we need to handle this
+    if len(our_subscriptions) > 1:
+        logger.warning(f"User {user_id} has multiple active subscriptions: {[sub['id'] for sub in our_subscriptions]}")
         
-        # If there are no more pages, break
-        if not usage_result['has_more']:
-            break
-            
-        page += 1
-    
-    end_time = time.time()
-    execution_time = end_time - start_time
-    logger.info(f"Calculate monthly usage took {execution_time:.3f} seconds, total cost: {total_cost}")
-    
-    await Cache.set(f"monthly_usage:{user_id}", total_cost, ttl=2 * 60)
-    return total_cost
+        # Get the most recent subscription
+        most_recent = max(our_subscriptions, key=lambda x: x['created'])
+        
+        # Cancel all other subscriptions
+        for sub in our_subscriptions:
+            if sub['id'] != most_recent['id']:
+                try:
+                    await stripe.Subscription.modify_async(
+                        sub['id'],
+                        cancel_at_period_end=True
+                    )
+                    logger.info(f"Cancelled subscription {sub['id']} for user {user_id}")
+                except Exception as e:
+                    logger.error(f"Error cancelling subscription {sub['id']}: {str(e)}")
+        
+        return most_recent
 
+    return our_subscriptions[0]
 
-async def get_usage_logs(client, user_id: str, page: int = 0, items_per_page: int = 1000) -> Dict:
-    """Get detailed usage logs for a user with pagination."""
-    # Get start of current month in UTC
+def _usage_period_start() -> datetime:
+    """Start of the current billing month in UTC."""
     now = datetime.now(timezone.utc)
     start_of_month = datetime(now.year, now.month, 1, tzinfo=timezone.utc)
     
@@ -369,90 +324,70 @@ async def get_usage_logs(client, user_id: str, page: int = 0, items_per_page: in
     # Ignore all token counts before this date
     cutoff_date = datetime(2025, 6, 30, 9, 0, 0, tzinfo=timezone.utc)
     
-    start_of_month = max(start_of_month, cutoff_date)
-    
-    # First get all threads for this user in batches
-    batch_size = 1000
-    offset = 0
-    all_threads = []
-    
-    while True:
-        threads_batch = await client.table('threads') \
-            .select('thread_id, agent_runs(thread_id)') \
-            .eq('account_id', user_id) \
-            .gte('agent_runs.created_at', start_of_month.isoformat()) \
-            .range(offset, offset + batch_size - 1) \
-            .execute()
-        
-        if not threads_batch.data:
-            break
-            
-        all_threads.extend(threads_batch.data)
-        
-        # If we got less than batch_size, we've reached the end
-        if len(threads_batch.data) < batch_size:
-            break
-            
-        offset += batch_size
-    
-    if not all_threads:
-        return {"logs": [], "has_more": False}
-    
-    thread_ids = [t['thread_id'] for t in all_threads]
-    
-    # Fetch usage messages with pagination, including thread project info
+    return max(start_of_month, cutoff_date)
+
+async def calculate_monthly_usage(client, user_id: str) -> float:
+    """Calculate the estimated cost of this month's usage for a user from the daily usage ledger."""
+    return await Cache.get_or_set(f"monthly_usage:{user_id}", lambda: _sum_monthly_usage(client, user_id), ttl=30)
+
+async def _sum_monthly_usage(client, user_id: str) -> float:
     start_time = time.time()
-    messages_result = await client.table('messages') \
-        .select(
-            'message_id, thread_id, created_at, content, threads!inner(project_id)'
-        ) \
-        .in_('thread_id', thread_ids) \
-        .eq('type', 'assistant_response_end') \
-        .gte('created_at', start_of_month.isoformat()) \
-        .order('created_at', desc=True) \
-        .range(page * items_per_page, (page + 1) * items_per_page - 1) \
-        .execute()
-    
-    end_time = time.time()
-    execution_time = end_time - start_time
+    total_cost = await usage_ledger.get_cost_since(client, user_id, _usage_period_start().date())
+    execution_time = time.time() - start_time
+    logger.info(f"Calculate monthly usage took {execution_time:.3f} seconds, total cost: {total_cost}")
+    return total_cost
+
+
+# One page of a user's usage messages, joined to their threads in SQL. Only the
+# usage fields are read from content, not the whole response payload.
+_USAGE_LOGS_SQL = """
+SELECT m.message_id, m.thread_id, m.created_at, t.project_id,
+       COALESCE((m.content->'usage'->>'prompt_tokens')::bigint, 0) AS prompt_tokens,
+       COALESCE((m.content->'usage'->>'completion_tokens')::bigint, 0) AS completion_tokens,
+       COALESCE(m.content->>'model', 'unknown') AS model
+FROM messages m
+JOIN threads t ON t.thread_id = m.thread_id::text
+WHERE t.account_id = $1
+  AND m.type = 'assistant_response_end'
+  AND m.created_at >= $2
+ORDER BY m.created_at DESC, m.message_id DESC
+LIMIT $3 OFFSET $4
+"""
+
+async def get_usage_logs(client, user_id: str, page: int = 0, items_per_page: int = 1000) -> Dict:
+    """Get detailed usage logs for a user with pagination.
+
+    This endpoint lists individual LLM responses (message, thread and project
+    ids), so it stays per-message rather than reading usage_daily; per-day
+    totals are served from the ledger by /usage-daily. The threads are joined
+    in SQL instead of being listed first and passed as an IN list.
+    """
+    start_of_month = _usage_period_start()
+
+    start_time = time.time()
+    async with client.pool.acquire() as conn:
+        rows = await conn.fetch(
+            _USAGE_LOGS_SQL, user_id, start_of_month, items_per_page, page * items_per_page
+        )
+    execution_time = time.time() - start_time
     logger.info(f"Database query for usage logs took {execution_time:.3f} seconds")
 
-    if not messages_result.data:
+    if not rows:
         return {"logs": [], "has_more": False}
 
     # Process messages into usage log entries
     processed_logs = []
-    
-    for message in messages_result.data:
+
+    for row in rows:
         try:
-            # Safely extract usage data with defaults
-            content = message.get('content', {})
-            usage = content.get('usage', {})
-            
-            # Ensure usage has required fields with safe defaults
-            prompt_tokens = usage.get('prompt_tokens', 0)
-            completion_tokens = usage.get('completion_tokens', 0)
-            model = content.get('model', 'unknown')
-            
-            # Safely calculate total tokens
-            total_tokens = (prompt_tokens or 0) + (completion_tokens or 0)
-            
-            # Calculate estimated cost using the same logic as calculate_monthly_usage
-            estimated_cost = calculate_token_cost(
-                prompt_tokens,
-                completion_tokens,
-                model
-            )
-            
-            # Safely extract project_id from threads relationship
-            project_id = 'unknown'
-            if message.get('threads') and isinstance(message['threads'], list) and len(message['threads']) > 0:
-                project_id = message['threads'][0].get('project_id', 'unknown')
-            
+            prompt_tokens = row['prompt_tokens']
+            completion_tokens = row['completion_tokens']
+            model = row['model']
+
             processed_logs.append({
-                'message_id': message.get('message_id', 'unknown'),
-                'thread_id': message.get('thread_id', 'unknown'),
-                'created_at': message.get('created_at', None),
+                'message_id': str(row['message_id']),
+                'thread_id': str(row['thread_id']),
+                'created_at': row['created_at'].isoformat() if row['created_at'] else None,
                 'content': {
                     'usage': {
                         'prompt_tokens': prompt_tokens,
@@ -460,16 +395,17 @@ async def get_usage_logs(client, user_id: str, page: int = 0, items_per_page: in
                     },
                     'model': model
                 },
-                'total_tokens': total_tokens,
-                'estimated_cost': estimated_cost,
-                'project_id': project_id
+                'total_tokens': prompt_tokens + completion_tokens,
+                # Calculate estimated cost using the same logic as the usage ledger
+                'estimated_cost': calculate_token_cost(prompt_tokens, completion_tokens, model),
+                'project_id': row['project_id'] or 'unknown'
             })
         except Exception as e:
-            logger.warning(f"Error processing usage log entry for message {message.get('message_id', 'unknown')}: {str(e)}")
+            logger.warning(f"Error processing usage log entry for message {row['message_id']}: {str(e)}")
             continue
     
     # Check if there are more results
-    has_more = len(processed_logs) == items_per_page
+    has_more = len(rows) == items_per_page
     
     return {
         "logs": processed_logs,
@@ -551,10 +487,9 @@ async def get_allowed_models_for_user(client, user_id: str):
         List of model names allowed for the user's subscription tier.
     """
 
-    result = await Cache.get(f"allowed_models_for_user:{user_id}")
-    if result:
-        return result
+    return await Cache.get_or_set(f"allowed_models_for_user:{user_id}", lambda: _allowed_models_for_tier(user_id), ttl=1 * 60)
 
+async def _allowed_models_for_tier(user_id: str):
     subscription = await get_user_subscription(user_id)
     tier_name = 'free'
     
@@ -571,9 +506,7 @@ async def get_allowed_models_for_user(client, user_id: str):
             tier_name = tier_info['name']
     
     # Return allowed models for this tier
-    result = MODEL_ACCESS_TIERS.get(tier_name, MODEL_ACCESS_TIERS['free'])  # Default to free tier if unknown
-    await Cache.set(f"allowed_models_for_user:{user_id}", result, ttl=1 * 60)
-    return result
+    return MODEL_ACCESS_TIERS.get(tier_name, MODEL_ACCESS_TIERS['free'])  # Default to free tier if unknown
 
 
 async def can_use_model(client, user_id: str, model_name: str):
@@ -663,6 +596,90 @@ async def check_billing_status(client, user_id: str) -> Tuple[bool, str, Optiona
     
     return True, "OK", subscription
 
+# 组合预检结果的缓存时间，需要足够短，避免额度用尽后仍放行
+BILLING_PREFLIGHT_TTL_SECONDS = 15
+
+async def billing_preflight(client, user_id: str, model_name: str) -> Dict:
+    """
+    Check model access and billing status for an agent run in one call.
+
+    The subscription and this month's usage are fetched concurrently and the
+    allowed models are derived from the same subscription, instead of the
+    sequential can_use_model + check_billing_status lookups. The composite
+    verdict is cached for BILLING_PREFLIGHT_TTL_SECONDS.
+
+    Returns:
+        Dict with can_run, status_code (200, 402 or 403), message,
+        subscription and allowed_models
+    """
+    resolved_model = MODEL_NAME_ALIASES.get(model_name, model_name)
+    if config.ENV_MODE == EnvMode.LOCAL:
+        logger.info("Running in local development mode - billing checks are disabled")
+        return {
+            "can_run": True,
+            "status_code": 200,
+            "message": "Local development mode - billing disabled",
+            "subscription": {
+                "price_id": "local_dev",
+                "plan_name": "Local Development",
+                "minutes_limit": "no limit"
+            },
+            "allowed_models": [],
+        }
+
+    return await Cache.get_or_set(
+        f"billing_preflight:{user_id}:{resolved_model}",
+        lambda: _evaluate_billing_preflight(client, user_id, model_name, resolved_model),
+        ttl=BILLING_PREFLIGHT_TTL_SECONDS,
+    )
+
+async def _evaluate_billing_preflight(client, user_id: str, model_name: str, resolved_model: str) -> Dict:
+    subscription, current_usage = await asyncio.gather(
+        get_user_subscription(user_id),
+        calculate_monthly_usage(client, user_id),
+    )
+    if not subscription:
+        subscription = {
+            'price_id': config.STRIPE_FREE_TIER_ID,
+            'plan_name': 'free'
+        }
+
+    if subscription.get('items') and subscription['items'].get('data') and len(subscription['items']['data']) > 0:
+        price_id = subscription['items']['data'][0]['price']['id']
+    else:
+        price_id = subscription.get('price_id', config.STRIPE_FREE_TIER_ID)
+
+    tier_info = SUBSCRIPTION_TIERS.get(price_id)
+    if not tier_info:
+        logger.warning(f"Unknown subscription tier: {price_id}, defaulting to free tier")
+        tier_info = SUBSCRIPTION_TIERS[config.STRIPE_FREE_TIER_ID]
+    allowed_models = MODEL_ACCESS_TIERS.get(tier_info['name'], MODEL_ACCESS_TIERS['free'])
+
+    # 与原先的检查顺序一致：先校验模型权限，再校验额度
+    if resolved_model not in allowed_models:
+        return {
+            "can_run": False,
+            "status_code": 403,
+            "message": f"Your current subscription plan does not include access to {model_name}. Please upgrade your subscription or choose from your available models: {', '.join(allowed_models)}",
+            "subscription": subscription,
+            "allowed_models": allowed_models,
+        }
+    if current_usage >= tier_info['cost']:
+        return {
+            "can_run": False,
+            "status_code": 402,
+            "message": f"Monthly limit of {tier_info['cost']} dollars reached. Please upgrade your plan or wait until next month.",
+            "subscription": subscription,
+            "allowed_models": allowed_models,
+        }
+    return {
+        "can_run": True,
+        "status_code": 200,
+        "message": "OK",
+        "subscription": subscription,
+        "allowed_models": allowed_models,
+    }
+
 async def check_subscription_commitment(subscription_id: str) -> dict:
     """
     Check if a subscription has an active yearly commitment that prevents cancellation.
@@ -1596,6 +1613,33 @@ async def get_usage_logs_endpoint(
         logger.error(f"Error getting usage logs: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error getting usage logs: {str(e)}")
 
+@router.get("/usage-daily")
+async def get_daily_usage_endpoint(
+    current_user_id: str = Depends(get_current_user_id_from_jwt)
+):
+    """Get this month's usage aggregated per day and model."""
+    try:
+        db = DBConnection()
+        client = await db.client
+        
+        if config.ENV_MODE == EnvMode.LOCAL:
+            logger.info("Running in local development mode - usage is not available")
+            return {
+                "days": [],
+                "total_cost": 0.0,
+                "message": "Usage is not available in local development mode"
+            }
+        
+        days = await usage_ledger.get_daily_usage(client, current_user_id, _usage_period_start().date())
+        return {
+            "days": days,
+            "total_cost": sum(day['cost'] for day in days)
+        }
+        
+    except Exception as e:
+        logger.error(f"Error getting daily usage: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error getting daily usage: {str(e)}")
+
 @router.get("/subscription-commitment/{subscription_id}")
 async def get_subscription_commitment(
     subscription_id: str,
@@ -0,0 +1,143 @@
+"""
+ADK 事件 actions 编解码器
+
+ADK 的 DatabaseSessionService 把 events.actions 存为 PickleType：每次 get_session
+都要逐行 unpickle，每次 append_event 都要 pickle，体积大、速度慢，
+截断的数据还会在读取时抛出 EOFError("Ran out of input")。
+
+这里把 actions 编码为带版本头的紧凑格式，仍然存放在 bytea 列中：
+
+    b"\\x00E" + 格式标识(1字节) + schema 版本(1字节) + 负载
+
+- J: JSON（默认，无额外依赖）
+- M: msgpack（可选依赖，未安装时不可选）
+
+pickle 数据总是以 0x80 开头，因此没有头部的旧数据仍按 pickle 解码，
+新旧格式可以在同一张表中共存，由 scripts/06_migrate_event_actions.py 分批转换。
+
+编码名 "pickle"（默认配置）照旧写入 pickle，SQLAlchemy 的 DatabaseSessionService
+仍能读取；新格式的行只有异步会话服务能读取。
+"""
+
+import json
+import pickle
+from typing import Any, Dict, Optional
+
+from utils.logger import logger
+
+try:
+    import msgpack # type: ignore
+except ImportError:  # msgpack 为可选依赖
+    msgpack = None
+
+MAGIC = b"\x00E"
+# 不加版本头、与 DatabaseSessionService 兼容的旧格式
+PICKLE_CODEC = "pickle"
+HEADER_SIZE = len(MAGIC) + 2
+SCHEMA_VERSION = 1
+
+
+class EventCodecError(Exception):
+    """事件 actions 编解码失败"""
+    pass
+
+
+def _actions_to_dict(actions: Any) -> Optional[Dict[str, Any]]:
+    """把 EventActions（或已是 dict 的 actions）转换为 JSON 兼容的 dict"""
+    if actions is None:
+        return None
+    if isinstance(actions, dict):
+        return actions
+    # by_alias=False 保持字段名与 EventActions 属性一致，populate_by_name 可直接还原
+    return actions.model_dump(mode="json", exclude_none=True)
+
+
+class ActionsCodec:
+    """actions 编解码器基类"""
+
+    format_id: bytes = b""
+    name: str = ""
+
+    def dumps(self, data: Dict[str, Any]) -> bytes:
+        raise NotImplementedError
+
+    def loads(self, payload: bytes) -> Dict[str, Any]:
+        raise NotImplementedError
+
+
+class JsonActionsCodec(ActionsCodec):
+    format_id = b"J"
+    name = "json"
+
+    def dumps(self, data: Dict[str, Any]) -> bytes:
+        return json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+    def loads(self, payload: bytes) -> Dict[str, Any]:
+        return json.loads(payload)
+
+
+class MsgpackActionsCodec(ActionsCodec):
+    format_id = b"M"
+    name = "msgpack"
+
+    def dumps(self, data: Dict[str, Any]) -> bytes:
+        return msgpack.packb(data, use_bin_type=True)
+
+    def loads(self, payload: bytes) -> Dict[str, Any]:
+        return msgpack.unpackb(payload, raw=False)
+
+
+_CODECS: Dict[str, ActionsCodec] = {"json": JsonActionsCodec()}
+if msgpack is not None:
+    _CODECS["msgpack"] = MsgpackActionsCodec()
+_CODECS_BY_FORMAT: Dict[bytes, ActionsCodec] = {codec.format_id: codec for codec in _CODECS.values()}
+
+
+def get_codec(name: str) -> ActionsCodec:
+    """按名称获取编解码器"""
+    codec = _CODECS.get(name)
+    if codec is None:
+        raise EventCodecError(f"Unsupported event actions codec: {name} (available: {', '.join(_CODECS)})")
+    return codec
+
+
+def encode_actions(actions: Any, codec_name: str = "json") -> bytes:
+    """
+    编码 actions 为带版本头的字节串
+
+    state_delta 中可能包含无法 JSON 化的任意对象，此时回退到 pickle，
+    保证写入不失败（读取端会自动识别）。codec_name 为 "pickle" 时直接写 pickle。
+    """
+    if codec_name == PICKLE_CODEC:
+        return pickle.dumps(actions, protocol=pickle.HIGHEST_PROTOCOL)
+    codec = get_codec(codec_name)
+    try:
+        payload = codec.dumps(_actions_to_dict(actions) or {})
+    except (TypeError, ValueError) as e:
+        logger.warning(f"Event actions not serializable with {codec.name}, falling back to pickle: {e}")
+        return pickle.dumps(actions, protocol=pickle.HIGHEST_PROTOCOL)
+    return MAGIC + codec.format_id + bytes([SCHEMA_VERSION]) + payload
+
+
+def is_encoded(data: Optional[bytes]) -> bool:
+    """判断数据是否已经是新格式"""
+    return bool(data) and bytes(data[:len(MAGIC)]) == MAGIC
+
+
+def decode_actions(data: Optional[bytes]) -> Any:
+    """解码 actions；没有版本头的数据按旧的 pickle 格式处理"""
+    if data is None:
+        return None
+    data = bytes(data)
+    if not is_encoded(data):
+        return pickle.loads(data)
+
+    if len(data) < HEADER_SIZE:
+        raise EventCodecError("Truncated event actions header")
+    codec = _CODECS_BY_FORMAT.get(data[2:3])
+    if codec is None:
+        raise EventCodecError(f"Unknown event actions format: {data[2:3]!r}")
+    version = data[3]
+    if version > SCHEMA_VERSION:
+        raise EventCodecError(f"Event actions schema version {version} is newer than supported {SCHEMA_VERSION}")
+    return codec.loads(data[HEADER_SIZE:])
@@ -0,0 +1,50 @@
+"""
+会话事件版本号 - 跨进程失效事件缓存
+
+IncrementalMessageLoader 和 AsyncDBSessionService 在进程内缓存已读取的事件，
+之后只拉取游标之后的新事件，因此删除或修改已有事件（删除消息、同步
+invocation_id、清理损坏的会话）不会反映到其他进程的缓存里。
+
+每个会话在 Redis 中保存一个随机版本号：
+- 修改或删除事件后调用 bump_event_version 换一个新版本号
+- 读取缓存前调用 get_event_version，与缓存时记录的版本号不一致就整段重新加载
+- 版本号过期或不存在时会生成新的版本号，旧缓存同样会失效
+- Redis 不可用时返回 None，调用方不应使用缓存
+"""
+
+import uuid
+from typing import Optional
+
+from services import redis
+from utils.logger import logger
+
+# 版本号的过期时间，过期后生成新版本号，相当于一次失效
+EVENT_VERSION_TTL_SECONDS = 7 * 24 * 3600
+
+
+def _version_key(session_id: str) -> str:
+    return f"event_version:{session_id}"
+
+
+async def get_event_version(session_id: str) -> Optional[str]:
+    """获取会话当前的事件版本号，不存在时创建；Redis 不可用时返回 None"""
+    key = _version_key(session_id)
+    try:
+        version = await redis.get(key)
+        if version is None:
+            # 并发创建时只有一个写入成功，其他调用方读取已写入的版本号
+            version = uuid.uuid4().hex
+            if not await redis.set(key, version, ex=EVENT_VERSION_TTL_SECONDS, nx=True):
+                version = await redis.get(key)
+        return version
+    except Exception as e:
+        logger.warning(f"Failed to read event version for session {session_id}: {e}")
+        return None
+
+
+async def bump_event_version(session_id: str) -> None:
+    """会话的已有事件被修改或删除后调用，使所有进程中的事件缓存失效"""
+    try:
+        await redis.set(_version_key(session_id), uuid.uuid4().hex, ex=EVENT_VERSION_TTL_SECONDS)
+    except Exception as e:
+        logger.warning(f"Failed to bump event version for session {session_id}: {e}")
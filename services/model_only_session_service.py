@@ -3,9 +3,12 @@
 """
 
 from typing import Any, Optional
+from google.adk.sessions.base_session_service import GetSessionConfig # type: ignore
 from google.adk.sessions.database_session_service import DatabaseSessionService # type: ignore
 from google.adk.sessions.session import Session # type: ignore
 from google.adk.events.event import Event # type: ignore
+from agentpress.thread_summarizer import SUMMARY_AUTHOR
+from services.async_session_service import AsyncDBSessionService
 import logging
 
 logger = logging.getLogger(__name__)
@@ -20,6 +23,20 @@ class ModelOnlyDBSessionService(DatabaseSessionService):
         """初始化服务"""
         super().__init__(db_url, **kwargs)
         logger.info("ModelOnlyDBSessionService initialized - will filter user events")
+
+    async def get_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        session_id: str,
+        config: Optional[GetSessionConfig] = None,
+    ) -> Optional[Session]:
+        """线程摘要事件只供 agentpress 的消息加载使用，不返回给 ADK"""
+        session = await super().get_session(app_name=app_name, user_id=user_id, session_id=session_id, config=config)
+        if session is not None:
+            session.events = [event for event in session.events if event.author != SUMMARY_AUTHOR]
+        return session
     
     async def append_event(self, session: Session, event: Event) -> Event:
         """
@@ -33,4 +50,27 @@ class ModelOnlyDBSessionService(DatabaseSessionService):
         
         # 存储非用户事件（模型响应等）
         logger.debug(f"Storing non-user event: {event.id} (author: {getattr(event, 'author', 'unknown')})")
-        return await super().append_event(session, event) 
\ No newline at end of file
+        return await super().append_event(session, event)
+
+
+class ModelOnlyAsyncDBSessionService(AsyncDBSessionService):
+    """
+    ModelOnlyDBSessionService 的 asyncpg 版本，复用 DBConnection 连接池，
+    同样过滤用户事件，读取会话时跳过线程摘要事件
+    """
+
+    excluded_authors = (SUMMARY_AUTHOR,)
+
+    async def append_event(self, session: Session, event: Event) -> Event:
+        """过滤用户事件，只存储模型/助手的响应"""
+        if getattr(event, "author", None) == "user":
+            logger.debug(f" Filtering user event: {event.id}")
+            return event
+
+        return await super().append_event(session, event)
+
+    async def append_events(self, session: Session, events: list[Event]) -> list[Event]:
+        """批量追加时同样过滤用户事件"""
+        return await super().append_events(
+            session, [event for event in events if getattr(event, "author", None) != "user"]
+        )
@@ -2,14 +2,18 @@
 AgentPress PostgreSQL Database Connection Manager
 """
 
-from typing import Optional, List, Dict, Any, Union
+from typing import Optional, List, Dict, Any, Union, Sequence, Tuple, AsyncIterator
 import asyncpg # type: ignore
 from utils.logger import logger
 from utils.config import config
 import threading
 import os
+import re
 import json
 
+# 可以直接用作键集游标的列名（允许带表名前缀）
+_PLAIN_COLUMN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)?$")
+
 class DBConnection:
     """线程安全的单例数据库连接管理器，使用PostgreSQL"""
     
@@ -56,7 +60,9 @@ class DBConnection:
                 database_url,
                 min_size=1, # 最小连接数
                 max_size=10, # 最大连接数
-                command_timeout=60 # 命令超时时间
+                command_timeout=60, # 命令超时时间
+                # 每个连接缓存的预编译语句数：相同形状的 SQL 文本只解析/规划一次
+                statement_cache_size=config.DB_STATEMENT_CACHE_SIZE
             )
             
             self._initialized = True
@@ -287,40 +293,60 @@ class PostgreSQLTable:
         self._limit_value = 1
         return self
     
+    def after(self, column: Union[str, Sequence[str]], value: Any, desc: bool = False):
+        """
+        添加键集分页游标：只返回排序键位于 value 之后的行
+
+        与 range() 的 OFFSET 不同，数据库可以直接从索引定位到游标位置，
+        翻页开销与页码无关。多列游标传入列名和值的元组，例如
+        .after(("created_at", "message_id"), (ts, message_id))；
+        降序排序时传 desc=True（返回游标之前的行）。
+        """
+        operator = "<" if desc else ">"
+        if isinstance(column, (list, tuple)):
+            placeholders = []
+            for item in value:
+                self._params.append(item)
+                placeholders.append(f"${len(self._params)}")
+            self._where_conditions.append(f"({', '.join(column)}) {operator} ({', '.join(placeholders)})")
+        else:
+            self._where_conditions.append(f"{column} {operator} ${len(self._params) + 1}")
+            self._params.append(value)
+        return self
+
+    def _build_select(self, conditions: List[str], params: List[Any],
+                      limit: Optional[int], offset: Optional[int]) -> Tuple[str, List[Any]]:
+        """构建SELECT语句；LIMIT/OFFSET 作为参数绑定，保证同一形状的查询 SQL 文本不变"""
+        query_parts = [f"SELECT {self._select_fields}", f"FROM {self.table_name}"]
+        if conditions:
+            query_parts.append(f"WHERE {' AND '.join(conditions)}")
+        if self._order_by:
+            query_parts.append(f"ORDER BY {', '.join(self._order_by)}")
+
+        params = list(params)
+        if limit:
+            params.append(limit)
+            query_parts.append(f"LIMIT ${len(params)}")
+        if offset:
+            params.append(offset)
+            query_parts.append(f"OFFSET ${len(params)}")
+        return " ".join(query_parts), params
+
     async def execute(self):
         """执行查询"""
-        # 构建SELECT查询
-        query_parts = [f"SELECT {self._select_fields}"]
-        
         # 如果需要计数，构建计数查询
         count_query = None
         if self._count_flag:
             count_query = f"SELECT COUNT(*) FROM {self.table_name}"
             if self._where_conditions:
                 count_query += f" WHERE {' AND '.join(self._where_conditions)}"
-        
-        query_parts.append(f"FROM {self.table_name}")
-        
-        # 添加WHERE子句
-        if self._where_conditions:
-            query_parts.append(f"WHERE {' AND '.join(self._where_conditions)}")
-        
-        # 添加ORDER BY
-        if self._order_by:
-            query_parts.append(f"ORDER BY {', '.join(self._order_by)}")
-        
-        # 添加LIMIT和OFFSET
-        if self._limit_value:
-            query_parts.append(f"LIMIT {self._limit_value}")
-        if self._offset_value:
-            query_parts.append(f"OFFSET {self._offset_value}")
-        
-        query = " ".join(query_parts)
+
+        query, params = self._build_select(self._where_conditions, self._params, self._limit_value, self._offset_value)
         
         try:
             async with self.pool.acquire() as conn:
                 # 执行主查询
-                rows = await conn.fetch(query, *self._params)
+                rows = await conn.fetch(query, *params)
                 data = [dict(row) for row in rows]
                 
                 # 如果需要计数，执行计数查询
@@ -343,7 +369,91 @@ class PostgreSQLTable:
                 return QueryResult(data, count)
                 
         except Exception as e:
-            logger.error(f"查询执行失败: {e}, SQL: {query}, 参数: {self._params}")
+            logger.error(f"查询执行失败: {e}, SQL: {query}, 参数: {params}")
+            raise RuntimeError(f"数据库查询失败: {str(e)}")
+
+    def _keyset_columns(self) -> Optional[Tuple[List[str], bool]]:
+        """返回可用于键集分页的排序列及方向；排序方向不一致或列不可用时返回 None"""
+        if not self._order_by:
+            return None
+
+        columns, directions = [], set()
+        for clause in self._order_by:
+            column, direction = clause.rsplit(" ", 1)
+            if not _PLAIN_COLUMN.match(column):
+                return None
+            columns.append(column)
+            directions.add(direction)
+        if len(directions) != 1:
+            return None
+
+        # 游标值从结果行中读取，排序列必须出现在查询的字段中
+        if self._select_fields.strip() != "*":
+            selected = {field.strip().split()[-1].split(".")[-1] for field in self._select_fields.split(",")}
+            if any(column.split(".")[-1] not in selected for column in columns):
+                return None
+        return columns, directions.pop() == "DESC"
+
+    async def stream(self, batch_size: int = 1000) -> AsyncIterator[Dict[str, Any]]:
+        """
+        按批流式返回所有匹配的行，不在内存中物化完整结果
+
+        设置了 ORDER BY 时使用键集分页：每批以上一批最后一行的排序列值作为游标，
+        每批单独获取连接，批之间不占用连接。排序应以唯一列结尾
+        （如 .order('created_at').order('message_id')），否则游标处的并列行可能被跳过。
+        没有可用的排序列时退化为事务内的服务端游标。
+        """
+        keyset = self._keyset_columns()
+        if keyset is None:
+            async for row in self._stream_with_cursor(batch_size):
+                yield row
+            return
+
+        columns, desc = keyset
+        keys = [column.split(".")[-1] for column in columns]
+        operator = "<" if desc else ">"
+        remaining = self._limit_value
+        offset = self._offset_value
+        cursor_values = None
+
+        while remaining is None or remaining > 0:
+            conditions, params = list(self._where_conditions), list(self._params)
+            if cursor_values is not None:
+                placeholders = []
+                for value in cursor_values:
+                    params.append(value)
+                    placeholders.append(f"${len(params)}")
+                conditions.append(f"({', '.join(columns)}) {operator} ({', '.join(placeholders)})")
+
+            fetch_size = batch_size if remaining is None else min(batch_size, remaining)
+            query, query_params = self._build_select(conditions, params, fetch_size, offset)
+            try:
+                async with self.pool.acquire() as conn:
+                    rows = await conn.fetch(query, *query_params)
+            except Exception as e:
+                logger.error(f"流式查询失败: {e}, SQL: {query}, 参数: {query_params}")
+                raise RuntimeError(f"数据库查询失败: {str(e)}")
+
+            for row in rows:
+                yield dict(row)
+
+            if len(rows) < fetch_size:
+                break
+            if remaining is not None:
+                remaining -= len(rows)
+            offset = None
+            cursor_values = [rows[-1][key] for key in keys]
+
+    async def _stream_with_cursor(self, batch_size: int) -> AsyncIterator[Dict[str, Any]]:
+        """使用服务端游标流式读取（需要在事务中持有连接直到读取结束）"""
+        query, params = self._build_select(self._where_conditions, self._params, self._limit_value, self._offset_value)
+        try:
+            async with self.pool.acquire() as conn:
+                async with conn.transaction():
+                    async for row in conn.cursor(query, *params, prefetch=batch_size):
+                        yield dict(row)
+        except Exception as e:
+            logger.error(f"流式查询失败: {e}, SQL: {query}, 参数: {params}")
             raise RuntimeError(f"数据库查询失败: {str(e)}")
     
     async def insert(self, data: Union[Dict[str, Any], List[Dict[str, Any]]]):
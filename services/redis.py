@@ -30,7 +30,7 @@ import os
 from dotenv import load_dotenv # type: ignore
 import asyncio
 from utils.logger import logger
-from typing import List, Any
+from typing import List, Any, Dict, Optional
 from utils.retry import retry
 
 # Redis客户端和连接池全局变量
@@ -249,3 +249,41 @@ async def expire(key: str, seconds: int):
     """
     redis_client = await get_client()
     return await redis_client.expire(key, seconds)
+
+async def xadd(key: str, fields: Dict[str, Any], maxlen: Optional[int] = None, approximate: bool = True) -> str:
+    """Append an entry to a stream
+    
+    Args:
+        key: stream key name
+        fields: entry fields
+        maxlen: cap the stream length (trims the oldest entries), optional
+        approximate: trim with ~ (cheaper, the stream may be slightly longer than maxlen)
+    
+    Returns:
+        id of the new entry
+    """
+    redis_client = await get_client()
+    return await redis_client.xadd(key, fields, maxlen=maxlen, approximate=approximate)
+
+async def xread(streams: Dict[str, str], count: Optional[int] = None, block: Optional[int] = None) -> List[Any]:
+    """Read entries newer than the given ids from one or more streams
+    
+    Args:
+        streams: mapping of stream key to the last id already read ("0-0" for all)
+        count: maximum entries per stream, optional
+        block: milliseconds to wait for new entries, optional (must stay below the socket timeout)
+    
+    Returns:
+        [[key, [(id, fields), ...]], ...], empty when the block timed out
+    """
+    redis_client = await get_client()
+    return await redis_client.xread(streams, count=count, block=block)
+
+async def xrange(key: str, min: str = "-", max: str = "+", count: Optional[int] = None) -> List[Any]:
+    """Get stream entries in an id range
+    
+    Returns:
+        list of (id, fields)
+    """
+    redis_client = await get_client()
+    return await redis_client.xrange(key, min=min, max=max, count=count)
@@ -0,0 +1,146 @@
+"""
+用量台账（usage_daily 日汇总表）
+
+每次 LLM 响应结束（assistant_response_end 消息写入时），把 token 数和估算费用
+按 (account_id, 日期, 模型) 累加到 usage_daily。月度用量检查和用量汇总接口只需
+读取当月的日汇总行，耗时与天数相关，而不再与消息数量相关。
+
+日期按 UTC 划分。上线前已有的消息可以用 scripts/07_backfill_usage_ledger.py 回填。
+"""
+
+from datetime import date, datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from utils.logger import logger
+
+# 通过 thread 找到所属用户并累加，一次往返完成
+_RECORD_SQL = """
+INSERT INTO usage_daily (account_id, usage_date, model, prompt_tokens, completion_tokens, cost, request_count, updated_at)
+SELECT account_id, $2, $3, $4, $5, $6, 1, now()
+FROM threads
+WHERE thread_id = $1
+ON CONFLICT (account_id, usage_date, model) DO UPDATE SET
+    prompt_tokens = usage_daily.prompt_tokens + EXCLUDED.prompt_tokens,
+    completion_tokens = usage_daily.completion_tokens + EXCLUDED.completion_tokens,
+    cost = usage_daily.cost + EXCLUDED.cost,
+    request_count = usage_daily.request_count + 1,
+    updated_at = now()
+RETURNING account_id
+"""
+
+_COST_SINCE_SQL = """
+SELECT COALESCE(SUM(cost), 0) FROM usage_daily
+WHERE account_id = $1 AND usage_date >= $2
+"""
+
+_DAILY_SINCE_SQL = """
+SELECT usage_date, model, prompt_tokens, completion_tokens, cost, request_count
+FROM usage_daily
+WHERE account_id = $1 AND usage_date >= $2
+ORDER BY usage_date DESC, model
+"""
+
+
+async def record_usage(
+    client,
+    thread_id: str,
+    model: str,
+    prompt_tokens: int,
+    completion_tokens: int,
+    cost: float,
+    at: Optional[datetime] = None,
+) -> Optional[str]:
+    """
+    把一次 LLM 响应的用量累加到所属用户当天的汇总行
+
+    Returns:
+        thread 所属的 account_id；thread 不存在时为 None
+    """
+    usage_date = (at or datetime.now(timezone.utc)).astimezone(timezone.utc).date()
+    async with client.pool.acquire() as conn:
+        account_id = await conn.fetchval(
+            _RECORD_SQL,
+            thread_id,
+            usage_date,
+            model or 'unknown',
+            int(prompt_tokens or 0),
+            int(completion_tokens or 0),
+            float(cost or 0.0),
+        )
+    if account_id is None:
+        logger.warning(f"Usage not recorded: thread {thread_id} not found")
+    return account_id
+
+
+async def record_response_usage(client, thread_id: str, content: Dict[str, Any]) -> None:
+    """
+    记录一条 assistant_response_end 消息中的用量
+
+    ThreadManager 和 ADKThreadManager 写入该消息时调用；失败只记录日志，
+    不影响消息写入。
+    """
+    from services.billing import calculate_token_cost
+
+    usage = content.get('usage') or {}
+    prompt_tokens = usage.get('prompt_tokens') or 0
+    completion_tokens = usage.get('completion_tokens') or 0
+    if not prompt_tokens and not completion_tokens:
+        return
+    model = content.get('model') or 'unknown'
+    try:
+        await record_usage(
+            client,
+            thread_id,
+            model,
+            prompt_tokens,
+            completion_tokens,
+            calculate_token_cost(prompt_tokens, completion_tokens, model),
+        )
+    except Exception as e:
+        logger.warning(f"Failed to record usage for thread {thread_id}: {str(e)}")
+
+
+async def get_cost_since(client, account_id: str, since: date) -> float:
+    """汇总 since（含）之后的估算费用"""
+    async with client.pool.acquire() as conn:
+        return float(await conn.fetchval(_COST_SINCE_SQL, account_id, since))
+
+
+async def get_daily_usage(client, account_id: str, since: date) -> List[Dict[str, Any]]:
+    """
+    按天返回 since（含）之后的用量，新的日期在前
+
+    Returns:
+        [{date, prompt_tokens, completion_tokens, total_tokens, cost, request_count, models: [...]}]
+    """
+    async with client.pool.acquire() as conn:
+        rows = await conn.fetch(_DAILY_SINCE_SQL, account_id, since)
+
+    days: Dict[date, Dict[str, Any]] = {}
+    for row in rows:
+        day = days.get(row['usage_date'])
+        if day is None:
+            day = days[row['usage_date']] = {
+                'date': row['usage_date'].isoformat(),
+                'prompt_tokens': 0,
+                'completion_tokens': 0,
+                'total_tokens': 0,
+                'cost': 0.0,
+                'request_count': 0,
+                'models': [],
+            }
+        total_tokens = row['prompt_tokens'] + row['completion_tokens']
+        day['prompt_tokens'] += row['prompt_tokens']
+        day['completion_tokens'] += row['completion_tokens']
+        day['total_tokens'] += total_tokens
+        day['cost'] += row['cost']
+        day['request_count'] += row['request_count']
+        day['models'].append({
+            'model': row['model'],
+            'prompt_tokens': row['prompt_tokens'],
+            'completion_tokens': row['completion_tokens'],
+            'total_tokens': total_tokens,
+            'cost': row['cost'],
+            'request_count': row['request_count'],
+        })
+    return list(days.values())
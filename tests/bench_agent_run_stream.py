@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Agent 运行响应传输的压测：Redis List + Pub/Sub vs Redis Streams
+
+生产者按 run_agent_background 的方式写入 N 条响应（每条带发送时间戳），
+V 个观看者按 stream_agent_run 的方式读取：
+- list：订阅 new_response 频道，每次通知后 lrange(last_index + 1, -1)
+- stream：agent_run_stream.iterate_stream（进程内共享一个 XREAD BLOCK 读取任务）
+
+输出生产者吞吐、每个观看者收齐全部响应的耗时，以及扇出延迟（写入到观看者收到）的 p50/p99。
+
+用法:
+    REDIS_HOST=localhost python tests/bench_agent_run_stream.py --responses 5000 --viewers 1 10 50
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import agent_run_stream, redis
+from utils.config import config
+
+
+async def produce(agent_run_id: str, responses: int, payload: str) -> float:
+    # 逐条等待写入，保证顺序且不超出连接池上限（128）
+    start = time.perf_counter()
+    for i in range(responses):
+        response = {"type": "assistant", "sequence": i, "content": payload, "sent_at": time.time()}
+        await agent_run_stream.append_response(agent_run_id, json.dumps(response))
+    await agent_run_stream.append_response(agent_run_id, json.dumps({"type": "status", "status": "completed", "sent_at": time.time()}))
+    await agent_run_stream.publish_control(agent_run_id, "END_STREAM")
+    return time.perf_counter() - start
+
+
+async def list_viewer(agent_run_id: str, ready: asyncio.Event, latencies: list):
+    pubsub = await redis.create_pubsub()
+    await pubsub.subscribe(agent_run_stream.response_channel(agent_run_id))
+    ready.set()
+    last_index = -1
+    try:
+        async for message in pubsub.listen():
+            if message.get("type") != "message":
+                continue
+            new_responses = await redis.lrange(agent_run_stream.response_list_key(agent_run_id), last_index + 1, -1)
+            received_at = time.time()
+            for raw in new_responses:
+                response = json.loads(raw)
+                latencies.append(received_at - response["sent_at"])
+                if agent_run_stream.is_terminal(response):
+                    return
+            last_index += len(new_responses)
+    finally:
+        await pubsub.unsubscribe()
+        await pubsub.close()
+
+
+async def stream_viewer(agent_run_id: str, ready: asyncio.Event, latencies: list):
+    ready.set()
+    async for _, _, response in agent_run_stream.iterate_stream(agent_run_id):
+        if "sent_at" in response:
+            latencies.append(time.time() - response["sent_at"])
+
+
+async def run_once(backend: str, viewers: int, responses: int, payload: str):
+    config.AGENT_RUN_STREAM_BACKEND = backend
+    agent_run_id = f"bench_{uuid.uuid4().hex[:12]}"
+    viewer = stream_viewer if backend == "stream" else list_viewer
+    latencies = [[] for _ in range(viewers)]
+    ready = [asyncio.Event() for _ in range(viewers)]
+
+    start = time.perf_counter()
+    tasks = [asyncio.create_task(viewer(agent_run_id, ready[i], latencies[i])) for i in range(viewers)]
+    await asyncio.gather(*(event.wait() for event in ready))
+    produce_seconds = await produce(agent_run_id, responses, payload)
+    await asyncio.wait_for(asyncio.gather(*tasks), timeout=300)
+    total_seconds = time.perf_counter() - start
+
+    await redis.delete(agent_run_stream.response_list_key(agent_run_id))
+    await redis.delete(agent_run_stream.response_stream_key(agent_run_id))
+
+    samples = sorted(value * 1000 for per_viewer in latencies for value in per_viewer)
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    print(
+        f"{backend:<7} viewers={viewers:<4} produce={responses / produce_seconds:>9.0f} msg/s  "
+        f"drain={total_seconds * 1000:>8.1f}ms  fan-out p50={statistics.median(samples):>7.2f}ms  p99={p99:>7.2f}ms"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="agent run response transport benchmark")
+    parser.add_argument("--responses", type=int, default=5000, help="responses produced per run")
+    parser.add_argument("--viewers", type=int, nargs="+", default=[1, 10, 50], help="concurrent viewer counts")
+    parser.add_argument("--payload", type=int, default=200, help="characters of content per response")
+    parser.add_argument("--backends", nargs="+", default=["list", "stream"], choices=["list", "stream"])
+    args = parser.parse_args()
+
+    await redis.initialize_async()
+    payload = "x" * args.payload
+    try:
+        for viewers in args.viewers:
+            for backend in args.backends:
+                await run_once(backend, viewers, args.responses, payload)
+    finally:
+        await redis.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
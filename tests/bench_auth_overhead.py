@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+每个请求的认证开销
+
+访问token：对比每次都 jwt.decode（旧实现）与命中 verified_token_cache 的
+AuthUtils.verify_token / get_current_user_id_from_jwt 耗时。
+
+刷新token（--refresh，需要 DATABASE_URL 和 Redis）：对比一次数据库查询
+（旧实现的 SELECT ... FROM refresh_tokens）与 RefreshTokenStore.lookup 的一次 Redis 往返。
+
+用法:
+    python tests/bench_auth_overhead.py --requests 20000 --tokens 100
+    DATABASE_URL=postgresql://... python tests/bench_auth_overhead.py --refresh --requests 2000
+"""
+
+import argparse
+import asyncio
+import os
+import secrets
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from starlette.requests import Request # type: ignore
+
+from utils.auth_utils import AuthUtils
+from utils.simple_auth_middleware import get_current_user_id_from_jwt
+from utils.token_cache import RefreshTokenStore, verified_token_cache
+
+
+def make_request(token: str) -> Request:
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "path": "/api/threads",
+        "headers": [(b"authorization", f"Bearer {token}".encode())],
+    })
+
+
+def report(name: str, samples):
+    samples = sorted(samples)
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    print(f"{name:<34} mean={statistics.mean(samples) * 1e6:>8.1f}us  p99={p99 * 1e6:>8.1f}us")
+
+
+async def bench_access(args):
+    tokens = [AuthUtils.create_access_token(f"bench-user-{i}") for i in range(args.tokens)]
+
+    samples = []
+    for i in range(args.requests):
+        verified_token_cache.clear()
+        started = time.perf_counter()
+        AuthUtils.verify_token(tokens[i % len(tokens)])
+        samples.append(time.perf_counter() - started)
+    report("verify_token (jwt.decode)", samples)
+
+    samples = []
+    for i in range(args.requests):
+        started = time.perf_counter()
+        AuthUtils.verify_token(tokens[i % len(tokens)])
+        samples.append(time.perf_counter() - started)
+    report("verify_token (cached)", samples)
+
+    requests = [make_request(token) for token in tokens]
+    samples = []
+    for i in range(args.requests):
+        verified_token_cache.clear()
+        started = time.perf_counter()
+        await get_current_user_id_from_jwt(requests[i % len(requests)])
+        samples.append(time.perf_counter() - started)
+    report("dependency (jwt.decode)", samples)
+
+    samples = []
+    for i in range(args.requests):
+        started = time.perf_counter()
+        await get_current_user_id_from_jwt(requests[i % len(requests)])
+        samples.append(time.perf_counter() - started)
+    report("dependency (cached)", samples)
+    print(f"cache: {verified_token_cache.stats()}")
+
+
+async def bench_refresh(args):
+    from services.postgresql import DBConnection
+    from services import redis
+
+    db = DBConnection()
+    await db.initialize()
+    client = await db.client
+    store = RefreshTokenStore(AuthUtils.REFRESH_TOKEN_EXPIRE_DAYS * 24 * 3600)
+    token_hash = AuthUtils.hash_refresh_token(secrets.token_urlsafe(32))
+    await store.remember("bench-user", token_hash, datetime.now(timezone.utc) + timedelta(minutes=5))
+
+    try:
+        samples = []
+        for _ in range(args.requests):
+            started = time.perf_counter()
+            async with client.pool.acquire() as conn:
+                await conn.fetchrow(
+                    "SELECT user_id, expires_at FROM refresh_tokens WHERE token_hash = $1 AND expires_at > $2",
+                    token_hash, datetime.now(),
+                )
+            samples.append(time.perf_counter() - started)
+        report("refresh check (database)", samples)
+
+        samples = []
+        for _ in range(args.requests):
+            started = time.perf_counter()
+            await store.lookup(token_hash)
+            samples.append(time.perf_counter() - started)
+        report("refresh check (redis)", samples)
+    finally:
+        await store.revoke([token_hash], datetime.now(timezone.utc) + timedelta(minutes=5))
+        await DBConnection.disconnect()
+        await redis.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="auth overhead per request benchmark")
+    parser.add_argument("--requests", type=int, default=20000, help="requests per case")
+    parser.add_argument("--tokens", type=int, default=100, help="distinct access tokens (users)")
+    parser.add_argument("--refresh", action="store_true", help="also compare refresh token checks (needs database and Redis)")
+    args = parser.parse_args()
+
+    asyncio.run(bench_access(args))
+    if args.refresh:
+        asyncio.run(bench_refresh(args))
+
+
+if __name__ == "__main__":
+    main()
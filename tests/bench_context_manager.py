@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+ContextManager.compress_messages：整表重复计数 vs 按消息缓存的 token 计数
+
+旧实现在每个 compress_* 开头、每条消息、每次阈值减半的递归重试中，
+以及省略消息时每删除 10 条后，都会对整个消息列表调用 litellm token_counter。
+这里生成一段合成的长线程（大量工具结果），分别统计：
+- 旧实现（本文件中的 legacy_compress_messages）的耗时与 token_counter 调用次数
+- 新实现第一次调用（缓存为空）与后续调用（同一线程的下一轮）的耗时与调用次数
+
+用法:
+    python tests/bench_context_manager.py --messages 300 --model deepseek/deepseek-chat
+"""
+
+import argparse
+import copy
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import agentpress.context_manager as context_manager
+from agentpress.context_manager import ContextManager, TokenCountCache
+
+_calls = {"count": 0}
+_token_counter = context_manager.token_counter
+
+
+def counting_token_counter(*args, **kwargs):
+    _calls["count"] += 1
+    return _token_counter(*args, **kwargs)
+
+
+context_manager.token_counter = counting_token_counter
+
+
+def legacy_compress_messages(cm, messages, llm_model, max_tokens, token_threshold=4096, max_iterations=5):
+    """旧的 compress_messages：每一步都对整个列表重新计数"""
+    def compress_where(predicate):
+        if counting_token_counter(model=llm_model, messages=messages) <= max_tokens:
+            return
+        seen = 0
+        for msg in reversed(messages):
+            if isinstance(msg, dict) and predicate(msg):
+                seen += 1
+                if counting_token_counter(messages=[msg]) > token_threshold:
+                    if seen > 1:
+                        msg["content"] = cm.compress_message(msg["content"], msg.get("message_id"), token_threshold * 3)
+                    else:
+                        msg["content"] = cm.safe_truncate(msg["content"], int(max_tokens * 2))
+
+    counting_token_counter(model=llm_model, messages=messages)
+    compress_where(cm.is_tool_result_message)
+    compress_where(lambda m: m.get("role") == "user")
+    compress_where(lambda m: m.get("role") == "assistant")
+    compressed = counting_token_counter(model=llm_model, messages=messages)
+    if max_iterations <= 0:
+        return messages
+    if compressed > max_tokens:
+        return legacy_compress_messages(cm, messages, llm_model, max_tokens, token_threshold // 2, max_iterations - 1)
+    return messages
+
+
+def synthetic_thread(count: int, tool_output_chars: int):
+    messages = [{"role": "system", "content": "You are a helpful agent. " * 200}]
+    for i in range(count):
+        if i % 3 == 0:
+            messages.append({"role": "user", "message_id": f"m{i}", "content": f"Please continue with step {i}. " * 20})
+        elif i % 3 == 1:
+            messages.append({"role": "assistant", "message_id": f"m{i}", "content": f"Running the tool for step {i}. " * 40})
+        else:
+            output = f"line {i}: " + "result data " * (tool_output_chars // 12)
+            messages.append({"role": "user", "message_id": f"m{i}", "content": f"<tool_result> ToolResult(success=True, output='{output}') </tool_result>"})
+    return messages
+
+
+def timed(label, fn):
+    _calls["count"] = 0
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {elapsed * 1000:>10.1f}ms  token_counter calls={_calls['count']:<6} messages={len(result)}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ContextManager token counting benchmark")
+    parser.add_argument("--messages", type=int, default=300, help="messages in the synthetic thread")
+    parser.add_argument("--tool-output", type=int, default=20000, help="characters per tool result")
+    parser.add_argument("--model", default="deepseek/deepseek-chat", help="model used for token counting")
+    parser.add_argument("--turns", type=int, default=3, help="repeated calls on the same thread")
+    args = parser.parse_args()
+
+    thread = synthetic_thread(args.messages, args.tool_output)
+    cm = ContextManager(token_cache=TokenCountCache())
+    max_tokens = 128 * 1000 - 28000
+
+    timed("legacy", lambda: legacy_compress_messages(cm, copy.deepcopy(thread), args.model, max_tokens))
+    for turn in range(1, args.turns + 1):
+        timed(f"cached (turn {turn})", lambda: cm.compress_messages(copy.deepcopy(thread), args.model))
+    print(f"cache hits={cm.token_cache.hits} misses={cm.token_cache.misses}")
+
+
+if __name__ == "__main__":
+    main()
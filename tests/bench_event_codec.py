@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+对比 events.actions 各编码格式的体积与解码耗时
+
+模拟一个包含数千个事件的会话（部分事件带 state_delta / artifact_delta），
+分别用 pickle（现状）、json、msgpack（如已安装）编码，统计：
+- 平均每个事件的字节数
+- 全部事件的编码/解码耗时（即 get_session 中 actions 部分的开销）
+
+用法:
+    python tests/bench_event_codec.py --events 5000
+"""
+
+import argparse
+import os
+import pickle
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google.adk.events.event import Event # type: ignore
+from google.adk.events.event_actions import EventActions # type: ignore
+
+from services.event_codec import decode_actions, encode_actions
+
+try:
+    import msgpack # type: ignore  # noqa: F401
+    CODECS = ["json", "msgpack"]
+except ImportError:
+    CODECS = ["json"]
+
+
+def build_actions(count: int):
+    actions = []
+    for i in range(count):
+        if i % 10 == 0:
+            actions.append(EventActions(
+                state_delta={"step": i, "user:last_tool": "web_search", "plan": ["search", "summarize"]},
+                artifact_delta={f"report_{i}.md": 1},
+            ))
+        elif i % 7 == 0:
+            actions.append(EventActions(skip_summarization=True))
+        else:
+            actions.append(EventActions())
+    return actions
+
+
+def bench(name, encode, decode, actions):
+    start = time.perf_counter()
+    encoded = [encode(a) for a in actions]
+    encode_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    # 与 get_session 一致：解码后交给 Event 做 pydantic 校验
+    for data in encoded:
+        Event(author="model", actions=decode(data))
+    decode_elapsed = time.perf_counter() - start
+
+    total_bytes = sum(len(data) for data in encoded)
+    print(
+        f"{name:<8} bytes/event={total_bytes / len(actions):>7.1f}  "
+        f"encode={encode_elapsed * 1000:>8.1f}ms  decode+validate={decode_elapsed * 1000:>8.1f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="event actions codec benchmark")
+    parser.add_argument("--events", type=int, default=5000, help="events per session")
+    args = parser.parse_args()
+
+    actions = build_actions(args.events)
+    print(f"session with {args.events} events")
+    bench("pickle", lambda a: pickle.dumps(a, protocol=pickle.HIGHEST_PROTOCOL), pickle.loads, actions)
+    for codec in CODECS:
+        bench(codec, lambda a, c=codec: encode_actions(a, c), decode_actions, actions)
+
+
+if __name__ == "__main__":
+    main()
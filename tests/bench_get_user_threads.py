@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+GET /threads 的查询延迟与用户线程数的关系
+
+为一个临时账号生成 N 个项目/线程，对比：
+- 旧实现：select('*') 读取全部线程 + Python 切片 + 按 project_id 批量查询项目
+- 新实现：LIMIT 分页 + LEFT JOIN projects + 索引计数（agent.api._fetch_user_threads / _count_user_threads）
+
+用法:
+    DATABASE_URL=postgresql://... python tests/bench_get_user_threads.py --threads 100 1000 10000 50000 --limit 50
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent.api import _count_user_threads, _fetch_user_threads
+from services.postgresql import DBConnection
+
+
+async def seed(client, account_id: str, count: int):
+    async with client.pool.acquire() as conn:
+        await conn.execute(
+            """
+            INSERT INTO projects (project_id, account_id, name, sandbox)
+            SELECT 'bench_p_' || $1 || '_' || g, $1, 'project ' || g, '{"id": "sandbox"}'::jsonb
+            FROM generate_series(1, $2) AS g
+            """,
+            account_id, count,
+        )
+        await conn.execute(
+            """
+            INSERT INTO threads (thread_id, project_id, account_id, created_at)
+            SELECT 'bench_t_' || $1 || '_' || g, 'bench_p_' || $1 || '_' || g, $1, now() - make_interval(secs => g)
+            FROM generate_series(1, $2) AS g
+            """,
+            account_id, count,
+        )
+        await conn.execute("ANALYZE threads")
+        await conn.execute("ANALYZE projects")
+
+
+async def cleanup(client, account_id: str):
+    async with client.pool.acquire() as conn:
+        await conn.execute("DELETE FROM threads WHERE account_id = $1", account_id)
+        await conn.execute("DELETE FROM projects WHERE account_id = $1", account_id)
+
+
+async def legacy_page(client, account_id: str, limit: int):
+    threads = await client.table('threads').select('*').eq('account_id', account_id).order('created_at', desc=True).execute()
+    total = len(threads.data)
+    page = threads.data[:limit]
+    project_ids = list({thread['project_id'] for thread in page})
+    projects = await client.table('projects').select('*').in_('project_id', project_ids).execute()
+    return total, page, projects.data
+
+
+async def new_page(client, account_id: str, limit: int):
+    return await asyncio.gather(
+        _fetch_user_threads(client, account_id, limit),
+        _count_user_threads(client, account_id),
+    )
+
+
+async def measure(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="GET /threads latency benchmark")
+    parser.add_argument("--threads", type=int, nargs="+", default=[100, 1000, 10000, 50000], help="thread counts to test")
+    parser.add_argument("--limit", type=int, default=50, help="page size")
+    parser.add_argument("--repeat", type=int, default=10, help="requests per measurement")
+    args = parser.parse_args()
+
+    db = DBConnection()
+    await db.initialize()
+    client = await db.client
+
+    print(f"{'threads':>8}  {'legacy p50':>12}  {'paged p50':>12}")
+    try:
+        for count in args.threads:
+            account_id = f"bench_{uuid.uuid4().hex[:12]}"
+            try:
+                await seed(client, account_id, count)
+                legacy = await measure(lambda: legacy_page(client, account_id, args.limit), args.repeat)
+                paged = await measure(lambda: new_page(client, account_id, args.limit), args.repeat)
+                print(f"{count:>8}  {legacy:>10.1f}ms  {paged:>10.1f}ms")
+            finally:
+                await cleanup(client, account_id)
+    finally:
+        await DBConnection.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+登录高峰期 bcrypt 对事件循环的影响
+
+模拟 N 个并发登录（每个登录做一次 bcrypt.checkpw），同时用一个探测协程
+模拟“无关接口”：每 10ms 发起一次只做 await asyncio.sleep(0) 的请求，记录其延迟。
+分别对比：
+- inline：在事件循环中直接调用 bcrypt（旧实现）
+- pool：通过 utils.password_hasher.PasswordHasher 在专用线程池中执行
+
+统计登录吞吐量（次/秒）、登录 p50/p99 延迟、无关请求的 p50/p99 延迟，
+以及线程池的排队深度与被拒绝的请求数。
+
+用法:
+    python tests/bench_password_hasher.py --logins 200 --concurrency 50 --workers 4 --rounds 12
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bcrypt # type: ignore
+
+from utils.password_hasher import PasswordHasher, PasswordHasherBusy
+
+PROBE_INTERVAL_SECONDS = 0.01
+
+
+def percentile(values, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def probe(latencies, stop: asyncio.Event):
+    """模拟无关接口：记录从发起到完成的时间"""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(0)
+        latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(PROBE_INTERVAL_SECONDS)
+
+
+async def run(mode: str, hashed: bytes, password: bytes, args):
+    hasher = PasswordHasher(max_workers=args.workers, max_pending=args.max_pending)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    login_latencies, probe_latencies = [], []
+    rejected = 0
+
+    async def login():
+        nonlocal rejected
+        async with semaphore:
+            started = time.perf_counter()
+            if mode == "inline":
+                bcrypt.checkpw(password, hashed)
+            else:
+                try:
+                    await hasher.verify(password.decode(), hashed.decode())
+                except PasswordHasherBusy:
+                    rejected += 1
+                    return
+            login_latencies.append(time.perf_counter() - started)
+
+    stop = asyncio.Event()
+    probe_task = asyncio.create_task(probe(probe_latencies, stop))
+    await asyncio.sleep(0.05)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(args.logins)))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await probe_task
+    hasher.shutdown()
+
+    stats = hasher.stats()
+    print(
+        f"{mode:<7} logins/s={len(login_latencies) / elapsed:>7.1f}  "
+        f"login p50={percentile(login_latencies, 50) * 1000:>7.1f}ms p99={percentile(login_latencies, 99) * 1000:>7.1f}ms  "
+        f"other p50={percentile(probe_latencies, 50) * 1000:>7.2f}ms p99={percentile(probe_latencies, 99) * 1000:>7.2f}ms "
+        f"max={max(probe_latencies, default=0) * 1000:>7.1f}ms  "
+        f"probes={len(probe_latencies)}  rejected={rejected}  "
+        f"queue_max={max(0, stats['pending_max'] - args.workers)}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="password hashing event loop benchmark")
+    parser.add_argument("--logins", type=int, default=200, help="total logins")
+    parser.add_argument("--concurrency", type=int, default=50, help="concurrent logins")
+    parser.add_argument("--workers", type=int, default=4, help="password hasher threads")
+    parser.add_argument("--max-pending", type=int, default=64, help="admission limit, 0 for none")
+    parser.add_argument("--rounds", type=int, default=12, help="bcrypt cost factor")
+    parser.add_argument("--modes", nargs="+", default=["inline", "pool"], choices=["inline", "pool"])
+    args = parser.parse_args()
+
+    password = b"correct horse battery staple"
+    hashed = bcrypt.hashpw(password, bcrypt.gensalt(rounds=args.rounds))
+    started = time.perf_counter()
+    bcrypt.checkpw(password, hashed)
+    print(f"bcrypt rounds={args.rounds}: {(time.perf_counter() - started) * 1000:.1f}ms per check, "
+          f"{args.logins} logins, concurrency={args.concurrency}, workers={args.workers}")
+
+    for mode in args.modes:
+        asyncio.run(run(mode, hashed, password, args))
+
+
+if __name__ == "__main__":
+    main()
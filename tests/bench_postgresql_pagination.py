@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+对比 PostgreSQLTable 的 OFFSET 分页与键集分页
+
+在独立的 bench_messages 表中为一个线程生成大量消息（结构与 messages 相同，
+带 (thread_id, created_at, message_id) 索引），分别测量：
+- range() 循环（LIMIT/OFFSET）读取全部消息的耗时
+- stream()（键集游标）读取全部消息的耗时
+- 读取最后一页的耗时：range(offset) vs after(cursor)
+
+用法:
+    DATABASE_URL=postgresql://... python tests/bench_postgresql_pagination.py --rows 1000000 --batch-size 1000
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.postgresql import DBConnection
+
+TABLE = "bench_messages"
+
+
+async def seed(client, thread_id: str, rows: int):
+    async with client.pool.acquire() as conn:
+        await conn.execute(f"DROP TABLE IF EXISTS {TABLE}")
+        await conn.execute(f"CREATE TABLE {TABLE} (LIKE messages INCLUDING DEFAULTS)")
+        await conn.execute(
+            f"""
+            INSERT INTO {TABLE} (message_id, thread_id, project_id, type, role, content, created_at)
+            SELECT gen_random_uuid(), $1::uuid, $1::uuid, 'assistant', 'assistant',
+                   jsonb_build_object('role', 'assistant', 'content', 'message ' || g),
+                   now() - make_interval(secs => $2 - g)
+            FROM generate_series(1, $2) AS g
+            """,
+            thread_id, rows,
+        )
+        await conn.execute(f"CREATE INDEX ON {TABLE} (thread_id, created_at, message_id)")
+        await conn.execute(f"ANALYZE {TABLE}")
+
+
+def base_query(client, thread_id: str):
+    return client.table(TABLE) \
+        .select('message_id, type, content, created_at') \
+        .eq('thread_id', thread_id) \
+        .order('created_at') \
+        .order('message_id')
+
+
+async def bench_offset(client, thread_id: str, batch_size: int) -> int:
+    total, offset = 0, 0
+    while True:
+        result = await base_query(client, thread_id).range(offset, offset + batch_size - 1).execute()
+        total += len(result.data)
+        if len(result.data) < batch_size:
+            return total
+        offset += batch_size
+
+
+async def bench_stream(client, thread_id: str, batch_size: int) -> int:
+    total = 0
+    async for _ in base_query(client, thread_id).stream(batch_size=batch_size):
+        total += 1
+    return total
+
+
+async def timed(label: str, coro):
+    start = time.perf_counter()
+    result = await coro
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {elapsed * 1000:>10.1f}ms")
+    return result
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="PostgreSQLTable pagination benchmark")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="messages in the benchmark thread")
+    parser.add_argument("--batch-size", type=int, default=1000, help="rows per page")
+    parser.add_argument("--keep", action="store_true", help="keep the benchmark table")
+    args = parser.parse_args()
+
+    db = DBConnection()
+    await db.initialize()
+    client = await db.client
+    thread_id = str(uuid.uuid4())
+
+    try:
+        await timed(f"seed {args.rows} rows", seed(client, thread_id, args.rows))
+
+        offset_rows = await timed("full scan: range()/OFFSET", bench_offset(client, thread_id, args.batch_size))
+        stream_rows = await timed("full scan: stream()/keyset", bench_stream(client, thread_id, args.batch_size))
+        assert offset_rows == stream_rows == args.rows, (offset_rows, stream_rows)
+
+        last_offset = args.rows - args.batch_size
+        await timed("last page: range()", base_query(client, thread_id)
+                    .range(last_offset, last_offset + args.batch_size - 1).execute())
+
+        cursor = (await base_query(client, thread_id)
+                  .range(last_offset - 1, last_offset - 1).execute()).data[0]
+        await timed("last page: after()", base_query(client, thread_id)
+                    .after(("created_at", "message_id"), (cursor["created_at"], cursor["message_id"]))
+                    .limit(args.batch_size).execute())
+    finally:
+        if not args.keep:
+            async with client.pool.acquire() as conn:
+                await conn.execute(f"DROP TABLE IF EXISTS {TABLE}")
+        await DBConnection.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+流式 XML 工具调用检测：整段重扫 vs XMLChunkScanner 增量扫描
+
+旧实现每收到一个 chunk 就在累积的整个缓冲区上查找 <function_calls>，
+找不到时再对每个已注册工具名做一次 find，开销为 O(缓冲区 × 工具数)，
+整个响应是平方级。这里回放一个流式响应，对比两种方式的总耗时。
+
+回放数据:
+- 默认生成一段长文本（夹杂若干 <function_calls> 块），按随机长度切成 chunk
+- --file 指定录制的响应：.jsonl 每行一个 chunk 字符串，其他文件按 --chunk-size 切分
+
+用法:
+    python tests/bench_xml_scanner.py --chars 200000 --tools 60
+    python tests/bench_xml_scanner.py --file recorded_stream.jsonl
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agentpress.xml_tool_parser import XMLChunkScanner
+
+
+def legacy_extract(content, tag_names):
+    """旧的 ResponseProcessor._extract_xml_chunks（不含嵌套处理，足以体现扫描开销）"""
+    chunks, pos = [], 0
+    while pos < len(content):
+        start = content.find('<function_calls>', pos)
+        if start == -1:
+            break
+        end = content.find('</function_calls>', start)
+        if end == -1:
+            break
+        chunks.append(content[start:end + len('</function_calls>')])
+        pos = end + len('</function_calls>')
+    if not chunks:
+        for tag in tag_names:
+            content.find(f'<{tag}', 0)
+    return chunks
+
+
+def replay_legacy(stream, tag_names):
+    buffer, found = "", 0
+    for chunk in stream:
+        buffer += chunk
+        for xml_chunk in legacy_extract(buffer, tag_names):
+            buffer = buffer.replace(xml_chunk, "", 1)
+            found += 1
+    return found
+
+
+def replay_scanner(stream, tag_names):
+    scanner, found = XMLChunkScanner(tag_names), 0
+    for chunk in stream:
+        found += len(scanner.feed(chunk))
+    return found
+
+
+def synthetic_stream(chars: int, blocks: int, seed: int = 7):
+    rng = random.Random(seed)
+    prose = "The agent keeps explaining its plan in detail, step by step. "
+    block = (
+        '<function_calls>\n<invoke name="create_file">\n'
+        '<parameter name="file_path">report.md</parameter>\n'
+        '<parameter name="file_contents">' + "# Report\n" * 50 + '</parameter>\n'
+        '</invoke>\n</function_calls>'
+    )
+    segment = max(1, chars // (blocks + 1))
+    text = "".join(prose * (segment // len(prose) + 1) + block for _ in range(blocks))
+    stream, i = [], 0
+    while i < len(text):
+        size = rng.randint(2, 24)
+        stream.append(text[i:i + size])
+        i += size
+    return stream
+
+
+def load_stream(path: str, chunk_size: int):
+    with open(path, encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            return [json.loads(line) for line in f if line.strip()]
+        text = f.read()
+    return [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="streaming XML tool call scanner benchmark")
+    parser.add_argument("--file", help="recorded stream (.jsonl of chunks or plain text)")
+    parser.add_argument("--chunk-size", type=int, default=16, help="chunk size for plain text recordings")
+    parser.add_argument("--chars", type=int, default=200_000, help="synthetic response length")
+    parser.add_argument("--blocks", type=int, default=5, help="tool call blocks in the synthetic response")
+    parser.add_argument("--tools", type=int, default=60, help="registered tool names")
+    args = parser.parse_args()
+
+    stream = load_stream(args.file, args.chunk_size) if args.file else synthetic_stream(args.chars, args.blocks)
+    tag_names = [f"tool-name-{i}" for i in range(args.tools)]
+    total_chars = sum(len(chunk) for chunk in stream)
+    print(f"{len(stream)} chunks, {total_chars} chars, {args.tools} tools")
+
+    for name, replay in (("legacy rescan", replay_legacy), ("XMLChunkScanner", replay_scanner)):
+        start = time.perf_counter()
+        found = replay(stream, tag_names)
+        elapsed = time.perf_counter() - start
+        print(f"{name:<16} blocks={found:<4} total={elapsed * 1000:>9.1f}ms  per_chunk={elapsed * 1e6 / len(stream):>8.2f}us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+测试删除/修改事件后，其他进程中的消息缓存会失效
+
+IncrementalMessageLoader 只拉取游标之后的新事件，已缓存的事件被删除或改写后
+只能通过会话的事件版本号（services.event_version）发现。这里用两个加载器实例
+模拟两个进程，共用假的 Redis 和 events 表：一个进程删除消息并更新版本号后，
+另一个进程不能再返回被删除的消息。
+
+用法:
+    python tests/test_message_cache_invalidation.py
+    pytest tests/test_message_cache_invalidation.py
+"""
+
+import asyncio
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agentpress.message_loader import IncrementalMessageLoader
+from services import event_version, redis
+
+THREAD_ID = "00000000-0000-0000-0000-0000000000bb"
+BASE_TIME = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+class FakeRedis:
+    def __init__(self):
+        self.values = {}
+
+    async def get(self, key, default=None):
+        return self.values.get(key, default)
+
+    async def set(self, key, value, ex=None, nx=False):
+        if nx and key in self.values:
+            return None
+        self.values[key] = value
+        return True
+
+
+class FakeConnection:
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def fetch(self, query, *params):
+        rows = sorted(self.rows, key=lambda row: (row["timestamp"], row["id"]))
+        if "(timestamp, id) >" in query:
+            rows = [row for row in rows if (row["timestamp"], row["id"]) > (params[2], params[3])]
+        return rows[:params[-1]]
+
+
+class FakeAcquire:
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def __aenter__(self):
+        return FakeConnection(self.rows)
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakePool:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def acquire(self):
+        return FakeAcquire(self.rows)
+
+
+class FakeClient:
+    def __init__(self, rows):
+        self.pool = FakePool(rows)
+
+
+def make_loader():
+    return IncrementalMessageLoader(
+        name="test",
+        columns=["id", "author", "content", "timestamp"],
+        convert=lambda row: {"message_id": row["id"], "role": row["author"], "content": row["content"]},
+    )
+
+
+def make_rows(count):
+    return [
+        {"id": f"event-{i}", "author": "user", "content": f"message {i}", "timestamp": BASE_TIME + timedelta(seconds=i)}
+        for i in range(count)
+    ]
+
+
+async def run_delete_in_other_process():
+    fake_redis = FakeRedis()
+    original_get, original_set = redis.get, redis.set
+    redis.get, redis.set = fake_redis.get, fake_redis.set
+    try:
+        rows = make_rows(3)
+        client = FakeClient(rows)
+        worker, api = make_loader(), make_loader()
+
+        before = await worker.load(client, THREAD_ID)
+        # API 进程删除一条消息，并更新事件版本号
+        await api.load(client, THREAD_ID)
+        rows.pop(1)
+        await event_version.bump_event_version(THREAD_ID)
+        after = await worker.load(client, THREAD_ID)
+        return before, after
+    finally:
+        redis.get, redis.set = original_get, original_set
+
+
+async def run_redis_unavailable():
+    async def broken(*args, **kwargs):
+        raise ConnectionError("redis down")
+
+    original_get, original_set = redis.get, redis.set
+    redis.get, redis.set = broken, broken
+    try:
+        rows = make_rows(2)
+        client = FakeClient(rows)
+        loader = make_loader()
+        await loader.load(client, THREAD_ID)
+        rows.pop(0)
+        # 无法校验版本号时不使用缓存
+        return await loader.load(client, THREAD_ID)
+    finally:
+        redis.get, redis.set = original_get, original_set
+
+
+def test_deleted_message_is_dropped_from_other_process_cache():
+    before, after = asyncio.run(run_delete_in_other_process())
+    assert [m["message_id"] for m in before] == ["event-0", "event-1", "event-2"]
+    assert [m["message_id"] for m in after] == ["event-0", "event-2"]
+
+
+def test_cache_is_not_used_without_event_version():
+    messages = asyncio.run(run_redis_unavailable())
+    assert [m["message_id"] for m in messages] == ["event-1"]
+
+
+if __name__ == "__main__":
+    test_deleted_message_is_dropped_from_other_process_cache()
+    test_cache_is_not_used_without_event_version()
+    print("✅ 消息缓存在事件删除后正确失效")
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+测试 MessageSink 写入失败时的处理
+
+批量写入反复失败后逐行重试；仍然写不进去的消息在运行结束的
+flush(final=True) 时抛出 MessageFlushError，而不是只记日志后丢弃。
+
+用法:
+    python tests/test_message_sink.py
+    pytest tests/test_message_sink.py
+"""
+
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agentpress.message_sink import MessageFlushError, MessageSink
+
+THREAD_ID = "00000000-0000-0000-0000-0000000000aa"
+
+
+class FakeConnection:
+    def __init__(self, pool):
+        self.pool = pool
+
+    async def execute(self, sql, *columns):
+        ids = columns[0]
+        self.pool.calls.append(list(ids))
+        if len(ids) > 1 and self.pool.fail_batches:
+            raise RuntimeError("batch insert failed")
+        if any(message_id in self.pool.bad_ids for message_id in ids):
+            raise RuntimeError("row insert failed")
+        self.pool.written.extend(ids)
+
+
+class FakePool:
+    def __init__(self, fail_batches=False, bad_ids=()):
+        self.fail_batches = fail_batches
+        self.bad_ids = set(bad_ids)
+        self.calls = []
+        self.written = []
+
+    def acquire(self):
+        pool = self
+
+        class _Acquire:
+            async def __aenter__(self):
+                return FakeConnection(pool)
+
+            async def __aexit__(self, *exc):
+                return False
+
+        return _Acquire()
+
+
+class FakeDB:
+    def __init__(self, pool):
+        async def _client():
+            return type("Client", (), {"pool": pool})()
+        self._client = _client
+
+    @property
+    def client(self):
+        return self._client()
+
+
+async def add_rows(sink, count):
+    rows = []
+    for i in range(count):
+        rows.append(await sink.add({
+            "thread_id": THREAD_ID, "type": "status", "is_llm_message": False,
+            "content": "{}", "metadata": "{}",
+        }))
+    return rows
+
+
+def test_failed_batch_is_written_row_by_row():
+    async def run():
+        pool = FakePool(fail_batches=True)
+        sink = MessageSink(FakeDB(pool), max_delay=60)
+        rows = await add_rows(sink, 3)
+        await sink.flush(final=True)
+        return pool, rows
+
+    pool, rows = asyncio.run(run())
+    assert pool.written == [row["message_id"] for row in rows]
+
+
+def test_unwritable_rows_fail_the_final_flush():
+    async def run():
+        pool = FakePool(fail_batches=True)
+        sink = MessageSink(FakeDB(pool), max_delay=60)
+        rows = await add_rows(sink, 3)
+        pool.bad_ids.add(rows[1]["message_id"])
+        try:
+            await sink.flush(final=True)
+        except MessageFlushError:
+            return pool, rows, True
+        return pool, rows, False
+
+    pool, rows, raised = asyncio.run(run())
+    assert raised
+    assert pool.written == [rows[0]["message_id"], rows[2]["message_id"]]
+
+
+def test_batch_full_flush_failure_is_raised_by_final_flush():
+    async def run():
+        pool = FakePool(fail_batches=True)
+        sink = MessageSink(FakeDB(pool), max_batch_size=2, max_delay=60)
+        rows = await add_rows(sink, 1)
+        pool.bad_ids.add(rows[0]["message_id"])
+        # 批量满时的 flush 失败三次后逐行写入，坏行的错误留到最后一次 flush 抛出
+        await add_rows(sink, 3)
+        try:
+            await sink.flush(final=True)
+        except MessageFlushError:
+            return pool, True
+        return pool, False
+
+    pool, raised = asyncio.run(run())
+    assert raised
+    assert len(pool.written) == 3
+
+
+if __name__ == "__main__":
+    test_failed_batch_is_written_row_by_row()
+    test_unwritable_rows_fail_the_final_flush()
+    test_batch_full_flush_failure_is_raised_by_final_flush()
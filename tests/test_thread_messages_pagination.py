@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+测试分页读取线程消息时，跨页的 tool/assistant 消息仍然能关联
+
+默认按时间倒序分页，tool 结果常常在前一页、对应的 assistant 消息在下一页。
+这里用假的数据库驱动 get_thread_messages 的 limit/cursor 模式，
+检查落在页边界两侧的一对消息中，tool 消息的 assistant_message_id 被正确填写，
+而且额外查出的 assistant 消息不会出现在本页结果中。
+
+用法:
+    python tests/test_thread_messages_pagination.py
+    pytest tests/test_thread_messages_pagination.py
+"""
+
+import asyncio
+import json
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent import api
+
+THREAD_ID = "00000000-0000-0000-0000-0000000000cc"
+BASE_TIME = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+def message_row(message_id, minutes, type_, content, metadata=None):
+    created_at = BASE_TIME + timedelta(minutes=minutes)
+    return {
+        "source": "message",
+        "sort_id": message_id,
+        "sort_ts": created_at,
+        "message_id": message_id,
+        "thread_id": THREAD_ID,
+        "type": type_,
+        "role": type_,
+        "content": json.dumps(content),
+        "metadata": json.dumps(metadata or {}),
+        "is_llm_message": True,
+        "created_at": created_at,
+        "updated_at": created_at,
+        "agent_id": None,
+        "agent_version_id": None,
+    }
+
+
+ROWS = [
+    message_row("00000000-0000-0000-0000-000000000001", 0, "assistant",
+                {"role": "assistant", "content": "", "tool_calls": [{"id": "call-1", "function": {"name": "ls"}}]}),
+    message_row("00000000-0000-0000-0000-000000000002", 1, "tool",
+                {"role": "tool", "content": "ok"}, {"tool_call_id": "call-1"}),
+    message_row("00000000-0000-0000-0000-000000000003", 2, "status",
+                {"status_type": "finish"}),
+]
+
+
+class FakeConnection:
+    async def fetch(self, query, *params):
+        if "UNION ALL" in query:
+            rows = sorted(ROWS, key=lambda row: (row["sort_ts"], row["sort_id"]), reverse=True)
+            if "(sort_ts, sort_id) <" in query:
+                rows = [row for row in rows if (row["sort_ts"], row["sort_id"]) < (params[2], params[3])]
+            return rows[:params[-1]]
+        # 按 tool_call_id 查 assistant 消息
+        tool_call_ids = set(params[1])
+        return [
+            {key: value for key, value in row.items() if key not in ("source", "sort_id", "sort_ts")}
+            for row in ROWS
+            if row["type"] == "assistant"
+            and any(call["id"] in tool_call_ids for call in json.loads(row["content"])["tool_calls"])
+        ]
+
+
+class FakeAcquire:
+    async def __aenter__(self):
+        return FakeConnection()
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakeClient:
+    class pool:
+        @staticmethod
+        def acquire():
+            return FakeAcquire()
+
+
+class FakeDB:
+    @property
+    async def client(self):
+        return FakeClient()
+
+
+async def fetch_first_page():
+    original_db, original_verify = api.db, api.verify_thread_access
+
+    async def allow(*args, **kwargs):
+        return True
+
+    api.db, api.verify_thread_access = FakeDB(), allow
+    try:
+        return await api.get_thread_messages(
+            thread_id=THREAD_ID, user_id="user-1", order="desc", limit=2, cursor=None, stream=False,
+        )
+    finally:
+        api.db, api.verify_thread_access = original_db, original_verify
+
+
+def test_tool_message_is_linked_across_page_boundary():
+    page = asyncio.run(fetch_first_page())
+    messages = page["messages"]
+
+    # 第一页只有 status 和 tool 消息，assistant 消息在下一页
+    assert [message["type"] for message in messages] == ["status", "tool"]
+    assert page["has_more"] is True
+    assert json.loads(messages[1]["metadata"])["assistant_message_id"] == ROWS[0]["message_id"]
+
+
+if __name__ == "__main__":
+    test_tool_message_is_linked_across_page_boundary()
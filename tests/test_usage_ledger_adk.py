@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+测试 ADK 运行路径会写入用量台账
+
+实际的 agent 运行使用 ADKThreadManager，assistant_response_end 消息由
+ResponseProcessor 通过 add_message 回调写入。这里用假的数据库客户端驱动
+ADKThreadManager.add_message，分别在写后缓冲开启和关闭时检查 usage_daily
+是否被累加。
+
+用法:
+    python tests/test_usage_ledger_adk.py
+    pytest tests/test_usage_ledger_adk.py
+"""
+
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agentpress.adk_thread_manager import ADKThreadManager
+from utils.config import config
+
+THREAD_ID = "00000000-0000-0000-0000-0000000000aa"
+RESPONSE_END = {
+    "choices": [{"finish_reason": "stop", "index": 0, "message": {"role": "assistant", "content": "hi"}}],
+    "model": "openai/gpt-4o",
+    "usage": {"prompt_tokens": 1200, "completion_tokens": 300, "total_tokens": 1500},
+    "streaming": True,
+}
+
+
+class FakeConnection:
+    def __init__(self, calls):
+        self.calls = calls
+
+    async def fetchval(self, sql, *args):
+        self.calls.append((sql, args))
+        return "account-1"
+
+
+class FakeAcquire:
+    def __init__(self, calls):
+        self.calls = calls
+
+    async def __aenter__(self):
+        return FakeConnection(self.calls)
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakePool:
+    def __init__(self):
+        self.calls = []
+
+    def acquire(self):
+        return FakeAcquire(self.calls)
+
+
+class FakeTable:
+    async def insert(self, data):
+        class Result:
+            pass
+        result = Result()
+        result.data = [{**data, "message_id": "message-1"}]
+        return result
+
+
+class FakeClient:
+    def __init__(self):
+        self.pool = FakePool()
+
+    def table(self, name):
+        return FakeTable()
+
+
+class FakeDB:
+    def __init__(self, client):
+        self._client = client
+
+    @property
+    def client(self):
+        async def get():
+            return self._client
+        return get()
+
+
+class FakeSink:
+    def __init__(self):
+        self.rows = []
+
+    async def add(self, row):
+        self.rows.append(row)
+        return {**row, "message_id": "message-1"}
+
+
+def make_manager(client: FakeClient) -> ADKThreadManager:
+    # 只需要 add_message 用到的属性，跳过 langfuse / 工具注册等初始化
+    manager = ADKThreadManager.__new__(ADKThreadManager)
+    manager.db = FakeDB(client)
+    manager.message_sink = FakeSink()
+    return manager
+
+
+def ledger_writes(client: FakeClient):
+    return [args for sql, args in client.pool.calls if "INSERT INTO usage_daily" in sql]
+
+
+async def add_response_end(write_behind: bool):
+    client = FakeClient()
+    manager = make_manager(client)
+    original = config.MESSAGE_WRITE_BEHIND
+    config.MESSAGE_WRITE_BEHIND = write_behind
+    try:
+        message = await manager.add_message(
+            thread_id=THREAD_ID,
+            type="assistant_response_end",
+            content=RESPONSE_END,
+            is_llm_message=False,
+            metadata={"thread_run_id": "run-1"},
+        )
+        # 其他类型的消息不记用量
+        await manager.add_message(thread_id=THREAD_ID, type="status", content={"status_type": "finish"})
+    finally:
+        config.MESSAGE_WRITE_BEHIND = original
+    return client, manager, message
+
+
+def test_adk_add_message_records_usage_with_write_behind():
+    client, manager, message = asyncio.run(add_response_end(write_behind=True))
+    writes = ledger_writes(client)
+    assert len(writes) == 1
+    thread_id, _, model, prompt_tokens, completion_tokens, cost = writes[0]
+    assert (thread_id, model, prompt_tokens, completion_tokens) == (THREAD_ID, "openai/gpt-4o", 1200, 300)
+    assert cost > 0
+    assert len(manager.message_sink.rows) == 2
+    assert message["message_id"] == "message-1"
+
+
+def test_adk_add_message_records_usage_without_write_behind():
+    client, manager, message = asyncio.run(add_response_end(write_behind=False))
+    assert len(ledger_writes(client)) == 1
+    assert manager.message_sink.rows == []
+    assert message["message_id"] == "message-1"
+
+
+if __name__ == "__main__":
+    test_adk_add_message_records_usage_with_write_behind()
+    test_adk_add_message_records_usage_without_write_behind()
+    print("✅ ADK 路径的用量台账写入正常")
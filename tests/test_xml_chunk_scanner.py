@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+测试 XMLChunkScanner 对未闭合旧格式标签的处理
+
+正文里提到工具名（例如 "<web-search>"）时，这个标签永远不会闭合。旧的提取逻辑
+会优先检查 <function_calls>，并跳过未闭合的旧格式标签继续往后找；增量扫描器
+必须保持同样的行为，不能让它挡住后面的工具调用。
+
+用法:
+    python tests/test_xml_chunk_scanner.py
+    pytest tests/test_xml_chunk_scanner.py
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agentpress.xml_tool_parser import XMLChunkScanner
+
+LEGACY_TAGS = ["create-file", "web-search", "ask"]
+
+
+def feed_in_chunks(content, chunk_size, tag_names=LEGACY_TAGS):
+    scanner = XMLChunkScanner(tag_names)
+    blocks = []
+    for i in range(0, len(content), chunk_size):
+        blocks += scanner.feed(content[i:i + chunk_size])
+    return blocks
+
+
+def test_unclosed_legacy_tag_does_not_block_function_calls():
+    block = '<function_calls><invoke name="web_search"><parameter name="query">x</parameter></invoke></function_calls>'
+    content = "I will use the <web-search> tool now.\n" + block
+    for chunk_size in (1, 7, len(content)):
+        assert feed_in_chunks(content, chunk_size) == [block]
+
+
+def test_unclosed_legacy_tag_does_not_block_later_legacy_block():
+    block = '<web-search query="x"></web-search>'
+    content = "Let me <ask about it first, then search: " + block + " done."
+    for chunk_size in (1, 7, len(content)):
+        assert feed_in_chunks(content, chunk_size) == [block]
+
+
+def test_nested_legacy_block_is_extracted_whole():
+    block = '<create-file path="a"><create-file path="b"></create-file></create-file>'
+    assert feed_in_chunks("text " + block + " more", 5) == [block]
+
+
+if __name__ == "__main__":
+    test_unclosed_legacy_tag_does_not_block_function_calls()
+    test_unclosed_legacy_tag_does_not_block_later_legacy_block()
+    test_nested_legacy_block_is_extracted_whole()
+    print("✅ XMLChunkScanner 未闭合标签处理正常")
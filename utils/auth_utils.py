@@ -12,6 +12,8 @@ from typing import Optional, Dict, Any
 from fastapi import HTTPException # type: ignore
 from utils.config import config
 from utils.logger import logger
+from utils.password_hasher import password_hasher, PasswordHasherBusy
+from utils.token_cache import verified_token_cache
 
 class AuthUtils:
     """JWT Authentication Utilities"""
@@ -57,6 +59,33 @@ class AuthUtils:
             logger.error(f"Password verification error: {e}")
             return False
     
+    @staticmethod
+    async def hash_password_async(password: str) -> str:
+        """password hashing on the password hasher pool, without blocking the event loop"""
+        try:
+            return await password_hasher.hash(password)
+        except PasswordHasherBusy:
+            raise HTTPException(status_code=503, detail="Too many requests, please retry", headers={"Retry-After": "1"})
+        except Exception as e:
+            logger.error(f"Password hashing failed: {e}")
+            raise
+    
+    @staticmethod
+    async def verify_password_async(password: str, hashed: str) -> bool:
+        """密码验证（在密码哈希线程池中执行，不阻塞事件循环）"""
+        try:
+            is_valid = await password_hasher.verify(password, hashed)
+        except PasswordHasherBusy:
+            raise HTTPException(status_code=503, detail="Too many requests, please retry", headers={"Retry-After": "1"})
+        except Exception as e:
+            logger.error(f"Password verification error: {e}")
+            return False
+        if is_valid:
+            logger.info("Password verification successful")
+        else:
+            logger.warning("Password verification failed: invalid password")
+        return is_valid
+    
     @staticmethod
     def create_access_token(user_id: str) -> str:
         """Create access token
@@ -108,7 +137,14 @@ class AuthUtils:
     
     @staticmethod
     def verify_token(token: str) -> Dict[str, Any]:
-        """Verify token"""
+        """Verify token
+
+        Verified tokens are remembered until their exp (verified_token_cache),
+        so repeated requests with the same token skip jwt.decode.
+        """
+        cached = verified_token_cache.get(token)
+        if cached is not None:
+            return cached
         try:
             logger.debug(f"Verifying token: {token[:10]}...")
 
@@ -124,7 +160,9 @@ class AuthUtils:
 
             # Step 3: 自动检查过期时间（jwt.decode会自动检查exp字段）
             # 如果过期会抛出jwt.ExpiredSignatureError
-            return {"user_id": user_id, "payload": payload}
+            token_data = {"user_id": user_id, "payload": payload}
+            verified_token_cache.put(token, token_data, payload.get("exp"))
+            return token_data
         except jwt.ExpiredSignatureError:
             # Token过期
             logger.warning(f"Token verification failed: token expired")
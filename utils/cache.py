@@ -1,26 +1,301 @@
+import asyncio
 import json
-from typing import Any
-from services.redis import get_client
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Tuple
+
+from services import redis
+from utils.logger import logger
+
+try:
+    import orjson
+except ImportError:  # optional, falls back to the json module
+    orjson = None
+
+# Longest time a value is served from the in-process tier without asking Redis
+L1_MAX_TTL_SECONDS = 30
+L1_MAX_ENTRIES = 4096
+INVALIDATION_CHANNEL = "cache:invalidate"
+LISTENER_RETRY_SECONDS = 5
+
+_MISSING = object()
+
+
+def _dumps(value: Any) -> str:
+    if orjson is not None:
+        try:
+            return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS).decode()
+        except TypeError:
+            pass
+    return json.dumps(value)
+
+
+def _loads(raw: str) -> Any:
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
 
 
 class _cache:
+    """JSON cache in Redis with an in-process LRU in front of it.
+
+    Values are kept in the local tier for the key's TTL, capped at
+    L1_MAX_TTL_SECONDS. invalidate() and writes are broadcast on
+    INVALIDATION_CHANNEL so other processes drop their local copy.
+    get_or_set() coalesces concurrent misses for the same key into one
+    loader call. Values served from the local tier are shared between
+    callers and must not be mutated.
+    """
+
+    def __init__(self):
+        self._l1: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._instance_id = uuid.uuid4().hex
+        self._listener_task: Optional[asyncio.Task] = None
+        self._stats = {
+            "l1_hits": 0,
+            "l2_hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "sets": 0,
+            "errors": 0,
+            "redis_calls": 0,
+            "redis_seconds_total": 0.0,
+            "redis_seconds_max": 0.0,
+            "loader_calls": 0,
+            "loader_seconds_total": 0.0,
+        }
+
+    @staticmethod
+    def _key(key: str) -> str:
+        return f"cache:{key}"
+
+    def _l1_get(self, key: str) -> Any:
+        entry = self._l1.get(key)
+        if entry is None:
+            return _MISSING
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._l1[key]
+            return _MISSING
+        self._l1.move_to_end(key)
+        return value
+
+    def _l1_set(self, key: str, value: Any, ttl_seconds: float):
+        if ttl_seconds <= 0:
+            self._l1.pop(key, None)
+            return
+        self._l1[key] = (time.monotonic() + min(ttl_seconds, L1_MAX_TTL_SECONDS), value)
+        self._l1.move_to_end(key)
+        while len(self._l1) > L1_MAX_ENTRIES:
+            self._l1.popitem(last=False)
+
+    def _record_redis(self, started_at: float):
+        elapsed = time.perf_counter() - started_at
+        self._stats["redis_calls"] += 1
+        self._stats["redis_seconds_total"] += elapsed
+        self._stats["redis_seconds_max"] = max(self._stats["redis_seconds_max"], elapsed)
+
+    def _ensure_listener(self):
+        if self._listener_task is None or self._listener_task.done():
+            self._listener_task = asyncio.create_task(self._listen_for_invalidations())
+
+    async def _listen_for_invalidations(self):
+        while True:
+            pubsub = None
+            try:
+                pubsub = await redis.create_pubsub()
+                await pubsub.subscribe(INVALIDATION_CHANNEL)
+                # Messages sent while we were not subscribed are lost
+                self._l1.clear()
+                async for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    sender, _, keys = message["data"].partition("|")
+                    if sender != self._instance_id:
+                        for key in keys.split("\n"):
+                            self._l1.pop(key, None)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Cache invalidation listener failed: {e}")
+            finally:
+                if pubsub is not None:
+                    try:
+                        await pubsub.close()
+                    except Exception:
+                        pass
+            await asyncio.sleep(LISTENER_RETRY_SECONDS)
+
+    def _invalidation_message(self, keys: Iterable[str]) -> str:
+        return f"{self._instance_id}|" + "\n".join(keys)
+
+    async def _lookup_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """Return {redis key: value} for the keys found in either tier."""
+        self._ensure_listener()
+        found, remote = {}, []
+        for key in keys:
+            value = self._l1_get(key)
+            if value is _MISSING:
+                remote.append(key)
+            else:
+                found[key] = value
+                self._stats["l1_hits"] += 1
+        if not remote:
+            return found
+
+        client = await redis.get_client()
+        started_at = time.perf_counter()
+        pipe = client.pipeline(transaction=False)
+        pipe.mget(remote)
+        for key in remote:
+            pipe.pttl(key)
+        results = await pipe.execute()
+        self._record_redis(started_at)
+
+        for key, raw, pttl in zip(remote, results[0], results[1:]):
+            if raw is None:
+                self._stats["misses"] += 1
+                continue
+            value = _loads(raw)
+            found[key] = value
+            self._stats["l2_hits"] += 1
+            # pttl is -1 for keys without expiry
+            self._l1_set(key, value, L1_MAX_TTL_SECONDS if pttl < 0 else pttl / 1000)
+        return found
+
     async def get(self, key: str):
-        redis = await get_client()
-        key = f"cache:{key}"
-        result = await redis.get(key)
-        if result:
-            return json.loads(result)
-        return None
+        key = self._key(key)
+        return (await self._lookup_many([key])).get(key)
+
+    async def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """Get several keys with one Redis round trip.
+
+        Returns:
+            Dict of the keys that were found (as passed in) to their values
+        """
+        keys = list(keys)
+        found = await self._lookup_many(self._key(key) for key in keys)
+        return {key: found[self._key(key)] for key in keys if self._key(key) in found}
 
     async def set(self, key: str, value: Any, ttl: int = 15 * 60):
-        redis = await get_client()
-        key = f"cache:{key}"
-        await redis.set(key, json.dumps(value), ex=ttl)
+        await self.set_many({key: value}, ttl=ttl)
+
+    async def set_many(self, values: Dict[str, Any], ttl: int = 15 * 60):
+        """Set several keys, plus the invalidation message, in one pipelined round trip."""
+        if not values:
+            return
+        self._ensure_listener()
+        client = await redis.get_client()
+        started_at = time.perf_counter()
+        pipe = client.pipeline(transaction=False)
+        keys = []
+        for key, value in values.items():
+            key = self._key(key)
+            keys.append(key)
+            raw = _dumps(value)
+            pipe.set(key, raw, ex=ttl)
+            # Store what a Redis hit would return (plain JSON types), not the caller's object
+            self._l1_set(key, _loads(raw), ttl)
+        pipe.publish(INVALIDATION_CHANNEL, self._invalidation_message(keys))
+        await pipe.execute()
+        self._record_redis(started_at)
+        self._stats["sets"] += len(keys)
 
     async def invalidate(self, key: str):
-        redis = await get_client()
-        key = f"cache:{key}"
-        await redis.delete(key)
+        key = self._key(key)
+        self._l1.pop(key, None)
+        client = await redis.get_client()
+        started_at = time.perf_counter()
+        pipe = client.pipeline(transaction=False)
+        pipe.delete(key)
+        pipe.publish(INVALIDATION_CHANNEL, self._invalidation_message([key]))
+        await pipe.execute()
+        self._record_redis(started_at)
+
+    async def get_or_set(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[Any]],
+        ttl: int = 15 * 60,
+        cache_none: bool = True,
+    ):
+        """
+        Get a key, calling loader and caching its result on a miss.
+
+        Concurrent misses for the same key in this process share one loader
+        call. Cache errors are logged and treated as misses, so the loader is
+        the only thing that can fail.
+
+        Args:
+            key: The cache key
+            loader: Async function producing the value
+            ttl: Expiry in seconds
+            cache_none: Whether a None result is cached
+
+        Returns:
+            The cached or loaded value
+        """
+        redis_key = self._key(key)
+        value = self._l1_get(redis_key)
+        if value is not _MISSING:
+            self._stats["l1_hits"] += 1
+            return value
+
+        # Concurrent callers wait for the first one's Redis lookup and load
+        inflight = self._inflight.get(redis_key)
+        if inflight is not None:
+            self._stats["coalesced"] += 1
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        # Nobody may be waiting for the failure
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[redis_key] = future
+        try:
+            value = await self._lookup_or_load(key, redis_key, loader, ttl, cache_none)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self._inflight.pop(redis_key, None)
+
+    async def _lookup_or_load(self, key: str, redis_key: str, loader: Callable[[], Awaitable[Any]], ttl: int, cache_none: bool):
+        try:
+            found = await self._lookup_many([redis_key])
+            if redis_key in found:
+                return found[redis_key]
+        except Exception as e:
+            self._stats["errors"] += 1
+            logger.warning(f"Cache read failed for {key}: {e}")
+
+        started_at = time.perf_counter()
+        value = await loader()
+        self._stats["loader_calls"] += 1
+        self._stats["loader_seconds_total"] += time.perf_counter() - started_at
+        if value is not None or cache_none:
+            try:
+                await self.set(key, value, ttl=ttl)
+            except Exception as e:
+                self._stats["errors"] += 1
+                logger.warning(f"Cache write failed for {key}: {e}")
+        return value
+
+    def stats(self) -> Dict[str, Any]:
+        redis_calls = self._stats["redis_calls"]
+        loader_calls = self._stats["loader_calls"]
+        return {
+            **self._stats,
+            "l1_entries": len(self._l1),
+            "redis_seconds_avg": self._stats["redis_seconds_total"] / redis_calls if redis_calls else 0.0,
+            "loader_seconds_avg": self._stats["loader_seconds_total"] / loader_calls if loader_calls else 0.0,
+        }
 
 
 Cache = _cache()
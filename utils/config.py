@@ -217,6 +217,38 @@ class Configuration:
     AWS_SECRET_ACCESS_KEY: Optional[str] = None
     AWS_REGION_NAME: Optional[str] = None
     
+    # ADK 会话服务：True 时使用 asyncpg 连接池的异步实现（默认使用 SQLAlchemy 同步实现）
+    ADK_ASYNC_SESSION_SERVICE: bool = False
+    # ADK 事件 actions 编码格式：pickle（默认，两种会话服务都能读取）、json 或 msgpack（需安装 msgpack）
+    # json/msgpack 写入的行只有异步会话服务能读取，开启后不能再回退到 SQLAlchemy 会话服务；
+    # 需先开启 ADK_ASYNC_SESSION_SERVICE 并运行 scripts/06_migrate_event_actions.py 转换已有数据
+    ADK_EVENT_ACTIONS_CODEC: str = "pickle"
+    # 是否把线程的已转换消息缓存同步到 Redis（多 worker 共享增量加载状态）
+    THREAD_MESSAGE_CACHE_REDIS: bool = False
+    # 每个数据库连接缓存的预编译语句数（使用 pgbouncer 事务池模式时设为 0）
+    DB_STATEMENT_CACHE_SIZE: int = 512
+    # 运行过程中的状态/工具消息先缓冲，再批量写入 messages 表（写入失败时运行报错）
+    MESSAGE_WRITE_BEHIND: bool = False
+    # bcrypt 密码哈希/校验使用的专用线程数（0 表示 min(4, CPU 核数)）
+    PASSWORD_HASH_WORKERS: int = 0
+    # 同时在执行或排队的哈希/校验请求上限，超出时登录/注册返回 503（0 表示不限制）
+    PASSWORD_HASH_MAX_PENDING: int = 64
+    # 启动 Agent 前按计费预检结果拒绝请求（403 模型无权限 / 402 额度用尽）；关闭时只记录日志
+    BILLING_ENFORCEMENT: bool = False
+    # Agent 运行响应的传输方式：list（Redis List + Pub/Sub）或 stream（Redis Streams）
+    AGENT_RUN_STREAM_BACKEND: str = "list"
+    # stream 后端每个运行保留的最大响应条数（XADD MAXLEN ~）
+    AGENT_RUN_STREAM_MAXLEN: int = 10000
+    # 线程 token 数超过上下文阈值的该百分比时，在后台（Dramatiq）对最早的消息做摘要
+    # 仅对 ThreadManager（get_llm_messages）路径生效；ADK 路径从会话取历史，不使用摘要
+    # 注意：agent/run.py 使用 ADKThreadManager 运行 Agent，实际的 Agent 运行不会生成或应用摘要
+    THREAD_SUMMARY_ENABLED: bool = False
+    THREAD_SUMMARY_TRIGGER_PERCENT: int = 70
+    # 摘要时保留不动的最新消息数
+    THREAD_SUMMARY_KEEP_RECENT: int = 20
+    # 摘要使用的模型（为空时使用当前运行的模型）
+    THREAD_SUMMARY_MODEL: Optional[str] = None
+
     # Model configuration
     MODEL_TO_USE: Optional[str] = "deepseek/deepseek-chat-v3.1"
     
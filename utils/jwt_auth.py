@@ -12,6 +12,7 @@ from typing import Optional, Dict, Any, Tuple
 from fastapi import HTTPException
 from utils.config import config
 from utils.logger import logger
+from utils.password_hasher import password_hasher, PasswordHasherBusy
 import bcrypt
 
 # JWT配置
@@ -38,6 +39,22 @@ class JWTAuth:
             logger.error(f"Password verification error: {e}")
             return False
     
+    @staticmethod
+    async def hash_password_async(password: str) -> str:
+        """哈希密码（在密码哈希线程池中执行）"""
+        return await password_hasher.hash(password)
+    
+    @staticmethod
+    async def verify_password_async(password: str, hashed: str) -> bool:
+        """验证密码（在密码哈希线程池中执行）"""
+        try:
+            return await password_hasher.verify(password, hashed)
+        except PasswordHasherBusy:
+            raise
+        except Exception as e:
+            logger.error(f"Password verification error: {e}")
+            return False
+    
     @staticmethod
     def generate_token_pair(user_id: str, email: str, name: Optional[str] = None) -> Tuple[str, str, datetime]:
         """
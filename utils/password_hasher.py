@@ -0,0 +1,118 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+import bcrypt # type: ignore
+
+from utils.config import config
+from utils.logger import logger
+
+# Queue waits longer than this are logged, they mean the pool is undersized
+SLOW_QUEUE_WAIT_SECONDS = 1.0
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when too many hash/verify calls are already waiting."""
+    pass
+
+
+class PasswordHasher:
+    """Runs bcrypt on a dedicated, size-limited thread pool.
+
+    bcrypt releases the GIL while hashing, so the pool gives real
+    parallelism and keeps the event loop free during login bursts. Calls
+    beyond max_pending (running + queued) are rejected with
+    PasswordHasherBusy instead of piling up behind each other.
+    """
+
+    def __init__(self, max_workers: int, max_pending: int):
+        """
+        Args:
+            max_workers: Threads hashing at the same time
+            max_pending: Calls allowed to be running or queued, 0 for no limit
+        """
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending = 0
+        self._stats = {
+            "completed": 0,
+            "rejected": 0,
+            "failed": 0,
+            "pending_max": 0,
+            "queue_seconds_total": 0.0,
+            "queue_seconds_max": 0.0,
+            "hash_seconds_total": 0.0,
+            "hash_seconds_max": 0.0,
+        }
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="password-hasher")
+        return self._executor
+
+    async def _run(self, fn: Callable[..., Any], *args) -> Any:
+        if self.max_pending and self._pending >= self.max_pending:
+            self._stats["rejected"] += 1
+            logger.warning(f"Password hasher busy: {self._pending} calls pending, rejecting")
+            raise PasswordHasherBusy(f"{self._pending} password hash calls already pending")
+
+        def timed():
+            started_at = time.perf_counter()
+            return fn(*args), started_at, time.perf_counter()
+
+        self._pending += 1
+        self._stats["pending_max"] = max(self._stats["pending_max"], self._pending)
+        submitted_at = time.perf_counter()
+        try:
+            result, started_at, finished_at = await asyncio.get_running_loop().run_in_executor(self._get_executor(), timed)
+        except Exception:
+            self._stats["failed"] += 1
+            raise
+        finally:
+            self._pending -= 1
+
+        queue_seconds = started_at - submitted_at
+        hash_seconds = finished_at - started_at
+        self._stats["completed"] += 1
+        self._stats["queue_seconds_total"] += queue_seconds
+        self._stats["queue_seconds_max"] = max(self._stats["queue_seconds_max"], queue_seconds)
+        self._stats["hash_seconds_total"] += hash_seconds
+        self._stats["hash_seconds_max"] = max(self._stats["hash_seconds_max"], hash_seconds)
+        if queue_seconds > SLOW_QUEUE_WAIT_SECONDS:
+            logger.warning(f"Password hash waited {queue_seconds:.2f}s in queue ({self._pending} still pending)")
+        return result
+
+    async def hash(self, password: str) -> str:
+        """Hash a password with a fresh salt."""
+        hashed = await self._run(bcrypt.hashpw, password.encode('utf-8'), bcrypt.gensalt())
+        return hashed.decode('utf-8')
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        """Check a password against a bcrypt hash."""
+        return await self._run(bcrypt.checkpw, password.encode('utf-8'), hashed.encode('utf-8'))
+
+    def stats(self) -> Dict[str, Any]:
+        completed = self._stats["completed"]
+        return {
+            **self._stats,
+            "pending": self._pending,
+            "queue_depth": max(0, self._pending - self.max_workers),
+            "max_workers": self.max_workers,
+            "max_pending": self.max_pending,
+            "queue_seconds_avg": self._stats["queue_seconds_total"] / completed if completed else 0.0,
+            "hash_seconds_avg": self._stats["hash_seconds_total"] / completed if completed else 0.0,
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+password_hasher = PasswordHasher(
+    max_workers=config.PASSWORD_HASH_WORKERS or min(4, os.cpu_count() or 1),
+    max_pending=config.PASSWORD_HASH_MAX_PENDING,
+)
@@ -0,0 +1,148 @@
+import hashlib
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from services import redis
+
+ACCESS_TOKEN_CACHE_MAX_ENTRIES = 10000
+
+_REFRESH_KEY_PREFIX = "auth:refresh:"
+_USER_REFRESH_KEY_PREFIX = "auth:user_refresh:"
+# Sorted set of revoked refresh token hashes, scored by when the token would have expired
+REVOKED_REFRESH_TOKENS_KEY = "auth:revoked_refresh_tokens"
+
+
+class VerifiedTokenCache:
+    """LRU of access tokens whose signature and claims were already checked.
+
+    Entries are keyed by a hash of the token and dropped once the token's
+    exp has passed, so a cached token is never accepted after it expires.
+    """
+
+    def __init__(self, max_entries: int = ACCESS_TOKEN_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[bytes, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        key = self._key(token)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at <= time.time():
+            del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, token: str, value: Dict[str, Any], expires_at: Optional[float]):
+        """Cache a verified token until expires_at (epoch seconds); tokens without exp are not cached."""
+        if not expires_at or expires_at <= time.time():
+            return
+        key = self._key(token)
+        self._entries[key] = (float(expires_at), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+class RefreshTokenStore:
+    """Redis copy of the refresh_tokens table plus a revocation set.
+
+    The database stays the source of truth. Issued tokens are mirrored to
+    Redis so a refresh can be checked without a query, and rotating a token
+    only needs a Redis write: the revocation set makes sure the database
+    fallback never accepts a token whose row has not been deleted yet.
+    """
+
+    def __init__(self, max_lifetime_seconds: float):
+        """
+        Args:
+            max_lifetime_seconds: Longest refresh token lifetime, used when revoking tokens of unknown expiry
+        """
+        self.max_lifetime_seconds = max_lifetime_seconds
+
+    @staticmethod
+    def _ttl(expires_at: datetime) -> int:
+        return max(1, int(expires_at.timestamp() - time.time()))
+
+    async def remember(self, user_id: str, token_hash: str, expires_at: datetime):
+        """Mirror a stored refresh token into Redis."""
+        ttl = self._ttl(expires_at)
+        client = await redis.get_client()
+        pipe = client.pipeline(transaction=False)
+        pipe.set(f"{_REFRESH_KEY_PREFIX}{token_hash}", f"{user_id}|{expires_at.timestamp()}", ex=ttl)
+        pipe.sadd(f"{_USER_REFRESH_KEY_PREFIX}{user_id}", token_hash)
+        # The per-user index lives as long as the newest token
+        pipe.expire(f"{_USER_REFRESH_KEY_PREFIX}{user_id}", ttl)
+        await pipe.execute()
+
+    async def lookup(self, token_hash: str) -> Tuple[bool, Optional[str]]:
+        """
+        Check a refresh token hash against Redis.
+
+        Returns:
+            (revoked, user_id): user_id is None when Redis does not know the
+            token and the database has to be asked
+        """
+        client = await redis.get_client()
+        pipe = client.pipeline(transaction=False)
+        pipe.zscore(REVOKED_REFRESH_TOKENS_KEY, token_hash)
+        pipe.get(f"{_REFRESH_KEY_PREFIX}{token_hash}")
+        revoked_until, active = await pipe.execute()
+        if revoked_until is not None and revoked_until > time.time():
+            return True, None
+        if active is None:
+            return False, None
+        user_id, _, expires_at = active.rpartition("|")
+        if float(expires_at) <= time.time():
+            return False, None
+        return False, user_id
+
+    async def revoke(self, token_hashes: Iterable[str], expires_at: Optional[datetime] = None, user_id: Optional[str] = None):
+        """
+        Add token hashes to the revocation set and drop their Redis copies.
+
+        Args:
+            token_hashes: Hashes to revoke
+            expires_at: Latest expiry of the tokens, defaults to the longest refresh token lifetime
+            user_id: Owner of the tokens, to keep the per-user index in sync
+        """
+        token_hashes = list(token_hashes)
+        if not token_hashes:
+            return
+        revoked_until = expires_at.timestamp() if expires_at else time.time() + self.max_lifetime_seconds
+        client = await redis.get_client()
+        pipe = client.pipeline(transaction=False)
+        pipe.zadd(REVOKED_REFRESH_TOKENS_KEY, {token_hash: revoked_until for token_hash in token_hashes})
+        pipe.zremrangebyscore(REVOKED_REFRESH_TOKENS_KEY, "-inf", time.time())
+        pipe.delete(*(f"{_REFRESH_KEY_PREFIX}{token_hash}" for token_hash in token_hashes))
+        if user_id:
+            pipe.srem(f"{_USER_REFRESH_KEY_PREFIX}{user_id}", *token_hashes)
+        await pipe.execute()
+
+    async def revoke_user(self, user_id: str):
+        """Revoke every refresh token of a user that Redis knows about."""
+        client = await redis.get_client()
+        token_hashes = await client.smembers(f"{_USER_REFRESH_KEY_PREFIX}{user_id}")
+        await self.revoke(token_hashes, user_id=user_id)
+
+
+verified_token_cache = VerifiedTokenCache()